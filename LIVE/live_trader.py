@@ -16,6 +16,9 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from trading_strategy import TradingStrategy
 from market_hours import MarketHours
+from performance_metrics import MetricsAccumulator, BARS_PER_DAY
+from tick_feed import TickFeed
+from market_data_cache import bridge_get
 # Import LIVE modules
 try:
     from LIVE.live_trading_config import get_config, validate_config, get_timeframe_config, merge_configs
@@ -61,12 +64,17 @@ class LiveTrader:
         self.position_sizer = PositionSizer()
         self.risk_manager = RiskManager()
         self.market_hours = MarketHours()
+        self.tick_feeds = {}  # Symbol -> TickFeed (laatste quote zonder EA request)
         
         # Trading state
         self.active_positions = {}
         self.starting_balance = None
         self.current_balance = None
         
+        # Live metrics: één equity punt per bar van de trading timeframe
+        self.metrics = MetricsAccumulator(timeframe=self.config['timeframe'])
+        self.last_metrics_bar = None
+        
         # Logging
         self.log_file = os.path.join(os.path.dirname(__file__), '..', 'LIVE', 'platform_logs.txt')
         os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
@@ -107,7 +115,8 @@ class LiveTrader:
             signal_data = self.strategy.generate_signal_from_chart(
                 symbol=symbol,
                 timeframe=timeframe,
-                count=100
+                count=100,
+                confluence_timeframes=self.config.get('confluence_timeframes') or None
             )
             
             signal = signal_data.get('signal')
@@ -164,9 +173,9 @@ class LiveTrader:
     def get_account_balance(self) -> float:
         """Get current account balance from MT5"""
         try:
-            response = requests.get(f"{self.api_url}/account", timeout=5)
-            if response.status_code == 200:
-                data = response.json()
+            # Shared memory cache van de bridge, anders de bridge zelf
+            data = bridge_get("/account", bridge_url=self.api_url, timeout=5)
+            if data is not None:
                 if not data.get('error'):
                     balance = float(data.get('balance', 0))
                     if balance > 0:  # Only use if we got a valid balance
@@ -203,9 +212,8 @@ class LiveTrader:
     def get_open_positions(self, symbol: Optional[str] = None):
         """Get open positions from MT5"""
         try:
-            response = requests.get(f"{self.api_url}/positions", timeout=5)
-            if response.status_code == 200:
-                data = response.json()
+            data = bridge_get("/positions", bridge_url=self.api_url, timeout=5)
+            if data is not None:
                 positions = data.get('positions', [])
                 if symbol:
                     return [p for p in positions if p.get('symbol') == symbol]
@@ -214,6 +222,39 @@ class LiveTrader:
             print(f"❌ Error getting positions: {e}")
         return []
     
+    def get_tick_feed(self, symbol: str) -> Optional[TickFeed]:
+        """Tick feed van de EA voor een symbol (None als use_tick_feed uit staat)"""
+        if not self.config.get('use_tick_feed'):
+            return None
+        if symbol not in self.tick_feeds:
+            try:
+                self.tick_feeds[symbol] = TickFeed(symbol, folder=self.config.get('tick_folder'))
+            except Exception as e:
+                print(f"⚠️  Tick feed not available: {e}")
+                self.tick_feeds[symbol] = None
+        return self.tick_feeds[symbol]
+    
+    def get_market_price(self, symbol: str, signal_type: str, fallback: float) -> float:
+        """
+        Huidige ask (BUY) of bid (SELL)
+        
+        Leest de laatste tick uit de tick ring file; alleen als die er niet is of de
+        EA heartbeat verouderd is wordt de tick via de bridge opgevraagd.
+        """
+        price_field = 'ask' if signal_type == 'BUY' else 'bid'
+        feed = self.get_tick_feed(symbol)
+        quote = feed.get_quote() if feed else None
+        if quote:
+            return float(quote[price_field])
+        
+        try:
+            tick_response = requests.get(f"{self.api_url}/tick/{symbol}", timeout=2)
+            if tick_response.status_code == 200:
+                return float(tick_response.json().get(price_field, fallback))
+        except:
+            pass
+        return fallback  # Fallback
+    
     def place_trade(self, symbol: str, signal_type: str, entry_price: float, 
                    sl_pips: int, tp_pips: int) -> Optional[Dict]:
         """
@@ -241,18 +282,7 @@ class LiveTrader:
         
         # Get current market price (more accurate than using entry_price)
         # This ensures we use the LATEST price at order placement time
-        try:
-            tick_response = requests.get(f"{self.api_url}/tick/{symbol}", timeout=2)
-            if tick_response.status_code == 200:
-                tick_data = tick_response.json()
-                if signal_type == 'BUY':
-                    current_price = float(tick_data.get('ask', entry_price))
-                else:  # SELL
-                    current_price = float(tick_data.get('bid', entry_price))
-            else:
-                current_price = entry_price  # Fallback
-        except:
-            current_price = entry_price  # Fallback
+        current_price = self.get_market_price(symbol, signal_type, entry_price)
         
         # Calculate TP/SL prices based on current market price
         # For XAUUSD: 1 pip = 0.01 (2 decimal places)
@@ -329,6 +359,15 @@ class LiveTrader:
                     # Record trade in risk manager
                     account_balance = self.get_account_balance()
                     self.risk_manager.record_trade(profit, account_balance)
+                    self.metrics.add_trade(profit)
+    
+    def update_metrics(self, account_balance: float):
+        """Voeg de balance toe aan de live metrics, maximaal één keer per bar"""
+        bars_per_day = BARS_PER_DAY.get(self.config['timeframe'].upper(), BARS_PER_DAY['H1'])
+        bar = int(time.time() // (86400 / bars_per_day))
+        if bar != self.last_metrics_bar:
+            self.metrics.update_equity(account_balance)
+            self.last_metrics_bar = bar
     
     def execute_trading_cycle(self):
         """Execute one trading cycle"""
@@ -355,6 +394,7 @@ class LiveTrader:
                 return
         
         print(f"💰 Account Balance: ${account_balance:.2f}")
+        self.update_metrics(account_balance)
         
         # Check risk manager
         should_stop, reason = self.risk_manager.should_stop_trading(
@@ -406,7 +446,8 @@ class LiveTrader:
         signal_data = self.strategy.generate_signal_from_chart(
             symbol=symbol,
             timeframe=timeframe,
-            count=100
+            count=100,
+            confluence_timeframes=self.config.get('confluence_timeframes') or None
         )
         
         signal = signal_data.get('signal')
@@ -449,6 +490,19 @@ class LiveTrader:
             self.log(f"❌ Trade REJECTED: No valid signal (got {signal})", "WARNING")
             return
         
+        # Check multi-timeframe confluence (hogere timeframes uit dezelfde feed)
+        confluence = signal_data.get('confluence') or {}
+        if confluence.get('timeframes'):
+            self.log(f"🧭 Confluence: aligned {confluence['aligned']}, opposed {confluence['opposed']} (score {confluence['score']})")
+        if self.config.get('require_confluence') and confluence.get('opposed'):
+            print(f"⏸️  Higher timeframes against signal: {', '.join(confluence['opposed'])}")
+            self.log(f"❌ Trade REJECTED: {signal} opposed by {', '.join(confluence['opposed'])}", "WARNING")
+            return
+        if self.config.get('require_confluence') and confluence.get('insufficient'):
+            print(f"⏸️  Not enough history on: {', '.join(confluence['insufficient'])}")
+            self.log(f"❌ Trade REJECTED: no confluence history for {', '.join(confluence['insufficient'])}", "WARNING")
+            return
+        
         # Check risk/reward ratio
         if tp_sl:
             tp_pips = tp_sl.get('tp_pips', 0)
@@ -515,6 +569,10 @@ class LiveTrader:
             print("\n📊 Final Daily Stats:")
             for key, value in stats.items():
                 print(f"   {key}: {value}")
+            metrics = self.metrics.get_metrics()
+            print("\n📈 Session Metrics:")
+            print(f"   Trades: {metrics['total_trades']} | Win Rate: {metrics['win_rate']}% | "
+                  f"Sharpe: {metrics['sharpe_ratio']} | Max DD: {metrics['max_drawdown_pct']}%")
 
 
 if __name__ == '__main__':
@@ -24,6 +24,8 @@ LIVE_CONFIG = {
     # Signal Settings
     'confidence_threshold': 70,      # Min 70% confidence vereist voor trade
     'min_risk_reward_ratio': 2.0,    # Min 1:2 risk/reward ratio
+    'confluence_timeframes': [],     # Hogere timeframes voor confluence, bv. ['H1', 'H4'] bij M5
+    'require_confluence': False,     # Geen trade als een hogere timeframe tegen het signaal in gaat of te weinig history heeft
     
     # Position Management
     'use_trailing_stop': True,        # Gebruik trailing stop loss
@@ -43,6 +45,8 @@ LIVE_CONFIG = {
     
     # MT5 Connection
     'mt5_bridge_url': 'http://localhost:5002',
+    'use_tick_feed': True,             # Huidige prijs uit de tick ring file van de EA (geen /tick request)
+    'tick_folder': None,               # Map met de tick ring file (None = Common Files folder van de bridge)
     
     # Monitoring
     'log_trades': True,                # Log alle trades
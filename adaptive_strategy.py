@@ -2,19 +2,59 @@
 """
 Adaptive Strategy
 Auto-switch strategie parameters op basis van market regime
+Eén candle snapshot per cyclus: regime detectie en signaal gebruiken dezelfde
+candles, en een regime wissel is alleen een parameter swap
 """
 
+import os
 from typing import Dict, List, Optional
 from datetime import datetime
+import numpy as np
 from trading_strategy import TradingStrategy
-from market_regime import MarketRegimeDetector
+from market_regime import MarketRegimeDetector, REGIME_PARAMETERS_FILE, REGIMES
+from indicator_series import PERIOD_INDICATORS, compute_indicator, ema_series, indicators_at
 
 class AdaptiveStrategy:
-    def __init__(self, bridge_url: str = "http://localhost:5002"):
+    def __init__(self, bridge_url: str = "http://localhost:5002", parameters_file: str = REGIME_PARAMETERS_FILE):
+        """
+        Args:
+            bridge_url: MT5 bridge
+            parameters_file: Geoptimaliseerde parameters per regime (ParameterOptimizer.optimize_regimes),
+                             wordt opnieuw geladen als het bestand verandert
+        """
+        self.parameters_file = parameters_file
+        self._parameters_mtime = None
         self.regime_detector = MarketRegimeDetector()
         self.current_regime = None
         self.strategy = TradingStrategy(bridge_url=bridge_url)
         self.regime_history = []
+        self.parameter_sets = {}
+        self._snapshot = None  # {'key', 'candles', 'series'} van de laatste cyclus
+        self._periods = {}  # timeframe -> {parameter: periodes van alle regimes}
+        self.reload_parameters()
+    
+    def reload_parameters(self) -> bool:
+        """
+        Laad de parameter sets van alle regimes (één keer, niet per wissel)
+        
+        Returns:
+            True als het parameters bestand (opnieuw) geladen is
+        """
+        mtime = os.path.getmtime(self.parameters_file) if os.path.exists(self.parameters_file) else None
+        if self.parameter_sets and mtime == self._parameters_mtime:
+            return False
+        
+        self._parameters_mtime = mtime
+        self.regime_detector.strategy_overrides = {}
+        if mtime is not None:
+            self.regime_detector.load_strategy_parameters(self.parameters_file)
+        self.parameter_sets = {regime: self.regime_detector.get_strategy_for_regime(regime) for regime in REGIMES}
+        self._snapshot = None  # Andere periodes: indicator reeksen opnieuw
+        self._periods = {}
+        
+        if self.current_regime in self.parameter_sets:
+            self.strategy.set_parameters(self.parameter_sets[self.current_regime])
+        return mtime is not None
     
     def update_strategy(self, candles: List[Dict]) -> bool:
         """
@@ -31,11 +71,9 @@ class AdaptiveStrategy:
         
         # Check if regime changed
         if new_regime != self.current_regime:
-            # Get parameters for new regime
-            params = self.regime_detector.get_strategy_for_regime(new_regime)
-            
-            # Update strategy
-            self.strategy = TradingStrategy(bridge_url=self.strategy.bridge_url, parameters=params)
+            # Parameter set was al geladen: alleen swappen
+            params = self.parameter_sets[new_regime]
+            self.strategy.set_parameters(params)
             self.current_regime = new_regime
             
             # Record regime change
@@ -52,21 +90,49 @@ class AdaptiveStrategy:
         
         return False
     
-    def generate_signal(self, symbol: str = "XAUUSD", timeframe: str = "H1", count: int = 100) -> Dict:
+    def _indicator_series(self, candles: List[Dict], timeframe: str) -> Dict:
         """
-        Generate signal with adaptive strategy
+        Indicator reeksen over de snapshot voor de periodes van álle regimes
+        
+        Zelfde snapshot (laatste bar + aantal) geeft de bewaarde reeksen terug,
+        dus een regime wissel rekent niets opnieuw.
+        """
+        last = candles[-1]
+        key = (timeframe, len(candles), last.get('time'), last.get('close'))
+        if self._snapshot and self._snapshot['key'] == key:
+            return self._snapshot['series']
+        
+        if timeframe not in self._periods:
+            periods = {}
+            for params in self.parameter_sets.values():
+                probe = TradingStrategy(bridge_url=self.strategy.bridge_url, parameters=params)
+                for name, period in probe.get_indicator_periods(timeframe).items():
+                    periods.setdefault(name, set()).add(period)
+            self._periods[timeframe] = periods
+        
+        closes = np.array([float(c.get('close', 0)) for c in candles])
+        series = {}
+        for name, values in self._periods[timeframe].items():
+            indicator = PERIOD_INDICATORS[name]
+            for period in values:
+                # EMA geseed op de eerste close van de snapshot, zoals calculate_ema
+                series[(indicator, period)] = (ema_series(closes, period, window=None) if indicator == 'ema'
+                                               else compute_indicator(closes, indicator, period))
+        self._snapshot = {'key': key, 'candles': candles, 'series': series}
+        return series
+    
+    def analyze_snapshot(self, candles: List[Dict], timeframe: str = "H1", symbol: str = "XAUUSD") -> Dict:
+        """
+        Regime + signaal op een gegeven candle snapshot (geen bridge request)
         
         Args:
+            candles: Candlestick data (oudste eerst)
+            timeframe: Timeframe van de candles
             symbol: Trading symbol
-            timeframe: Timeframe
-            count: Number of candles
         
         Returns:
-            Signal dict
+            Signal dict met 'regime' en 'regime_description'
         """
-        # Get candles
-        candles = self.strategy.get_candlestick_data(symbol, timeframe, count)
-        
         if not candles or len(candles) < 50:
             return {
                 'signal': 'NEUTRAL',
@@ -75,25 +141,73 @@ class AdaptiveStrategy:
                 'regime': self.current_regime or 'unknown'
             }
         
+        self.reload_parameters()
+        
         # Update strategy if regime changed
         self.update_strategy(candles)
         
-        # Generate signal with current strategy
-        signal = self.strategy.generate_signal_from_chart(symbol, timeframe, count)
+        series = self._indicator_series(candles, timeframe)
+        indicators = indicators_at(series, self.strategy.get_indicator_periods(timeframe), len(candles) - 1)
+        signal = self.strategy.analyze_candles(candles, timeframe=timeframe, indicators=indicators)
         
         # Add regime info
         signal['regime'] = self.current_regime
-        signal['regime_description'] = self.regime_detector.get_strategy_for_regime(self.current_regime).get('description', '')
+        signal['regime_description'] = self.parameter_sets[self.current_regime].get('description', '')
+        
+        return signal
+    
+    def generate_signal(self, symbol: str = "XAUUSD", timeframe: str = "H1", count: int = 100,
+                        candles: Optional[List[Dict]] = None,
+                        confluence_timeframes: Optional[List[str]] = None) -> Dict:
+        """
+        Generate signal with adaptive strategy
+        
+        Args:
+            symbol: Trading symbol
+            timeframe: Timeframe
+            count: Number of candles
+            candles: Optionele snapshot (bv. gedeeld met andere strategieën); anders één fetch
+            confluence_timeframes: Hogere timeframes voor 'confluence' (zelfde candles)
+        
+        Returns:
+            Signal dict
+        """
+        # Get candles (één keer per cyclus)
+        if candles is None:
+            candles = self.strategy.get_candlestick_data(symbol, timeframe, count)
         
+        signal = self.analyze_snapshot(candles, timeframe=timeframe, symbol=symbol)
+        if confluence_timeframes:
+            self.strategy.add_confluence(signal, symbol, timeframe, candles, confluence_timeframes)
         return signal
     
+    def generate_signal_from_chart(self, symbol: str = "XAUUSD", timeframe: str = "H1", count: int = 100,
+                                   confluence_timeframes: Optional[List[str]] = None) -> Dict:
+        """Zelfde interface als TradingStrategy (één fetch per aanroep)"""
+        return self.generate_signal(symbol, timeframe, count, confluence_timeframes=confluence_timeframes)
+    
     def get_regime_history(self) -> List[Dict]:
         """Get history of regime changes"""
         return self.regime_history
 
 if __name__ == "__main__":
-    from datetime import datetime
+    import time
     
-    # Test adaptive strategy
+    # Test adaptive strategy op een random walk snapshot
     strategy = AdaptiveStrategy()
     print("✅ Adaptive Strategy initialized")
+    
+    rng = np.random.default_rng(5)
+    closes = 2500 + np.cumsum(rng.normal(0, 3, 400))
+    candles = [{
+        'time': f"2024.01.{1 + i // 24:02d} {i % 24:02d}:00:00",
+        'open': closes[i - 1] if i else closes[0], 'close': closes[i],
+        'high': closes[i] + 1.5, 'low': closes[i] - 1.5, 'volume': 500.0
+    } for i in range(len(closes))]
+    
+    start = time.perf_counter()
+    for end in range(100, len(candles)):
+        signal = strategy.analyze_snapshot(candles[end - 100:end])
+    elapsed = (time.perf_counter() - start) / (len(candles) - 100) * 1000
+    print(f"⚡ {elapsed:.2f}ms per cycle, {len(strategy.regime_history)} regime switches")
+    print(f"Last signal: {signal['signal']} ({signal['confidence']}%), regime {signal['regime']}")
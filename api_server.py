@@ -6,8 +6,9 @@ Provides REST API endpoints for trading dashboard
 
 import os
 import json
+import threading
 from datetime import datetime, timedelta
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, send_file
 from flask_cors import CORS
 
 app = Flask(__name__)
@@ -60,27 +61,14 @@ def get_stats():
     """Get trading statistics - from MT5 account and history"""
     try:
         import requests
+        from market_data_cache import bridge_get
         
         # Try bridge first, then API server endpoints
-        account_data = {}
-        positions_data = {}
         history_data = {}
         
-        # Get account info - try bridge first
-        try:
-            account_response = requests.get('http://localhost:5002/account', timeout=2)
-            if account_response.status_code == 200:
-                account_data = account_response.json()
-        except:
-            pass
-
-        # Get positions - try bridge first
-        try:
-            positions_response = requests.get('http://localhost:5002/positions', timeout=2)
-            if positions_response.status_code == 200:
-                positions_data = positions_response.json()
-        except:
-            pass
+        # Get account info and positions - shared memory cache of the bridge, else the bridge
+        account_data = bridge_get('/account', timeout=2) or {}
+        positions_data = bridge_get('/positions', timeout=2) or {}
 
         # Get history - try bridge first
         try:
@@ -178,16 +166,11 @@ def get_stats():
 def mt5_account():
     """Get MT5 account information - tries bridge first"""
     try:
-        import requests
-        # Try bridge first
-        try:
-            bridge_response = requests.get('http://localhost:5002/account', timeout=5)
-            if bridge_response.status_code == 200:
-                account_data = bridge_response.json()
-                if account_data and not account_data.get('error') and account_data.get('balance') is not None:
-                    return jsonify(account_data)
-        except Exception as e:
-            print(f"Bridge error: {e}")
+        from market_data_cache import bridge_get
+        # Try bridge first (shared memory cache, then HTTP)
+        account_data = bridge_get('/account', timeout=5)
+        if account_data and not account_data.get('error') and account_data.get('balance') is not None:
+            return jsonify(account_data)
         
         return jsonify({'error': 'Unable to connect to MT5'}), 503
     except Exception as e:
@@ -197,13 +180,10 @@ def mt5_account():
 def mt5_positions():
     """Get MT5 positions - tries bridge first"""
     try:
-        import requests
-        try:
-            bridge_response = requests.get('http://localhost:5002/positions', timeout=5)
-            if bridge_response.status_code == 200:
-                return jsonify(bridge_response.json())
-        except:
-            pass
+        from market_data_cache import bridge_get
+        positions_data = bridge_get('/positions', timeout=5)
+        if positions_data is not None:
+            return jsonify(positions_data)
         return jsonify({'error': 'Unable to connect to MT5'}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -227,14 +207,11 @@ def mt5_history():
 def mt5_tick():
     """Get MT5 tick/price for a symbol - tries bridge first"""
     try:
-        import requests
+        from market_data_cache import bridge_get
         symbol = request.args.get('symbol', 'XAUUSD')
-        try:
-            bridge_response = requests.get(f'http://localhost:5002/tick/{symbol}', timeout=5)
-            if bridge_response.status_code == 200:
-                return jsonify(bridge_response.json())
-        except:
-            pass
+        tick_data = bridge_get(f'/tick/{symbol}', timeout=5)
+        if tick_data is not None:
+            return jsonify(tick_data)
         return jsonify({'error': 'Unable to connect to MT5'}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -243,20 +220,15 @@ def mt5_tick():
 def mt5_candles():
     """Get MT5 candlestick/OHLC data - tries bridge first"""
     try:
-        import requests
+        from market_data_cache import bridge_get
         symbol = request.args.get('symbol', 'XAUUSD')
         timeframe = request.args.get('timeframe', 'H1')
         count = request.args.get('count', type=int, default=100)
         
-        # Try bridge first
-        try:
-            bridge_response = requests.get(f'http://localhost:5002/candles/{symbol}/{timeframe}/{count}', timeout=10)
-            if bridge_response.status_code == 200:
-                data = bridge_response.json()
-                if 'error' not in data:
-                    return jsonify(data)
-        except Exception as bridge_error:
-            print(f"Bridge error: {bridge_error}")
+        # Try bridge first (shared memory cache, then HTTP)
+        data = bridge_get(f'/candles/{symbol}/{timeframe}/{count}', timeout=10)
+        if data is not None and 'error' not in data:
+            return jsonify(data)
         
         return jsonify({'error': 'Unable to connect to MT5. Please ensure the bridge is running.'}), 503
     except Exception as e:
@@ -316,17 +288,39 @@ def verify():
     except:
         return jsonify({'valid': False}), 401
 
+# Eén TradingStrategy voor alle signal requests: support/resistance indexes en
+# confluence aggregators blijven warm tussen requests. De candles worden buiten
+# de locks opgehaald; de analyse deelt één lock, confluence een lock per symbol/timeframe
+signal_strategy = None
+signal_strategy_lock = threading.Lock()
+confluence_locks = {}
+
 @app.route('/api/trading/signal', methods=['GET'])
 def get_trading_signal():
     """Get AI trading signal based on chart analysis"""
+    global signal_strategy
     try:
         from trading_strategy import TradingStrategy
         
         symbol = request.args.get('symbol', 'XAUUSD')
+        timeframe = request.args.get('timeframe', 'H1')
         count = request.args.get('count', type=int, default=100)
-        
-        strategy = TradingStrategy()
-        signal = strategy.generate_signal_from_chart(symbol=symbol, count=count)
+        # Hogere timeframes voor confluence, bv. ?timeframe=M5&confluence=H1,H4
+        confluence = [tf.strip() for tf in request.args.get('confluence', '').split(',') if tf.strip()]
+        
+        with signal_strategy_lock:
+            if signal_strategy is None:
+                signal_strategy = TradingStrategy()
+            strategy = signal_strategy
+            confluence_lock = confluence_locks.setdefault((symbol.upper(), timeframe.upper()), threading.Lock())
+        
+        candles = strategy.get_candlestick_data(symbol=symbol, timeframe=timeframe, count=count)
+        with signal_strategy_lock:
+            signal = strategy.analyze_candles(candles, timeframe=timeframe)
+        if confluence:
+            # Eerste keer per symbol/timeframe: sync + backfill via de bridge
+            with confluence_lock:
+                strategy.add_confluence(signal, symbol, timeframe, candles, confluence)
         
         return jsonify(signal)
     except Exception as e:
@@ -471,26 +465,92 @@ def run_backtest():
         days = data.get('days', 30)
         volume = data.get('volume', 0.20)
         initial_balance = data.get('initial_balance', 100000.0)
+        # Aantal equity punten voor de grafiek (LTTB), 0 voor volledige resolutie
+        max_points = int(data.get('max_points', 2000))
         
         # Create strategy and engine
         strategy = TradingStrategy()
         engine = BacktestingEngine(strategy, initial_balance=initial_balance)
         
-        # Run backtest
-        results = engine.run_backtest(
-            symbol=symbol,
-            timeframe=timeframe,
-            days=days,
-            volume=volume
-        )
+        regime = data.get('regime')
+        if regime:
+            # Regime-conditionele backtest: lokale history + opgeslagen regime kolom
+            from candle_store import CandleStore
+            from market_regime import REGIMES
+            if regime not in REGIMES:
+                return jsonify({'error': 'Unknown regime', 'message': f'Use one of {REGIMES}', 'success': False}), 400
+            store = CandleStore()
+            store.sync(symbol, timeframe, data.get('sync_count', 1000))
+            results = engine.run_backtest_on_candles(
+                store.load_candles(symbol, timeframe),
+                symbol=symbol,
+                timeframe=timeframe,
+                volume=volume,
+                entry_mask=store.regime_mask(symbol, timeframe, regime)
+            )
+            results['regime'] = regime
+        else:
+            # Run backtest
+            results = engine.run_backtest(
+                symbol=symbol,
+                timeframe=timeframe,
+                days=days,
+                volume=volume
+            )
         
-        return jsonify(results)
+        if results.get('error'):
+            return jsonify(results)
+        
+        # Volledig resultaat compact bewaren, response met downsampled equity
+        from backtest_results import BacktestResult, BacktestResultStore
+        result = BacktestResult.from_backtest(results)
+        BacktestResultStore().save(result)
+        return jsonify(result.to_response(max_points=max_points))
     except Exception as e:
         print(f"Backtest error: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e), 'success': False}), 500
 
+@app.route('/api/backtest/results/<result_id>', methods=['GET'])
+def get_backtest_result(result_id):
+    """
+    Haal een bewaard backtest resultaat op
+    
+    Query params:
+        format: json (default), npz of arrow
+        max_points: Equity punten voor json (default: volledige resolutie)
+        table: equity of trades (alleen voor arrow)
+    """
+    try:
+        from backtest_results import BacktestResultStore
+        
+        store = BacktestResultStore()
+        path = store.path(result_id)
+        if not path:
+            return jsonify({'error': 'Result not found', 'result_id': result_id}), 404
+        
+        output_format = request.args.get('format', 'json')
+        if output_format == 'npz':
+            return send_file(os.path.abspath(path), mimetype='application/octet-stream',
+                             as_attachment=True, download_name=f"backtest_{result_id}.npz")
+        
+        result = store.load(result_id)
+        if output_format == 'arrow':
+            files = result.save_arrow(store.storage_dir)
+            if files.get('error'):
+                return jsonify(files), 501
+            table = request.args.get('table', 'equity')
+            if table not in files:
+                return jsonify({'error': f'Unknown table: {table}'}), 400
+            return send_file(os.path.abspath(files[table]), mimetype='application/vnd.apache.arrow.file',
+                             as_attachment=True, download_name=os.path.basename(files[table]))
+        
+        max_points = request.args.get('max_points', type=int)
+        return jsonify(result.to_response(max_points=max_points))
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
 @app.route('/api/backtest/metrics', methods=['POST'])
 def calculate_backtest_metrics():
     """Bereken alleen metrics van bestaande trades"""
@@ -504,7 +564,7 @@ def calculate_backtest_metrics():
         if not trades:
             return jsonify({'error': 'No trades provided'}), 400
         
-        metrics = PerformanceMetrics(trades, equity_curve)
+        metrics = PerformanceMetrics(trades, equity_curve, timeframe=data.get('timeframe', 'H1'))
         results = metrics.calculate_all_metrics()
         
         return jsonify({
@@ -514,6 +574,52 @@ def calculate_backtest_metrics():
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
+@app.route('/api/backtest/portfolio', methods=['POST'])
+def run_portfolio_backtest():
+    """
+    Multi-strategy portfolio backtest over de lokale candle history
+    
+    Body:
+        strategies: [{name, type, weight, parameters, ml_model_path}]
+        schemes: Gewicht schema's om te vergelijken (default: static, equal, performance)
+        window / refit_every: Rolling venster en refit interval (bars) voor 'performance'
+    """
+    try:
+        from candle_store import CandleStore
+        from portfolio_backtester import PortfolioBacktester, WEIGHT_SCHEMES
+        
+        data = request.json or {}
+        symbol = data.get('symbol', 'XAUUSD')
+        timeframe = data.get('timeframe', 'H1')
+        strategies = data.get('strategies') or [{'name': 'standard'}, {'name': 'adaptive', 'type': 'adaptive'}]
+        
+        backtester = PortfolioBacktester(initial_balance=data.get('initial_balance', 100000.0))
+        for strategy in strategies:
+            if not strategy.get('name'):
+                return jsonify({'error': 'Strategy name is required', 'success': False}), 400
+            backtester.add_strategy(strategy['name'], strategy_type=strategy.get('type', 'standard'),
+                                    weight=strategy.get('weight', 1.0), parameters=strategy.get('parameters'),
+                                    ml_model_path=strategy.get('ml_model_path'))
+        
+        store = CandleStore()
+        store.sync(symbol, timeframe, data.get('sync_count', 1000))
+        results = backtester.run(
+            symbol=symbol,
+            timeframe=timeframe,
+            volume=data.get('volume', 0.20),
+            schemes=data.get('schemes', WEIGHT_SCHEMES),
+            window=int(data.get('window', 500)),
+            refit_every=int(data.get('refit_every', 100)),
+            candle_store=store,
+            max_points=int(data.get('max_points', 500))
+        )
+        if results.get('error'):
+            return jsonify({**results, 'success': False}), 400
+        return jsonify(results)
+    except Exception as e:
+        print(f"Portfolio backtest error: {e}")
+        return jsonify({'error': str(e), 'success': False}), 500
+
 @app.route('/api/optimize/parameters', methods=['POST'])
 def optimize_parameters():
     """Run parameter optimization"""
@@ -522,7 +628,7 @@ def optimize_parameters():
         from trading_strategy import TradingStrategy
         
         data = request.json or {}
-        method = data.get('method', 'grid_search')  # 'grid_search' or 'genetic'
+        method = data.get('method', 'grid_search')  # 'grid_search', 'genetic', 'bayesian', 'walk_forward' or 'regime'
         symbol = data.get('symbol', 'XAUUSD')
         timeframe = data.get('timeframe', 'H1')
         days = data.get('days', 30)
@@ -532,7 +638,63 @@ def optimize_parameters():
         
         optimizer = ParameterOptimizer(TradingStrategy)
         
-        if method == 'genetic':
+        if method == 'walk_forward':
+            from candle_store import CandleStore
+            
+            # Vul de lokale history aan voordat de folds worden opgebouwd
+            store = CandleStore()
+            store.sync(symbol, timeframe, data.get('sync_count', 1000))
+            results = optimizer.walk_forward(
+                symbol=symbol,
+                timeframe=timeframe,
+                volume=volume,
+                train_bars=data.get('train_bars', 500),
+                test_bars=data.get('test_bars', 100),
+                mode=data.get('mode', 'rolling'),
+                method=data.get('fold_method', 'grid_search'),
+                objective=objective,
+                max_combinations=max_combinations,
+                population_size=data.get('population_size', 20),
+                generations=data.get('generations', 10),
+                workers=data.get('workers'),
+                candle_store=store
+            )
+        elif method == 'regime':
+            from candle_store import CandleStore
+            from market_regime import REGIME_PARAMETERS_FILE
+            
+            # Parameters per regime; AdaptiveStrategy laadt het resultaat uit REGIME_PARAMETERS_FILE
+            store = CandleStore()
+            store.sync(symbol, timeframe, data.get('sync_count', 1000))
+            results = optimizer.optimize_regimes(
+                symbol=symbol,
+                timeframe=timeframe,
+                volume=volume,
+                method=data.get('regime_method', 'grid_search'),
+                objective=objective,
+                regimes=data.get('regimes'),
+                min_bars=data.get('min_bars', 100),
+                max_combinations=max_combinations,
+                population_size=data.get('population_size', 20),
+                generations=data.get('generations', 10),
+                candle_store=store,
+                output_file=REGIME_PARAMETERS_FILE if data.get('save', True) else None
+            )
+        elif method == 'bayesian':
+            from candle_store import CandleStore
+            
+            store = CandleStore()
+            store.sync(symbol, timeframe, data.get('sync_count', 1000))
+            results = optimizer.bayesian_search(
+                symbol=symbol,
+                timeframe=timeframe,
+                volume=volume,
+                objective=objective,
+                n_rounds=data.get('n_rounds', 6),
+                eta=data.get('eta', 3),
+                candle_store=store
+            )
+        elif method == 'genetic':
             population_size = data.get('population_size', 20)
             generations = data.get('generations', 10)
             results = optimizer.genetic_algorithm(
@@ -565,6 +727,72 @@ def optimize_parameters():
         traceback.print_exc()
         return jsonify({'error': str(e), 'success': False}), 500
 
+@app.route('/api/regimes', methods=['GET'])
+def get_regimes():
+    """Regime samenvatting en intervallen uit de lokale candle history"""
+    try:
+        from candle_store import CandleStore
+        from market_regime import REGIMES
+        
+        symbol = request.args.get('symbol', 'XAUUSD')
+        timeframe = request.args.get('timeframe', 'H1')
+        regime = request.args.get('regime')
+        limit = request.args.get('limit', type=int, default=50)
+        min_bars = request.args.get('min_bars', type=int, default=1)
+        if regime and regime not in REGIMES:
+            return jsonify({'error': 'Unknown regime', 'message': f'Use one of {REGIMES}', 'success': False}), 400
+        
+        store = CandleStore()
+        if request.args.get('sync', 'false').lower() == 'true':
+            store.sync(symbol, timeframe, request.args.get('count', type=int, default=1000))
+        if not store.count(symbol, timeframe):
+            return jsonify({'error': 'No candle history', 'message': f'No stored candles for {symbol} {timeframe}', 'success': False}), 404
+        
+        intervals = store.regime_intervals(symbol, timeframe, regime=regime, min_bars=min_bars)
+        return jsonify({
+            'success': True,
+            'symbol': symbol,
+            'timeframe': timeframe,
+            'current_regime': store.regime_intervals(symbol, timeframe)[-1]['regime'],
+            'summary': store.regime_summary(symbol, timeframe),
+            'intervals': intervals[-limit:] if limit else intervals,
+            'total_intervals': len(intervals)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+@app.route('/api/patterns', methods=['GET'])
+def get_patterns():
+    """Candlestick pattern frequentie en forward returns uit de lokale candle history"""
+    try:
+        from candle_store import CandleStore
+        from candle_patterns import patterns_at
+        
+        symbol = request.args.get('symbol', 'XAUUSD')
+        timeframe = request.args.get('timeframe', 'H1')
+        horizon = request.args.get('horizon', type=int, default=10)
+        if horizon < 1:
+            return jsonify({'error': 'Invalid horizon', 'message': 'horizon must be at least 1 bar', 'success': False}), 400
+        
+        store = CandleStore()
+        if request.args.get('sync', 'false').lower() == 'true':
+            store.sync(symbol, timeframe, request.args.get('count', type=int, default=1000))
+        bars = store.count(symbol, timeframe)
+        if not bars:
+            return jsonify({'error': 'No candle history', 'message': f'No stored candles for {symbol} {timeframe}', 'success': False}), 404
+        
+        return jsonify({
+            'success': True,
+            'symbol': symbol,
+            'timeframe': timeframe,
+            'bars': bars,
+            'horizon': horizon,
+            'current': patterns_at(store.load_patterns(symbol, timeframe), bars - 1),
+            'patterns': store.pattern_summary(symbol, timeframe, horizon=horizon)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
 @app.route('/api/strategies', methods=['GET'])
 def get_strategies():
     """Get all saved strategies"""
@@ -657,26 +885,115 @@ def train_ml_model():
     """Train ML model on historical data"""
     try:
         from ml_model import MLTradingModel
-        from ml_features import MLFeatureEngineer
-        from trading_strategy import TradingStrategy
+        from ml_labeling import LabelingEngine
+        from ml_feature_matrix import FEATURE_NAMES
+        from ml_validation import ModelValidator
+        from ml_registry import get_model_registry
+        from candle_store import CandleStore
         
         data = request.json or {}
         model_type = data.get('model_type', 'random_forest')
         symbol = data.get('symbol', 'XAUUSD')
         timeframe = data.get('timeframe', 'H1')
-        days = data.get('days', 90)  # Use 90 days for training
+        count = int(data.get('count', 5000))  # Candles om te syncen vanuit MT5
         save_path = data.get('save_path', 'ml_models/xauusd_model.pkl')
         
-        # This is a simplified training - in production, you'd need labeled historical data
-        # For now, we'll create a model structure that can be trained later
+        # Labels: triple barrier (TP/SL zoals calculate_dynamic_tp_sl) of forward return
+        labeler = LabelingEngine(
+            method=data.get('label_method', 'triple_barrier'),
+            timeframe=timeframe,
+            horizon=int(data.get('horizon', 24)),
+            risk_reward_ratio=float(data.get('risk_reward_ratio', 2.0)),
+            sl_percent=data.get('sl_percent'),
+            threshold=float(data.get('threshold', 0.002)),
+            intrabar=bool(data.get('intrabar', False))
+        )
+        
+        # History uit de lokale candle store (aangevuld via de bridge)
+        store = CandleStore()
+        store.sync(symbol, timeframe, count)
+        arrays = store.load_arrays(symbol, timeframe)
+        
+        X, y, index = labeler.build_dataset(arrays)
+        distribution = labeler.get_label_distribution(y)
+        if len(X) < 100 or sum(1 for value in distribution.values() if value >= 2) < 2:
+            return jsonify({
+                'error': 'Insufficient labeled data',
+                'message': f'{len(arrays["time"])} candles, {len(X)} labeled rows',
+                'label_distribution': distribution,
+                'success': False
+            }), 400
+        
+        test_size = float(data.get('test_size', 0.2))
+        validation = None
+        if data.get('search'):
+            # Purged walk-forward CV + hyperparameter search over een process pool
+            validator = ModelValidator(
+                model_type=model_type,
+                n_splits=int(data.get('cv_folds', 5)),
+                purge=labeler.horizon,
+                embargo=int(data.get('embargo', 0)),
+                mode=data.get('cv_mode', 'walk_forward'),
+                scoring=data.get('scoring', 'accuracy'),
+                workers=int(data['workers']) if data.get('workers') else None
+            )
+            validation = validator.search(X, y, data.get('param_grid'), index=index)
+            if validation.get('error'):
+                return jsonify({**validation, 'success': False}), 400
+            model = validator.fit_best(X, y, validation, feature_names=FEATURE_NAMES, test_size=test_size)
+            metrics = model.training_metrics
+        else:
+            model = MLTradingModel(model_type=model_type, model_params=data.get('model_params'))
+            model.feature_names = list(FEATURE_NAMES)
+            # Chronologische split met purge: geen toekomstige bars in de train set
+            metrics = model.train(X, y, test_size=test_size,
+                                  time_series=bool(data.get('time_series', True)), purge=labeler.horizon)
+        if metrics.get('error'):
+            return jsonify({**metrics, 'success': False}), 400
+        
+        # Optioneel: snoei features met lage importance (inference rekent alleen de rest)
+        selection = None
+        if data.get('feature_selection'):
+            selection = model.select_features(
+                X, y,
+                cumulative=float(data.get('importance_cumulative', 0.95)),
+                min_features=int(data.get('min_features', 5)),
+                max_features=int(data['max_features']) if data.get('max_features') else None,
+                test_size=test_size,
+                purge=labeler.horizon
+            )
+            if selection.get('error'):
+                return jsonify({**selection, 'success': False}), 400
+            metrics = model.training_metrics
+        
+        # Labeling bij het model bewaren: retraining scoort op dezelfde labels
+        model.training_metrics['labeling'] = labeler.get_config()
+        
+        os.makedirs(os.path.dirname(save_path) or '.', exist_ok=True)
+        model.save_model(save_path)
+        if validation:
+            get_model_registry().record_validation(save_path, validation)
         
-        model = MLTradingModel(model_type=model_type)
+        # Optioneel: compact .npz naast de pickle voor snelle live inference
+        compact = None
+        if data.get('export_compact') and model.model_type == 'random_forest':
+            compact = model.export_compact(os.path.splitext(save_path)[0] + '.npz')
         
         return jsonify({
             'success': True,
-            'message': 'ML model structure created. Training requires labeled historical data.',
-            'model_type': model_type,
-            'note': 'Full training implementation requires historical labeled data'
+            'model_type': model.model_type,
+            'model_path': save_path,
+            'compact_model': compact,
+            'symbol': symbol,
+            'timeframe': timeframe,
+            'samples': int(len(X)),
+            'features': len(model.feature_names),
+            'label_method': labeler.method,
+            'label_distribution': distribution,
+            'train_accuracy': metrics.get('train_accuracy'),
+            'test_accuracy': metrics.get('test_accuracy'),
+            'cross_validation': metrics.get('cross_validation'),
+            'feature_selection': selection
         })
     except Exception as e:
         import traceback
@@ -687,8 +1004,8 @@ def train_ml_model():
 def ml_predict():
     """Get ML prediction for current market"""
     try:
-        from ml_strategy import MLTradingStrategy
-        from ml_model import MLTradingModel
+        from ml_registry import get_model_registry
+        from trading_strategy import TradingStrategy
         
         data = request.json or {}
         symbol = data.get('symbol', 'XAUUSD')
@@ -699,14 +1016,14 @@ def ml_predict():
         if not model_path:
             return jsonify({'error': 'model_path is required'}), 400
         
-        # Load model and get prediction
-        model = MLTradingModel(model_path=model_path)
-        if not model.trained:
-            return jsonify({'error': 'Model not trained'}), 400
+        # Model blijft geladen in de registry (herlaadt alleen als het bestand verandert)
+        registry = get_model_registry()
+        model = registry.get(model_path)
+        if model is None:
+            return jsonify({'error': 'Model not found', 'model_path': model_path}), 404
         
         # Get candles
-        strategy = MLTradingStrategy(ml_model_path=model_path)
-        candles = strategy.get_candlestick_data(symbol, timeframe, count)
+        candles = TradingStrategy().get_candlestick_data(symbol, timeframe, count)
         
         if not candles:
             return jsonify({'error': 'Could not fetch candles'}), 400
@@ -715,7 +1032,116 @@ def ml_predict():
         
         return jsonify({
             'success': True,
-            'prediction': prediction
+            'prediction': prediction,
+            'model_version': registry.get_metadata(model_path)['version']
+        })
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+@app.route('/api/ml/predict/batch', methods=['POST'])
+def ml_predict_batch():
+    """
+    Score veel rijen in één model call
+    
+    Body: model_path plus één van
+        features: [[...], ...] (optioneel feature_names voor de kolom volgorde)
+        symbols: ['XAUUSD', ...] met timeframe/count: laatste bar per symbol
+    """
+    try:
+        from ml_registry import get_model_registry
+        from ml_feature_matrix import FeatureMatrixBuilder
+        from trading_strategy import TradingStrategy
+        import numpy as np
+        
+        data = request.json or {}
+        model_path = data.get('model_path', None)
+        if not model_path:
+            return jsonify({'error': 'model_path is required'}), 400
+        
+        registry = get_model_registry()
+        model = registry.get(model_path)
+        if model is None:
+            return jsonify({'error': 'Model not found', 'model_path': model_path}), 404
+        
+        if data.get('features') is not None:
+            X = np.asarray(data['features'], dtype=np.float64)
+            result = model.predict_many(X, data.get('feature_names'))
+        elif data.get('symbols'):
+            timeframe = data.get('timeframe', 'H1')
+            count = max(int(data.get('count', 100)), 50)
+            strategy = TradingStrategy()
+            # Alleen de features die het model gebruikt
+            builder = FeatureMatrixBuilder(feature_set=model.feature_names or None)
+            rows = []
+            symbols = []
+            skipped = []
+            for symbol in data['symbols']:
+                candles = strategy.get_candlestick_data(symbol, timeframe, count)
+                if len(candles) < builder.lookback:
+                    skipped.append(symbol)
+                    continue
+                X, _ = builder.build(candles[-builder.lookback:])
+                rows.append(X[-1])
+                symbols.append(symbol)
+            if not rows:
+                return jsonify({'error': 'Could not fetch candles', 'skipped': skipped}), 400
+            result = model.predict_many(np.vstack(rows), builder.feature_names)
+            result['symbols'] = symbols
+            result['skipped'] = skipped
+        else:
+            return jsonify({'error': 'features or symbols is required'}), 400
+        
+        if result.get('error'):
+            return jsonify({**result, 'success': False}), 400
+        
+        return jsonify({
+            'success': True,
+            **result,
+            'model_version': registry.get_metadata(model_path)['version']
+        })
+    except ValueError as e:
+        # Feature namen passen niet bij het model (ontbrekende features)
+        return jsonify({'error': str(e), 'success': False}), 400
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+@app.route('/api/ml/export', methods=['POST'])
+def ml_export_model():
+    """Exporteer een getraind model naar het compacte .npz inference formaat"""
+    try:
+        from ml_model import MLTradingModel
+        
+        data = request.json or {}
+        model_path = data.get('model_path', None)
+        if not model_path:
+            return jsonify({'error': 'model_path is required'}), 400
+        if not os.path.exists(model_path):
+            return jsonify({'error': 'Model not found', 'model_path': model_path}), 404
+        
+        output_path = data.get('output_path') or os.path.splitext(model_path)[0] + '.npz'
+        model = MLTradingModel(model_path=model_path)
+        try:
+            info = model.export_compact(output_path)
+        except ValueError as e:
+            return jsonify({'error': 'Export not supported', 'message': str(e), 'success': False}), 400
+        
+        return jsonify({
+            'success': True,
+            **info,
+            'source_size': os.path.getsize(model_path)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+@app.route('/api/ml/models', methods=['GET'])
+def list_ml_models():
+    """Geladen modellen in de registry, met versie en metadata"""
+    try:
+        from ml_registry import get_model_registry
+        
+        return jsonify({
+            'success': True,
+            'models': get_model_registry().list_models()
         })
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
@@ -739,6 +1165,77 @@ def get_ml_performance():
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
+# Retraining services per model pad (achtergrond fit blijft buiten de request)
+ml_retraining_services = {}
+
+@app.route('/api/ml/retrain', methods=['POST'])
+def ml_retrain():
+    """
+    Hertrain het model als de monitor een dalende accuracy ziet (of met force)
+    
+    Keert direct terug; status via GET /api/ml/retrain/status
+    """
+    try:
+        from ml_retraining import RetrainingService
+        from ml_labeling import LabelingEngine
+        
+        data = request.json or {}
+        model_path = data.get('model_path', None)
+        if not model_path:
+            return jsonify({'error': 'model_path is required'}), 400
+        
+        key = os.path.abspath(model_path)
+        service = ml_retraining_services.get(key)
+        if service is None:
+            timeframe = data.get('timeframe', 'H1')
+            # Zonder labeling parameters gebruikt de service de labeling van het model
+            labeler = None
+            if any(name in data for name in ('label_method', 'horizon', 'risk_reward_ratio', 'sl_percent',
+                                             'threshold', 'intrabar')):
+                labeler = LabelingEngine(
+                    method=data.get('label_method', 'triple_barrier'),
+                    timeframe=timeframe,
+                    horizon=int(data.get('horizon', 24)),
+                    risk_reward_ratio=float(data.get('risk_reward_ratio', 2.0)),
+                    sl_percent=data.get('sl_percent'),
+                    threshold=float(data.get('threshold', 0.002)),
+                    intrabar=bool(data.get('intrabar', False))
+                )
+            service = RetrainingService(
+                model_path,
+                symbol=data.get('symbol', 'XAUUSD'),
+                timeframe=timeframe,
+                labeler=labeler,
+                window=int(data.get('window', 5000)),
+                min_accuracy=float(data.get('min_accuracy', 50.0)),
+                min_improvement=float(data.get('min_improvement', 0.0)),
+                extra_trees=int(data.get('extra_trees', 50)),
+                compact_path=data.get('compact_path')
+            )
+            ml_retraining_services[key] = service
+        
+        result = service.check_and_retrain(force=bool(data.get('force', False)))
+        status_code = 400 if result['status'] == 'error' else 200
+        return jsonify({'success': result['status'] != 'error', **result}), status_code
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+@app.route('/api/ml/retrain/status', methods=['GET'])
+def ml_retrain_status():
+    """Status en historie van de retraining service voor een model"""
+    try:
+        model_path = request.args.get('model_path')
+        if not model_path:
+            return jsonify({'error': 'model_path is required'}), 400
+        
+        service = ml_retraining_services.get(os.path.abspath(model_path))
+        if service is None:
+            return jsonify({'error': 'No retraining service for this model', 'model_path': model_path}), 404
+        
+        return jsonify({'success': True, **service.get_status()})
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
 @app.route('/api/webhooks', methods=['GET'])
 def get_webhooks():
     """Get all registered webhooks"""
@@ -1033,9 +1530,9 @@ def live_trader_stats():
     """Get live trader statistics with risk metrics"""
     try:
         from LIVE.risk_manager import RiskManager
-        import requests
+        from market_data_cache import bridge_get
         
-        # Get account balance and margin info from MT5 bridge
+        # Get account balance and margin info from MT5 bridge (shared memory cache first)
         account_balance = 0.0
         equity = 0.0
         margin_used = 0.0
@@ -1043,24 +1540,21 @@ def live_trader_stats():
         margin_level = 0.0
         
         try:
-            bridge_response = requests.get('http://localhost:5002/account', timeout=2)
-            if bridge_response.status_code == 200:
-                bridge_data = bridge_response.json()
-                if not bridge_data.get('error'):
-                    account_balance = float(bridge_data.get('balance', 0))
-                    equity = float(bridge_data.get('equity', account_balance))
-                    margin_used = float(bridge_data.get('margin', 0))
-                    free_margin = float(bridge_data.get('free_margin', account_balance))
-                    margin_level = float(bridge_data.get('margin_level', 0))
+            bridge_data = bridge_get('/account', timeout=2)
+            if bridge_data and not bridge_data.get('error'):
+                account_balance = float(bridge_data.get('balance', 0))
+                equity = float(bridge_data.get('equity', account_balance))
+                margin_used = float(bridge_data.get('margin', 0))
+                free_margin = float(bridge_data.get('free_margin', account_balance))
+                margin_level = float(bridge_data.get('margin_level', 0))
         except Exception as e:
             print(f"Warning: Could not get account balance from MT5: {e}")
         
         # Get positions for exposure calculation
         total_exposure = 0.0
         try:
-            positions_response = requests.get('http://localhost:5002/positions', timeout=2)
-            if positions_response.status_code == 200:
-                positions_data = positions_response.json()
+            positions_data = bridge_get('/positions', timeout=2)
+            if positions_data is not None:
                 positions = positions_data.get('positions', [])
                 # Calculate total exposure (volume * current price)
                 for pos in positions:
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Backtest Results
+Compacte opslag van backtest resultaten: float64 equity curve en trades als
+structured NumPy array, met binaire export (npz / Arrow) en LTTB downsampling
+voor de dashboard grafiek
+"""
+
+import os
+import json
+import uuid
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from candle_store import parse_candle_time, format_candle_time
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+    print("⚠️  pyarrow not available, Arrow export disabled")
+
+# Eén record per trade (tijden als epoch seconden)
+TRADE_DTYPE = np.dtype([
+    ('type', 'U4'),
+    ('entry_price', 'f8'),
+    ('exit_price', 'f8'),
+    ('entry_time', 'i8'),
+    ('exit_time', 'i8'),
+    ('volume', 'f8'),
+    ('pnl', 'f8'),
+    ('reason', 'U32'),
+    ('profit', '?'),
+    ('duration_candles', 'i4')
+])
+
+def lttb(values: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling
+
+    Behoudt de visuele vorm (pieken en dalen) van een curve met `threshold` punten.
+
+    Args:
+        values: Y waarden (x = index)
+        threshold: Gewenst aantal punten (eerste en laatste punt blijven altijd)
+
+    Returns:
+        Gesorteerde indices van de gekozen punten
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Punten tussen eerste en laatste verdeeld over threshold - 2 buckets
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        # Gemiddelde van de volgende bucket als derde hoekpunt
+        next_start = end
+        next_end = min(int((bucket + 2) * every) + 1, n)
+        avg_x = (next_start + next_end - 1) / 2.0
+        avg_y = values[next_start:next_end].mean()
+
+        xs = np.arange(start, end)
+        areas = np.abs((previous - avg_x) * (values[start:end] - values[previous])
+                       - (previous - xs) * (avg_y - values[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+
+    return selected
+
+class BacktestResult:
+    """
+    Array-backed backtest resultaat
+
+    equity: float64 equity per bar (eerste punt = initial balance)
+    trades: structured array met TRADE_DTYPE
+    """
+
+    def __init__(self, equity: np.ndarray, trades: np.ndarray, metrics: Dict, meta: Optional[Dict] = None,
+                 result_id: Optional[str] = None):
+        self.equity = np.asarray(equity, dtype=np.float64)
+        self.trades = np.asarray(trades, dtype=TRADE_DTYPE)
+        self.metrics = metrics
+        self.meta = meta or {}
+        self.result_id = result_id or uuid.uuid4().hex[:12]
+
+    @classmethod
+    def from_backtest(cls, results: Dict) -> 'BacktestResult':
+        """Converteer de dict van BacktestingEngine.run_backtest"""
+        trades = results.get('trades', [])
+        records = np.empty(len(trades), dtype=TRADE_DTYPE)
+        for i, trade in enumerate(trades):
+            records[i] = (
+                trade.get('type', ''),
+                float(trade.get('entry_price', 0)),
+                float(trade.get('exit_price', 0)),
+                parse_candle_time(trade['entry_time']) if trade.get('entry_time') else 0,
+                parse_candle_time(trade['exit_time']) if trade.get('exit_time') else 0,
+                float(trade.get('volume', 0)),
+                float(trade.get('pnl', 0)),
+                trade.get('reason', ''),
+                bool(trade.get('profit', False)),
+                int(trade.get('duration_candles', 0))
+            )
+
+        meta = {key: value for key, value in results.items()
+                if key not in ('trades', 'equity_curve', 'metrics')}
+        return cls(np.asarray(results.get('equity_curve', []), dtype=np.float64), records,
+                   results.get('metrics', {}), meta)
+
+    def trades_as_dicts(self, start: int = 0, end: Optional[int] = None) -> List[Dict]:
+        """Trades in het oude dict formaat (tijden weer als EA strings)"""
+        trades = []
+        for record in self.trades[start:end]:
+            trades.append({
+                'type': str(record['type']),
+                'entry_price': round(float(record['entry_price']), 2),
+                'exit_price': round(float(record['exit_price']), 2),
+                'entry_time': format_candle_time(record['entry_time']),
+                'exit_time': format_candle_time(record['exit_time']),
+                'volume': float(record['volume']),
+                'pnl': float(record['pnl']),
+                'reason': str(record['reason']),
+                'profit': bool(record['profit']),
+                'duration_candles': int(record['duration_candles'])
+            })
+        return trades
+
+    def downsample(self, max_points: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Equity curve voor een grafiek
+
+        Returns:
+            (indices, values), volledige resolutie als max_points leeg is
+        """
+        if not max_points or max_points >= len(self.equity):
+            indices = np.arange(len(self.equity))
+        else:
+            indices = lttb(self.equity, int(max_points))
+        return indices, self.equity[indices]
+
+    def to_response(self, max_points: Optional[int] = None, include_trades: bool = True) -> Dict:
+        """
+        JSON response voor de API (zelfde velden als run_backtest)
+
+        Args:
+            max_points: Aantal equity punten (LTTB), None/0 voor volledige resolutie
+            include_trades: Trades meesturen
+        """
+        indices, values = self.downsample(max_points)
+        response = dict(self.meta)
+        response.update({
+            'result_id': self.result_id,
+            'metrics': self.metrics,
+            'equity_curve': np.round(values, 2).tolist(),
+            'equity_index': indices.tolist(),
+            'equity_points_total': int(len(self.equity)),
+            'downsampled': bool(len(indices) < len(self.equity)),
+            'trades': self.trades_as_dicts() if include_trades else [],
+            'total_trades': int(len(self.trades))
+        })
+        return response
+
+    def save_npz(self, path: str):
+        """Schrijf het resultaat als .npz (metrics/meta als JSON string)"""
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(
+            tmp_path,
+            equity=self.equity,
+            trades=self.trades,
+            info=np.array(json.dumps({'result_id': self.result_id, 'metrics': self.metrics, 'meta': self.meta},
+                                     default=str))
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_npz(cls, path: str) -> 'BacktestResult':
+        """Laad een resultaat dat met save_npz is weggeschreven"""
+        with np.load(path) as data:
+            info = json.loads(str(data['info']))
+            return cls(data['equity'], data['trades'], info.get('metrics', {}), info.get('meta', {}),
+                       result_id=info.get('result_id'))
+
+    def save_arrow(self, directory: str) -> Dict[str, str]:
+        """
+        Schrijf equity en trades als Arrow (Feather) bestanden
+
+        Returns:
+            {'equity': path, 'trades': path} of een error dict zonder pyarrow
+        """
+        if not ARROW_AVAILABLE:
+            return {'error': 'pyarrow not installed', 'message': 'pip install pyarrow for Arrow export'}
+
+        os.makedirs(directory, exist_ok=True)
+        equity_path = os.path.join(directory, f"{self.result_id}_equity.arrow")
+        trades_path = os.path.join(directory, f"{self.result_id}_trades.arrow")
+        feather.write_feather(pa.table({'equity': self.equity}), equity_path)
+        feather.write_feather(pa.table({name: self.trades[name] for name in TRADE_DTYPE.names}), trades_path)
+        return {'equity': equity_path, 'trades': trades_path}
+
+class BacktestResultStore:
+    """Bewaar volledige resultaten op disk zodat de API ze later op volle resolutie kan leveren"""
+
+    def __init__(self, storage_dir: str = 'backtest_results', max_results: int = 50):
+        self.storage_dir = storage_dir
+        self.max_results = max_results
+
+    def _path(self, result_id: str) -> str:
+        # Alleen hex ids, geen paden uit een request
+        safe_id = ''.join(ch for ch in result_id if ch in '0123456789abcdef')
+        return os.path.join(self.storage_dir, f"{safe_id}.npz")
+
+    def save(self, result: BacktestResult) -> str:
+        os.makedirs(self.storage_dir, exist_ok=True)
+        result.save_npz(self._path(result.result_id))
+        self._cleanup()
+        return result.result_id
+
+    def path(self, result_id: str) -> Optional[str]:
+        path = self._path(result_id)
+        return path if os.path.exists(path) else None
+
+    def load(self, result_id: str) -> Optional[BacktestResult]:
+        path = self.path(result_id)
+        return BacktestResult.load_npz(path) if path else None
+
+    def _cleanup(self):
+        """Houd alleen de laatste max_results resultaten (inclusief hun Arrow exports)"""
+        files = [os.path.join(self.storage_dir, name) for name in os.listdir(self.storage_dir)
+                 if name.endswith('.npz') and not name.endswith('.tmp.npz')]
+        files.sort(key=os.path.getmtime)
+        for path in files[:-self.max_results]:
+            base = path[:-len('.npz')]
+            for stale in (path, f"{base}_equity.arrow", f"{base}_trades.arrow"):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+if __name__ == "__main__":
+    # Test compacte resultaten met een random walk equity curve
+    rng = np.random.default_rng(1)
+    equity = 100000 + np.cumsum(rng.normal(2, 80, 100000))
+    trades = [{
+        'type': 'BUY', 'entry_price': 2000.0, 'exit_price': 2010.0,
+        'entry_time': '2024.01.02 10:00:00', 'exit_time': '2024.01.02 15:00:00',
+        'volume': 0.2, 'pnl': 200.0, 'reason': 'Take Profit', 'profit': True, 'duration_candles': 5
+    }] * 500
+    result = BacktestResult.from_backtest({'equity_curve': equity.tolist(), 'trades': trades, 'metrics': {},
+                                           'symbol': 'XAUUSD', 'timeframe': 'H1'})
+
+    full = json.dumps(result.to_response())
+    small = json.dumps(result.to_response(max_points=1000))
+    print(f"📦 Full JSON: {len(full) / 1024:.0f} KB, downsampled: {len(small) / 1024:.0f} KB")
+
+    store = BacktestResultStore('/tmp/backtest_results_test')
+    result_id = store.save(result)
+    loaded = store.load(result_id)
+    print(f"✅ Reloaded {result_id}: {len(loaded.equity)} equity points, {len(loaded.trades)} trades "
+          f"({os.path.getsize(store.path(result_id)) / 1024:.0f} KB on disk)")
@@ -5,21 +5,36 @@ Test strategie op historische data
 """
 
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence
 from trading_strategy import TradingStrategy
-from performance_metrics import PerformanceMetrics
+from performance_metrics import MetricsAccumulator
+from indicator_series import indicators_at, ANALYSIS_WINDOW, IndicatorCache
+from candle_patterns import pattern_columns_from_candles, patterns_at
 import requests
 
+# Aantal candles nodig voordat indicatoren betrouwbaar zijn
+WARMUP_CANDLES = 50
+
 class BacktestingEngine:
-    def __init__(self, strategy: TradingStrategy, initial_balance: float = 100000.0, bridge_url: str = "http://localhost:5002"):
+    def __init__(self, strategy: TradingStrategy, initial_balance: float = 100000.0, bridge_url: str = "http://localhost:5002",
+                 verbose: bool = True, indicator_cache: Optional[IndicatorCache] = None):
         self.strategy = strategy
+        self.indicator_cache = indicator_cache
         self.bridge_url = bridge_url
         self.initial_balance = initial_balance
         self.current_balance = initial_balance
+        self.verbose = verbose
         self.trades = []
         self.equity_curve = [initial_balance]
+        self.metrics = MetricsAccumulator(initial_balance)
         self.open_position = None
         self.current_candles = []
+        self.current_index = 0
+    
+    def log(self, message: str):
+        """Print alleen als verbose aan staat (optimizer runs draaien stil)"""
+        if self.verbose:
+            print(message)
         
     def get_historical_data(self, symbol: str, timeframe: str, count: int = 1000) -> List[Dict]:
         """Haal historische candlestick data op van MT5 via bridge"""
@@ -101,31 +116,78 @@ class BacktestingEngine:
         print(f"📊 Fetching {count} candles...")
         candles = self.get_historical_data(symbol, timeframe, count)
         
-        if not candles or len(candles) < 50:
+        results = self.run_backtest_on_candles(candles, symbol=symbol, timeframe=timeframe, volume=volume)
+        results['period_days'] = days
+        return results
+    
+    def run_backtest_on_candles(self, candles: List[Dict], symbol: str = "XAUUSD", timeframe: str = "H1",
+                                volume: float = 0.20, start_index: Optional[int] = None,
+                                end_index: Optional[int] = None,
+                                indicator_series: Optional[Dict] = None,
+                                entry_mask: Optional[Sequence[bool]] = None) -> Dict:
+        """
+        Run backtest op een gegeven candle history (geen bridge requests)
+        
+        Signalen worden per bar berekend op de candles t/m die bar, dus zonder
+        lookahead. Candles voor start_index dienen alleen als warm-up/context.
+        
+        Args:
+            candles: Historische candles (oudste eerst)
+            symbol: Trading symbol
+            timeframe: Timeframe van de candles
+            volume: Trade volume in lots
+            start_index: Eerste bar om te handelen (default: na 50 warm-up candles)
+            end_index: Bar index (exclusief) waar de backtest stopt (default: einde)
+            indicator_series: Vooraf berekende indicator reeksen over dezelfde candles,
+                              {(indicator, period): array}, zie indicator_series.py
+                              (default: lazy uit self.indicator_cache als die gezet is)
+            entry_mask: Per bar over dezelfde candles; alleen op bars met True worden
+                        nieuwe posities geopend (bv. CandleStore.regime_mask voor één
+                        regime). Open posities lopen door tot TP/SL.
+        
+        Returns:
+            Dict met backtest results
+        """
+        start_index = WARMUP_CANDLES if start_index is None else max(start_index, WARMUP_CANDLES)
+        end_index = len(candles) if end_index is None else min(end_index, len(candles))
+        
+        if not candles or end_index - start_index < 1 or len(candles) < WARMUP_CANDLES:
             return {
                 'error': 'Insufficient historical data',
-                'message': f'Only {len(candles) if candles else 0} candles available, need at least 50',
+                'message': f'Only {len(candles) if candles else 0} candles available, need at least {WARMUP_CANDLES}',
                 'trades': [],
                 'metrics': {},
                 'equity_curve': []
             }
         
-        print(f"✅ Got {len(candles)} candles")
-        print(f"📅 Date range: {candles[0].get('time')} to {candles[-1].get('time')}")
-        print()
+        self.log(f"✅ Got {len(candles)} candles")
+        self.log(f"📅 Date range: {candles[start_index].get('time')} to {candles[end_index - 1].get('time')}")
+        self.log("")
         
         # Reset state
         self.current_balance = self.initial_balance
         self.trades = []
         self.equity_curve = [self.initial_balance]
+        # Metrics lopen per bar mee, annualized naar de timeframe van de candles
+        self.metrics = MetricsAccumulator(self.initial_balance, timeframe=timeframe)
         self.open_position = None
         self.current_candles = []
         
+        # Strategieën met een batch stap (bv. ML) scoren de hele history vooraf
+        if hasattr(self.strategy, 'prepare_backtest'):
+            self.strategy.prepare_backtest(candles, symbol=symbol, timeframe=timeframe)
+        
+        if indicator_series is None and self.indicator_cache is not None:
+            indicator_series = self.indicator_cache.bind([float(c.get('close', 0)) for c in candles])
+        periods = self.strategy.get_indicator_periods(timeframe) if indicator_series is not None else None
+        # Candlestick patronen één keer over de hele history
+        patterns = pattern_columns_from_candles(candles)
+        
         # Loop door elke candle (start na 50 candles voor indicatoren)
-        print("🔄 Running backtest...")
+        self.log("🔄 Running backtest...")
         processed = 0
-        for i in range(50, len(candles)):
-            self.current_candles = candles[:i+1]
+        for i in range(start_index, end_index):
+            self.current_index = i
             current_candle = candles[i]
             current_price = float(current_candle.get('close', 0))
             current_time = current_candle.get('time', '')
@@ -137,16 +199,23 @@ class BacktestingEngine:
             if self.open_position:
                 self.manage_position(current_price, current_time)
             
+            if entry_mask is not None and not entry_mask[i]:
+                # Buiten het gekozen regime: geen nieuwe signalen
+                self.update_equity_curve(current_price)
+                processed += 1
+                continue
+            
             # Genereer signaal (gebruik laatste 100 candles voor analyse)
-            analysis_candles = self.current_candles[-100:] if len(self.current_candles) > 100 else self.current_candles
+            self.current_candles = candles[max(0, i + 1 - ANALYSIS_WINDOW):i + 1]
             
             try:
-                # Generate signal using strategy with timeframe support
-                # Convert candles to format expected by strategy
-                signal_data = self.strategy.generate_signal_from_chart(
-                    symbol=symbol,
+                # Generate signal on the historical snapshot with timeframe support
+                indicators = indicators_at(indicator_series, periods, i) if periods else {}
+                indicators['patterns'] = patterns_at(patterns, i)
+                signal_data = self.strategy.analyze_candles(
+                    self.current_candles,
                     timeframe=timeframe,
-                    count=min(len(analysis_candles), 100)  # Limit to 100 for performance
+                    indicators=indicators
                 )
                 
                 signal = signal_data.get('signal')
@@ -160,15 +229,16 @@ class BacktestingEngine:
                             'type': signal,
                             'entry_price': current_price,
                             'entry_time': current_time,
+                            'entry_index': i,
                             'volume': volume,
                             'tp': tp_sl.get('tp'),
                             'sl': tp_sl.get('sl'),
                             'confidence': confidence
                         }
-                        print(f"  📈 {signal} signal @ ${current_price:.2f} (Confidence: {confidence}%)")
+                        self.log(f"  📈 {signal} signal @ ${current_price:.2f} (Confidence: {confidence}%)")
             
             except Exception as e:
-                print(f"  ⚠️  Error generating signal: {e}")
+                self.log(f"  ⚠️  Error generating signal: {e}")
                 continue
             
             # Update equity curve
@@ -176,21 +246,20 @@ class BacktestingEngine:
             processed += 1
             
             if processed % 100 == 0:
-                print(f"  Processed {processed}/{len(candles)-50} candles...")
+                self.log(f"  Processed {processed}/{end_index - start_index} candles...")
         
         # Close laatste positie als nog open
         if self.open_position:
-            final_price = float(candles[-1].get('close', 0))
-            final_time = candles[-1].get('time', '')
+            final_price = float(candles[end_index - 1].get('close', 0))
+            final_time = candles[end_index - 1].get('time', '')
             self.close_position(final_price, final_time, reason='End of backtest')
         
-        print()
-        print("✅ Backtest completed!")
-        print()
+        self.log("")
+        self.log("✅ Backtest completed!")
+        self.log("")
         
-        # Bereken metrics
-        metrics = PerformanceMetrics(self.trades, self.equity_curve)
-        results = metrics.calculate_all_metrics()
+        # Metrics zijn al per bar bijgehouden
+        results = self.metrics.get_metrics()
         
         # Calculate total return
         final_balance = self.equity_curve[-1] if self.equity_curve else self.current_balance
@@ -207,9 +276,10 @@ class BacktestingEngine:
             'total_return_pct': round(total_return, 2),
             'symbol': symbol,
             'timeframe': timeframe,
-            'period_days': days,
             'total_candles': len(candles),
-            'processed_candles': processed
+            'processed_candles': processed,
+            'start_index': start_index,
+            'end_index': end_index
         }
     
     def manage_position(self, current_price: float, current_time: str):
@@ -271,12 +341,13 @@ class BacktestingEngine:
             'pnl': pnl,
             'reason': reason,
             'profit': pnl > 0,
-            'duration_candles': len(self.current_candles) - (self.current_candles.index([c for c in self.current_candles if c.get('time') == entry_time][0]) if any(c.get('time') == entry_time for c in self.current_candles) else 0)
+            'duration_candles': self.current_index - self.open_position.get('entry_index', self.current_index)
         }
         self.trades.append(trade)
+        self.metrics.add_trade(pnl, trade['profit'])
         
         status = "✅ WIN" if pnl > 0 else "❌ LOSS"
-        print(f"  {status} {pos_type} @ ${entry_price:.2f} → ${exit_price:.2f} | P&L: ${pnl:.2f} ({reason})")
+        self.log(f"  {status} {pos_type} @ ${entry_price:.2f} → ${exit_price:.2f} | P&L: ${pnl:.2f} ({reason})")
         
         # Reset open position
         self.open_position = None
@@ -295,6 +366,7 @@ class BacktestingEngine:
             equity = self.current_balance
         
         self.equity_curve.append(round(equity, 2))
+        self.metrics.update_equity(self.equity_curve[-1])
 
 if __name__ == "__main__":
     # Test backtesting engine
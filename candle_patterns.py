@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Candle Patterns
+Candlestick patronen als boolean kolommen over de hele OHLC history (NumPy masks)
+Eén definitie voor TradingStrategy, backtests, ML features en pattern statistieken;
+een nieuw patroon is één functie met @register_pattern
+"""
+
+from typing import Callable, Dict, List, Optional, Sequence
+import numpy as np
+
+# Geregistreerde patronen in detectie volgorde:
+# naam -> {'detect': functie(geometry) -> bool mask, 'strength': signaal sterkte,
+#          'lookback': aantal recente candles waarin het patroon meetelt}
+PATTERNS = {}
+
+# ML feature -> patroon (volgorde van ml_feature_matrix.FEATURE_NAMES)
+FEATURE_PATTERNS = {
+    'pattern_hammer': 'HAMMER',
+    'pattern_shooting_star': 'SHOOTING_STAR',
+    'pattern_doji': 'DOJI',
+    'pattern_bullish_engulfing': 'BULLISH_ENGULFING',
+    'pattern_bearish_engulfing': 'BEARISH_ENGULFING'
+}
+
+def register_pattern(name: str, strength: int = 0, lookback: int = 1) -> Callable:
+    """
+    Registreer een patroon detector
+
+    Args:
+        name: Patroon naam (zoals in detect_candlestick_patterns)
+        strength: Bijdrage aan signal_strength (positief bullish, negatief bearish)
+        lookback: Het patroon telt mee als het in één van de laatste `lookback` candles voorkomt
+    """
+    def decorator(detect: Callable[[Dict[str, np.ndarray]], np.ndarray]) -> Callable:
+        PATTERNS[name] = {'detect': detect, 'strength': strength, 'lookback': lookback}
+        return detect
+    return decorator
+
+def candle_geometry(opens, highs, lows, closes) -> Dict[str, np.ndarray]:
+    """
+    Body/wick maten per candle, gedeeld door alle detectors
+
+    'valid' is False voor candles zonder prijs of zonder range (die worden overgeslagen).
+    """
+    opens, highs, lows, closes = (np.asarray(values, dtype=np.float64) for values in (opens, highs, lows, closes))
+    body = np.abs(closes - opens)
+    total_range = highs - lows
+    valid = (opens != 0) & (closes != 0) & (total_range != 0)
+    body_ratio = np.zeros(len(closes))
+    np.divide(body, total_range, out=body_ratio, where=valid)
+    return {
+        'open': opens,
+        'high': highs,
+        'low': lows,
+        'close': closes,
+        'body': body,
+        'range': total_range,
+        'valid': valid,
+        'body_ratio': body_ratio,
+        'upper_wick': highs - np.maximum(opens, closes),
+        'lower_wick': np.minimum(opens, closes) - lows
+    }
+
+def _with_previous(current: np.ndarray) -> np.ndarray:
+    """Mask voor patronen van twee candles: de eerste bar heeft geen voorganger"""
+    mask = np.zeros(len(current) + 1, dtype=bool)
+    mask[1:] = current
+    return mask
+
+@register_pattern('DOJI', strength=5, lookback=3)
+def _doji(g: Dict[str, np.ndarray]) -> np.ndarray:
+    # Zeer kleine body
+    return g['valid'] & (g['body_ratio'] < 0.1)
+
+@register_pattern('HAMMER', strength=15, lookback=3)
+def _hammer(g: Dict[str, np.ndarray]) -> np.ndarray:
+    # Kleine body bovenaan, lange onderste wick
+    return g['valid'] & (g['body_ratio'] < 0.3) & (g['lower_wick'] > g['body'] * 2) & (g['upper_wick'] < g['body'])
+
+@register_pattern('SHOOTING_STAR', strength=-15, lookback=3)
+def _shooting_star(g: Dict[str, np.ndarray]) -> np.ndarray:
+    # Kleine body onderaan, lange bovenste wick
+    return g['valid'] & (g['body_ratio'] < 0.3) & (g['upper_wick'] > g['body'] * 2) & (g['lower_wick'] < g['body'])
+
+@register_pattern('BULLISH_ENGULFING', strength=20)
+def _bullish_engulfing(g: Dict[str, np.ndarray]) -> np.ndarray:
+    prev_open, prev_close, curr_open, curr_close = g['open'][:-1], g['close'][:-1], g['open'][1:], g['close'][1:]
+    return _with_previous((prev_close < prev_open) & (curr_close > curr_open)
+                          & (curr_open < prev_close) & (curr_close > prev_open))
+
+@register_pattern('BEARISH_ENGULFING', strength=-20)
+def _bearish_engulfing(g: Dict[str, np.ndarray]) -> np.ndarray:
+    prev_open, prev_close, curr_open, curr_close = g['open'][:-1], g['close'][:-1], g['open'][1:], g['close'][1:]
+    return _with_previous((prev_close > prev_open) & (curr_close < curr_open)
+                          & (curr_open > prev_close) & (curr_close < prev_open))
+
+def pattern_columns(opens, highs, lows, closes, names: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+    """
+    Boolean kolom per patroon over de hele history
+
+    Args:
+        opens, highs, lows, closes: OHLC arrays (oudste eerst)
+        names: Alleen deze patronen (default: alle geregistreerde, in registratie volgorde)
+
+    Returns:
+        {naam: bool array}, True op de bar waar het patroon voltooid is
+    """
+    geometry = candle_geometry(opens, highs, lows, closes)
+    selected = [name for name in PATTERNS if names is None or name in names]
+    return {name: PATTERNS[name]['detect'](geometry) for name in selected}
+
+def pattern_columns_from_candles(candles: List[Dict], names: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+    """pattern_columns voor candle dicts"""
+    return pattern_columns(*([float(c.get(field, 0)) for c in candles] for field in ('open', 'high', 'low', 'close')),
+                           names=names)
+
+def recent_flags(columns: Dict[str, np.ndarray], name: str) -> np.ndarray:
+    """Per bar: kwam het patroon voor in de laatste `lookback` candles van dat patroon"""
+    mask = columns[name]
+    lookback = PATTERNS[name]['lookback']
+    if lookback <= 1:
+        return mask.copy()
+    counts = np.cumsum(mask)
+    flags = counts > 0
+    flags[lookback:] = counts[lookback:] - counts[:-lookback] > 0
+    return flags
+
+def patterns_at(columns: Dict[str, np.ndarray], index: int) -> Dict:
+    """
+    Patronen en signal_strength voor één bar (zelfde vorm als detect_candlestick_patterns)
+
+    Elk voorkomen binnen de lookback van een patroon telt, oudste candle eerst.
+    """
+    patterns = []
+    signal_strength = 0
+    max_lookback = max((PATTERNS[name]['lookback'] for name in columns), default=1)
+    for offset in range(max_lookback - 1, -1, -1):
+        bar = index - offset
+        if bar < 0:
+            continue
+        for name, mask in columns.items():
+            if PATTERNS[name]['lookback'] > offset and mask[bar]:
+                patterns.append(name)
+                signal_strength += PATTERNS[name]['strength']
+    return {
+        'patterns': patterns,
+        'signal_strength': signal_strength
+    }
+
+def pattern_statistics(columns: Dict[str, np.ndarray], closes, horizon: int = 10) -> Dict[str, Dict]:
+    """
+    Frequentie en forward return per patroon
+
+    Args:
+        columns: Pattern kolommen over de history
+        closes: Close prices van dezelfde bars
+        horizon: Bars vooruit voor de forward return
+
+    Returns:
+        {naam: {count, frequency_pct, avg_forward_return_pct, hit_rate_pct}}; hit rate is het
+        percentage in de richting van de strength (None bij strength 0)
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    n = len(closes)
+    forward = np.full(n, np.nan)
+    if n > horizon:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            forward[:n - horizon] = (closes[horizon:] - closes[:n - horizon]) / closes[:n - horizon] * 100
+
+    statistics = {}
+    for name, mask in columns.items():
+        returns = forward[mask]
+        returns = returns[np.isfinite(returns)]
+        direction = np.sign(PATTERNS[name]['strength'])
+        hit_rate = None
+        if direction and len(returns):
+            hit_rate = round(float((returns * direction > 0).mean() * 100), 2)
+        statistics[name] = {
+            'count': int(mask.sum()),
+            'frequency_pct': round(float(mask.mean() * 100), 3) if n else 0.0,
+            'avg_forward_return_pct': round(float(returns.mean()), 4) if len(returns) else None,
+            'hit_rate_pct': hit_rate
+        }
+    return statistics
+
+if __name__ == "__main__":
+    import time
+
+    # Test pattern kolommen op een random walk history
+    rng = np.random.default_rng(12)
+    n = 100000
+    closes = 2500 + np.cumsum(rng.normal(0, 2, n))
+    opens = np.concatenate([[closes[0]], closes[:-1]]) + rng.normal(0, 0.5, n)
+    highs = np.maximum(opens, closes) + rng.exponential(1.0, n)
+    lows = np.minimum(opens, closes) - rng.exponential(1.0, n)
+
+    start = time.perf_counter()
+    columns = pattern_columns(opens, highs, lows, closes)
+    print(f"⚡ {len(columns)} patterns over {n} bars in {(time.perf_counter() - start) * 1000:.1f}ms")
+    print(f"Last bar: {patterns_at(columns, n - 1)}")
+    for name, stats in pattern_statistics(columns, closes).items():
+        print(f"   {name}: {stats}")
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Candle Store
+Lokale candle history per symbol/timeframe (NumPy .npz bestanden)
+Wordt aangevuld vanuit de MT5 bridge zodat backtests en optimalisatie
+niet bij elke run opnieuw de EA hoeven te bevragen
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import requests
+from market_regime import REGIMES, regime_series
+from candle_patterns import pattern_columns, pattern_statistics
+
+# Tijd formaat van de EA (TimeToString met TIME_DATE|TIME_SECONDS)
+TIME_FORMAT = "%Y.%m.%d %H:%M:%S"
+EPOCH = datetime(1970, 1, 1)
+
+OHLCV_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+# Regime kolom: int8 index in market_regime.REGIMES per bar
+REGIME_FIELD = 'regime'
+REGIME_LOOKBACK_KEY = 'regime_lookback'
+
+def parse_candle_time(value) -> int:
+    """Converteer EA tijd string (of epoch) naar epoch seconden"""
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return int(value)
+    value = str(value).strip()
+    for fmt in (TIME_FORMAT, "%Y.%m.%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return int((datetime.strptime(value, fmt) - EPOCH).total_seconds())
+        except ValueError:
+            continue
+    raise ValueError(f"Unknown candle time format: {value}")
+
+def format_candle_time(epoch: int) -> str:
+    """Converteer epoch seconden terug naar het EA tijd formaat"""
+    return (EPOCH + timedelta(seconds=int(epoch))).strftime(TIME_FORMAT)
+
+def candles_to_arrays(candles: List[Dict]) -> Dict[str, np.ndarray]:
+    """
+    Converteer een lijst candle dicts naar kolom arrays
+
+    Returns:
+        {'time': int64 epoch, 'open': float64, 'high', 'low', 'close', 'volume'}
+    """
+    arrays = {'time': np.array([parse_candle_time(c.get('time', 0)) for c in candles], dtype=np.int64)}
+    for field in OHLCV_FIELDS:
+        arrays[field] = np.array([float(c.get(field, 0)) for c in candles], dtype=np.float64)
+    return arrays
+
+def arrays_to_candles(arrays: Dict[str, np.ndarray], start: int = 0, end: Optional[int] = None) -> List[Dict]:
+    """Converteer kolom arrays terug naar candle dicts (zelfde vorm als de bridge)"""
+    end = len(arrays['time']) if end is None else end
+    candles = []
+    for i in range(start, end):
+        candle = {'time': format_candle_time(arrays['time'][i])}
+        for field in OHLCV_FIELDS:
+            candle[field] = float(arrays[field][i])
+        candles.append(candle)
+    return candles
+
+def regime_intervals_from_codes(codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Aaneengesloten stukken met hetzelfde regime
+
+    Returns:
+        (starts, ends, codes) arrays; end is exclusief
+    """
+    codes = np.asarray(codes)
+    if len(codes) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([], dtype=np.int8)
+    starts = np.concatenate([[0], np.flatnonzero(codes[1:] != codes[:-1]) + 1])
+    ends = np.concatenate([starts[1:], [len(codes)]])
+    return starts, ends, codes[starts]
+
+class CandleStore:
+    def __init__(self, storage_dir: str = 'candle_data', bridge_url: str = "http://localhost:5002",
+                 regime_lookback: int = 50):
+        """
+        Args:
+            storage_dir: Map met de .npz bestanden
+            bridge_url: MT5 bridge voor sync()
+            regime_lookback: Venster van de per-bar regime kolom (zelfde als detect_regime)
+        """
+        self.storage_dir = storage_dir
+        self.bridge_url = bridge_url
+        self.regime_lookback = regime_lookback
+        self._cache = {}  # (symbol, timeframe) -> (mtime, arrays)
+        self._intervals = {}  # (symbol, timeframe) -> (mtime, (starts, ends, codes))
+        self._patterns = {}  # (symbol, timeframe) -> (mtime, {pattern: bool array})
+
+    def _path(self, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.storage_dir, f"{symbol.upper()}_{timeframe.upper()}.npz")
+
+    def load_arrays(self, symbol: str, timeframe: str) -> Dict[str, np.ndarray]:
+        """
+        Laad de opgeslagen history als kolom arrays (oudste eerst)
+
+        Returns:
+            Dict met 'time', OHLCV en 'regime' arrays (leeg als er niets opgeslagen is)
+        """
+        path = self._path(symbol, timeframe)
+        key = (symbol.upper(), timeframe.upper())
+        if not os.path.exists(path):
+            return {'time': np.array([], dtype=np.int64), **{f: np.array([], dtype=np.float64) for f in OHLCV_FIELDS},
+                    REGIME_FIELD: np.array([], dtype=np.int8)}
+
+        mtime = os.path.getmtime(path)
+        cached = self._cache.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files if name != REGIME_LOOKBACK_KEY}
+            lookback = int(data[REGIME_LOOKBACK_KEY]) if REGIME_LOOKBACK_KEY in data.files else None
+
+        if REGIME_FIELD not in arrays or lookback != self.regime_lookback:
+            # Oud bestand of ander venster: regime kolom één keer opnieuw opbouwen
+            arrays[REGIME_FIELD] = self._regime_column(arrays)
+            self.save_arrays(symbol, timeframe, arrays)
+            return arrays
+        self._cache[key] = (mtime, arrays)
+        return arrays
+
+    def load_candles(self, symbol: str, timeframe: str, count: Optional[int] = None) -> List[Dict]:
+        """
+        Laad de opgeslagen history als candle dicts
+
+        Args:
+            symbol: Trading symbol
+            timeframe: Timeframe
+            count: Alleen de laatste `count` candles (None voor alles)
+        """
+        arrays = self.load_arrays(symbol, timeframe)
+        total = len(arrays['time'])
+        start = max(0, total - count) if count else 0
+        return arrays_to_candles(arrays, start, total)
+
+    def count(self, symbol: str, timeframe: str) -> int:
+        """Aantal opgeslagen candles"""
+        return len(self.load_arrays(symbol, timeframe)['time'])
+
+    def save_arrays(self, symbol: str, timeframe: str, arrays: Dict[str, np.ndarray]):
+        """Schrijf arrays atomisch weg (tmp bestand + rename)"""
+        os.makedirs(self.storage_dir, exist_ok=True)
+        if REGIME_FIELD not in arrays:
+            arrays = {**arrays, REGIME_FIELD: self._regime_column(arrays)}
+        path = self._path(symbol, timeframe)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **arrays, **{REGIME_LOOKBACK_KEY: np.array(self.regime_lookback)})
+        os.replace(tmp_path, path)
+        self._cache[(symbol.upper(), timeframe.upper())] = (os.path.getmtime(path), arrays)
+
+    def append_candles(self, symbol: str, timeframe: str, candles: List[Dict]) -> int:
+        """
+        Voeg candles toe aan de history (dubbele tijden worden overschreven)
+
+        Returns:
+            Aantal nieuwe bars
+        """
+        if not candles:
+            return 0
+
+        existing = self.load_arrays(symbol, timeframe)
+        incoming = candles_to_arrays(candles)
+        before = len(existing['time'])
+
+        merged_time = np.concatenate([existing['time'], incoming['time']])
+        # Laatste voorkomen wint (de bridge levert de meest recente versie van een bar)
+        _, reverse_idx = np.unique(merged_time[::-1], return_index=True)
+        order = len(merged_time) - 1 - reverse_idx  # gesorteerd op tijd
+
+        merged = {'time': merged_time[order]}
+        for field in OHLCV_FIELDS:
+            merged[field] = np.concatenate([existing[field], incoming[field]])[order]
+
+        # Bars vóór de oudste binnenkomende bar zijn ongewijzigd: hun regime blijft staan
+        first_changed = int(np.searchsorted(merged['time'], incoming['time'].min()))
+        merged[REGIME_FIELD] = self._regime_column(merged, existing[REGIME_FIELD][:first_changed])
+
+        self.save_arrays(symbol, timeframe, merged)
+        return len(merged['time']) - before
+
+    def _regime_column(self, arrays: Dict[str, np.ndarray], known: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Regime code per bar; alleen bars na `known` worden berekend
+
+        Een bar hangt alleen af van zijn eigen venster (regime_lookback bars),
+        dus de berekening start regime_lookback - 1 bars vóór de eerste nieuwe bar.
+        """
+        known = np.array([], dtype=np.int8) if known is None else np.asarray(known, dtype=np.int8)
+        first = len(known)
+        if first >= len(arrays['time']):
+            return known[:len(arrays['time'])]
+        start = max(0, first - self.regime_lookback + 1)
+        codes = regime_series(arrays['high'][start:], arrays['low'][start:], arrays['close'][start:],
+                              self.regime_lookback)
+        return np.concatenate([known, codes[first - start:]]).astype(np.int8)
+
+    def load_regimes(self, symbol: str, timeframe: str) -> np.ndarray:
+        """Regime code per opgeslagen bar (index in market_regime.REGIMES)"""
+        return self.load_arrays(symbol, timeframe)[REGIME_FIELD]
+
+    def regime_mask(self, symbol: str, timeframe: str, regime: str) -> np.ndarray:
+        """Bool array: True voor bars in `regime`"""
+        return self.load_regimes(symbol, timeframe) == REGIMES.index(regime)
+
+    def regime_intervals(self, symbol: str, timeframe: str, regime: Optional[str] = None,
+                         min_bars: int = 1) -> List[Dict]:
+        """
+        Index van regime intervallen (aaneengesloten bars met hetzelfde regime)
+
+        Args:
+            symbol: Trading symbol
+            timeframe: Timeframe
+            regime: Alleen intervallen van dit regime (None voor alle)
+            min_bars: Kortere intervallen overslaan
+
+        Returns:
+            Lijst van {'regime', 'start', 'end' (exclusief), 'bars', 'start_time', 'end_time'}
+        """
+        arrays = self.load_arrays(symbol, timeframe)
+        key = (symbol.upper(), timeframe.upper())
+        mtime = self._cache.get(key, (None,))[0]
+        cached = self._intervals.get(key)
+        if cached and cached[0] == mtime and mtime is not None:
+            starts, ends, codes = cached[1]
+        else:
+            starts, ends, codes = regime_intervals_from_codes(arrays[REGIME_FIELD])
+            self._intervals[key] = (mtime, (starts, ends, codes))
+
+        selected = (ends - starts) >= min_bars
+        if regime is not None:
+            selected &= codes == REGIMES.index(regime)
+        times = arrays['time']
+        return [{
+            'regime': REGIMES[codes[i]],
+            'start': int(starts[i]),
+            'end': int(ends[i]),
+            'bars': int(ends[i] - starts[i]),
+            'start_time': format_candle_time(times[starts[i]]),
+            'end_time': format_candle_time(times[ends[i] - 1])
+        } for i in np.flatnonzero(selected)]
+
+    def regime_summary(self, symbol: str, timeframe: str) -> Dict:
+        """Bars, aandeel en intervallen per regime over de hele history"""
+        codes = self.load_regimes(symbol, timeframe)
+        intervals = self.regime_intervals(symbol, timeframe)
+        summary = {}
+        for code, regime in enumerate(REGIMES):
+            bars = int(np.count_nonzero(codes == code))
+            lengths = [interval['bars'] for interval in intervals if interval['regime'] == regime]
+            summary[regime] = {
+                'bars': bars,
+                'share': round(bars / len(codes) * 100, 2) if len(codes) else 0,
+                'intervals': len(lengths),
+                'avg_interval_bars': round(float(np.mean(lengths)), 1) if lengths else 0
+            }
+        return summary
+
+    def load_patterns(self, symbol: str, timeframe: str) -> Dict[str, np.ndarray]:
+        """Candlestick pattern kolommen per opgeslagen bar (candle_patterns), per bestand gecached"""
+        arrays = self.load_arrays(symbol, timeframe)
+        key = (symbol.upper(), timeframe.upper())
+        mtime = self._cache.get(key, (None,))[0]
+        cached = self._patterns.get(key)
+        if cached and cached[0] == mtime and mtime is not None:
+            return cached[1]
+        columns = pattern_columns(arrays['open'], arrays['high'], arrays['low'], arrays['close'])
+        self._patterns[key] = (mtime, columns)
+        return columns
+
+    def pattern_summary(self, symbol: str, timeframe: str, horizon: int = 10) -> Dict:
+        """Frequentie en forward return per candlestick patroon over de hele history"""
+        return pattern_statistics(self.load_patterns(symbol, timeframe),
+                                  self.load_arrays(symbol, timeframe)['close'], horizon=horizon)
+
+    def sync(self, symbol: str = "XAUUSD", timeframe: str = "H1", count: int = 1000) -> int:
+        """
+        Haal de laatste `count` candles op via de bridge en voeg ze toe
+
+        Returns:
+            Aantal nieuwe bars (0 bij een fout)
+        """
+        try:
+            response = requests.get(f"{self.bridge_url}/candles/{symbol}/{timeframe}/{count}", timeout=30)
+            if response.status_code == 200:
+                data = response.json()
+                if not data.get('error'):
+                    return self.append_candles(symbol, timeframe, data.get('candles', []))
+            print(f"⚠️  Error syncing candles: {response.text}")
+        except Exception as e:
+            print(f"❌ Error syncing candles: {e}")
+        return 0
+
+if __name__ == "__main__":
+    # Test candle store
+    store = CandleStore()
+    new_bars = store.sync("XAUUSD", "H1", 1000)
+    print(f"✅ Synced {new_bars} new candles, total: {store.count('XAUUSD', 'H1')}")
+    if store.count("XAUUSD", "H1"):
+        print(f"🧭 Regimes: {store.regime_summary('XAUUSD', 'H1')}")
@@ -55,7 +55,7 @@ export default function BacktestPage() {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify(config),
+        body: JSON.stringify({ ...config, max_points: 1000 }),
       });
 
       const data = await response.json();
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Indicator Series
+Vectorized indicator reeksen over de volledige candle history (NumPy)
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+from collections.abc import Mapping
+from multiprocessing import resource_tracker, shared_memory
+import hashlib
+import numpy as np
+
+# Standaard analyse venster van TradingStrategy.generate_signal_from_chart
+ANALYSIS_WINDOW = 100
+
+def sma_series(values: np.ndarray, period: int) -> np.ndarray:
+    """
+    Simple Moving Average voor elke bar
+
+    Returns:
+        Array met dezelfde lengte als values, NaN tot er `period` waarden zijn
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    if period <= 0 or len(values) < period:
+        return result
+    cumsum = np.cumsum(np.insert(values, 0, 0.0))
+    result[period - 1:] = (cumsum[period:] - cumsum[:-period]) / period
+    return result
+
+def ema_series(values: np.ndarray, period: int, window: Optional[int] = ANALYSIS_WINDOW) -> np.ndarray:
+    """
+    Exponential Moving Average voor elke bar
+
+    TradingStrategy.calculate_ema seedt de EMA op de eerste prijs van het
+    analyse venster (laatste `window` candles). Voor bars met een volledig
+    venster wordt die EMA exact berekend als vaste gewichten over het venster,
+    daarvoor is het venster de hele history en valt het samen met een gewone EMA.
+
+    Args:
+        values: Close prices
+        period: EMA period
+        window: Analyse venster (None voor een EMA over de hele history)
+
+    Returns:
+        Array met dezelfde lengte als values, NaN tot er `period` waarden zijn
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    result = np.full(n, np.nan)
+    if period <= 0 or n < period:
+        return result
+
+    multiplier = 2.0 / (period + 1)
+    decay = 1.0 - multiplier
+
+    # Recursieve EMA geseed op values[0]
+    full = np.empty(n)
+    ema = values[0]
+    full[0] = ema
+    for i in range(1, n):
+        ema = values[i] * multiplier + ema * decay
+        full[i] = ema
+
+    if window is not None and n >= window:
+        # Vaste gewichten: seed krijgt decay^(w-1), de rest multiplier * decay^k
+        weights = multiplier * decay ** np.arange(window)
+        weights[window - 1] = decay ** (window - 1)
+        windowed = np.convolve(values, weights, mode='valid')
+        full[window - 1:] = windowed
+
+    result[period - 1:] = full[period - 1:]
+    return result
+
+def rsi_series(values: np.ndarray, period: int = 14) -> np.ndarray:
+    """
+    RSI voor elke bar, zelfde definitie als TradingStrategy.calculate_rsi
+    (simpel gemiddelde van gains/losses over de laatste `period` changes)
+
+    Returns:
+        Array met dezelfde lengte als values, NaN tot er `period + 1` waarden zijn
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    result = np.full(n, np.nan)
+    if period <= 0 or n < period + 1:
+        return result
+
+    changes = np.diff(values)
+    gains = np.where(changes > 0, changes, 0.0)
+    losses = np.where(changes > 0, 0.0, -changes)
+
+    avg_gain = sma_series(gains, period)
+    avg_loss = sma_series(losses, period)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = avg_gain / avg_loss
+        rsi = 100.0 - (100.0 / (1.0 + rs))
+    rsi = np.where(avg_loss == 0, 100.0, rsi)
+
+    # changes[i] hoort bij values[i + 1]
+    result[1:] = rsi
+    result[:period] = np.nan
+    return result
+
+INDICATOR_FUNCTIONS = {
+    'sma': sma_series,
+    'ema': ema_series,
+    'rsi': rsi_series
+}
+
+# Welke indicator hoort bij welke strategie parameter
+PERIOD_INDICATORS = {
+    'sma_short': 'sma',
+    'sma_long': 'sma',
+    'ema_fast': 'ema',
+    'ema_slow': 'ema',
+    'rsi_period': 'rsi'
+}
+
+def compute_indicator(closes: np.ndarray, indicator: str, period: int) -> np.ndarray:
+    """Bereken een indicator reeks op naam ('sma', 'ema', 'rsi')"""
+    if indicator not in INDICATOR_FUNCTIONS:
+        raise ValueError(f"Unknown indicator: {indicator}")
+    return INDICATOR_FUNCTIONS[indicator](closes, int(period))
+
+def precompute_indicator_series(closes: np.ndarray,
+                                periods: Dict[str, Iterable[int]]) -> Dict[Tuple[str, int], np.ndarray]:
+    """
+    Bereken alle indicator reeksen vooraf voor een set strategie periodes
+
+    Args:
+        closes: Close prices van de hele history
+        periods: {parameter_name: [periods]}, bv. {'sma_short': [10, 20], 'rsi_period': [14]}
+
+    Returns:
+        Dict van (indicator, period) -> reeks
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    series = {}
+    for param_name, values in periods.items():
+        indicator = PERIOD_INDICATORS.get(param_name)
+        if indicator is None:
+            continue
+        for period in values:
+            key = (indicator, int(period))
+            if key not in series:
+                series[key] = compute_indicator(closes, indicator, period)
+    return series
+
+def indicators_at(series, periods: Dict[str, int], index: int) -> Dict[str, Optional[float]]:
+    """
+    Haal indicator waarden op voor één bar
+
+    Args:
+        series: Mapping van (indicator, period) -> reeks
+        periods: Strategie periodes, zie TradingStrategy.get_indicator_periods
+        index: Bar index in de history
+
+    Returns:
+        {'sma_short': float|None, 'sma_long': ..., 'ema_fast': ..., 'ema_slow': ..., 'rsi': ...}
+        None betekent: niet beschikbaar, de strategie rekent zelf terug
+    """
+    values = {}
+    for param_name, period in periods.items():
+        indicator = PERIOD_INDICATORS.get(param_name)
+        if indicator is None:
+            continue
+        name = 'rsi' if param_name == 'rsi_period' else param_name
+        key = (indicator, int(period))
+        value = None
+        if key in series:
+            raw = series[key][index]
+            if not np.isnan(raw):
+                value = float(raw)
+        values[name] = value
+    return values
+
+def data_fingerprint(values: np.ndarray) -> str:
+    """Korte hash van een prijs reeks; zelfde data geeft dezelfde cache keys"""
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    return hashlib.sha1(values.tobytes()).hexdigest()[:16]
+
+# Header van een shared memory blok: int64 status (0 = wordt geschreven, 1 = klaar)
+_SHM_HEADER = 8
+_SHM_READY = 1
+
+def _untrack(segment: shared_memory.SharedMemory):
+    """Levensduur wordt door IndicatorCache.release() beheerd, niet door de resource tracker"""
+    try:
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    except Exception:
+        pass
+
+class IndicatorCache:
+    """
+    Memoizing cache voor indicator reeksen, key: (data fingerprint, indicator, period)
+
+    Reeksen worden pas berekend als een kandidaat ze opvraagt en daarna gedeeld
+    door alle kandidaten die dezelfde data gebruiken. Met shared=True worden
+    berekende reeksen ook in een shared memory blok gepubliceerd (naam afgeleid
+    van de key), zodat andere worker processen ze zonder herberekening kunnen
+    mappen. Blokken blijven bestaan tot release() (de resource tracker van
+    een worker zou ze anders bij het afsluiten van die worker al opruimen).
+    """
+
+    def __init__(self, shared: bool = False, prefix: str = 'ait'):
+        self.shared = shared
+        self.prefix = prefix
+        self._series = {}         # key -> np.ndarray
+        self._segments = {}       # key -> SharedMemory (houdt buffers in leven)
+        self._created = set()     # shared memory namen die dit process aanmaakte
+        self.hits = 0
+        self.misses = 0
+
+    def bind(self, closes: np.ndarray) -> 'IndicatorSeriesView':
+        """Geef een lazy (indicator, period) -> reeks view voor deze data"""
+        return IndicatorSeriesView(self, closes)
+
+    def get(self, closes: np.ndarray, indicator: str, period: int,
+            fingerprint: Optional[str] = None) -> np.ndarray:
+        """Haal een reeks uit de cache of bereken (en publiceer) hem"""
+        fingerprint = fingerprint or data_fingerprint(closes)
+        key = (fingerprint, indicator, int(period))
+        series = self._series.get(key)
+        if series is not None:
+            self.hits += 1
+            return series
+
+        if self.shared:
+            series = self._attach(key, len(closes))
+            if series is not None:
+                self.hits += 1
+                self._series[key] = series
+                return series
+
+        self.misses += 1
+        series = compute_indicator(closes, indicator, period)
+        if self.shared:
+            series = self._publish(key, series)
+        self._series[key] = series
+        return series
+
+    def segment_name(self, key: Tuple[str, str, int]) -> str:
+        """Shared memory naam voor een key (kort gehouden: macOS staat max 31 tekens toe)"""
+        digest = hashlib.sha1(f"{key[0]}:{key[1]}:{key[2]}".encode()).hexdigest()[:12]
+        return f"{self.prefix}_{digest}"
+
+    def _attach(self, key: Tuple[str, str, int], length: int) -> Optional[np.ndarray]:
+        try:
+            segment = shared_memory.SharedMemory(name=self.segment_name(key))
+        except FileNotFoundError:
+            return None
+        _untrack(segment)
+        header = np.ndarray((1,), dtype=np.int64, buffer=segment.buf)
+        if header[0] != _SHM_READY or segment.size < _SHM_HEADER + length * 8:
+            # Nog niet klaar (of andere data): zelf berekenen i.p.v. wachten
+            segment.close()
+            return None
+        self._segments[key] = segment
+        return np.ndarray((length,), dtype=np.float64, buffer=segment.buf, offset=_SHM_HEADER)
+
+    def _publish(self, key: Tuple[str, str, int], series: np.ndarray) -> np.ndarray:
+        name = self.segment_name(key)
+        try:
+            segment = shared_memory.SharedMemory(name=name, create=True, size=_SHM_HEADER + series.nbytes)
+        except FileExistsError:
+            # Een ander process was ons voor; gebruik die versie als hij klaar is
+            attached = self._attach(key, len(series))
+            return attached if attached is not None else series
+        except OSError:
+            return series
+        _untrack(segment)
+
+        view = np.ndarray(series.shape, dtype=np.float64, buffer=segment.buf, offset=_SHM_HEADER)
+        view[:] = series
+        np.ndarray((1,), dtype=np.int64, buffer=segment.buf)[0] = _SHM_READY
+        self._segments[key] = segment
+        self._created.add(name)
+        return view
+
+    def release(self, fingerprint: Optional[str] = None, keys: Iterable[Tuple[str, int]] = ()):
+        """
+        Geef shared memory vrij
+
+        Sluit alle gemapte blokken en unlinkt de blokken die dit process maakte.
+        Met fingerprint + keys ((indicator, period) paren) worden ook blokken
+        van (afgesloten) worker processen voor die data opgeruimd.
+        """
+        names = set(self._created)
+        if fingerprint:
+            names.update(self.segment_name((fingerprint, indicator, int(period))) for indicator, period in keys)
+
+        self._series.clear()
+        for segment in self._segments.values():
+            try:
+                segment.close()
+            except BufferError:
+                pass
+        self._segments.clear()
+
+        for name in names:
+            try:
+                segment = shared_memory.SharedMemory(name=name)
+                segment.close()
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+        self._created.clear()
+
+    def get_stats(self) -> Dict:
+        return {
+            'cached_series': len(self._series),
+            'hits': self.hits,
+            'misses': self.misses,
+            'shared': self.shared
+        }
+
+class IndicatorSeriesView(Mapping):
+    """
+    Lazy mapping (indicator, period) -> reeks over één data set
+
+    Kan overal gebruikt worden waar een dict van vooraf berekende reeksen
+    verwacht wordt (BacktestingEngine, indicators_at).
+    """
+
+    def __init__(self, cache: IndicatorCache, closes: np.ndarray):
+        self.cache = cache
+        self.closes = np.ascontiguousarray(closes, dtype=np.float64)
+        self.fingerprint = data_fingerprint(self.closes)
+        self._requested = set()
+
+    def __getitem__(self, key: Tuple[str, int]) -> np.ndarray:
+        indicator, period = key
+        if indicator not in INDICATOR_FUNCTIONS:
+            raise KeyError(key)
+        self._requested.add((indicator, int(period)))
+        return self.cache.get(self.closes, indicator, period, fingerprint=self.fingerprint)
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, tuple) and len(key) == 2 and key[0] in INDICATOR_FUNCTIONS
+
+    def __iter__(self):
+        return iter(sorted(self._requested))
+
+    def __len__(self) -> int:
+        return len(self._requested)
+
+if __name__ == "__main__":
+    # Test indicator series
+    prices = 2500 + np.cumsum(np.random.randn(300))
+    print(f"SMA20: {sma_series(prices, 20)[-1]:.2f}")
+    print(f"EMA12: {ema_series(prices, 12)[-1]:.2f}")
+    print(f"RSI14: {rsi_series(prices, 14)[-1]:.2f}")
+    
+    cache = IndicatorCache()
+    series = cache.bind(prices)
+    series[('sma', 20)]
+    series[('sma', 20)]
+    print(f"Cache: {cache.get_stats()}")
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Market Data Cache
+Gedeeld shared memory segment met marktdata voor api_server, mt5_bridge en live_trader
+
+De bridge is de enige schrijver: elke succesvolle EA response voor quotes, candles,
+account en positions wordt in een slot gezet. Andere processen mappen hetzelfde
+segment en lezen zonder HTTP round-trip zolang de data vers genoeg is; anders
+vallen ze terug op de bridge (die het slot dan bijwerkt).
+
+Layout: header (64 bytes) + slot headers (128 bytes) + slot payloads (SLOT_SIZE)
+    slot header: seq (uint64, seqlock: oneven = wordt geschreven), updated (float64, time.time()),
+                 kind (uint32), length (uint32), key (96 bytes utf-8)
+Candles staan als records (CANDLE_DTYPE), de rest als JSON.
+"""
+
+import json
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import requests
+from candle_store import candles_to_arrays, arrays_to_candles, OHLCV_FIELDS
+from indicator_series import _untrack
+
+SEGMENT_NAME = 'ait_market_data'  # macOS staat max 31 tekens toe
+CACHE_MAGIC = 0x4D445443  # b'CTDM' als little-endian int32
+CACHE_VERSION = 1
+SLOT_COUNT = 32
+SLOT_SIZE = 256 * 1024
+
+HEADER_SIZE = 64
+SLOT_HEADER_SIZE = 128
+KEY_OFFSET = 32
+KEY_SIZE = SLOT_HEADER_SIZE - KEY_OFFSET
+
+KIND_JSON = 1
+KIND_CANDLES = 2
+CANDLE_DTYPE = np.dtype([('time', '<i8')] + [(field, '<f8') for field in OHLCV_FIELDS])
+
+# Maximale leeftijd (seconden) per soort data voordat een reader de bridge vraagt
+MAX_AGE = {
+    'tick': 2.0,
+    'candles': 5.0,
+    'account': 5.0,
+    'positions': 2.0
+}
+DEFAULT_MAX_AGE = 2.0
+
+# Aantal pogingen als de schrijver een slot bijwerkt tijdens het lezen
+READ_RETRIES = 100
+
+def cache_key(path: str) -> str:
+    """
+    Slot key voor een bridge pad
+
+    '/candles/XAUUSD/H1/100' -> 'candles/XAUUSD/H1' (count hoort niet bij de key,
+    readers nemen de laatste `count` candles), '/tick/xauusd' -> 'tick/XAUUSD'.
+    """
+    parts = [part for part in path.split('?')[0].split('/') if part]
+    if parts and parts[0] == 'candles':
+        return '/'.join(['candles'] + [part.upper() for part in parts[1:3]])
+    return '/'.join(parts[:1] + [part.upper() for part in parts[1:]])
+
+def max_age_for(key: str) -> float:
+    return MAX_AGE.get(key.split('/')[0], DEFAULT_MAX_AGE)
+
+class MarketDataCache:
+    """
+    Seqlock slots in één shared memory segment
+
+    Eén schrijver per segment (de bridge, threads gesynchroniseerd met een lock);
+    readers proberen opnieuw als de seq tijdens het kopiëren veranderde.
+    """
+
+    def __init__(self, name: str = SEGMENT_NAME, writer: bool = False,
+                 slot_count: int = SLOT_COUNT, slot_size: int = SLOT_SIZE):
+        """
+        Args:
+            name: Naam van het shared memory segment
+            writer: True voor de bridge (maakt het segment aan als het niet bestaat)
+            slot_count: Aantal slots (alleen bij aanmaken)
+            slot_size: Payload bytes per slot (alleen bij aanmaken)
+        """
+        self.name = name
+        self.writer = writer
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+        self._segment = None
+        self._slots = {}  # key -> slot index
+        self._lock = threading.Lock()
+
+    def open(self) -> bool:
+        """Map het segment (schrijver: aanmaken of een bestaand segment hergebruiken)"""
+        if self._segment is not None:
+            return True
+        size = HEADER_SIZE + self.slot_count * (SLOT_HEADER_SIZE + self.slot_size)
+        try:
+            segment = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            if not self.writer:
+                return False
+            try:
+                segment = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+            except FileExistsError:
+                segment = shared_memory.SharedMemory(name=self.name)
+            except OSError as e:
+                print(f"⚠️  Market data cache not available: {e}")
+                return False
+            else:
+                # Layout eerst, magic als laatste: readers mappen pas een compleet segment
+                struct.pack_into('<III', segment.buf, 4, CACHE_VERSION, self.slot_count, self.slot_size)
+                struct.pack_into('<I', segment.buf, 0, CACHE_MAGIC)
+        # Het segment overleeft de processen; alleen unlink() ruimt het op
+        _untrack(segment)
+
+        magic, version, slot_count, slot_size = struct.unpack_from('<4I', segment.buf, 0)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            segment.close()
+            return False
+        self.slot_count, self.slot_size = slot_count, slot_size
+        self._segment = segment
+        self._scan()
+        return True
+
+    def close(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def unlink(self):
+        """Verwijder het segment (alleen de schrijver, bv. bij een layout wijziging)"""
+        self.close()
+        try:
+            # Nieuwe handle: unlink() meldt zich af bij de resource tracker (open() deed dat al)
+            segment = shared_memory.SharedMemory(name=self.name)
+            segment.close()
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _slot_offset(self, index: int) -> int:
+        return HEADER_SIZE + index * SLOT_HEADER_SIZE
+
+    def _payload_offset(self, index: int) -> int:
+        return HEADER_SIZE + self.slot_count * SLOT_HEADER_SIZE + index * self.slot_size
+
+    def _read_key(self, index: int) -> str:
+        offset = self._slot_offset(index) + KEY_OFFSET
+        return bytes(self._segment.buf[offset:offset + KEY_SIZE]).rstrip(b'\0').decode('utf-8', errors='ignore')
+
+    def _scan(self):
+        """Key -> slot index opnieuw opbouwen uit de slot headers"""
+        self._slots = {}
+        for index in range(self.slot_count):
+            key = self._read_key(index)
+            if key:
+                self._slots[key] = index
+
+    def _find_slot(self, key: str) -> Optional[int]:
+        index = self._slots.get(key)
+        if index is not None and self._read_key(index) == key:
+            return index
+        # Slot kan intussen door de schrijver zijn toegewezen of hergebruikt
+        self._scan()
+        return self._slots.get(key)
+
+    def _allocate_slot(self, key: str) -> int:
+        index = self._find_slot(key)
+        if index is not None:
+            return index
+        used = set(self._slots.values())
+        free = [index for index in range(self.slot_count) if index not in used]
+        if free:
+            return free[0]
+        # Vol: het langst niet bijgewerkte slot hergebruiken
+        return min(range(self.slot_count),
+                   key=lambda index: struct.unpack_from('<d', self._segment.buf, self._slot_offset(index) + 8)[0])
+
+    def write(self, key: str, kind: int, payload: bytes) -> bool:
+        """Zet een payload in het slot van key (alleen de schrijver)"""
+        encoded_key = key.encode('utf-8')
+        if not self.writer or len(encoded_key) > KEY_SIZE or len(payload) > self.slot_size or not self.open():
+            return False
+        with self._lock:
+            index = self._allocate_slot(key)
+            offset = self._slot_offset(index)
+            payload_offset = self._payload_offset(index)
+            buf = self._segment.buf
+            seq = struct.unpack_from('<Q', buf, offset)[0]
+
+            struct.pack_into('<Q', buf, offset, seq + 1)  # Oneven: readers wachten
+            struct.pack_into('<dII', buf, offset + 8, time.time(), kind, len(payload))
+            buf[offset + KEY_OFFSET:offset + SLOT_HEADER_SIZE] = encoded_key.ljust(KEY_SIZE, b'\0')
+            buf[payload_offset:payload_offset + len(payload)] = payload
+            struct.pack_into('<Q', buf, offset, seq + 2)
+            self._slots[key] = index
+        return True
+
+    def invalidate(self, key: str):
+        """Markeer een slot als verouderd (bv. positions na een order), readers vragen dan de bridge"""
+        if not self.writer or not self.open():
+            return
+        with self._lock:
+            index = self._find_slot(key)
+            if index is None:
+                return
+            offset = self._slot_offset(index)
+            buf = self._segment.buf
+            seq = struct.unpack_from('<Q', buf, offset)[0]
+            struct.pack_into('<Q', buf, offset, seq + 1)
+            struct.pack_into('<d', buf, offset + 8, 0.0)
+            struct.pack_into('<Q', buf, offset, seq + 2)
+
+    def read(self, key: str, max_age: Optional[float] = None) -> Optional[Tuple[int, bytes, float]]:
+        """
+        Consistente kopie van een slot
+
+        Returns:
+            (kind, payload, updated) of None als het slot niet bestaat of ouder is dan max_age
+        """
+        if not self.open():
+            return None
+        index = self._find_slot(key)
+        if index is None:
+            return None
+        offset = self._slot_offset(index)
+        payload_offset = self._payload_offset(index)
+        buf = self._segment.buf
+        for _ in range(READ_RETRIES):
+            seq = struct.unpack_from('<Q', buf, offset)[0]
+            if seq % 2:
+                time.sleep(0)
+                continue
+            updated, kind, length = struct.unpack_from('<dII', buf, offset + 8)
+            slot_key = bytes(buf[offset + KEY_OFFSET:offset + SLOT_HEADER_SIZE])
+            payload = bytes(buf[payload_offset:payload_offset + min(length, self.slot_size)])
+            if struct.unpack_from('<Q', buf, offset)[0] != seq:
+                continue
+            if slot_key.rstrip(b'\0').decode('utf-8', errors='ignore') != key:
+                return None
+            if max_age is not None and time.time() - updated > max_age:
+                return None
+            return kind, payload, updated
+        return None
+
+    def put_json(self, key: str, data: Dict) -> bool:
+        return self.write(key, KIND_JSON, json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+    def get_json(self, key: str, max_age: Optional[float] = None) -> Optional[Dict]:
+        entry = self.read(key, max_age)
+        if entry is None or entry[0] != KIND_JSON:
+            return None
+        try:
+            data = json.loads(entry[1])
+        except ValueError:
+            # Onleesbare payload (b.v. een writer die halverwege stopte): cache miss
+            return None
+        return data if isinstance(data, dict) else None
+
+    def put_candles(self, key: str, candles: List[Dict]) -> bool:
+        """
+        Sla candles op als records; een kortere update die aansluit op de bestaande
+        history wordt erachter geplakt zodat readers met een grotere count ook bediend worden
+        """
+        if not candles:
+            return False
+        arrays = candles_to_arrays(candles)
+        records = np.empty(len(arrays['time']), dtype=CANDLE_DTYPE)
+        for field in CANDLE_DTYPE.names:
+            records[field] = arrays[field]
+
+        existing = self.get_candle_records(key)
+        if existing is not None and np.any(existing['time'] == records['time'][0]):
+            # Alleen aansluitende history behouden (geen gat tussen oud en nieuw)
+            records = np.concatenate([existing[existing['time'] < records['time'][0]], records])
+        return self.write(key, KIND_CANDLES, records[-(self.slot_size // CANDLE_DTYPE.itemsize):].tobytes())
+
+    def get_candle_records(self, key: str, max_age: Optional[float] = None) -> Optional[np.ndarray]:
+        entry = self.read(key, max_age)
+        if entry is None or entry[0] != KIND_CANDLES or len(entry[1]) % CANDLE_DTYPE.itemsize:
+            return None
+        return np.frombuffer(entry[1], dtype=CANDLE_DTYPE)
+
+    def get_candles(self, key: str, count: int, max_age: Optional[float] = None) -> Optional[List[Dict]]:
+        """Laatste `count` candles als candle dicts, None als er er minder in de cache staan"""
+        records = self.get_candle_records(key, max_age)
+        if records is None or len(records) < count:
+            return None
+        records = records[len(records) - count:]
+        return arrays_to_candles({field: records[field] for field in CANDLE_DTYPE.names})
+
+    def publish(self, path: str, data: Dict) -> bool:
+        """Zet een bridge response in de cache (alleen geldige responses)"""
+        if not isinstance(data, dict) or data.get('error'):
+            return False
+        key = cache_key(path)
+        if key.startswith('candles/'):
+            return self.put_candles(key, data.get('candles', []))
+        return self.put_json(key, data)
+
+    def lookup(self, path: str, max_age: Optional[float] = None) -> Optional[Dict]:
+        """Bridge response voor een pad uit de cache (zelfde vorm als de bridge), None bij een miss"""
+        key = cache_key(path)
+        max_age = max_age_for(key) if max_age is None else max_age
+        if not key.startswith('candles/'):
+            return self.get_json(key, max_age)
+
+        parts = [part for part in path.split('?')[0].split('/') if part]
+        if len(parts) < 4 or not parts[3].isdigit():
+            return None
+        candles = self.get_candles(key, int(parts[3]), max_age)
+        if candles is None:
+            return None
+        return {'symbol': parts[1], 'timeframe': parts[2], 'count': len(candles), 'candles': candles}
+
+    def get_stats(self) -> Dict:
+        if not self.open():
+            return {'available': False, 'name': self.name}
+        self._scan()
+        now = time.time()
+        slots = {}
+        for key, index in sorted(self._slots.items()):
+            updated, kind, length = struct.unpack_from('<dII', self._segment.buf, self._slot_offset(index) + 8)
+            slots[key] = {'age_seconds': round(now - updated, 3) if updated else None, 'bytes': length,
+                          'kind': 'candles' if kind == KIND_CANDLES else 'json'}
+        return {'available': True, 'name': self.name, 'slot_count': self.slot_count, 'slots': slots}
+
+# Reader per process, één keer gemapt
+_reader = None
+_reader_retry = 0.0
+
+def get_reader() -> Optional[MarketDataCache]:
+    """Gedeelde reader voor dit process (None zolang de bridge het segment niet heeft aangemaakt)"""
+    global _reader, _reader_retry
+    if _reader is not None:
+        return _reader
+    if time.time() < _reader_retry:
+        return None
+    cache = MarketDataCache()
+    if cache.open():
+        _reader = cache
+        return _reader
+    _reader_retry = time.time() + 5
+    return None
+
+def bridge_get(path: str, bridge_url: str = "http://localhost:5002", max_age: Optional[float] = None,
+               timeout: float = 5) -> Optional[Dict]:
+    """
+    GET op de bridge, eerst uit de shared memory cache
+
+    Args:
+        path: Bridge pad, bv. '/account' of '/candles/XAUUSD/H1/100'
+        bridge_url: Bridge URL voor een cache miss
+        max_age: Maximale leeftijd van de cache data (default per soort, zie MAX_AGE)
+        timeout: HTTP timeout bij een cache miss
+
+    Returns:
+        JSON response (ook EA foutmeldingen met status 200), None als de bridge niet antwoordt
+    """
+    reader = get_reader()
+    if reader is not None:
+        try:
+            cached = reader.lookup(path, max_age)
+        except Exception as e:
+            # Cache fout is nooit fataal: dan gewoon via HTTP
+            print(f"⚠️  Market data cache lookup {path} failed: {e}")
+            cached = None
+        if cached is not None:
+            return cached
+    try:
+        response = requests.get(f"{bridge_url}{path}", timeout=timeout)
+        if response.status_code == 200:
+            return response.json()
+    except Exception as e:
+        print(f"⚠️  Bridge request {path} failed: {e}")
+    return None
+
+if __name__ == "__main__":
+    # Test: schrijver (bridge) en reader (api_server/live_trader) op hetzelfde segment
+    writer = MarketDataCache(name='ait_market_test', writer=True)
+    writer.open()
+    writer.publish('/account', {'balance': 100000.0, 'equity': 100250.5})
+    writer.publish('/candles/XAUUSD/H1/24', {'candles': [
+        {'time': f"2024.01.01 {hour:02d}:00:00", 'open': 2000 + hour, 'high': 2001 + hour,
+         'low': 1999 + hour, 'close': 2000.5 + hour, 'volume': 100} for hour in range(24)
+    ]})
+
+    reader = MarketDataCache(name='ait_market_test')
+    reader.open()
+    start = time.perf_counter()
+    for _ in range(1000):
+        account = reader.lookup('/account')
+    print(f"⚡ Account {account} in {(time.perf_counter() - start):.4f}ms per read")
+    print(f"✅ Candles: {reader.lookup('/candles/XAUUSD/H1/2')}")
+    print(f"📊 {reader.get_stats()}")
+    reader.close()
+    writer.unlink()
@@ -4,12 +4,126 @@ Market Regime Detection
 Detect trending/ranging/volatile markets
 """
 
-from typing import Dict, List
+import json
+import os
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
 import numpy as np
+from indicator_series import sma_series
+
+REGIMES = ['trending_bullish', 'trending_bearish', 'ranging', 'volatile']
+RANGING = REGIMES.index('ranging')
+ATR_PERIOD = 14
+MIN_BARS = 20  # Minder bars in het venster: 'ranging'
+
+# Per regime geoptimaliseerde strategie parameters (ParameterOptimizer.optimize_regimes)
+REGIME_PARAMETERS_FILE = 'regime_parameters.json'
+
+def true_range_series(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray) -> np.ndarray:
+    """True range per bar (NaN voor bar 0, die heeft geen vorige close)"""
+    highs, lows, closes = (np.asarray(a, dtype=np.float64) for a in (highs, lows, closes))
+    tr = np.full(len(highs), np.nan)
+    if len(highs) > 1:
+        prev_close = closes[:-1]
+        tr[1:] = np.maximum.reduce([highs[1:] - lows[1:], np.abs(highs[1:] - prev_close), np.abs(lows[1:] - prev_close)])
+    return tr
+
+def regime_indicator_series(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray,
+                            lookback: int = 50) -> Dict[str, np.ndarray]:
+    """
+    ATR, ATR baseline, ADX (DX) en trend voor elke bar, uit één true range reeks
+
+    Elke bar krijgt dezelfde waarden als detect_regime op de candles t/m die bar
+    (venster = laatste `lookback` bars, L). De baseline is het rolling gemiddelde
+    van de ATR over de L - 20 bars vóór de bar zelf (cumsum, O(1) per bar).
+
+    Returns:
+        {'atr', 'baseline', 'adx', 'trend', 'window'} arrays (window = bars in het venster)
+    """
+    highs, lows, closes = (np.asarray(a, dtype=np.float64) for a in (highs, lows, closes))
+    n = len(closes)
+    tr = true_range_series(highs, lows, closes)
+
+    up_move = np.zeros(n)
+    down_move = np.zeros(n)
+    up_move[1:] = highs[1:] - highs[:-1]
+    down_move[1:] = lows[:-1] - lows[1:]
+    plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+    minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+
+    # Rolling gemiddelden over de laatste ATR_PERIOD bars (bar 0 heeft geen TR/DM)
+    atr = np.zeros(n)
+    avg_plus = np.zeros(n)
+    avg_minus = np.zeros(n)
+    if n > ATR_PERIOD:
+        atr[1:] = np.nan_to_num(sma_series(tr[1:], ATR_PERIOD))
+        avg_plus[1:] = np.nan_to_num(sma_series(plus_dm[1:], ATR_PERIOD))
+        avg_minus[1:] = np.nan_to_num(sma_series(minus_dm[1:], ATR_PERIOD))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        di_plus = np.where(atr > 0, 100 * avg_plus / atr, 0.0)
+        di_minus = np.where(atr > 0, 100 * avg_minus / atr, 0.0)
+        di_sum = di_plus + di_minus
+        adx = np.where(di_sum > 0, 100 * np.abs(di_plus - di_minus) / di_sum, 0.0)
+
+    # Trend: (SMA10 - SMA20) / SMA20 + 0.5 * momentum over 10 bars, in procenten
+    trend = np.zeros(n)
+    if n >= 20:
+        sma_short = sma_series(closes, 10)
+        sma_long = sma_series(closes, 20)
+        base_close = np.concatenate([np.full(9, np.nan), closes[:-9]])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            momentum = np.where(base_close > 0, (closes - base_close) / base_close, 0.0)
+            crossover = np.where(sma_long > 0, (sma_short - sma_long) / sma_long, 0.0)
+        trend[19:] = ((crossover + momentum * 0.5) * 100)[19:]
+
+    # Baseline: gemiddelde ATR van de L - 20 voorgaande bars (venster posities 19..L-2)
+    bars = np.arange(n)
+    window = np.minimum(lookback, bars + 1)
+    span = np.maximum(window - 20, 1)
+    cumsum = np.concatenate([[0.0], np.cumsum(atr)])
+    baseline = (cumsum[bars] - cumsum[np.maximum(bars - span, 0)]) / span
+    baseline = np.where(window > 20, baseline, atr)
+
+    return {'atr': atr, 'baseline': baseline, 'adx': adx, 'trend': trend, 'window': window}
+
+def classify_regimes(indicators: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Regime code per bar (index in REGIMES), zelfde regels als detect_regime:
+    volatile als ATR > 1.5 x baseline, anders trending bij ADX > 25, anders ranging
+    """
+    codes = np.full(len(indicators['atr']), RANGING, dtype=np.int8)
+    trending = indicators['adx'] > 25
+    codes[trending] = np.where(indicators['trend'][trending] > 0,
+                               REGIMES.index('trending_bullish'), REGIMES.index('trending_bearish'))
+    codes[indicators['atr'] > indicators['baseline'] * 1.5] = REGIMES.index('volatile')
+    codes[indicators['window'] < MIN_BARS] = RANGING
+    return codes
+
+def regime_series(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray, lookback: int = 50) -> np.ndarray:
+    """
+    Regime code voor elke bar van een hele history in O(n)
+
+    Returns:
+        int8 array met index in REGIMES (REGIMES[code] is de regime naam)
+    """
+    return classify_regimes(regime_indicator_series(highs, lows, closes, lookback))
 
 class MarketRegimeDetector:
-    def __init__(self):
-        self.regimes = ['trending_bullish', 'trending_bearish', 'ranging', 'volatile']
+    def __init__(self, lookback: int = 50, parameters_file: Optional[str] = None):
+        """
+        Args:
+            lookback: Venster voor update() en detect_regime_series()
+            parameters_file: JSON met geoptimaliseerde parameters per regime (optioneel)
+        """
+        self.regimes = list(REGIMES)
+        self.lookback = lookback
+        self.current_regime = None
+        self.strategy_overrides = {}  # regime -> parameters over de defaults heen
+        if parameters_file:
+            self.load_strategy_parameters(parameters_file)
+        self.reset()
     
     def detect_regime(self, candles: List[Dict], lookback: int = 50) -> str:
         """
@@ -25,38 +139,121 @@ class MarketRegimeDetector:
         if len(candles) < lookback:
             lookback = len(candles)
         
-        if lookback < 20:
+        if lookback < MIN_BARS:
             return 'ranging'  # Default
         
         recent_candles = candles[-lookback:]
         
         # Extract price data
-        highs = [float(c.get('high', 0)) for c in recent_candles]
-        lows = [float(c.get('low', 0)) for c in recent_candles]
-        closes = [float(c.get('close', 0)) for c in recent_candles]
-        
-        # Calculate indicators
-        adx = self._calculate_adx(highs, lows, closes, 14)
-        atr = self._calculate_atr(highs, lows, closes, 14)
-        trend = self._detect_trend(closes)
-        volatility = self._calculate_volatility(closes)
-        
-        # Regime detection logic
-        # 1. Check for volatility
-        avg_atr = np.mean([self._calculate_atr(highs[:i+20], lows[:i+20], closes[:i+20], 14) 
-                           for i in range(20, len(closes))]) if len(closes) > 20 else atr
-        if atr > avg_atr * 1.5:
-            return 'volatile'
-        
-        # 2. Check for trending (ADX > 25)
-        if adx > 25:
-            if trend > 0:
-                return 'trending_bullish'
+        highs = np.array([float(c.get('high', 0)) for c in recent_candles])
+        lows = np.array([float(c.get('low', 0)) for c in recent_candles])
+        closes = np.array([float(c.get('close', 0)) for c in recent_candles])
+        
+        # Eén pass over het venster; de laatste bar is het huidige regime
+        codes = regime_series(highs, lows, closes, lookback)
+        return REGIMES[codes[-1]]
+    
+    def detect_regime_series(self, candles: List[Dict], lookback: Optional[int] = None) -> List[str]:
+        """
+        Regime voor elke candle (elke bar ziet alleen zijn eigen venster, geen toekomst)
+        
+        Args:
+            candles: Hele candle history (oudste eerst)
+            lookback: Venster per bar (default: self.lookback)
+        
+        Returns:
+            Lijst met regime strings, zelfde lengte als candles
+        """
+        highs = np.array([float(c.get('high', 0)) for c in candles])
+        lows = np.array([float(c.get('low', 0)) for c in candles])
+        closes = np.array([float(c.get('close', 0)) for c in candles])
+        codes = regime_series(highs, lows, closes, lookback or self.lookback)
+        return [REGIMES[code] for code in codes]
+    
+    def reset(self):
+        """Wis de incrementele state van update()"""
+        self._state = {
+            'bars': 0,
+            'prev': None,  # (high, low, close) van de vorige bar
+            'tr': deque(maxlen=ATR_PERIOD),
+            'plus_dm': deque(maxlen=ATR_PERIOD),
+            'minus_dm': deque(maxlen=ATR_PERIOD),
+            'closes': deque(maxlen=MIN_BARS),
+            'atr': deque(maxlen=max(self.lookback - 20, 1))  # ATR van eerdere bars voor de baseline
+        }
+        self._committed = None  # State voor de laatste bar (voor updates van een lopende bar)
+        self._last_time = None
+        self.current_regime = None
+    
+    @staticmethod
+    def _copy_state(state: Dict) -> Dict:
+        return {key: value.copy() if isinstance(value, deque) else value for key, value in state.items()}
+    
+    def update(self, candle: Dict) -> str:
+        """
+        Incrementele regime detectie voor live gebruik: O(1) per bar
+        
+        Geeft hetzelfde regime als detect_regime(candles, self.lookback) op alle
+        candles tot en met deze. Een update met dezelfde 'time' als de vorige
+        (lopende bar) vervangt die bar in plaats van een nieuwe toe te voegen.
+        
+        Args:
+            candle: Candle dict met high/low/close (en time)
+        
+        Returns:
+            Regime string
+        """
+        bar_time = candle.get('time')
+        if bar_time is not None and bar_time == self._last_time and self._committed is not None:
+            self._state = self._copy_state(self._committed)
+        else:
+            self._committed = self._copy_state(self._state)
+        self._last_time = bar_time
+        
+        state = self._state
+        high, low, close = float(candle.get('high', 0)), float(candle.get('low', 0)), float(candle.get('close', 0))
+        if state['prev'] is not None:
+            prev_high, prev_low, prev_close = state['prev']
+            up_move = high - prev_high
+            down_move = prev_low - low
+            state['plus_dm'].append(up_move if up_move > down_move and up_move > 0 else 0.0)
+            state['minus_dm'].append(down_move if down_move > up_move and down_move > 0 else 0.0)
+            state['tr'].append(max(high - low, abs(high - prev_close), abs(low - prev_close)))
+        state['prev'] = (high, low, close)
+        state['closes'].append(close)
+        state['bars'] += 1
+        
+        atr = float(np.mean(state['tr'])) if len(state['tr']) == ATR_PERIOD else 0.0
+        window = min(self.lookback, state['bars'])
+        regime = 'ranging'
+        
+        if window >= MIN_BARS:
+            if window > 20:
+                previous = list(state['atr'])[-(window - 20):]
+                baseline = sum(previous) / (window - 20)
             else:
-                return 'trending_bearish'
+                baseline = atr
+            
+            if atr > baseline * 1.5:
+                regime = 'volatile'
+            elif self._calculate_dx(state, atr) > 25:
+                regime = 'trending_bullish' if self._detect_trend(list(state['closes'])) > 0 else 'trending_bearish'
         
-        # 3. Default to ranging
-        return 'ranging'
+        state['atr'].append(atr)
+        self.current_regime = regime
+        return regime
+    
+    @staticmethod
+    def _calculate_dx(state: Dict, atr: float) -> float:
+        """DX uit de DM/TR vensters van de incrementele state (zelfde als _calculate_adx)"""
+        if atr == 0 or len(state['plus_dm']) < ATR_PERIOD:
+            return 0
+        di_plus = 100 * (np.mean(state['plus_dm']) / atr)
+        di_minus = 100 * (np.mean(state['minus_dm']) / atr)
+        di_sum = di_plus + di_minus
+        if di_sum == 0:
+            return 0
+        return 100 * abs(di_plus - di_minus) / di_sum
     
     def get_strategy_for_regime(self, regime: str) -> Dict:
         """
@@ -103,7 +300,41 @@ class MarketRegimeDetector:
             }
         }
         
-        return strategies.get(regime, strategies['ranging'])
+        parameters = dict(strategies.get(regime, strategies['ranging']))
+        parameters.update(self.strategy_overrides.get(regime if regime in strategies else 'ranging', {}))
+        return parameters
+    
+    def set_strategy_parameters(self, regime: str, parameters: Dict):
+        """Overschrijf (een deel van) de strategie parameters voor een regime"""
+        if regime not in REGIMES:
+            raise ValueError(f"Unknown regime: {regime}")
+        self.strategy_overrides[regime] = {key: value for key, value in parameters.items() if key != 'description'}
+    
+    def load_strategy_parameters(self, path: str = REGIME_PARAMETERS_FILE) -> bool:
+        """Laad parameters per regime uit JSON (False als het bestand ontbreekt of ongeldig is)"""
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            for regime, parameters in data.get('regimes', {}).items():
+                if regime in REGIMES:
+                    self.set_strategy_parameters(regime, parameters)
+            return True
+        except Exception as e:
+            print(f"Error loading regime parameters: {e}")
+            return False
+    
+    def save_strategy_parameters(self, path: str = REGIME_PARAMETERS_FILE):
+        """Schrijf de parameters per regime atomisch weg"""
+        data = {
+            'regimes': self.strategy_overrides,
+            'last_updated': datetime.now().isoformat()
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
     
     def _calculate_adx(self, highs: List[float], lows: List[float], closes: List[float], period: int = 14) -> float:
         """Calculate Average Directional Index"""
@@ -226,3 +457,18 @@ if __name__ == "__main__":
     
     strategy_params = detector.get_strategy_for_regime(regime)
     print(f"Strategy Parameters: {strategy_params}")
+    
+    # Regime reeks over een random walk history + incrementeel dezelfde bars
+    import time
+    rng = np.random.default_rng(7)
+    closes = 2500 + np.cumsum(rng.normal(0, 3, 5000))
+    highs = closes + rng.uniform(0, 3, 5000)
+    lows = closes - rng.uniform(0, 3, 5000)
+    
+    start = time.perf_counter()
+    codes = regime_series(highs, lows, closes)
+    print(f"⚡ regime_series: {len(codes)} bars in {(time.perf_counter() - start) * 1000:.1f}ms")
+    
+    for i in range(len(closes)):
+        live_regime = detector.update({'time': i, 'high': highs[i], 'low': lows[i], 'close': closes[i]})
+    print(f"✅ update(): {live_regime} (series: {REGIMES[codes[-1]]})")
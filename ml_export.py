@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+ML Model Export
+Compact inference formaat voor getrainde Random Forest modellen
+Alle bomen worden platgeslagen in een paar NumPy arrays (.npz); scoren gebeurt
+met pure NumPy, zonder sklearn te importeren
+"""
+
+import json
+import os
+import time
+from typing import Dict, List, Optional
+import numpy as np
+
+COMPACT_FORMAT_VERSION = 1
+_SIGNAL_NAMES = {1: 'BUY', -1: 'SELL'}
+_SUPPORTED_ESTIMATORS = ('RandomForestClassifier', 'ExtraTreesClassifier')
+
+def align_features(X: np.ndarray, feature_names: Optional[List[str]], model_features: List[str]) -> np.ndarray:
+    """
+    Herorden kolommen naar de volgorde waarop het model getraind is
+
+    Args:
+        X: Feature matrix, kolommen in de volgorde van feature_names
+        feature_names: Namen van de kolommen (None: al in model volgorde)
+        model_features: Feature namen van het model
+
+    Raises:
+        ValueError: Als een feature van het model niet in feature_names zit
+    """
+    if feature_names is None or not model_features or list(feature_names) == list(model_features):
+        return X
+    positions = {name: i for i, name in enumerate(feature_names)}
+    missing = [name for name in model_features if name not in positions]
+    if missing:
+        raise ValueError(f"Missing model features: {', '.join(missing)}")
+    return X[:, [positions[name] for name in model_features]]
+
+def export_compact(model, filepath: str) -> Dict:
+    """
+    Exporteer een getraind model naar het compacte .npz formaat
+
+    Per node worden alleen feature, threshold en de kinderen bewaard; de
+    klasse kansen alleen voor bladeren. Bladeren verwijzen naar zichzelf met
+    threshold +inf, zodat het scoren een vast aantal stappen (max diepte) is.
+
+    Args:
+        model: MLTradingModel of een sklearn RandomForestClassifier/ExtraTreesClassifier
+        filepath: Doel bestand (.npz)
+
+    Returns:
+        Dict met bestandsgrootte, aantal bomen/nodes en max diepte
+    """
+    estimator = getattr(model, 'model', model)
+    feature_names = list(getattr(model, 'feature_names', []) or [])
+    training_metrics = getattr(model, 'training_metrics', {}) or {}
+    model_type = getattr(model, 'model_type', 'random_forest')
+
+    if type(estimator).__name__ not in _SUPPORTED_ESTIMATORS or not hasattr(estimator, 'estimators_'):
+        raise ValueError(f"Compact export supports {', '.join(_SUPPORTED_ESTIMATORS)} only, "
+                         f"got {type(estimator).__name__}")
+    if getattr(estimator, 'n_outputs_', 1) != 1:
+        raise ValueError("Compact export supports single-output models only")
+
+    features, thresholds, lefts, rights, leaf_slots, leaf_values = [], [], [], [], [], []
+    roots = []
+    offset = 0
+    leaf_offset = 0
+    max_depth = 0
+
+    for tree_estimator in estimator.estimators_:
+        tree = tree_estimator.tree_
+        count = tree.node_count
+        left = tree.children_left.astype(np.int64)
+        right = tree.children_right.astype(np.int64)
+        is_leaf = left == -1
+        node_ids = np.arange(count)
+
+        # Bladeren: naar zichzelf, altijd "links" (threshold +inf)
+        feature = np.where(is_leaf, 0, tree.feature).astype(np.int32)
+        threshold = np.where(is_leaf, np.inf, tree.threshold)
+        left = np.where(is_leaf, node_ids, left) + offset
+        right = np.where(is_leaf, node_ids, right) + offset
+
+        # Klasse kansen per blad (genormaliseerd zoals DecisionTreeClassifier.predict_proba)
+        value = tree.value[is_leaf, 0, :].astype(np.float64)
+        totals = value.sum(axis=1, keepdims=True)
+        value = value / np.where(totals == 0, 1.0, totals)
+        slots = np.full(count, -1, dtype=np.int64)
+        slots[is_leaf] = np.arange(int(is_leaf.sum())) + leaf_offset
+
+        features.append(feature)
+        thresholds.append(threshold)
+        lefts.append(left)
+        rights.append(right)
+        leaf_slots.append(slots)
+        leaf_values.append(value)
+        roots.append(offset)
+        offset += count
+        leaf_offset += len(value)
+        max_depth = max(max_depth, int(tree.max_depth))
+
+    index_dtype = np.int32 if offset < np.iinfo(np.int32).max else np.int64
+    n_features = int(getattr(estimator, 'n_features_in_', len(feature_names)))
+    metadata = {
+        'format_version': COMPACT_FORMAT_VERSION,
+        'model_type': model_type,
+        'estimator': type(estimator).__name__,
+        'feature_names': feature_names,
+        'n_features': n_features,
+        'training_metrics': {key: training_metrics.get(key) for key in ('train_accuracy', 'test_accuracy')
+                             if key in training_metrics},
+        'exported_at': time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    # Schrijf naar een tijdelijk bestand en vervang atomisch (registry kan het bestand lezen)
+    tmp_path = filepath + '.tmp.npz'
+    np.savez_compressed(
+        tmp_path,
+        feature=np.concatenate(features).astype(np.int16 if n_features < 2 ** 15 else np.int32),
+        threshold=np.concatenate(thresholds),
+        left=np.concatenate(lefts).astype(index_dtype),
+        right=np.concatenate(rights).astype(index_dtype),
+        leaf_slot=np.concatenate(leaf_slots).astype(index_dtype),
+        leaf_value=np.vstack(leaf_values),
+        roots=np.asarray(roots, dtype=index_dtype),
+        classes=np.asarray(estimator.classes_),
+        max_depth=np.asarray(max_depth),
+        metadata=np.asarray(json.dumps(metadata))
+    )
+    os.replace(tmp_path, filepath)
+
+    size = os.path.getsize(filepath)
+    print(f"✅ Compact model exported to {filepath} ({size / 1024:.0f} KB, "
+          f"{len(roots)} trees, {offset} nodes)")
+    return {
+        'path': filepath,
+        'file_size': size,
+        'trees': len(roots),
+        'nodes': int(offset),
+        'leaves': int(leaf_offset),
+        'max_depth': max_depth
+    }
+
+class CompactForest:
+    def __init__(self, model_path: Optional[str] = None):
+        """
+        Args:
+            model_path: Pad naar een met export_compact geschreven .npz (optional)
+        """
+        self.model_type = 'random_forest'
+        self.feature_names = []
+        self.training_metrics = {}
+        self.trained = False
+        self.classes_ = np.empty(0)
+        self.max_depth = 0
+
+        if model_path and os.path.exists(model_path):
+            self.load_model(model_path)
+
+    def load_model(self, filepath: str):
+        """Laad een compact model (.npz)"""
+        with np.load(filepath, allow_pickle=False) as data:
+            metadata = json.loads(str(data['metadata']))
+            if metadata.get('format_version', 0) > COMPACT_FORMAT_VERSION:
+                raise ValueError(f"Unsupported compact format version {metadata.get('format_version')}")
+            self._feature = data['feature'].astype(np.intp)
+            self._threshold = data['threshold']
+            self._left = data['left'].astype(np.intp)
+            self._right = data['right'].astype(np.intp)
+            self._leaf_slot = data['leaf_slot'].astype(np.intp)
+            self._leaf_value = data['leaf_value']
+            self._roots = data['roots'].astype(np.intp)
+            self.classes_ = data['classes']
+            self.max_depth = int(data['max_depth'])
+
+        self.model_type = metadata.get('model_type', 'random_forest')
+        self.feature_names = metadata.get('feature_names', [])
+        self.n_features = metadata.get('n_features', len(self.feature_names))
+        self.training_metrics = metadata.get('training_metrics', {})
+        self.metadata = metadata
+        self.trained = True
+
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        """Blad node per (rij, boom)"""
+        # sklearn vergelijkt float32 features met float64 thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self._roots, (len(X), len(self._roots)))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self._feature[nodes]] <= self._threshold[nodes]
+            nodes = np.where(go_left, self._left[nodes], self._right[nodes])
+        return nodes
+
+    def _leaves_single(self, x: np.ndarray) -> np.ndarray:
+        """Snelle route voor één rij (live loop)"""
+        x = np.asarray(x, dtype=np.float32).astype(np.float64)
+        nodes = self._roots
+        for _ in range(self.max_depth):
+            nodes = np.where(x[self._feature[nodes]] <= self._threshold[nodes],
+                             self._left[nodes], self._right[nodes])
+        return nodes
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Gemiddelde blad kansen over alle bomen, zelfde als RandomForestClassifier.predict_proba"""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if len(X) == 1:
+            return self._leaf_value[self._leaf_slot[self._leaves_single(X[0])]].mean(axis=0, keepdims=True)
+        return self._leaf_value[self._leaf_slot[self._leaves(X)]].mean(axis=1)
+
+    def predict(self, candles: List[Dict]) -> Dict:
+        """
+        Predict trading signal from current candles (zelfde vorm als MLTradingModel.predict)
+
+        Args:
+            candles: List of candlestick data (min. 50 candles)
+        """
+        if not self.trained:
+            return {'signal': 'NEUTRAL', 'confidence': 0, 'error': 'Model not trained'}
+
+        from ml_feature_matrix import FeatureMatrixBuilder
+        builder = FeatureMatrixBuilder(feature_set=self.feature_names or None)
+        if not candles or len(candles) < builder.lookback:
+            return {'signal': 'NEUTRAL', 'confidence': 0, 'error': 'Could not extract features'}
+        X, _ = builder.build(candles[-builder.lookback:])
+        return self.predict_features(X[-1], builder.feature_names)
+
+    def predict_features(self, feature_row: np.ndarray, feature_names: Optional[List[str]] = None) -> Dict:
+        """Predict vanuit één feature rij, zelfde vorm als MLTradingModel.predict_features"""
+        if not self.trained:
+            return {'signal': 'NEUTRAL', 'confidence': 0, 'error': 'Model not trained'}
+
+        row = align_features(np.asarray(feature_row, dtype=np.float64).reshape(1, -1), feature_names,
+                             self.feature_names)
+        probabilities = self.predict_proba(row)[0]
+        best = int(np.argmax(probabilities))
+        prediction = int(self.classes_[best])
+        return {
+            'signal': _SIGNAL_NAMES.get(prediction, 'NEUTRAL'),
+            'confidence': round(float(probabilities[best]) * 100, 2),
+            'probabilities': {_SIGNAL_NAMES.get(int(cls), 'NEUTRAL'): float(probabilities[i])
+                              for i, cls in enumerate(self.classes_)},
+            'prediction': prediction,
+            'features_used': len(self.feature_names)
+        }
+
+    def predict_many(self, feature_matrix: np.ndarray, feature_names: Optional[List[str]] = None) -> Dict:
+        """Predict een hele feature matrix, zelfde vorm als MLTradingModel.predict_many"""
+        if not self.trained:
+            return {'error': 'Model not trained', 'signals': [], 'rows': 0}
+
+        X = np.asarray(feature_matrix, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if len(X) == 0:
+            return {'signals': [], 'predictions': [], 'confidence': [], 'probabilities': {}, 'rows': 0}
+        X = align_features(X, feature_names, self.feature_names)
+
+        probabilities = self.predict_proba(X)
+        predictions = self.classes_[np.argmax(probabilities, axis=1)]
+        return {
+            'signals': [_SIGNAL_NAMES.get(int(p), 'NEUTRAL') for p in predictions],
+            'predictions': predictions.astype(int).tolist(),
+            'confidence': np.round(probabilities.max(axis=1) * 100, 2).tolist(),
+            'probabilities': {_SIGNAL_NAMES.get(int(cls), 'NEUTRAL'): probabilities[:, i].tolist()
+                              for i, cls in enumerate(self.classes_)},
+            'rows': int(len(X)),
+            'features_used': len(self.feature_names)
+        }
+
+def is_compact_model(filepath: str) -> bool:
+    return filepath.lower().endswith('.npz')
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Usage: python ml_export.py <model.pkl> [output.npz]")
+        sys.exit(1)
+
+    from ml_model import MLTradingModel
+
+    source = sys.argv[1]
+    target = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(source)[0] + '.npz'
+    model = MLTradingModel(model_path=source)
+    info = export_compact(model, target)
+    print(f"   Pickle: {os.path.getsize(source) / 1024:.0f} KB -> compact: {info['file_size'] / 1024:.0f} KB")
+
+    compact = CompactForest(target)
+    X = np.random.default_rng(0).normal(0, 1, (2000, compact.n_features))
+    reference = model.model.predict_proba(X)
+    print(f"   Max proba diff vs sklearn: {np.abs(compact.predict_proba(X) - reference).max():.2e}")
+
+    start = time.perf_counter()
+    for row in X[:500]:
+        compact.predict_features(row)
+    print(f"⚡ Single row: {(time.perf_counter() - start) / 500 * 1e6:.0f}µs")
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+ML Feature Matrix Builder
+Alle features van MLFeatureEngineer.extract_features als volledige kolommen
+over de hele candle history, in één vectorized pass (NumPy)
+
+Rij i bevat dezelfde waarden als extract_features(candles[:i + 1]) met een
+lookback van 50 candles, in dezelfde volgorde (FEATURE_NAMES).
+"""
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from indicator_series import ema_series, rsi_series
+from candle_store import candles_to_arrays
+from candle_patterns import FEATURE_PATTERNS, pattern_columns, recent_flags
+
+# Volgorde van MLFeatureEngineer.extract_features (alle feature groepen)
+FEATURE_NAMES = [
+    # Technical
+    'sma_20', 'sma_50', 'ema_12', 'ema_26', 'rsi',
+    'macd', 'macd_signal', 'macd_histogram',
+    'bb_upper', 'bb_middle', 'bb_lower', 'bb_width', 'bb_position',
+    'atr', 'adx', 'price_vs_sma20', 'price_vs_sma50',
+    # Patterns
+    'pattern_hammer', 'pattern_shooting_star', 'pattern_doji',
+    'pattern_bullish_engulfing', 'pattern_bearish_engulfing',
+    # Support/Resistance
+    'distance_to_support', 'support_strength', 'distance_to_resistance', 'resistance_strength',
+    # Volume
+    'volume_sma_20', 'volume_ratio', 'volume_trend',
+    # Momentum
+    'momentum_5', 'momentum_10', 'momentum_20', 'roc_5', 'roc_10',
+    # Volatility
+    'volatility_20', 'volatility_5', 'volatility_ratio',
+    # Market structure
+    'higher_highs_count', 'lower_lows_count', 'trend_strength', 'price_position_in_range'
+]
+
+# Feature groepen (één berekening per groep) en de losse indicatoren binnen 'technical'
+FEATURE_GROUPS = {
+    'technical': FEATURE_NAMES[0:17],
+    'patterns': FEATURE_NAMES[17:22],
+    'support_resistance': FEATURE_NAMES[22:26],
+    'volume': FEATURE_NAMES[26:29],
+    'momentum': FEATURE_NAMES[29:34],
+    'volatility': FEATURE_NAMES[34:37],
+    'market_structure': FEATURE_NAMES[37:41]
+}
+TECHNICAL_BLOCKS = {
+    'sma': ['sma_20', 'sma_50', 'price_vs_sma20', 'price_vs_sma50'],
+    'ema': ['ema_12', 'ema_26'],
+    'rsi': ['rsi'],
+    'macd': ['macd', 'macd_signal', 'macd_histogram'],
+    'bollinger': ['bb_upper', 'bb_middle', 'bb_lower', 'bb_width', 'bb_position'],
+    'atr': ['atr'],
+    'adx': ['adx']
+}
+
+def required_blocks(feature_set: Optional[Iterable[str]] = None) -> Set[str]:
+    """
+    Groepen en technical blokken die nodig zijn voor een feature set
+
+    Returns:
+        Set met groep namen (FEATURE_GROUPS) en technical blok namen (TECHNICAL_BLOCKS);
+        None geeft alles
+    """
+    if feature_set is None:
+        return set(FEATURE_GROUPS) | set(TECHNICAL_BLOCKS)
+    wanted = set(feature_set)
+    unknown = wanted - set(FEATURE_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown features: {sorted(unknown)}")
+    blocks = {group for group, names in FEATURE_GROUPS.items() if wanted.intersection(names)}
+    blocks |= {block for block, names in TECHNICAL_BLOCKS.items() if wanted.intersection(names)}
+    return blocks
+
+def _rolling(values: np.ndarray, window: int) -> np.ndarray:
+    """Vensters van `window` waarden die eindigen op elke bar (len - window + 1 rijen)"""
+    return sliding_window_view(values, window)
+
+def _tail(values: np.ndarray, window: int, rows: int) -> np.ndarray:
+    """Laatste `rows` rijen van een rolling venster, uitgelijnd op de laatste bars"""
+    windows = _rolling(values, window)
+    return windows[len(windows) - rows:]
+
+def _safe_div(numerator: np.ndarray, denominator: np.ndarray, default: float) -> np.ndarray:
+    """numerator / denominator waar denominator > 0, anders default"""
+    result = np.full(np.broadcast(numerator, denominator).shape, default, dtype=np.float64)
+    valid = np.broadcast_to(denominator > 0, result.shape)
+    np.divide(numerator, denominator, out=result, where=valid)
+    return result
+
+class FeatureMatrixBuilder:
+    def __init__(self, lookback: int = 50, feature_set: Optional[Iterable[str]] = None):
+        """
+        Args:
+            lookback: Candles per feature venster (min. 50)
+            feature_set: Alleen deze features berekenen (bv. de geselecteerde set van een model);
+                         kolommen blijven in FEATURE_NAMES volgorde. None = alle features
+        """
+        if lookback < 50:
+            raise ValueError("lookback must be at least 50 (all feature groups need 50 candles)")
+        self.lookback = lookback
+        self.blocks = required_blocks(feature_set)
+        wanted = set(FEATURE_NAMES if feature_set is None else feature_set)
+        self.feature_names = [name for name in FEATURE_NAMES if name in wanted]
+
+    def build(self, candles: Union[List[Dict], Dict[str, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Bouw de feature matrix voor elke bar met een volledige lookback
+
+        Args:
+            candles: Candle dicts (oudste eerst) of kolom arrays (zie candle_store)
+
+        Returns:
+            (X, index): X met shape (rows, len(self.feature_names)), index = bar index per rij
+        """
+        arrays = candles_to_arrays(candles) if isinstance(candles, list) else candles
+        opens = np.asarray(arrays['open'], dtype=np.float64)
+        highs = np.asarray(arrays['high'], dtype=np.float64)
+        lows = np.asarray(arrays['low'], dtype=np.float64)
+        closes = np.asarray(arrays['close'], dtype=np.float64)
+        volumes = np.asarray(arrays['volume'], dtype=np.float64)
+
+        n = len(closes)
+        first = self.lookback - 1
+        if n < self.lookback:
+            return np.empty((0, len(self.feature_names))), np.empty(0, dtype=np.int64)
+
+        rows = n - first
+        index = np.arange(first, n)
+        blocks = self.blocks
+        columns = {}
+        if 'technical' in blocks:
+            columns.update(self._technical(opens, highs, lows, closes, rows))
+        if 'patterns' in blocks:
+            columns.update(self._patterns(opens, highs, lows, closes, rows))
+        if 'support_resistance' in blocks:
+            columns.update(self._support_resistance(highs, lows, closes, rows))
+        if 'volume' in blocks:
+            columns.update(self._volume(volumes, rows))
+        if 'momentum' in blocks:
+            columns.update(self._momentum(closes, rows))
+        if 'volatility' in blocks:
+            columns.update(self._volatility(closes, rows))
+        if 'market_structure' in blocks:
+            columns.update(self._market_structure(highs, lows, closes, rows))
+
+        X = np.column_stack([columns[name] for name in self.feature_names])
+        return X, index
+
+    def _technical(self, opens, highs, lows, closes, rows: int) -> Dict[str, np.ndarray]:
+        """Technical indicators; alleen de blokken uit self.blocks"""
+        blocks = self.blocks
+        current = closes[-rows:]
+        features = {}
+        if blocks & {'sma', 'bollinger'}:
+            features['sma_20'] = _tail(closes, 20, rows).mean(axis=1)
+        if 'sma' in blocks:
+            features['sma_50'] = _tail(closes, 50, rows).mean(axis=1)
+        if blocks & {'ema', 'macd'}:
+            # EMA geseed op de eerste prijs van het lookback venster
+            features['ema_12'] = ema_series(closes, 12, window=self.lookback)[-rows:]
+            features['ema_26'] = ema_series(closes, 26, window=self.lookback)[-rows:]
+        if 'rsi' in blocks:
+            features['rsi'] = rsi_series(closes, 14)[-rows:]
+
+        if 'macd' in blocks:
+            features['macd'] = features['ema_12'] - features['ema_26']
+            features['macd_signal'] = features['macd'] * 0.9  # Approximation, zoals _calculate_macd
+            features['macd_histogram'] = features['macd'] - features['macd_signal']
+
+        if 'bollinger' in blocks:
+            bb_window = _tail(closes, 20, rows)
+            std = bb_window.std(axis=1)
+            middle = features['sma_20']
+            upper = middle + std * 2.0
+            lower = middle - std * 2.0
+            width = upper - lower
+            features['bb_upper'] = upper
+            features['bb_middle'] = middle
+            features['bb_lower'] = lower
+            features['bb_width'] = width
+            features['bb_position'] = _safe_div(current - lower, width, 0.5)
+
+        if 'atr' in blocks:
+            # True range per bar (t.o.v. de vorige close)
+            previous_close = closes[:-1]
+            true_range = np.maximum.reduce([
+                highs[1:] - lows[1:],
+                np.abs(highs[1:] - previous_close),
+                np.abs(lows[1:] - previous_close)
+            ])
+            features['atr'] = _tail(true_range, 14, rows).mean(axis=1)
+
+        if 'adx' in blocks:
+            up_move = highs[1:] - highs[:-1]
+            down_move = lows[:-1] - lows[1:]
+            plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+            minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+            avg_plus = _tail(plus_dm, 14, rows).mean(axis=1)
+            avg_minus = _tail(minus_dm, 14, rows).mean(axis=1)
+            total = avg_plus + avg_minus
+            features['adx'] = np.where(total == 0, 0.0, 100 * _safe_div(np.abs(avg_plus - avg_minus), total, 0.0))
+
+        if 'sma' in blocks:
+            features['price_vs_sma20'] = _safe_div(current - features['sma_20'], features['sma_20'], 0.0)
+            features['price_vs_sma50'] = _safe_div(current - features['sma_50'], features['sma_50'], 0.0)
+        return features
+
+    def _patterns(self, opens, highs, lows, closes, rows: int) -> Dict[str, np.ndarray]:
+        # Vlag als het patroon binnen zijn lookback voorkomt (laatste 3 candles, engulfing alleen de laatste)
+        columns = pattern_columns(opens, highs, lows, closes, names=FEATURE_PATTERNS.values())
+        return {feature: recent_flags(columns, name)[-rows:].astype(np.float64)
+                for feature, name in FEATURE_PATTERNS.items()}
+
+    def _support_resistance(self, highs, lows, closes, rows: int) -> Dict[str, np.ndarray]:
+        n = len(closes)
+        current = closes[-rows:]
+
+        # Pivot op bar j (2 bars aan elke kant); binnen het venster alleen j in [start + 2, eind - 2]
+        pivot_low = np.zeros(n, dtype=bool)
+        pivot_high = np.zeros(n, dtype=bool)
+        if n >= 5:
+            center = slice(2, n - 2)
+            pivot_low[center] = ((lows[2:-2] < lows[1:-3]) & (lows[2:-2] < lows[:-4])
+                                 & (lows[2:-2] < lows[3:-1]) & (lows[2:-2] < lows[4:]))
+            pivot_high[center] = ((highs[2:-2] > highs[1:-3]) & (highs[2:-2] > highs[:-4])
+                                  & (highs[2:-2] > highs[3:-1]) & (highs[2:-2] > highs[4:]))
+
+        # Kandidaat pivots voor een rij die eindigt op bar i: j in [i - lookback + 3, i - 2]
+        span = self.lookback - 4
+        support_levels = _tail(np.where(pivot_low, lows, np.nan), span, rows + 2)[:rows]
+        resistance_levels = _tail(np.where(pivot_high, highs, np.nan), span, rows + 2)[:rows]
+
+        features = {}
+        with np.errstate(invalid='ignore'):
+            below = support_levels < current[:, None]
+            nearest_support = np.where(below, support_levels, -np.inf).max(axis=1)
+            has_support = np.isfinite(nearest_support)
+            nearest_support = np.where(has_support, nearest_support, 0.0)
+            support_strength = (np.abs(support_levels - nearest_support[:, None])
+                                < (nearest_support * 0.001)[:, None]).sum(axis=1)
+
+            above = resistance_levels > current[:, None]
+            nearest_resistance = np.where(above, resistance_levels, np.inf).min(axis=1)
+            has_resistance = np.isfinite(nearest_resistance)
+            nearest_resistance = np.where(has_resistance, nearest_resistance, 0.0)
+            resistance_strength = (np.abs(resistance_levels - nearest_resistance[:, None])
+                                   < (nearest_resistance * 0.001)[:, None]).sum(axis=1)
+
+        features['distance_to_support'] = np.where(
+            has_support, _safe_div(current - nearest_support, current, 0.0), 0.1)
+        features['support_strength'] = np.where(has_support, support_strength, 0).astype(np.float64)
+        features['distance_to_resistance'] = np.where(
+            has_resistance, _safe_div(nearest_resistance - current, current, 0.0), 0.1)
+        features['resistance_strength'] = np.where(has_resistance, resistance_strength, 0).astype(np.float64)
+        return features
+
+    def _volume(self, volumes, rows: int) -> Dict[str, np.ndarray]:
+        volume_sma = _tail(volumes, 20, rows).mean(axis=1)
+        recent = _tail(volumes, 5, rows).mean(axis=1)
+        older = _tail(volumes[:-5], 5, rows).mean(axis=1)
+        return {
+            'volume_sma_20': volume_sma,
+            'volume_ratio': _safe_div(volumes[-rows:], volume_sma, 1.0),
+            'volume_trend': _safe_div(recent - older, older, 0.0)
+        }
+
+    def _momentum(self, closes, rows: int) -> Dict[str, np.ndarray]:
+        current = closes[-rows:]
+        features = {}
+        for period in (5, 10, 20):
+            # closes[-period] in het venster = period - 1 bars terug
+            past = closes[len(closes) - rows - period + 1:len(closes) - period + 1]
+            features[f'momentum_{period}'] = _safe_div(current - past, past, 0.0)
+        features['roc_5'] = features['momentum_5'] * 100
+        features['roc_10'] = features['momentum_10'] * 100
+        return features
+
+    def _volatility(self, closes, rows: int) -> Dict[str, np.ndarray]:
+        previous = closes[:-1]
+        price_changes = _safe_div(np.abs(closes[1:] - previous), previous, 0.0)
+        volatility_20 = _tail(price_changes, 20, rows).std(axis=1)
+        volatility_5 = _tail(price_changes, 5, rows).std(axis=1)
+        return {
+            'volatility_20': volatility_20,
+            'volatility_5': volatility_5,
+            'volatility_ratio': _safe_div(volatility_5, volatility_20, 1.0)
+        }
+
+    def _market_structure(self, highs, lows, closes, rows: int) -> Dict[str, np.ndarray]:
+        # 9 vergelijkingen binnen de laatste 10 candles
+        higher = (highs[1:] > highs[:-1]).astype(np.float64)
+        lower = (lows[1:] < lows[:-1]).astype(np.float64)
+        higher_highs = _tail(higher, 9, rows).sum(axis=1)
+        lower_lows = _tail(lower, 9, rows).sum(axis=1)
+
+        range_high = _tail(highs, 20, rows).max(axis=1)
+        range_low = _tail(lows, 20, rows).min(axis=1)
+        range_size = range_high - range_low
+        return {
+            'higher_highs_count': higher_highs,
+            'lower_lows_count': lower_lows,
+            'trend_strength': (higher_highs - lower_lows) / 10.0,
+            'price_position_in_range': _safe_div(closes[-rows:] - range_low, range_size, 0.5)
+        }
+
+if __name__ == "__main__":
+    # Vergelijk met extract_features op random candles
+    import time
+    from ml_features import MLFeatureEngineer
+
+    rng = np.random.default_rng(3)
+    closes = 2500 + np.cumsum(rng.normal(0, 3, 2000))
+    opens = np.concatenate([[closes[0]], closes[:-1]])
+    candles = [{
+        'open': opens[i], 'close': closes[i],
+        'high': max(opens[i], closes[i]) + rng.uniform(0, 3),
+        'low': min(opens[i], closes[i]) - rng.uniform(0, 3),
+        'volume': float(rng.integers(100, 1000))
+    } for i in range(len(closes))]
+
+    start = time.time()
+    X, index = FeatureMatrixBuilder().build(candles)
+    print(f"✅ Feature matrix {X.shape} in {time.time() - start:.3f}s")
+
+    engineer = MLFeatureEngineer()
+    worst = 0.0
+    for row in range(0, len(index), 97):
+        expected = engineer.extract_features(candles[:index[row] + 1])
+        vector = np.array([expected[name] for name in FEATURE_NAMES], dtype=np.float64)
+        worst = max(worst, float(np.max(np.abs(vector - X[row]) / np.maximum(1.0, np.abs(vector)))))
+    print(f"📊 Max relative difference vs extract_features: {worst:.2e}")
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+ML Feature Store
+Feature rijen per (symbol, timeframe, bar tijd) voor live ML inference
+Gesloten bars worden één keer berekend; bij een nieuwe bar alleen de nieuwste rij
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from ml_feature_matrix import FeatureMatrixBuilder
+from candle_store import candles_to_arrays
+
+class FeatureStore:
+    def __init__(self, lookback: int = 50, max_rows: int = 5000, feature_set: Optional[List[str]] = None):
+        """
+        Args:
+            lookback: Candles per feature venster (zelfde als extract_features)
+            max_rows: Max bewaarde rijen per symbol/timeframe (oudste eerst weg)
+            feature_set: Alleen deze features berekenen (bv. model.feature_names), None = alle
+        """
+        self.lookback = lookback
+        self.max_rows = max_rows
+        self.builder = FeatureMatrixBuilder(lookback=lookback, feature_set=feature_set)
+        self.feature_names = list(self.builder.feature_names)
+        self._rows = {}  # (symbol, timeframe) -> OrderedDict(bar_time -> (signature, row))
+        self._lock = threading.Lock()
+        self.computed_rows = 0
+        self.cache_hits = 0
+
+    @staticmethod
+    def _signature(candle: Dict) -> Tuple:
+        """OHLCV van een bar; verandert zolang de bar nog loopt"""
+        return tuple(float(candle.get(field, 0)) for field in ('open', 'high', 'low', 'close', 'volume'))
+
+    def _table(self, symbol: str, timeframe: str) -> OrderedDict:
+        key = (symbol.upper(), timeframe.upper())
+        if key not in self._rows:
+            self._rows[key] = OrderedDict()
+        return self._rows[key]
+
+    def update(self, symbol: str, timeframe: str, candles: List[Dict]) -> Optional[np.ndarray]:
+        """
+        Feature rij voor de laatste bar van `candles`
+
+        Alleen als de laatste bar nieuw of gewijzigd is wordt er gerekend, en
+        dan alleen over de laatste `lookback` candles (één rij).
+
+        Returns:
+            Feature vector in self.feature_names volgorde, None bij te weinig candles
+        """
+        if not candles or len(candles) < self.lookback:
+            return None
+
+        last = candles[-1]
+        bar_time = last.get('time')
+        signature = self._signature(last)
+
+        with self._lock:
+            table = self._table(symbol, timeframe)
+            cached = table.get(bar_time)
+            if cached is not None and cached[0] == signature:
+                self.cache_hits += 1
+                return cached[1]
+
+        X, _ = self.builder.build(candles_to_arrays(candles[-self.lookback:]))
+        row = X[-1]
+
+        with self._lock:
+            table = self._table(symbol, timeframe)
+            table[bar_time] = (signature, row)
+            table.move_to_end(bar_time)
+            while len(table) > self.max_rows:
+                table.popitem(last=False)
+            self.computed_rows += 1
+        return row
+
+    def warm(self, symbol: str, timeframe: str, candles: List[Dict]) -> int:
+        """
+        Vul de store in één pass met rijen voor een hele history
+
+        Returns:
+            Aantal rijen toegevoegd
+        """
+        X, index = self.builder.build(candles_to_arrays(candles))
+        start = max(0, len(index) - self.max_rows)
+        with self._lock:
+            table = self._table(symbol, timeframe)
+            for row, bar in zip(X[start:], index[start:]):
+                candle = candles[bar]
+                table[candle.get('time')] = (self._signature(candle), row)
+            while len(table) > self.max_rows:
+                table.popitem(last=False)
+            self.computed_rows += len(X) - start
+        return len(X) - start
+
+    def extend(self, symbol: str, timeframe: str, candles: List[Dict]) -> int:
+        """
+        Vul alleen ontbrekende of gewijzigde bars aan (bv. een training venster)
+
+        Rijen die al bewaard zijn met dezelfde OHLCV worden hergebruikt; er
+        wordt alleen gerekend over het stuk history vanaf de eerste ontbrekende bar.
+
+        Returns:
+            Aantal nieuw berekende rijen
+        """
+        first_bar = self.lookback - 1
+        if len(candles) <= first_bar:
+            return 0
+
+        with self._lock:
+            table = self._table(symbol, timeframe)
+            missing = [bar for bar in range(first_bar, len(candles))
+                       if (cached := table.get(candles[bar].get('time'))) is None
+                       or cached[0] != self._signature(candles[bar])]
+        if not missing:
+            return 0
+
+        start = missing[0] - first_bar
+        X, index = self.builder.build(candles_to_arrays(candles[start:missing[-1] + 1]))
+        computed = {start + bar: row for row, bar in zip(X, index)}
+
+        with self._lock:
+            table = self._table(symbol, timeframe)
+            merged = OrderedDict()
+            for bar in range(first_bar, len(candles)):
+                candle = candles[bar]
+                bar_time = candle.get('time')
+                if bar in computed:
+                    merged[bar_time] = (self._signature(candle), computed[bar])
+                elif bar_time in table:
+                    merged[bar_time] = table[bar_time]
+            # Bars die alleen live gezien zijn (nieuwer dan `candles`) achteraan houden
+            for bar_time, entry in table.items():
+                if bar_time not in merged:
+                    merged[bar_time] = entry
+            while len(merged) > self.max_rows:
+                merged.popitem(last=False)
+            self._rows[(symbol.upper(), timeframe.upper())] = merged
+            self.computed_rows += len(missing)
+        return len(missing)
+
+    def get_row(self, symbol: str, timeframe: str, bar_time) -> Optional[np.ndarray]:
+        """Bewaarde feature rij voor een bar (None als onbekend)"""
+        with self._lock:
+            cached = self._table(symbol, timeframe).get(bar_time)
+        return cached[1] if cached else None
+
+    def get_matrix(self, symbol: str, timeframe: str) -> Tuple[np.ndarray, List]:
+        """
+        Alle bewaarde rijen als matrix
+
+        Returns:
+            (X, bar_times), oudste eerst
+        """
+        with self._lock:
+            items = list(self._table(symbol, timeframe).items())
+        if not items:
+            return np.empty((0, len(self.feature_names))), []
+        return np.vstack([row for _, (_, row) in items]), [bar_time for bar_time, _ in items]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stored = {f"{symbol}_{timeframe}": len(table) for (symbol, timeframe), table in self._rows.items()}
+        return {
+            'stored_rows': stored,
+            'computed_rows': self.computed_rows,
+            'cache_hits': self.cache_hits
+        }
+
+if __name__ == "__main__":
+    # Test feature store met een groeiende history
+    rng = np.random.default_rng(11)
+    closes = 2500 + np.cumsum(rng.normal(0, 3, 300))
+    candles = [{
+        'time': f"2024.01.{1 + i // 24:02d} {i % 24:02d}:00:00",
+        'open': closes[i - 1] if i else closes[0], 'close': closes[i],
+        'high': closes[i] + 1.5, 'low': closes[i] - 1.5, 'volume': 500.0
+    } for i in range(len(closes))]
+
+    store = FeatureStore()
+    store.warm("XAUUSD", "H1", candles[:200])
+    for end in range(200, 300):
+        store.update("XAUUSD", "H1", candles[:end + 1])
+        store.update("XAUUSD", "H1", candles[:end + 1])  # zelfde bar: cache hit
+    print(f"✅ Feature store: {store.get_stats()}")
@@ -4,24 +4,39 @@ ML Feature Engineering
 Extract features voor machine learning model
 """
 
+import threading
 from typing import Dict, List, Optional
 import numpy as np
+from ml_feature_matrix import required_blocks
+from support_resistance import SupportResistanceIndex
+from candle_patterns import FEATURE_PATTERNS, pattern_columns_from_candles, recent_flags
+
+# Maximaal aantal S/R indexes per engineer (één per venster lengte)
+MAX_SR_INDEXES = 8
 
 class MLFeatureEngineer:
     def __init__(self):
         self.feature_names = []
+        self._sr_indexes = {}  # Venster lengte -> SupportResistanceIndex
+        # Het model (en dus deze engineer) wordt via de ModelRegistry door meerdere threads gedeeld
+        self._sr_lock = threading.Lock()
     
-    def extract_features(self, candles: List[Dict], lookback: int = 50) -> Dict:
+    def extract_features(self, candles: List[Dict], lookback: int = 50,
+                         feature_set: Optional[List[str]] = None) -> Dict:
         """
         Extract alle features voor ML model
         
         Args:
             candles: List of candlestick data
             lookback: Number of candles to use for feature calculation
+            feature_set: Alleen deze features berekenen (bv. model.feature_names na
+                         feature selectie); groepen/indicatoren zonder gevraagde
+                         features worden overgeslagen. None = alle features
         
         Returns:
             Dict with feature names and values
         """
+        blocks = required_blocks(feature_set)
         if len(candles) < lookback:
             lookback = len(candles)
         
@@ -40,177 +55,149 @@ class MLFeatureEngineer:
         features = {}
         
         # 1. Technical Indicators
-        features.update(self._get_technical_indicators(closes, highs, lows))
+        if 'technical' in blocks:
+            features.update(self._get_technical_indicators(closes, highs, lows, blocks))
         
         # 2. Candlestick Patterns
-        features.update(self._get_pattern_features(recent_candles))
+        if 'patterns' in blocks:
+            features.update(self._get_pattern_features(recent_candles))
         
         # 3. Support/Resistance Features
-        features.update(self._get_sr_features(highs, lows, closes))
+        if 'support_resistance' in blocks:
+            features.update(self._get_sr_features(highs, lows, closes, recent_candles))
         
         # 4. Volume Features
-        features.update(self._get_volume_features(volumes, closes))
+        if 'volume' in blocks:
+            features.update(self._get_volume_features(volumes, closes))
         
         # 5. Momentum Features
-        features.update(self._get_momentum_features(closes))
+        if 'momentum' in blocks:
+            features.update(self._get_momentum_features(closes))
         
         # 6. Volatility Features
-        features.update(self._get_volatility_features(highs, lows, closes))
+        if 'volatility' in blocks:
+            features.update(self._get_volatility_features(highs, lows, closes))
         
         # 7. Market Structure Features
-        features.update(self._get_market_structure_features(closes, highs, lows))
+        if 'market_structure' in blocks:
+            features.update(self._get_market_structure_features(closes, highs, lows))
+        
+        if feature_set is not None:
+            wanted = set(feature_set)
+            features = {name: value for name, value in features.items() if name in wanted}
         
         self.feature_names = list(features.keys())
         return features
     
-    def _get_technical_indicators(self, closes: List[float], highs: List[float], lows: List[float]) -> Dict:
-        """Extract technical indicator features"""
+    def _get_technical_indicators(self, closes: List[float], highs: List[float], lows: List[float],
+                                  blocks: Optional[set] = None) -> Dict:
+        """Extract technical indicator features (alleen de indicator blokken uit `blocks`)"""
         features = {}
+        blocks = required_blocks() if blocks is None else blocks
         
         if len(closes) < 50:
             return features
         
         # Moving Averages
-        features['sma_20'] = np.mean(closes[-20:]) if len(closes) >= 20 else closes[-1]
-        features['sma_50'] = np.mean(closes[-50:]) if len(closes) >= 50 else features['sma_20']
-        features['ema_12'] = self._calculate_ema(closes, 12)
-        features['ema_26'] = self._calculate_ema(closes, 26) if len(closes) >= 26 else features['ema_12']
+        if 'sma' in blocks:
+            features['sma_20'] = np.mean(closes[-20:]) if len(closes) >= 20 else closes[-1]
+            features['sma_50'] = np.mean(closes[-50:]) if len(closes) >= 50 else features['sma_20']
+        if 'ema' in blocks:
+            features['ema_12'] = self._calculate_ema(closes, 12)
+            features['ema_26'] = self._calculate_ema(closes, 26) if len(closes) >= 26 else features['ema_12']
         
         # RSI
-        features['rsi'] = self._calculate_rsi(closes, 14)
+        if 'rsi' in blocks:
+            features['rsi'] = self._calculate_rsi(closes, 14)
         
         # MACD
-        macd = self._calculate_macd(closes)
-        features['macd'] = macd.get('macd', 0)
-        features['macd_signal'] = macd.get('signal', 0)
-        features['macd_histogram'] = macd.get('histogram', 0)
+        if 'macd' in blocks:
+            macd = self._calculate_macd(closes)
+            features['macd'] = macd.get('macd', 0)
+            features['macd_signal'] = macd.get('signal', 0)
+            features['macd_histogram'] = macd.get('histogram', 0)
         
         # Bollinger Bands
-        bb = self._calculate_bollinger_bands(closes, 20)
-        features['bb_upper'] = bb.get('upper', 0)
-        features['bb_middle'] = bb.get('middle', 0)
-        features['bb_lower'] = bb.get('lower', 0)
-        features['bb_width'] = bb.get('width', 0)
-        features['bb_position'] = bb.get('position', 0)  # 0-1, where price is in band
+        if 'bollinger' in blocks:
+            bb = self._calculate_bollinger_bands(closes, 20)
+            features['bb_upper'] = bb.get('upper', 0)
+            features['bb_middle'] = bb.get('middle', 0)
+            features['bb_lower'] = bb.get('lower', 0)
+            features['bb_width'] = bb.get('width', 0)
+            features['bb_position'] = bb.get('position', 0)  # 0-1, where price is in band
         
         # ATR (Average True Range)
-        features['atr'] = self._calculate_atr(highs, lows, closes, 14)
+        if 'atr' in blocks:
+            features['atr'] = self._calculate_atr(highs, lows, closes, 14)
         
         # ADX (Average Directional Index)
-        features['adx'] = self._calculate_adx(highs, lows, closes, 14)
+        if 'adx' in blocks:
+            features['adx'] = self._calculate_adx(highs, lows, closes, 14)
         
         # Price position relative to indicators
-        current_price = closes[-1]
-        features['price_vs_sma20'] = (current_price - features['sma_20']) / features['sma_20'] if features['sma_20'] > 0 else 0
-        features['price_vs_sma50'] = (current_price - features['sma_50']) / features['sma_50'] if features['sma_50'] > 0 else 0
+        if 'sma' in blocks:
+            current_price = closes[-1]
+            features['price_vs_sma20'] = (current_price - features['sma_20']) / features['sma_20'] if features['sma_20'] > 0 else 0
+            features['price_vs_sma50'] = (current_price - features['sma_50']) / features['sma_50'] if features['sma_50'] > 0 else 0
         
         return features
     
     def _get_pattern_features(self, candles: List[Dict]) -> Dict:
-        """Extract candlestick pattern features"""
+        """Extract candlestick pattern features (candle_patterns kolommen)"""
         features = {}
         
         if len(candles) < 3:
             return features
         
-        # Analyze last 3 candles
-        recent = candles[-3:]
-        
-        # Pattern flags (one-hot encoded)
-        features['pattern_hammer'] = 0
-        features['pattern_shooting_star'] = 0
-        features['pattern_doji'] = 0
-        features['pattern_bullish_engulfing'] = 0
-        features['pattern_bearish_engulfing'] = 0
-        
-        for candle in recent:
-            open_price = float(candle.get('open', 0))
-            close_price = float(candle.get('close', 0))
-            high_price = float(candle.get('high', 0))
-            low_price = float(candle.get('low', 0))
-            
-            if open_price == 0 or close_price == 0:
-                continue
-            
-            body_size = abs(close_price - open_price)
-            total_range = high_price - low_price
-            
-            if total_range == 0:
-                continue
-            
-            body_ratio = body_size / total_range
-            upper_wick = high_price - max(open_price, close_price)
-            lower_wick = min(open_price, close_price) - low_price
-            
-            # Doji
-            if body_ratio < 0.1:
-                features['pattern_doji'] = 1
-            
-            # Hammer
-            if body_ratio < 0.3 and lower_wick > body_size * 2 and upper_wick < body_size:
-                features['pattern_hammer'] = 1
-            
-            # Shooting Star
-            if body_ratio < 0.3 and upper_wick > body_size * 2 and lower_wick < body_size:
-                features['pattern_shooting_star'] = 1
-        
-        # Engulfing patterns (need 2 candles)
-        if len(recent) >= 2:
-            prev = recent[-2]
-            curr = recent[-1]
-            
-            prev_open = float(prev.get('open', 0))
-            prev_close = float(prev.get('close', 0))
-            curr_open = float(curr.get('open', 0))
-            curr_close = float(curr.get('close', 0))
-            
-            # Bullish engulfing
-            if prev_close < prev_open and curr_close > curr_open:
-                if curr_open < prev_close and curr_close > prev_open:
-                    features['pattern_bullish_engulfing'] = 1
-            
-            # Bearish engulfing
-            if prev_close > prev_open and curr_close < curr_open:
-                if curr_open > prev_close and curr_close < prev_open:
-                    features['pattern_bearish_engulfing'] = 1
+        # Analyze last 3 candles, pattern flags (one-hot encoded)
+        columns = pattern_columns_from_candles(candles[-3:])
+        for feature, name in FEATURE_PATTERNS.items():
+            features[feature] = int(recent_flags(columns, name)[-1])
         
         return features
     
-    def _get_sr_features(self, highs: List[float], lows: List[float], closes: List[float]) -> Dict:
-        """Extract support/resistance features"""
+    def _get_sr_features(self, highs: List[float], lows: List[float], closes: List[float],
+                         candles: Optional[List[Dict]] = None) -> Dict:
+        """
+        Extract support/resistance features
+        
+        Met candles (zelfde venster als highs/lows) komen de pivot levels uit een
+        SupportResistanceIndex die bij opeenvolgende vensters alleen nieuwe bars verwerkt.
+        """
         features = {}
         
         if len(closes) < 20:
             return features
         
+        if candles is None:
+            candles = [{'high': h, 'low': l, 'close': c} for h, l, c in zip(highs, lows, closes)]
         current_price = closes[-1]
-        
-        # Find local minima (support) and maxima (resistance)
-        support_levels = []
-        resistance_levels = []
-        
-        for i in range(2, len(lows) - 2):
-            if lows[i] < lows[i-1] and lows[i] < lows[i-2] and lows[i] < lows[i+1] and lows[i] < lows[i+2]:
-                support_levels.append(lows[i])
-            if highs[i] > highs[i-1] and highs[i] > highs[i-2] and highs[i] > highs[i+1] and highs[i] > highs[i+2]:
-                resistance_levels.append(highs[i])
+        with self._sr_lock:
+            index = self._sr_indexes.get(len(candles))
+            if index is None:
+                if len(self._sr_indexes) >= MAX_SR_INDEXES:
+                    # Oudste venster lengte eruit (b.v. een eenmalige count uit een request)
+                    del self._sr_indexes[next(iter(self._sr_indexes))]
+                index = self._sr_indexes[len(candles)] = SupportResistanceIndex(len(candles))
+            index.update(candles)
+            support = index.nearest_support(current_price)
+            resistance = index.nearest_resistance(current_price)
         
         # Distance to nearest support/resistance
-        valid_support = [s for s in support_levels if s < current_price]
-        valid_resistance = [r for r in resistance_levels if r > current_price]
-        
-        if valid_support:
-            nearest_support = max(valid_support)
+        nearest = support
+        if nearest:
+            nearest_support, strength = nearest
             features['distance_to_support'] = (current_price - nearest_support) / current_price if current_price > 0 else 0
-            features['support_strength'] = sum(1 for s in support_levels if abs(s - nearest_support) < (nearest_support * 0.001))
+            features['support_strength'] = strength
         else:
             features['distance_to_support'] = 0.1  # Default
             features['support_strength'] = 0
         
-        if valid_resistance:
-            nearest_resistance = min(valid_resistance)
+        nearest = resistance
+        if nearest:
+            nearest_resistance, strength = nearest
             features['distance_to_resistance'] = (nearest_resistance - current_price) / current_price if current_price > 0 else 0
-            features['resistance_strength'] = sum(1 for r in resistance_levels if abs(r - nearest_resistance) < (nearest_resistance * 0.001))
+            features['resistance_strength'] = strength
         else:
             features['distance_to_resistance'] = 0.1  # Default
             features['resistance_strength'] = 0
@@ -336,6 +323,23 @@ class MLFeatureEngineer:
         
         return np.array(X), np.array(y)
     
+    def build_feature_matrix(self, candles: List[Dict], lookback: int = 50,
+                             feature_set: Optional[List[str]] = None) -> tuple:
+        """
+        Feature matrix over de hele history in één vectorized pass
+        
+        Zelfde features als extract_features per venster, maar als kolommen
+        (zie ml_feature_matrix.py). Gebruik dit voor training sets.
+        
+        Returns:
+            (X, index) tuple, index = bar index van elke rij
+        """
+        from ml_feature_matrix import FeatureMatrixBuilder
+        
+        builder = FeatureMatrixBuilder(lookback=lookback, feature_set=feature_set)
+        self.feature_names = builder.feature_names
+        return builder.build(candles)
+    
     # Helper methods for technical indicators
     def _calculate_ema(self, prices: List[float], period: int) -> float:
         """Calculate Exponential Moving Average"""
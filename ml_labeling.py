@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+ML Labeling
+BUY/SELL/NEUTRAL labels uit de candle history voor ML training
+Forward-return of triple-barrier regels, vectorized over de hele history
+"""
+
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from candle_store import candles_to_arrays
+from ml_feature_matrix import FeatureMatrixBuilder
+
+LABEL_BUY = 1
+LABEL_SELL = -1
+LABEL_NEUTRAL = 0
+LABEL_NAMES = {LABEL_BUY: 'BUY', LABEL_SELL: 'SELL', LABEL_NEUTRAL: 'NEUTRAL'}
+
+# Rijen per blok bij het scannen van barrières (begrenst het geheugen: rows x horizon)
+_CHUNK_ROWS = 20000
+
+def barrier_percentages(timeframe: str = "H1", risk_reward_ratio: float = 2.0,
+                        sl_percent: Optional[float] = None) -> Tuple[float, float]:
+    """
+    TP/SL afstanden als fractie van de entry prijs
+
+    Volgt de limieten van TradingStrategy.calculate_dynamic_tp_sl: max SL 1%
+    (M5/M15) of 2%, TP = SL * risk/reward met een max van 2% of 3%; als de
+    TP wordt afgekapt wordt de SL teruggerekend om de ratio te behouden.
+
+    Returns:
+        (tp_percent, sl_percent)
+    """
+    short_timeframe = timeframe.upper() in ['M5', 'M15']
+    max_sl_percent = 0.01 if short_timeframe else 0.02
+    max_tp_percent = 0.02 if short_timeframe else 0.03
+
+    sl = min(sl_percent, max_sl_percent) if sl_percent else max_sl_percent
+    tp = sl * risk_reward_ratio
+    if tp > max_tp_percent:
+        tp = max_tp_percent
+        sl = tp / risk_reward_ratio
+    return tp, sl
+
+def _first_hit(windows: np.ndarray, hit: np.ndarray) -> np.ndarray:
+    """Index van de eerste True per rij (horizon als er niets geraakt is)"""
+    return np.where(hit.any(axis=1), hit.argmax(axis=1), windows.shape[1])
+
+class LabelingEngine:
+    def __init__(self, method: str = 'triple_barrier', timeframe: str = "H1", horizon: int = 24,
+                 risk_reward_ratio: float = 2.0, sl_percent: Optional[float] = None,
+                 threshold: float = 0.002, intrabar: bool = False):
+        """
+        Args:
+            method: 'triple_barrier' of 'forward_return'
+            timeframe: Timeframe van de candles (bepaalt de TP/SL limieten)
+            horizon: Aantal bars vooruit (verticale barrière / return horizon)
+            risk_reward_ratio: TP = SL * ratio (triple barrier)
+            sl_percent: SL afstand als fractie van de prijs (default: max SL van de timeframe)
+            threshold: Minimale forward return voor BUY/SELL (forward_return)
+            intrabar: Barrières op high/low i.p.v. close (SL wint als beide in één bar vallen)
+        """
+        if method not in ('triple_barrier', 'forward_return'):
+            raise ValueError(f"Unknown labeling method: {method}")
+        self.method = method
+        self.timeframe = timeframe
+        self.horizon = int(horizon)
+        self.risk_reward_ratio = risk_reward_ratio
+        self.sl_percent = sl_percent
+        self.threshold = threshold
+        self.intrabar = intrabar
+
+    def label(self, candles: Union[List[Dict], Dict[str, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Label elke bar (entry op de close van die bar)
+
+        Returns:
+            (labels, valid): int8 labels (1 BUY, -1 SELL, 0 NEUTRAL) en een mask
+            van bars met een volledige horizon
+        """
+        arrays = candles_to_arrays(candles) if isinstance(candles, list) else candles
+        closes = np.asarray(arrays['close'], dtype=np.float64)
+        highs = np.asarray(arrays['high'], dtype=np.float64) if self.intrabar else closes
+        lows = np.asarray(arrays['low'], dtype=np.float64) if self.intrabar else closes
+
+        n = len(closes)
+        labels = np.zeros(n, dtype=np.int8)
+        valid = np.zeros(n, dtype=bool)
+        rows = n - self.horizon
+        if rows <= 0 or self.horizon <= 0:
+            return labels, valid
+        valid[:rows] = True
+
+        if self.method == 'forward_return':
+            returns = (closes[self.horizon:] - closes[:rows]) / closes[:rows]
+            labels[:rows] = np.where(returns > self.threshold, LABEL_BUY,
+                                     np.where(returns < -self.threshold, LABEL_SELL, LABEL_NEUTRAL))
+            return labels, valid
+
+        tp, sl = barrier_percentages(self.timeframe, self.risk_reward_ratio, self.sl_percent)
+        # Vensters van de `horizon` bars na elke entry
+        future_highs = sliding_window_view(highs[1:], self.horizon)
+        future_lows = sliding_window_view(lows[1:], self.horizon)
+
+        for start in range(0, rows, _CHUNK_ROWS):
+            end = min(start + _CHUNK_ROWS, rows)
+            entry = closes[start:end, None]
+            window_highs = future_highs[start:end]
+            window_lows = future_lows[start:end]
+
+            long_tp = _first_hit(window_highs, window_highs >= entry * (1 + tp))
+            long_sl = _first_hit(window_lows, window_lows <= entry * (1 - sl))
+            short_tp = _first_hit(window_lows, window_lows <= entry * (1 - tp))
+            short_sl = _first_hit(window_highs, window_highs >= entry * (1 + sl))
+
+            # Winst als de TP strikt eerder geraakt wordt dan de SL
+            long_win = long_tp < long_sl
+            short_win = short_tp < short_sl
+            chunk = np.full(end - start, LABEL_NEUTRAL, dtype=np.int8)
+            chunk[long_win] = LABEL_BUY
+            chunk[short_win & (~long_win | (short_tp < long_tp))] = LABEL_SELL
+            labels[start:end] = chunk
+
+        return labels, valid
+
+    def build_dataset(self, candles: Union[List[Dict], Dict[str, np.ndarray]],
+                      lookback: int = 50) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Feature matrix + labels voor elke bar met features en een volledige horizon
+
+        Returns:
+            (X, y, index): y met 1/-1/0, index = bar index per rij
+        """
+        arrays = candles_to_arrays(candles) if isinstance(candles, list) else candles
+        X, index = FeatureMatrixBuilder(lookback=lookback).build(arrays)
+        labels, valid = self.label(arrays)
+        keep = valid[index]
+        return X[keep], labels[index[keep]].astype(np.int64), index[keep]
+
+    def get_label_distribution(self, y: np.ndarray) -> Dict[str, int]:
+        return {LABEL_NAMES[value]: int(np.sum(y == value)) for value in LABEL_NAMES}
+
+    def get_config(self) -> Dict:
+        """Labeling instellingen (opgeslagen in training_metrics['labeling'] van het model)"""
+        return {
+            'method': self.method,
+            'timeframe': self.timeframe,
+            'horizon': self.horizon,
+            'risk_reward_ratio': self.risk_reward_ratio,
+            'sl_percent': self.sl_percent,
+            'threshold': self.threshold,
+            'intrabar': self.intrabar
+        }
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'LabelingEngine':
+        return cls(**config)
+
+if __name__ == "__main__":
+    # Test labeling op een random walk
+    rng = np.random.default_rng(5)
+    closes = 2500 + np.cumsum(rng.normal(0, 4, 5000))
+    arrays = {
+        'time': np.arange(5000, dtype=np.int64) * 3600,
+        'open': np.concatenate([[closes[0]], closes[:-1]]),
+        'close': closes,
+        'high': closes + rng.uniform(0, 3, 5000),
+        'low': closes - rng.uniform(0, 3, 5000),
+        'volume': rng.uniform(100, 1000, 5000)
+    }
+
+    for method in ('triple_barrier', 'forward_return'):
+        engine = LabelingEngine(method=method, timeframe="H1", horizon=48, sl_percent=0.005)
+        X, y, index = engine.build_dataset(arrays)
+        print(f"🏷️  {method}: X {X.shape}, labels {engine.get_label_distribution(y)}")
@@ -7,6 +7,7 @@ Train Random Forest en XGBoost modellen voor trading signalen
 import numpy as np
 import pandas as pd
 from typing import Dict, List, Optional, Tuple
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
@@ -21,15 +22,18 @@ except ImportError:
     print("⚠️  XGBoost not available, using Random Forest only")
 
 from ml_features import MLFeatureEngineer
+from ml_export import align_features
 
 class MLTradingModel:
-    def __init__(self, model_type: str = 'random_forest', model_path: Optional[str] = None):
+    def __init__(self, model_type: str = 'random_forest', model_path: Optional[str] = None,
+                 model_params: Optional[Dict] = None):
         """
         Initialize ML Trading Model
         
         Args:
             model_type: 'random_forest' or 'xgboost'
             model_path: Path to saved model (optional)
+            model_params: Hyperparameters die de defaults overschrijven, bv. uit ModelValidator.search (optional)
         """
         self.model_type = model_type
         self.feature_engineer = MLFeatureEngineer()
@@ -41,37 +45,41 @@ class MLTradingModel:
         if model_path and os.path.exists(model_path):
             self.load_model(model_path)
         else:
-            self._initialize_model()
+            self._initialize_model(model_params)
     
-    def _initialize_model(self):
+    def _initialize_model(self, params: Optional[Dict] = None):
         """Initialize model based on type"""
+        params = params or {}
         if self.model_type == 'random_forest':
-            self.model = RandomForestClassifier(
-                n_estimators=100,
-                max_depth=10,
-                min_samples_split=5,
-                min_samples_leaf=2,
-                random_state=42,
-                n_jobs=-1
-            )
+            self.model = RandomForestClassifier(**{
+                'n_estimators': 100,
+                'max_depth': 10,
+                'min_samples_split': 5,
+                'min_samples_leaf': 2,
+                'random_state': 42,
+                'n_jobs': -1,
+                **params
+            })
         elif self.model_type == 'xgboost' and XGBOOST_AVAILABLE:
-            self.model = xgb.XGBClassifier(
-                n_estimators=100,
-                max_depth=6,
-                learning_rate=0.1,
-                random_state=42,
-                n_jobs=-1
-            )
+            self.model = xgb.XGBClassifier(**{
+                'n_estimators': 100,
+                'max_depth': 6,
+                'learning_rate': 0.1,
+                'random_state': 42,
+                'n_jobs': -1,
+                **params
+            })
         else:
             if self.model_type == 'xgboost':
                 print("⚠️  XGBoost not available, falling back to Random Forest")
             self.model_type = 'random_forest'
-            self.model = RandomForestClassifier(
-                n_estimators=100,
-                max_depth=10,
-                random_state=42,
-                n_jobs=-1
-            )
+            self.model = RandomForestClassifier(**{
+                'n_estimators': 100,
+                'max_depth': 10,
+                'random_state': 42,
+                'n_jobs': -1,
+                **params
+            })
     
     def prepare_training_data(self, historical_candles: List[List[Dict]], 
                             labels: List[str]) -> Tuple[np.ndarray, np.ndarray]:
@@ -113,7 +121,32 @@ class MLTradingModel:
         
         return np.array(X), np.array(y)
     
-    def train(self, X: np.ndarray, y: np.ndarray, test_size: float = 0.2) -> Dict:
+    def prepare_training_data_from_history(self, candles: List[Dict], labels: List[Optional[str]],
+                                          lookback: int = 50) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Prepare training data uit één doorlopende candle history
+        
+        Bouwt alle features in één pass (FeatureMatrixBuilder) i.p.v. per
+        overlappend venster extract_features aan te roepen.
+        
+        Args:
+            candles: Candle history (oudste eerst)
+            labels: Label per candle ('BUY', 'SELL', 'NEUTRAL' of None om over te slaan)
+            lookback: Candles per feature venster
+        
+        Returns:
+            (X, y) tuple
+        """
+        X, index = self.feature_engineer.build_feature_matrix(candles, lookback=lookback)
+        self.feature_names = list(self.feature_engineer.feature_names)
+        
+        label_map = {'BUY': 1, 'SELL': -1}
+        keep = [i for i, bar in enumerate(index) if bar < len(labels) and labels[bar] is not None]
+        y = np.array([label_map.get(labels[index[i]], 0) for i in keep], dtype=np.int64)
+        return X[keep], y
+    
+    def train(self, X: np.ndarray, y: np.ndarray, test_size: float = 0.2,
+              time_series: bool = False, purge: int = 0) -> Dict:
         """
         Train the ML model
         
@@ -121,6 +154,9 @@ class MLTradingModel:
             X: Feature matrix
             y: Label array
             test_size: Proportion of data for testing
+            time_series: Chronologische split (laatste test_size als test set) i.p.v. random/stratified;
+                         X moet dan oudste eerst zijn
+            purge: Rijen tussen train en test die weggelaten worden (label horizon), alleen met time_series
         
         Returns:
             Training metrics
@@ -136,9 +172,15 @@ class MLTradingModel:
         print()
         
         # Split data
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=test_size, random_state=42, stratify=y
-        )
+        if time_series:
+            # Geen toekomstige bars in de train set; labels die in de test set kijken vallen weg
+            split = int(len(X) * (1 - test_size))
+            X_train, y_train = X[:max(split - purge, 0)], y[:max(split - purge, 0)]
+            X_test, y_test = X[split:], y[split:]
+        else:
+            X_train, X_test, y_train, y_test = train_test_split(
+                X, y, test_size=test_size, random_state=42, stratify=y
+            )
         
         print(f"Train set: {len(X_train)} samples")
         print(f"Test set: {len(X_test)} samples")
@@ -173,6 +215,7 @@ class MLTradingModel:
             'test_confusion_matrix': test_cm.tolist()
         }
         
+        self._record_feature_importances()
         self.trained = True
         
         print("✅ Training completed!")
@@ -184,6 +227,75 @@ class MLTradingModel:
         
         return self.training_metrics
     
+    def _record_feature_importances(self):
+        """Feature importances (hoogste eerst) voor select_features"""
+        importances = getattr(self.model, 'feature_importances_', None)
+        if importances is not None and len(self.feature_names) == len(importances):
+            ranked = sorted(zip(self.feature_names, importances), key=lambda item: item[1], reverse=True)
+            self.training_metrics['feature_importances'] = {name: round(float(value), 6) for name, value in ranked}
+    
+    def select_features(self, X: np.ndarray, y: np.ndarray, cumulative: float = 0.95,
+                        min_features: int = 5, max_features: Optional[int] = None,
+                        test_size: float = 0.2, time_series: bool = True, purge: int = 0) -> Dict:
+        """
+        Snoei features op basis van de importances van het getrainde model
+        
+        Houdt de kleinste set belangrijkste features die samen `cumulative` van
+        de totale importance dekken en traint het model opnieuw op die kolommen.
+        De set wordt als feature_names met het model opgeslagen, zodat predict()
+        alleen die features laat berekenen.
+        
+        Args:
+            X: Feature matrix met kolommen in self.feature_names volgorde (dezelfde als bij train)
+            y: Labels
+            cumulative: Aandeel van de totale importance dat behouden blijft
+            min_features: Minimaal aantal features
+            max_features: Maximaal aantal features (optional)
+            test_size: Zie train()
+            time_series: Zie train()
+            purge: Zie train()
+        
+        Returns:
+            Dict met de geselecteerde/weggelaten features en test accuracy voor en na
+        """
+        importances = self.training_metrics.get('feature_importances')
+        if not self.trained or not importances:
+            return {'error': 'Model not trained or has no feature importances'}
+        
+        selected = []
+        covered = 0.0
+        total = sum(importances.values()) or 1.0
+        for name, importance in importances.items():
+            if len(selected) >= min_features and covered / total >= cumulative:
+                break
+            if max_features and len(selected) >= max_features:
+                break
+            selected.append(name)
+            covered += importance
+        
+        # Kolom volgorde van het oorspronkelijke model aanhouden
+        columns = [i for i, name in enumerate(self.feature_names) if name in selected]
+        previous_names = list(self.feature_names)
+        previous_metrics = dict(self.training_metrics)
+        full_test_accuracy = self.training_metrics.get('test_accuracy')
+        
+        self.model = clone(self.model)
+        self.feature_names = [previous_names[i] for i in columns]
+        self.train(np.asarray(X)[:, columns], y, test_size=test_size, time_series=time_series, purge=purge)
+        # Metrics van de hertraining over de vorige heen (cross_validation e.d. blijven bewaard)
+        self.training_metrics = {**previous_metrics, **self.training_metrics}
+        
+        selection = {
+            'selected': list(self.feature_names),
+            'dropped': [name for name in previous_names if name not in self.feature_names],
+            'cumulative_importance': round(covered / total, 4),
+            'full_test_accuracy': full_test_accuracy,
+            'pruned_test_accuracy': self.training_metrics.get('test_accuracy')
+        }
+        self.training_metrics['feature_selection'] = selection
+        print(f"✂️  Feature selection: {len(previous_names)} -> {len(self.feature_names)} features")
+        return selection
+    
     def predict(self, candles: List[Dict]) -> Dict:
         """
         Predict trading signal from current candles
@@ -201,8 +313,8 @@ class MLTradingModel:
                 'error': 'Model not trained'
             }
         
-        # Extract features
-        features = self.feature_engineer.extract_features(candles)
+        # Extract features (alleen de set waarop het model getraind is)
+        features = self.feature_engineer.extract_features(candles, feature_set=self.feature_names or None)
         if not features:
             return {
                 'signal': 'NEUTRAL',
@@ -215,7 +327,69 @@ class MLTradingModel:
             self.feature_names = list(features.keys())
         
         feature_vector = np.array([[features.get(name, 0) for name in self.feature_names]])
+        return self._predict_vector(feature_vector)
+    
+    def predict_features(self, feature_row: np.ndarray, feature_names: Optional[List[str]] = None) -> Dict:
+        """
+        Predict vanuit een kant-en-klare feature rij (bv. uit de FeatureStore)
+        
+        Args:
+            feature_row: Feature waarden
+            feature_names: Namen bij feature_row (default: volgorde van self.feature_names)
+        
+        Returns:
+            Prediction dict, zelfde vorm als predict()
+        """
+        if not self.trained:
+            return {
+                'signal': 'NEUTRAL',
+                'confidence': 0,
+                'error': 'Model not trained'
+            }
+        
+        feature_row = np.asarray(feature_row, dtype=np.float64).reshape(1, -1)
+        return self._predict_vector(align_features(feature_row, feature_names, self.feature_names))
+    
+    def predict_many(self, feature_matrix: np.ndarray, feature_names: Optional[List[str]] = None) -> Dict:
+        """
+        Predict een hele feature matrix in één model call
+        
+        Args:
+            feature_matrix: Shape (rows, n_features), bv. uit FeatureMatrixBuilder
+            feature_names: Namen van de kolommen (default: volgorde van self.feature_names)
+        
+        Returns:
+            {'signals': [...], 'predictions': [...], 'confidence': [...],
+             'probabilities': {'BUY': [...], 'SELL': [...], 'NEUTRAL': [...]}, 'rows': n}
+        """
+        if not self.trained:
+            return {'error': 'Model not trained', 'signals': [], 'rows': 0}
+        
+        X = np.asarray(feature_matrix, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if len(X) == 0:
+            return {'signals': [], 'predictions': [], 'confidence': [], 'probabilities': {}, 'rows': 0}
+        X = align_features(X, feature_names, self.feature_names)
+        
+        # Eén predict_proba; de predictie is de klasse met de hoogste kans (zoals predict)
+        probabilities = self.model.predict_proba(X)
+        classes = self.model.classes_
+        predictions = classes[np.argmax(probabilities, axis=1)]
         
+        names = {1: 'BUY', -1: 'SELL'}
+        prob_dict = {names.get(int(cls), 'NEUTRAL'): probabilities[:, i].tolist() for i, cls in enumerate(classes)}
+        return {
+            'signals': [names.get(int(p), 'NEUTRAL') for p in predictions],
+            'predictions': predictions.astype(int).tolist(),
+            'confidence': np.round(probabilities.max(axis=1) * 100, 2).tolist(),
+            'probabilities': prob_dict,
+            'rows': int(len(X)),
+            'features_used': len(self.feature_names)
+        }
+    
+    def _predict_vector(self, feature_vector: np.ndarray) -> Dict:
+        """Model call op één feature vector (shape (1, n_features))"""
         # Predict
         prediction = self.model.predict(feature_vector)[0]
         probabilities = self.model.predict_proba(feature_vector)[0]
@@ -266,6 +440,19 @@ class MLTradingModel:
         joblib.dump(model_data, filepath)
         print(f"✅ Model saved to {filepath}")
     
+    def export_compact(self, filepath: str) -> Dict:
+        """
+        Export naar het compacte .npz inference formaat (zie ml_export)
+        
+        Kleiner bestand, laadt zonder sklearn en scoort één rij in microseconden.
+        Alleen voor Random Forest modellen.
+        """
+        if not self.trained:
+            raise ValueError("Model not trained yet")
+        
+        from ml_export import export_compact
+        return export_compact(self, filepath)
+    
     def load_model(self, filepath: str):
         """Load trained model from file"""
         model_data = joblib.load(filepath)
@@ -2,49 +2,139 @@
 """
 ML Model Monitoring
 Track model performance en retrain periodiek
+Predicties gaan naar een append-only JSON-lines log; per dag worden tellers
+bijgehouden zodat statistieken de history niet opnieuw hoeven te parsen
 """
 
 import os
 import json
+import threading
+from collections import deque
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
-from ml_model import MLTradingModel
+
+def _empty_day() -> Dict[str, int]:
+    return {'total': 0, 'correct': 0, 'buy': 0, 'buy_correct': 0, 'sell': 0, 'sell_correct': 0}
 
 class MLModelMonitor:
-    def __init__(self, storage_file: str = 'ml_model_performance.json'):
+    def __init__(self, storage_file: str = 'ml_model_performance.json', recent_size: int = 1000,
+                 summary_interval: int = 50, max_log_bytes: int = 20 * 1024 * 1024, max_days: int = 400):
+        """
+        Args:
+            storage_file: Basis pad; de log wordt <basis>.jsonl, de dag tellers <basis>_daily.json
+                (een bestaande .json history wordt één keer naar de log overgezet)
+            recent_size: Aantal recente records in het geheugen (performance_history)
+            summary_interval: Dag tellers na zoveel nieuwe records wegschrijven
+            max_log_bytes: Log roteren naar .jsonl.1 boven deze grootte
+            max_days: Aantal dagen aan tellers dat bewaard wordt
+        """
+        base = os.path.splitext(storage_file)[0]
         self.storage_file = storage_file
-        self.performance_history = []
+        self.log_file = base + '.jsonl'
+        self.summary_file = base + '_daily.json'
+        self.summary_interval = summary_interval
+        self.max_log_bytes = max_log_bytes
+        self.max_days = max_days
+        
+        self.daily = {}  # 'YYYY-MM-DD' -> tellers
+        self.recent = deque(maxlen=recent_size)
+        self._offset = 0  # bytes van de log die in self.daily verwerkt zijn
+        self._unsaved = 0
+        self._lock = threading.Lock()
         self.load_history()
     
+    @property
+    def performance_history(self) -> List[Dict]:
+        """Records die dit process gelezen of geschreven heeft (max recent_size), oudste eerst"""
+        return list(self.recent)
+    
     def load_history(self):
-        """Load performance history from storage"""
-        if os.path.exists(self.storage_file):
-            try:
-                with open(self.storage_file, 'r') as f:
-                    data = json.load(f)
-                    self.performance_history = data.get('history', [])
-            except Exception as e:
-                print(f"Error loading ML performance history: {e}")
-                self.performance_history = []
-        else:
-            self.performance_history = []
+        """Laad de dag tellers en verwerk alleen de log regels van na de laatste save"""
+        with self._lock:
+            self._migrate_legacy()
+            if os.path.exists(self.summary_file):
+                try:
+                    with open(self.summary_file, 'r') as f:
+                        data = json.load(f)
+                    self.daily = data.get('daily', {})
+                    self._offset = int(data.get('log_offset', 0))
+                except Exception as e:
+                    print(f"Error loading ML performance summary: {e}")
+                    self.daily = {}
+                    self._offset = 0
+            self._read_tail()
+    
+    def _migrate_legacy(self):
+        """Zet een oude {'history': [...]} JSON history één keer om naar de log"""
+        if self.storage_file == self.log_file or os.path.exists(self.log_file) or not os.path.exists(self.storage_file):
+            return
+        try:
+            with open(self.storage_file, 'r') as f:
+                history = json.load(f).get('history', [])
+            with open(self.log_file, 'a') as f:
+                for record in history:
+                    f.write(json.dumps(record, separators=(',', ':')) + '\n')
+            print(f"📦 Migrated {len(history)} ML predictions to {self.log_file}")
+        except Exception as e:
+            print(f"Error migrating ML performance history: {e}")
+    
+    def _read_tail(self):
+        """Verwerk log regels na self._offset (ook van andere processen)"""
+        if not os.path.exists(self.log_file):
+            return
+        if os.path.getsize(self.log_file) < self._offset:
+            self._offset = 0  # Log is geroteerd: tellers bevatten de oude log al
+        
+        with open(self.log_file, 'rb') as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Half geschreven regel: volgende keer
+                self._offset += len(line)
+                try:
+                    self._apply(json.loads(line))
+                except ValueError:
+                    continue
+    
+    def _apply(self, record: Dict):
+        """Tel een record bij zijn dag op (datum = eerste 10 tekens van de ISO timestamp)"""
+        day = self.daily.setdefault(record.get('timestamp', '')[:10], _empty_day())
+        correct = bool(record.get('correct', False))
+        day['total'] += 1
+        day['correct'] += correct
+        signal = record.get('predicted_signal')
+        if signal == 'BUY':
+            day['buy'] += 1
+            day['buy_correct'] += correct
+        elif signal == 'SELL':
+            day['sell'] += 1
+            day['sell_correct'] += correct
+        self.recent.append(record)
+        self._unsaved += 1
     
     def save_history(self):
-        """Save performance history to storage"""
+        """Schrijf de dag tellers (klein bestand, atomisch) met de verwerkte log positie"""
+        if len(self.daily) > self.max_days:
+            for date in sorted(self.daily)[:len(self.daily) - self.max_days]:
+                del self.daily[date]
         try:
             data = {
-                'history': self.performance_history,
+                'daily': self.daily,
+                'log_offset': self._offset,
                 'last_updated': datetime.now().isoformat()
             }
-            with open(self.storage_file, 'w') as f:
-                json.dump(data, f, indent=2)
+            tmp_path = self.summary_file + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.summary_file)
+            self._unsaved = 0
         except Exception as e:
-            print(f"Error saving ML performance history: {e}")
+            print(f"Error saving ML performance summary: {e}")
     
-    def record_prediction(self, prediction: Dict, actual_outcome: str, 
+    def record_prediction(self, prediction: Dict, actual_outcome: str,
                          trade_result: Optional[Dict] = None):
         """
-        Record a prediction and its outcome
+        Record a prediction and its outcome (één regel append aan de log)
         
         Args:
             prediction: ML prediction dict
@@ -61,32 +151,46 @@ class MLModelMonitor:
             'probabilities': prediction.get('probabilities', {})
         }
         
-        self.performance_history.append(record)
-        
-        # Keep only last 1000 records
-        if len(self.performance_history) > 1000:
-            self.performance_history = self.performance_history[-1000:]
-        
-        self.save_history()
+        with self._lock:
+            try:
+                with open(self.log_file, 'a') as f:
+                    f.write(json.dumps(record, separators=(',', ':')) + '\n')
+            except Exception as e:
+                print(f"Error writing ML prediction log: {e}")
+                return
+            self._read_tail()
+            
+            if os.path.getsize(self.log_file) > self.max_log_bytes:
+                os.replace(self.log_file, self.log_file + '.1')
+                self._offset = 0
+                self.save_history()
+            elif self._unsaved >= self.summary_interval:
+                self.save_history()
+    
+    def _days_since(self, days: int) -> List[Dict[str, int]]:
+        """Dag tellers vanaf `days` dagen geleden (inclusief vandaag)"""
+        with self._lock:
+            self._read_tail()
+            cutoff = (datetime.now() - timedelta(days=days)).date().isoformat()
+            return [counts for date, counts in self.daily.items() if date >= cutoff]
     
     def get_performance_stats(self, days: int = 30) -> Dict:
         """
         Get performance statistics for recent period
         
         Args:
-            days: Number of days to analyze
+            days: Number of days to analyze (per hele dag, uit de dag tellers)
         
         Returns:
             Performance statistics
         """
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        recent_records = [
-            r for r in self.performance_history
-            if datetime.fromisoformat(r['timestamp']) >= cutoff_date
-        ]
+        totals = _empty_day()
+        for counts in self._days_since(days):
+            for key in totals:
+                totals[key] += counts.get(key, 0)
         
-        if not recent_records:
+        total = totals['total']
+        if not total:
             return {
                 'total_predictions': 0,
                 'accuracy': 0,
@@ -94,16 +198,10 @@ class MLModelMonitor:
                 'incorrect_predictions': 0
             }
         
-        correct = sum(1 for r in recent_records if r.get('correct', False))
-        total = len(recent_records)
-        accuracy = (correct / total * 100) if total > 0 else 0
-        
-        # Signal-specific accuracy
-        buy_predictions = [r for r in recent_records if r['predicted_signal'] == 'BUY']
-        sell_predictions = [r for r in recent_records if r['predicted_signal'] == 'SELL']
-        
-        buy_accuracy = sum(1 for r in buy_predictions if r.get('correct', False)) / len(buy_predictions) * 100 if buy_predictions else 0
-        sell_accuracy = sum(1 for r in sell_predictions if r.get('correct', False)) / len(sell_predictions) * 100 if sell_predictions else 0
+        correct = totals['correct']
+        accuracy = correct / total * 100
+        buy_accuracy = totals['buy_correct'] / totals['buy'] * 100 if totals['buy'] else 0
+        sell_accuracy = totals['sell_correct'] / totals['sell'] * 100 if totals['sell'] else 0
         
         return {
             'total_predictions': total,
@@ -112,8 +210,8 @@ class MLModelMonitor:
             'incorrect_predictions': total - correct,
             'buy_accuracy': round(buy_accuracy, 2),
             'sell_accuracy': round(sell_accuracy, 2),
-            'buy_predictions': len(buy_predictions),
-            'sell_predictions': len(sell_predictions)
+            'buy_predictions': totals['buy'],
+            'sell_predictions': totals['sell']
         }
     
     def should_retrain(self, min_accuracy: float = 50.0, min_predictions: int = 100) -> bool:
@@ -139,35 +237,17 @@ class MLModelMonitor:
     
     def get_recent_accuracy_trend(self, days: int = 7) -> List[float]:
         """Get daily accuracy trend"""
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        recent_records = [
-            r for r in self.performance_history
-            if datetime.fromisoformat(r['timestamp']) >= cutoff_date
-        ]
-        
-        # Group by day
-        daily_accuracy = {}
-        for record in recent_records:
-            date = datetime.fromisoformat(record['timestamp']).date()
-            if date not in daily_accuracy:
-                daily_accuracy[date] = {'correct': 0, 'total': 0}
-            
-            daily_accuracy[date]['total'] += 1
-            if record.get('correct', False):
-                daily_accuracy[date]['correct'] += 1
+        with self._lock:
+            self._read_tail()
+            cutoff = (datetime.now() - timedelta(days=days)).date().isoformat()
+            daily = sorted((date, counts) for date, counts in self.daily.items() if date >= cutoff)
         
-        # Calculate accuracy per day
-        trend = []
-        for date in sorted(daily_accuracy.keys()):
-            acc = daily_accuracy[date]
-            accuracy = (acc['correct'] / acc['total'] * 100) if acc['total'] > 0 else 0
-            trend.append(accuracy)
-        
-        return trend
+        return [counts['correct'] / counts['total'] * 100 if counts['total'] else 0 for _, counts in daily]
 
 if __name__ == "__main__":
     # Test ML monitor
+    import time
+    
     monitor = MLModelMonitor()
     
     # Record some test predictions
@@ -176,5 +256,11 @@ if __name__ == "__main__":
         'BUY'
     )
     
+    start = time.perf_counter()
+    for i in range(1000):
+        monitor.record_prediction({'signal': 'SELL', 'confidence': 60}, 'SELL' if i % 2 else 'NEUTRAL')
+    print(f"⚡ record_prediction: {(time.perf_counter() - start) * 1000:.1f}µs avg")
+    
     stats = monitor.get_performance_stats()
     print(f"Performance Stats: {stats}")
+    print(f"Trend: {monitor.get_recent_accuracy_trend()}")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+ML Model Registry
+Process-wide cache van geladen ML modellen: elk model wordt één keer geladen
+en automatisch herladen als het bestand verandert
+Compacte .npz exports (ml_export) worden zonder sklearn geladen en zijn de
+kleinste vorm voor grote forests (platte node arrays i.p.v. sklearn objecten)
+"""
+
+import os
+import time
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+from ml_export import CompactForest, is_compact_model
+
+class ModelRegistry:
+    def __init__(self, check_interval: float = 1.0, max_history: int = 20):
+        """
+        Args:
+            check_interval: Seconden tussen bestand checks (mtime/size) per model
+            max_history: Aantal bewaarde versies per model in de metadata
+        """
+        self.check_interval = check_interval
+        self.max_history = max_history
+        self._entries = {}  # abs path -> entry dict
+        self._validation = {}  # abs path -> laatste ModelValidator.search resultaat
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _file_signature(path: str) -> Optional[tuple]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, model_path: str):
+        """
+        Geef het geladen model voor een pad
+
+        Laadt bij de eerste aanvraag en herlaadt (hot-swap) als het bestand
+        sinds de vorige load veranderd is. Een mislukte herlaad houdt de
+        vorige versie actief.
+
+        Returns:
+            MLTradingModel (.pkl) of CompactForest (.npz), None als het bestand niet bestaat
+        """
+        path = os.path.abspath(model_path)
+        now = time.time()
+        entry = self._entries.get(path)
+        if entry and now - entry['checked_at'] < self.check_interval:
+            return entry['model']
+
+        with self._lock:
+            entry = self._entries.get(path)
+            signature = self._file_signature(path)
+            if signature is None:
+                return entry['model'] if entry else None
+
+            if entry and entry['signature'] == signature:
+                entry['checked_at'] = now
+                return entry['model']
+
+            try:
+                self._load(path, signature, entry)
+            except Exception as e:
+                print(f"⚠️  Could not load model {model_path}: {e}")
+                if not entry:
+                    return None
+                entry['checked_at'] = now
+            return self._entries[path]['model']
+
+    def _load(self, path: str, signature: tuple, previous: Optional[Dict]):
+        start = time.time()
+        if is_compact_model(path):
+            model = CompactForest(model_path=path)
+        else:
+            # sklearn alleen importeren als er echt een pickle model geladen wordt
+            from ml_model import MLTradingModel
+            model = MLTradingModel(model_path=path)
+        if not model.trained:
+            raise ValueError("Model file is not trained")
+        load_ms = (time.time() - start) * 1000
+
+        version = previous['version'] + 1 if previous else 1
+        history = list(previous['history']) if previous else []
+        history.append({
+            'version': version,
+            'loaded_at': datetime.now().isoformat(),
+            'file_modified': datetime.fromtimestamp(signature[0] / 1e9).isoformat(),
+            'file_size': signature[1],
+            'load_ms': round(load_ms, 1)
+        })
+
+        # Nieuwe entry in één keer vervangen: lopende requests houden hun oude model
+        self._entries[path] = {
+            'model': model,
+            'signature': signature,
+            'checked_at': time.time(),
+            'version': version,
+            'history': history[-self.max_history:],
+            'metadata': {
+                'model_type': model.model_type,
+                'format': 'compact' if is_compact_model(path) else 'joblib',
+                'features': len(model.feature_names),
+                'train_accuracy': model.training_metrics.get('train_accuracy'),
+                'test_accuracy': model.training_metrics.get('test_accuracy'),
+                'cross_validation': model.training_metrics.get('cross_validation')
+            }
+        }
+        print(f"🔄 Model registry: loaded {os.path.basename(path)} v{version} in {load_ms:.0f}ms")
+
+    def record_validation(self, model_path: str, validation: Dict):
+        """Bewaar het volledige CV/search resultaat bij een model pad (ook als het nog niet geladen is)"""
+        with self._lock:
+            self._validation[os.path.abspath(model_path)] = validation
+    
+    def get_metadata(self, model_path: str) -> Optional[Dict]:
+        """Versie en metadata van een geladen model"""
+        path = os.path.abspath(model_path)
+        entry = self._entries.get(path)
+        if not entry:
+            return None
+        metadata = {
+            'model_path': path,
+            'version': entry['version'],
+            **entry['metadata'],
+            'history': entry['history']
+        }
+        if path in self._validation:
+            metadata['validation'] = self._validation[path]
+        return metadata
+
+    def list_models(self) -> List[Dict]:
+        with self._lock:
+            paths = list(self._entries.keys())
+        return [self.get_metadata(path) for path in paths]
+
+    def unload(self, model_path: str) -> bool:
+        with self._lock:
+            return self._entries.pop(os.path.abspath(model_path), None) is not None
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_model_registry() -> ModelRegistry:
+    """Eén registry per process (API server, live trader)"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Usage: python ml_registry.py <model_path>")
+        sys.exit(1)
+
+    registry = get_model_registry()
+    for _ in range(3):
+        start = time.time()
+        model = registry.get(sys.argv[1])
+        print(f"  get: {(time.time() - start) * 1000:.2f}ms, trained: {model.trained if model else None}")
+    print(f"✅ {registry.get_metadata(sys.argv[1])}")
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+ML Retraining Service
+Hertraint het live model als MLModelMonitor een dalende accuracy ziet
+Het training venster komt uit de feature store (alleen nieuwe bars worden berekend),
+het fitten gebeurt in een achtergrond process en een beter model wordt atomisch
+op het model pad gezet, zodat de registry het bij de volgende get() oppakt
+"""
+
+import os
+import shutil
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import numpy as np
+from candle_store import CandleStore, arrays_to_candles, format_candle_time
+from ml_feature_store import FeatureStore
+from ml_labeling import LabelingEngine
+from ml_monitor import MLModelMonitor
+
+def _fit_candidate(model_path: str, candidate_path: str, X_train: np.ndarray, y_train: np.ndarray,
+                   X_val: np.ndarray, y_val: np.ndarray, settings: Dict) -> Dict:
+    """
+    Fit een kandidaat model (draait in het achtergrond process)
+
+    Random Forest: warm start met `extra_trees` nieuwe bomen op het nieuwe
+    venster, of een volledige refit als de klassen veranderd zijn of het
+    maximum aantal bomen bereikt is. XGBoost: extra boosting rounds op de
+    bestaande booster.
+
+    Returns:
+        Dict met accuracy van het live en het kandidaat model op de validatie set
+    """
+    from sklearn.base import clone
+    from ml_model import MLTradingModel
+    from ml_export import align_features
+
+    live = MLTradingModel(model_path=model_path)
+    # Feature store kolommen -> de (eventueel gesnoeide) feature set van het live model
+    X_train = align_features(X_train, settings['feature_names'], live.feature_names)
+    X_val = align_features(X_val, settings['feature_names'], live.feature_names)
+    live_accuracy = float(live.model.score(X_val, y_val)) if live.trained else 0.0
+
+    candidate = MLTradingModel(model_path=model_path)
+    estimator = candidate.model
+    mode = 'refit'
+
+    if candidate.model_type == 'random_forest' and live.trained:
+        trees = len(estimator.estimators_)
+        same_classes = set(np.unique(y_train)) == set(estimator.classes_.tolist())
+        if same_classes and trees + settings['extra_trees'] <= settings['max_trees']:
+            estimator.set_params(warm_start=True, n_estimators=trees + settings['extra_trees'],
+                                 n_jobs=settings['n_jobs'])
+            estimator.fit(X_train, y_train)
+            estimator.set_params(warm_start=False)
+            mode = 'warm_start'
+    elif candidate.model_type == 'xgboost' and live.trained:
+        estimator.set_params(n_estimators=settings['extra_trees'], n_jobs=settings['n_jobs'])
+        estimator.fit(X_train, y_train, xgb_model=estimator.get_booster())
+        mode = 'boost_rounds'
+
+    if mode == 'refit':
+        # Zelfde (via CV getunede) hyperparameters als het live model; het aantal bomen
+        # terug naar de getunede waarde i.p.v. wat warm starts/boost rounds erbij zetten
+        tuned = live.training_metrics.get('cross_validation', {}).get('best_params', {})
+        base_trees = tuned.get('n_estimators', MLTradingModel(model_type=live.model_type).model.n_estimators)
+        estimator = clone(live.model)
+        estimator.set_params(n_estimators=base_trees, n_jobs=settings['n_jobs'])
+        estimator.fit(X_train, y_train)
+        candidate.model = estimator
+
+    candidate_accuracy = float(estimator.score(X_val, y_val))
+    candidate.feature_names = list(live.feature_names)
+    candidate.trained = True
+    # Feature selectie en CV samenvatting van het live model blijven bewaard
+    candidate.training_metrics = {
+        **live.training_metrics,
+        'train_accuracy': float(estimator.score(X_train, y_train)),
+        'test_accuracy': candidate_accuracy,
+        'retrained_at': datetime.now().isoformat(),
+        'retrain_mode': mode,
+        'train_samples': int(len(X_train)),
+        'validation_samples': int(len(X_val))
+    }
+    candidate._record_feature_importances()
+    candidate.save_model(candidate_path)
+
+    return {
+        'mode': mode,
+        'live_accuracy': live_accuracy,
+        'candidate_accuracy': candidate_accuracy,
+        'trees': len(getattr(estimator, 'estimators_', [])) or settings['extra_trees'],
+        'train_samples': int(len(X_train)),
+        'validation_samples': int(len(X_val))
+    }
+
+class RetrainingService:
+    def __init__(self, model_path: str, symbol: str = "XAUUSD", timeframe: str = "H1",
+                 monitor: Optional[MLModelMonitor] = None, feature_store: Optional[FeatureStore] = None,
+                 candle_store: Optional[CandleStore] = None, labeler: Optional[LabelingEngine] = None,
+                 window: int = 5000, validation_fraction: float = 0.2, min_accuracy: float = 50.0,
+                 min_predictions: int = 100, min_improvement: float = 0.0, min_interval_hours: float = 6.0,
+                 extra_trees: int = 50, max_trees: int = 300, n_jobs: int = 1,
+                 compact_path: Optional[str] = None):
+        """
+        Args:
+            model_path: Pad van het live (joblib) model; wordt bij promotie vervangen
+            symbol: Trading symbol van het model
+            timeframe: Timeframe van het model
+            monitor: MLModelMonitor met de live predicties
+            feature_store: Feature store voor het training venster (default: nieuwe store)
+            candle_store: Lokale candle history (gesynced via de bridge)
+            labeler: LabelingEngine voor de labels (default: de labeling waarmee het live model
+                     getraind is, anders triple barrier op de timeframe); moet bij het model passen
+            window: Aantal meest recente bars in het training venster
+            validation_fraction: Laatste deel van het venster als validatie (op tijd, geen shuffle)
+            min_accuracy: Hertrain onder deze live accuracy (%)
+            min_predictions: Minimaal aantal gemonitorde predicties
+            min_improvement: Kandidaat moet de live accuracy met minstens dit verslaan (fractie)
+            min_interval_hours: Minimale tijd tussen twee retrains
+            extra_trees: Nieuwe bomen (RF warm start) of boosting rounds (XGBoost) per retrain
+            max_trees: Boven dit aantal bomen volgt een volledige refit
+            n_jobs: Cores voor het fitten (laag houden naast de trading loop)
+            compact_path: Optioneel .npz pad dat na promotie opnieuw geëxporteerd wordt
+        """
+        self.model_path = os.path.abspath(model_path)
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.monitor = monitor or MLModelMonitor()
+        self.feature_store = feature_store or FeatureStore(max_rows=window + 500)
+        self.candle_store = candle_store or CandleStore()
+        self.labeler = labeler
+        self.window = window
+        self.validation_fraction = validation_fraction
+        self.min_accuracy = min_accuracy
+        self.min_predictions = min_predictions
+        self.min_improvement = min_improvement
+        self.min_interval = timedelta(hours=min_interval_hours)
+        self.compact_path = compact_path
+        self.settings = {'extra_trees': extra_trees, 'max_trees': max_trees, 'n_jobs': n_jobs}
+
+        self._executor = None
+        self._thread = None
+        self._future = None
+        self._running = False  # Van start tot en met de promotie (of fout)
+        self._lock = threading.Lock()
+        self.last_started = None
+        self.last_result = None
+        self.history = []
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def check_and_retrain(self, force: bool = False) -> Dict:
+        """
+        Start een retrain als de monitor dat aangeeft (of force)
+
+        Keert direct terug; het training venster wordt in een achtergrond thread
+        opgebouwd en het fitten loopt daarna in een achtergrond process.
+
+        Returns:
+            Status dict ('started', 'running', 'skipped' of 'error')
+        """
+        with self._lock:
+            if self.is_running():
+                return {'status': 'running', 'started_at': self.last_started.isoformat()}
+            if not force:
+                if self.last_started and datetime.now() - self.last_started < self.min_interval:
+                    return {'status': 'skipped', 'reason': 'Retrained recently'}
+                if not self.monitor.should_retrain(self.min_accuracy, self.min_predictions):
+                    return {'status': 'skipped', 'reason': 'Model accuracy OK'}
+            if not os.path.exists(self.model_path):
+                return {'status': 'error', 'error': 'Model not found', 'model_path': self.model_path}
+
+            self.last_started = datetime.now()
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+        print(f"🔁 Retraining started for {os.path.basename(self.model_path)}")
+        return {'status': 'started', 'started_at': self.last_started.isoformat()}
+
+    def _run(self):
+        """Bouw het training venster (bridge sync + feature store) en start de fit"""
+        try:
+            labeling = self.resolve_labeler()
+            if labeling.get('error'):
+                print(f"❌ Retraining skipped: {labeling['message']}")
+                self._record({'status': 'error', **labeling})
+                return
+            dataset = self.build_training_window()
+        except Exception as e:
+            print(f"❌ Retraining failed: {e}")
+            self._record({'status': 'failed', 'error': str(e)})
+            return
+        if dataset.get('error'):
+            print(f"❌ Retraining skipped: {dataset['message']}")
+            self._record({'status': 'error', **dataset})
+            return
+
+        if self._executor is None:
+            # Spawn: veilig vanuit een process met threads (Flask, live loop)
+            self._executor = ProcessPoolExecutor(max_workers=1,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        candidate_path = self.model_path + '.candidate'
+        self._future = self._executor.submit(
+            _fit_candidate, self.model_path, candidate_path,
+            dataset['X_train'], dataset['y_train'], dataset['X_val'], dataset['y_val'],
+            {**self.settings, 'feature_names': self.feature_store.feature_names}
+        )
+        self._future.add_done_callback(lambda future: self._on_fitted(future, candidate_path))
+        print(f"🔁 Fitting candidate: {len(dataset['X_train'])} train / {len(dataset['X_val'])} validation rows")
+
+    def build_training_window(self) -> Dict:
+        """
+        Feature rijen + labels voor de laatste `window` bars
+
+        De candle store wordt aangevuld via de bridge; de feature store rekent
+        alleen rijen voor bars die nog niet (of met andere OHLCV) bewaard zijn.
+
+        Returns:
+            Dict met X_train, y_train, X_val, y_val (chronologisch gesplitst)
+        """
+        self.candle_store.sync(self.symbol, self.timeframe, min(self.window, 5000))
+        arrays = self.candle_store.load_arrays(self.symbol, self.timeframe)
+        total = len(arrays['time'])
+        start = max(0, total - self.window - self.feature_store.lookback)
+        window_arrays = {name: values[start:] for name, values in arrays.items()}
+        candles = arrays_to_candles(window_arrays)
+
+        self.feature_store.extend(self.symbol, self.timeframe, candles)
+        X, bar_times = self.feature_store.get_matrix(self.symbol, self.timeframe)
+
+        # Labels per bar tijd; bars zonder volledige horizon vallen af
+        labels, valid = self.labeler.label(window_arrays)
+        label_by_time = {format_candle_time(t): int(label)
+                         for t, label, ok in zip(window_arrays['time'], labels, valid) if ok}
+        keep = [i for i, bar_time in enumerate(bar_times) if bar_time in label_by_time]
+        if len(keep) < 100:
+            return {'error': 'Insufficient labeled data', 'message': f'{total} candles, {len(keep)} labeled rows'}
+
+        X = X[keep]
+        y = np.array([label_by_time[bar_times[i]] for i in keep], dtype=np.int64)
+        split = int(len(X) * (1 - self.validation_fraction))
+        return {'X_train': X[:split], 'y_train': y[:split], 'X_val': X[split:], 'y_val': y[split:]}
+
+    def resolve_labeler(self) -> Dict:
+        """
+        Labeling van het live model (training_metrics['labeling']) gebruiken
+
+        Live en kandidaat worden op dezelfde labels gescoord als waarop het live
+        model getraind is; een afwijkende labeler wordt geweigerd.
+
+        Returns:
+            Dict met de labeling config, of een error dict bij een mismatch
+        """
+        from ml_model import MLTradingModel
+
+        trained_with = MLTradingModel(model_path=self.model_path).training_metrics.get('labeling')
+        if trained_with is None:
+            # Model van vóór de labeling metadata: opgegeven labeler of de default
+            self.labeler = self.labeler or LabelingEngine(timeframe=self.timeframe)
+        elif self.labeler is None:
+            self.labeler = LabelingEngine.from_config(trained_with)
+        elif self.labeler.get_config() != trained_with:
+            return {'error': 'Labeling mismatch',
+                    'message': f"Model trained with {trained_with}, retrain requested {self.labeler.get_config()}"}
+        return self.labeler.get_config()
+
+    def _on_fitted(self, future, candidate_path: str):
+        """Valideer de kandidaat en promoot hem als hij het live model verslaat"""
+        try:
+            self._evaluate(future.result(), candidate_path)
+        except Exception as e:
+            print(f"❌ Retraining failed: {e}")
+            self._record({'status': 'failed', 'error': str(e)})
+
+    def _evaluate(self, result: Dict, candidate_path: str):
+        improvement = result['candidate_accuracy'] - result['live_accuracy']
+        if improvement < self.min_improvement:
+            os.remove(candidate_path)
+            print(f"⏸️  Candidate not promoted: {result['candidate_accuracy']:.2%} vs live {result['live_accuracy']:.2%}")
+            self._record({'status': 'rejected', **result})
+            return
+
+        self.promote(candidate_path)
+        print(f"✅ Model promoted ({result['mode']}): {result['live_accuracy']:.2%} -> {result['candidate_accuracy']:.2%}")
+        self._record({'status': 'promoted', **result})
+
+    def promote(self, candidate_path: str):
+        """
+        Zet de kandidaat atomisch op het model pad (vorige versie als .prev)
+
+        os.replace is atomisch: de registry ziet óf het oude óf het nieuwe
+        bestand en hot-swapt bij de volgende get().
+        """
+        shutil.copy2(self.model_path, self.model_path + '.prev')
+        os.replace(candidate_path, self.model_path)
+        if self.compact_path:
+            from ml_model import MLTradingModel
+            MLTradingModel(model_path=self.model_path).export_compact(self.compact_path)
+
+    def _record(self, result: Dict):
+        """Eindstatus van een retrain; pas hierna kan een volgende starten"""
+        result['finished_at'] = datetime.now().isoformat()
+        self.last_result = result
+        self.history = (self.history + [result])[-20:]
+        self._running = False
+
+    def get_status(self) -> Dict:
+        return {
+            'model_path': self.model_path,
+            'running': self.is_running(),
+            'last_started': self.last_started.isoformat() if self.last_started else None,
+            'last_result': self.last_result,
+            'history': self.history,
+            'feature_store': self.feature_store.get_stats()
+        }
+
+    def shutdown(self):
+        if self._thread is not None:
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Usage: python ml_retraining.py <model_path> [symbol] [timeframe]")
+        sys.exit(1)
+
+    service = RetrainingService(sys.argv[1],
+                                symbol=sys.argv[2] if len(sys.argv) > 2 else "XAUUSD",
+                                timeframe=sys.argv[3] if len(sys.argv) > 3 else "H1")
+    print(service.check_and_retrain(force=True))
+    service.shutdown()
+    print(f"📊 {service.last_result}")
@@ -8,6 +8,9 @@ from typing import Dict, List, Optional
 from trading_strategy import TradingStrategy
 from ml_model import MLTradingModel
 from ml_features import MLFeatureEngineer
+from ml_feature_store import FeatureStore
+from ml_feature_matrix import FeatureMatrixBuilder
+from ml_registry import get_model_registry
 
 class MLTradingStrategy(TradingStrategy):
     def __init__(self, ml_model_path: Optional[str] = None, 
@@ -26,19 +29,35 @@ class MLTradingStrategy(TradingStrategy):
         self.ml_weight = ml_weight
         self.ta_weight = 1.0 - ml_weight
         self.ml_model = None
+        self.ml_model_path = ml_model_path
         self.ml_available = False
+        # Feature rijen per bar: bij een nieuwe bar wordt alleen de nieuwste rij berekend
+        self.feature_store = FeatureStore()
+        # Vooraf gescoorde bars voor backtests: bar tijd -> ML prediction
+        self.backtest_predictions = {}
         
         if ml_model_path:
             try:
-                self.ml_model = MLTradingModel(model_path=ml_model_path)
-                if self.ml_model.trained:
+                # Gedeeld model uit de registry i.p.v. een eigen joblib load
+                self.ml_model = get_model_registry().get(ml_model_path)
+                if self.ml_model and self.ml_model.trained:
                     self.ml_available = True
+                    self._sync_feature_store()
                     print(f"✅ ML Model loaded: {ml_model_path}")
             except Exception as e:
                 print(f"⚠️  Could not load ML model: {e}")
                 print("   Falling back to technical analysis only")
     
-    def generate_signal_from_chart(self, symbol: str = "XAUUSD", timeframe: str = "H1", count: int = 100) -> Dict:
+    def _sync_feature_store(self):
+        """Feature store rekent alleen de features van het (eventueel gesnoeide) model"""
+        feature_names = list(self.ml_model.feature_names or []) if self.ml_model else []
+        if feature_names and set(feature_names) != set(self.feature_store.feature_names):
+            self.feature_store = FeatureStore(lookback=self.feature_store.lookback,
+                                              max_rows=self.feature_store.max_rows,
+                                              feature_set=feature_names)
+    
+    def generate_signal_from_chart(self, symbol: str = "XAUUSD", timeframe: str = "H1", count: int = 100,
+                                   confluence_timeframes: Optional[List[str]] = None) -> Dict:
         """
         Generate trading signal combining ML and technical analysis
         
@@ -46,24 +65,46 @@ class MLTradingStrategy(TradingStrategy):
             symbol: Trading symbol
             timeframe: Timeframe
             count: Number of candles
+            confluence_timeframes: Hogere timeframes voor 'confluence' (zelfde candles)
+        
+        Returns:
+            Combined signal dict
+        """
+        # Eén fetch voor zowel de technische analyse als het ML model
+        candles = self.get_candlestick_data(symbol=symbol, timeframe=timeframe, count=count)
+        signal = self.analyze_snapshot(candles, timeframe=timeframe, symbol=symbol)
+        if confluence_timeframes:
+            self.add_confluence(signal, symbol, timeframe, candles, confluence_timeframes)
+        return signal
+    
+    def analyze_snapshot(self, candles: List[Dict], timeframe: str = "H1", symbol: str = "XAUUSD") -> Dict:
+        """
+        Live signaal op een gegeven snapshot: technische analyse + ML via de feature store
+        
+        Args:
+            candles: Candlestick data (oudste eerst)
+            timeframe: Timeframe
+            symbol: Trading symbol (feature store key)
         
         Returns:
             Combined signal dict
         """
-        # Get base signal from technical analysis
-        base_signal = super().generate_signal_from_chart(symbol, timeframe, count)
+        base_signal = super().analyze_candles(candles, timeframe=timeframe)
         
         # If ML not available, return base signal
         if not self.ml_available or not self.ml_model:
             return base_signal
         
-        # Get ML prediction
-        candles = self.get_candlestick_data(symbol, timeframe, count)
-        if not candles or len(candles) < 50:
+        if not candles or len(candles) < self.feature_store.lookback:
             return base_signal
         
         try:
-            ml_prediction = self.ml_model.predict(candles)
+            # Registry geeft de nieuwste versie als het model bestand vervangen is
+            if self.ml_model_path:
+                self.ml_model = get_model_registry().get(self.ml_model_path) or self.ml_model
+                self._sync_feature_store()
+            feature_row = self.feature_store.update(symbol, timeframe, candles)
+            ml_prediction = self.ml_model.predict_features(feature_row, self.feature_store.feature_names)
             
             # Combine signals
             combined_signal = self._combine_signals(base_signal, ml_prediction)
@@ -73,6 +114,42 @@ class MLTradingStrategy(TradingStrategy):
             print(f"⚠️  ML prediction error: {e}")
             return base_signal
     
+    def prepare_backtest(self, candles: List[Dict], symbol: str = "XAUUSD", timeframe: str = "H1"):
+        """
+        Score de hele backtest history in één predict_many call
+        
+        Wordt door BacktestingEngine aangeroepen voor de bar loop; analyze_candles
+        combineert daarna per bar met de vooraf berekende ML prediction.
+        """
+        self.backtest_predictions = {}
+        if not self.ml_available or not self.ml_model or len(candles) < self.feature_store.lookback:
+            return
+        
+        X, index = FeatureMatrixBuilder(lookback=self.feature_store.lookback,
+                                        feature_set=self.feature_store.feature_names).build(candles)
+        result = self.ml_model.predict_many(X, self.feature_store.feature_names)
+        if result.get('error'):
+            return
+        
+        for row, bar in enumerate(index):
+            self.backtest_predictions[candles[bar].get('time')] = {
+                'signal': result['signals'][row],
+                'confidence': result['confidence'][row],
+                'probabilities': {name: values[row] for name, values in result['probabilities'].items()}
+            }
+    
+    def analyze_candles(self, candles: List[Dict], timeframe: str = "H1",
+                        indicators: Optional[Dict] = None) -> Dict:
+        """Technische analyse, gecombineerd met de vooraf gescoorde ML prediction (backtests)"""
+        base_signal = super().analyze_candles(candles, timeframe=timeframe, indicators=indicators)
+        if not self.backtest_predictions or not candles:
+            return base_signal
+        
+        ml_prediction = self.backtest_predictions.get(candles[-1].get('time'))
+        if not ml_prediction:
+            return base_signal
+        return self._combine_signals(base_signal, ml_prediction)
+    
     def _combine_signals(self, ta_signal: Dict, ml_signal: Dict) -> Dict:
         """
         Combine technical analysis and ML signals
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+ML Model Validation
+Time-series cross-validation (purged/embargoed folds) en hyperparameter search
+voor MLTradingModel; folds draaien parallel over een process pool die de
+feature matrix read-only via shared memory deelt
+"""
+
+import itertools
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sklearn.metrics import accuracy_score, f1_score
+from indicator_series import _untrack
+from ml_model import MLTradingModel
+
+# CV worker state: feature matrix (shared memory view), labels en folds,
+# één keer per worker gezet via de pool initializer
+_CV_STATE = {}
+
+DEFAULT_PARAM_GRID = {
+    'n_estimators': [100, 200],
+    'max_depth': [6, 10, None],
+    'min_samples_leaf': [2, 5]
+}
+
+def purged_splits(index: np.ndarray, n_splits: int = 5, purge: int = 24, embargo: int = 0,
+                  mode: str = 'walk_forward', max_train: Optional[int] = None,
+                  min_train: int = 100) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Train/test folds zonder lekkage van toekomstige bars
+
+    walk_forward: de rijen worden in n_splits + 1 opeenvolgende blokken verdeeld;
+    fold k test op blok k + 1 en traint alleen op eerdere rijen (max_train: rolling).
+    purged_kfold: elk blok is één keer test, train aan beide kanten.
+
+    Purge: train rijen waarvan de label horizon (purge bars) in de test periode
+    valt worden weggelaten. Embargo: train rijen tot `embargo` bars na de test
+    periode worden weggelaten (overlappende feature vensters).
+
+    Args:
+        index: Bar index per rij (oplopend), bv. uit LabelingEngine.build_dataset
+        n_splits: Aantal folds
+        purge: Label horizon in bars
+        embargo: Bars na de test periode zonder training (purged_kfold)
+        mode: 'walk_forward' of 'purged_kfold'
+        max_train: Max train rijen per fold (walk_forward, None = expanding)
+        min_train: Folds met minder train rijen worden overgeslagen
+
+    Returns:
+        Lijst van (train_rows, test_rows)
+    """
+    if mode not in ('walk_forward', 'purged_kfold'):
+        raise ValueError(f"Unknown split mode: {mode}")
+
+    index = np.asarray(index)
+    blocks = n_splits + 1 if mode == 'walk_forward' else n_splits
+    bounds = np.linspace(0, len(index), blocks + 1).astype(int)
+    rows = np.arange(len(index))
+    splits = []
+
+    for block in range(1 if mode == 'walk_forward' else 0, blocks):
+        test = rows[bounds[block]:bounds[block + 1]]
+        if len(test) == 0:
+            continue
+        first_bar, last_bar = index[test[0]], index[test[-1]]
+
+        before = rows[index < first_bar - purge]
+        if mode == 'walk_forward':
+            train = before[-max_train:] if max_train else before
+        else:
+            train = np.concatenate([before, rows[index > last_bar + embargo]])
+        if len(train) >= min_train:
+            splits.append((train, test))
+    return splits
+
+def _init_cv_worker(shm_name: str, shape: Tuple, dtype: str, y: np.ndarray,
+                    splits: List[Tuple[np.ndarray, np.ndarray]], model_type: str):
+    """Pool initializer: map de feature matrix (read-only) en zet labels/folds één keer per worker"""
+    segment = shared_memory.SharedMemory(name=shm_name)
+    _untrack(segment)
+    X = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+    X.flags.writeable = False
+    _CV_STATE.update({'segment': segment, 'X': X, 'y': y, 'splits': splits, 'model_type': model_type})
+
+def _run_cv_task(task: Tuple[int, int, Dict]) -> Dict:
+    """Fit één kandidaat op één fold en score de test rijen"""
+    candidate, fold, params = task
+    X, y = _CV_STATE['X'], _CV_STATE['y']
+    train, test = _CV_STATE['splits'][fold]
+
+    # n_jobs=1: de parallelliteit zit in de pool
+    estimator = MLTradingModel(model_type=_CV_STATE['model_type'], model_params={**params, 'n_jobs': 1}).model
+    estimator.fit(X[train], y[train])
+    predicted = estimator.predict(X[test])
+    return {
+        'candidate': candidate,
+        'fold': fold,
+        'accuracy': float(accuracy_score(y[test], predicted)),
+        'f1_macro': float(f1_score(y[test], predicted, average='macro', zero_division=0)),
+        'train_rows': int(len(train)),
+        'test_rows': int(len(test))
+    }
+
+class ModelValidator:
+    def __init__(self, model_type: str = 'random_forest', n_splits: int = 5, purge: int = 24,
+                 embargo: int = 0, mode: str = 'walk_forward', max_train: Optional[int] = None,
+                 scoring: str = 'accuracy', workers: Optional[int] = None):
+        """
+        Args:
+            model_type: 'random_forest' of 'xgboost'
+            n_splits: Aantal folds
+            purge: Label horizon in bars (zelfde als LabelingEngine.horizon)
+            embargo: Bars na elke test periode zonder training (purged_kfold)
+            mode: 'walk_forward' of 'purged_kfold'
+            max_train: Max train rijen per fold (walk_forward, None = expanding)
+            scoring: 'accuracy' of 'f1_macro' voor de keuze van de beste kandidaat
+            workers: Aantal processen (default: cpu_count)
+        """
+        if scoring not in ('accuracy', 'f1_macro'):
+            raise ValueError(f"Unknown scoring: {scoring}")
+        self.model_type = model_type
+        self.n_splits = n_splits
+        self.purge = purge
+        self.embargo = embargo
+        self.mode = mode
+        self.max_train = max_train
+        self.scoring = scoring
+        self.workers = workers or os.cpu_count() or 1
+
+    def cross_validate(self, X: np.ndarray, y: np.ndarray, params: Optional[Dict] = None,
+                       index: Optional[np.ndarray] = None) -> Dict:
+        """Cross-validation van één parameter set"""
+        result = self.search(X, y, {name: [value] for name, value in (params or {}).items()}, index)
+        if result.get('error'):
+            return result
+        return result['results'][0]
+
+    def search(self, X: np.ndarray, y: np.ndarray, param_grid: Optional[Dict[str, List]] = None,
+               index: Optional[np.ndarray] = None) -> Dict:
+        """
+        Hyperparameter search: elke combinatie uit param_grid over alle folds
+
+        Alle (kandidaat, fold) taken gaan tegelijk naar de pool.
+
+        Args:
+            X: Feature matrix (oudste eerst)
+            y: Labels
+            param_grid: {param: [waarden]} (default: DEFAULT_PARAM_GRID)
+            index: Bar index per rij (default: 0..n-1)
+
+        Returns:
+            Dict met best_params, best_score en per kandidaat mean/std/fold scores
+        """
+        param_grid = DEFAULT_PARAM_GRID if param_grid is None else param_grid
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        y = np.asarray(y)
+        index = np.arange(len(X)) if index is None else np.asarray(index)
+
+        splits = purged_splits(index, self.n_splits, self.purge, self.embargo, self.mode, self.max_train)
+        if not splits:
+            return {'error': 'Insufficient data', 'message': f'{len(X)} rows, no fold with enough training data'}
+
+        names = list(param_grid.keys())
+        candidates = [dict(zip(names, values)) for values in itertools.product(*[param_grid[n] for n in names])]
+        tasks = [(c, f, params) for c, params in enumerate(candidates) for f in range(len(splits))]
+
+        print(f"\n{'='*70}")
+        print(f"🧪 MODEL VALIDATION ({self.mode}, {self.model_type.upper()})")
+        print(f"{'='*70}")
+        print(f"Rows: {len(X)}, folds: {len(splits)}, candidates: {len(candidates)}, workers: {self.workers}")
+
+        workers = min(self.workers, len(tasks))
+        if workers == 1:
+            _CV_STATE.update({'X': X, 'y': y, 'splits': splits, 'model_type': self.model_type})
+            try:
+                scores = [_run_cv_task(task) for task in tasks]
+            finally:
+                _CV_STATE.clear()
+        else:
+            # Eén kopie van X in shared memory; workers mappen hem i.p.v. een pickle per proces
+            segment = shared_memory.SharedMemory(name=f"ait_cv_{uuid.uuid4().hex[:12]}", create=True, size=max(X.nbytes, 1))
+            _untrack(segment)
+            try:
+                np.ndarray(X.shape, dtype=X.dtype, buffer=segment.buf)[:] = X
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_cv_worker,
+                                         initargs=(segment.name, X.shape, X.dtype.str, y, splits,
+                                                   self.model_type)) as executor:
+                    scores = list(executor.map(_run_cv_task, tasks))
+            finally:
+                segment.close()
+                # Zelfde patroon als IndicatorCache.release: opnieuw mappen en unlinken
+                shared_memory.SharedMemory(name=segment.name).unlink()
+
+        results = []
+        for c, params in enumerate(candidates):
+            folds = sorted((s for s in scores if s['candidate'] == c), key=lambda s: s['fold'])
+            accuracy = np.array([s['accuracy'] for s in folds])
+            f1 = np.array([s['f1_macro'] for s in folds])
+            results.append({
+                'params': params,
+                'mean_accuracy': round(float(accuracy.mean()), 4),
+                'std_accuracy': round(float(accuracy.std()), 4),
+                'mean_f1_macro': round(float(f1.mean()), 4),
+                'std_f1_macro': round(float(f1.std()), 4),
+                'folds': [{key: s[key] for key in ('fold', 'accuracy', 'f1_macro', 'train_rows', 'test_rows')}
+                          for s in folds]
+            })
+        results.sort(key=lambda r: r[f'mean_{self.scoring}'], reverse=True)
+        best = results[0]
+
+        print(f"✅ Best {self.scoring}: {best[f'mean_{self.scoring}']:.4f} ± {best[f'std_{self.scoring}']:.4f}")
+        print(f"   Params: {best['params']}")
+
+        return {
+            'mode': self.mode,
+            'model_type': self.model_type,
+            'scoring': self.scoring,
+            'n_folds': len(splits),
+            'purge': self.purge,
+            'embargo': self.embargo,
+            'best_params': best['params'],
+            'best_score': best[f'mean_{self.scoring}'],
+            'results': results,
+            'validated_at': datetime.now().isoformat()
+        }
+
+    def fit_best(self, X: np.ndarray, y: np.ndarray, search_result: Dict,
+                 feature_names: Optional[List[str]] = None, test_size: float = 0.2) -> MLTradingModel:
+        """
+        Train het eindmodel met de beste parameters (chronologische holdout met purge)
+
+        De CV samenvatting komt in training_metrics['cross_validation'] en wordt
+        zo met het model opgeslagen.
+        """
+        model = MLTradingModel(model_type=self.model_type, model_params=search_result['best_params'])
+        model.feature_names = list(feature_names or [])
+        model.train(X, y, test_size=test_size, time_series=True, purge=self.purge)
+        model.training_metrics['cross_validation'] = {
+            key: search_result[key] for key in ('mode', 'scoring', 'n_folds', 'purge', 'embargo',
+                                                'best_params', 'best_score', 'validated_at')
+        }
+        return model
+
+if __name__ == "__main__":
+    # Test CV + search op gelabelde random walk data
+    from ml_labeling import LabelingEngine
+
+    rng = np.random.default_rng(3)
+    closes = 2500 + np.cumsum(rng.normal(0, 4, 3000))
+    arrays = {
+        'time': np.arange(3000, dtype=np.int64) * 3600,
+        'open': np.concatenate([[closes[0]], closes[:-1]]),
+        'close': closes,
+        'high': closes + rng.uniform(0, 3, 3000),
+        'low': closes - rng.uniform(0, 3, 3000),
+        'volume': rng.uniform(100, 1000, 3000)
+    }
+    labeler = LabelingEngine(method='forward_return', horizon=12, threshold=0.002)
+    X, y, index = labeler.build_dataset(arrays)
+
+    validator = ModelValidator(n_splits=4, purge=labeler.horizon)
+    result = validator.search(X, y, {'n_estimators': [50], 'max_depth': [4, 8]}, index=index)
+    for candidate in result['results']:
+        print(f"   {candidate['params']}: {candidate['mean_accuracy']:.3f} ± {candidate['std_accuracy']:.3f}")
@@ -10,6 +10,9 @@ import time
 from datetime import datetime
 from flask import Flask, jsonify, request
 from flask_cors import CORS
+from mt5_paths import find_common_folder
+from tick_feed import TickFeed
+from market_data_cache import MarketDataCache
 
 app = Flask(__name__)
 CORS(app)
@@ -17,49 +20,10 @@ CORS(app)
 # Configuration
 BRIDGE_PORT = 5002  # Port for this bridge service
 
-# MT5 Common Files folder (where FILE_COMMON files are stored)
-# On Wine/macOS, FILE_COMMON points to Terminal/Common/Files, NOT MQL5/Files/Common!
-MT5_COMMON_FOLDER = os.path.expanduser(
-    "~/Library/Application Support/net.metaquotes.wine.metatrader5/drive_c/users/user/AppData/Roaming/MetaQuotes/Terminal/Common/Files"
-)
-
-# Alternative paths to try (fallback options)
-ALTERNATIVE_PATHS = [
-    os.path.expanduser("~/Library/Application Support/net.metaquotes.wine.metatrader5/drive_c/Program Files/MetaTrader 5/MQL5/Files/Common"),
-    os.path.expanduser("~/Library/Application Support/net.metaquotes.wine.metatrader5/drive_c/users/user/AppData/Roaming/MetaQuotes/Terminal/Common"),
-    os.path.expanduser("~/Library/Application Support/net.metaquotes.wine.metatrader5/drive_c/Users/Public/Documents/MQL5/Files/Common"),
-    os.path.expanduser("~/.wine/drive_c/Program Files/MetaTrader 5/MQL5/Files/Common"),
-]
-
 # File names for communication
 REQUEST_FILE = "mt5_request.txt"
 RESPONSE_FILE = "mt5_response.txt"
 
-def find_common_folder():
-    """Find the MT5 Common Files folder"""
-    # Try primary path
-    if os.path.exists(MT5_COMMON_FOLDER):
-        return MT5_COMMON_FOLDER
-    
-    # Try alternative paths
-    for path in ALTERNATIVE_PATHS:
-        if os.path.exists(path):
-            return path
-    
-    # Create if doesn't exist
-    try:
-        os.makedirs(MT5_COMMON_FOLDER, exist_ok=True)
-        return MT5_COMMON_FOLDER
-    except:
-        # Try first alternative
-        try:
-            os.makedirs(ALTERNATIVE_PATHS[0], exist_ok=True)
-            return ALTERNATIVE_PATHS[0]
-        except:
-            pass
-    
-    return MT5_COMMON_FOLDER  # Default
-
 COMMON_FOLDER = find_common_folder()
 REQUEST_PATH = os.path.join(COMMON_FOLDER, REQUEST_FILE)
 RESPONSE_PATH = os.path.join(COMMON_FOLDER, RESPONSE_FILE)
@@ -155,6 +119,25 @@ def send_request(request_line, body=""):
         print(f"Error sending request: {e}")
         return None
 
+# Shared memory marktdata voor api_server en live_trader (deze bridge is de enige schrijver)
+market_cache = MarketDataCache(writer=True)
+
+def publish_market_data(path, data):
+    """Zet een EA response in de shared memory cache en geef hem ongewijzigd terug"""
+    try:
+        market_cache.publish(path, data)
+    except Exception as e:
+        print(f"⚠️  Could not publish {path} to market data cache: {e}")
+    return data
+
+def invalidate_trading_data():
+    """Na een order/close: account en positions opnieuw bij de EA ophalen"""
+    try:
+        market_cache.invalidate('account')
+        market_cache.invalidate('positions')
+    except Exception as e:
+        print(f"⚠️  Could not invalidate market data cache: {e}")
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check"""
@@ -163,6 +146,7 @@ def health():
         'status': 'healthy',
         'mt5_bridge_connected': mt5_connected,
         'common_folder': COMMON_FOLDER,
+        'market_data_cache': market_cache.get_stats(),
         'timestamp': datetime.now().isoformat()
     })
 
@@ -197,7 +181,7 @@ def get_account_ea():
         response = send_request("GET /account")
         if response:
             try:
-                return jsonify(json.loads(response))
+                return jsonify(publish_market_data("/account", json.loads(response)))
             except:
                 return jsonify({'error': 'Invalid JSON response', 'raw': response}), 500
         else:
@@ -212,7 +196,7 @@ def get_positions_ea():
         response = send_request("GET /positions")
         if response:
             try:
-                return jsonify(json.loads(response))
+                return jsonify(publish_market_data("/positions", json.loads(response)))
             except:
                 return jsonify({'error': 'Invalid JSON response', 'raw': response}), 500
         else:
@@ -259,6 +243,7 @@ def place_order_ea():
         body = json.dumps(data)
         
         response = send_request(request_line, body)
+        invalidate_trading_data()
         if response:
             try:
                 return jsonify(json.loads(response))
@@ -276,6 +261,7 @@ def close_position_ea(ticket):
         print(f"🔒 Closing position {ticket}...")
         request_line = f"POST /close-position/{ticket}"
         response = send_request(request_line)
+        invalidate_trading_data()
         print(f"📥 Response received: {response[:200] if response else 'None'}...")
         
         if response:
@@ -352,7 +338,7 @@ def get_candles_ea(symbol, timeframe, count):
         response = send_request(f"GET /candles/{symbol}/{timeframe}/{count}")
         if response:
             try:
-                return jsonify(json.loads(response))
+                return jsonify(publish_market_data(f"/candles/{symbol}/{timeframe}/{count}", json.loads(response)))
             except:
                 return jsonify({'error': 'Invalid JSON response', 'raw': response}), 500
         else:
@@ -360,14 +346,30 @@ def get_candles_ea(symbol, timeframe, count):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Tick feeds per symbol (tick ring file van de EA, memory-mapped)
+tick_feeds = {}
+
+def get_tick_feed(symbol):
+    """TickFeed voor een symbol, leest alleen nieuwe ticks bij elke aanroep"""
+    key = symbol.upper()
+    if key not in tick_feeds:
+        tick_feeds[key] = TickFeed(key, folder=COMMON_FOLDER)
+    tick_feeds[key].poll()
+    return tick_feeds[key]
+
 @app.route('/tick/<symbol>', methods=['GET'])
 def get_tick(symbol):
     """Get current tick/price for a symbol"""
     try:
+        # Tick ring van de EA: geen request nodig zolang de EA heartbeat actueel is
+        quote = get_tick_feed(symbol).get_quote()
+        if quote:
+            return jsonify(publish_market_data(f"/tick/{symbol}", quote))
+        
         response = send_request(f"GET /tick/{symbol}")
         if response:
             try:
-                return jsonify(json.loads(response))
+                return jsonify(publish_market_data(f"/tick/{symbol}", json.loads(response)))
             except:
                 return jsonify({'error': 'Invalid JSON response', 'raw': response}), 500
         else:
@@ -375,6 +377,27 @@ def get_tick(symbol):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/tick-bars/<symbol>/<int:count>', methods=['GET'])
+def get_tick_bars(symbol, count):
+    """M1 bars gebouwd uit de tick ring (incl. de lopende bar)"""
+    try:
+        feed = get_tick_feed(symbol)
+        if not feed.available:
+            return jsonify({'error': 'No tick stream', 'message': f'Tick ring file for {symbol} not found, enable EnableTickStream in the EA'}), 404
+        
+        include_forming = request.args.get('include_forming', 'true').lower() == 'true'
+        candles = feed.get_candles(count, include_forming=include_forming)
+        return jsonify({
+            'symbol': symbol,
+            'timeframe': 'M1',
+            'count': len(candles),
+            'candles': candles,
+            'ticks_read': feed.sequence,
+            'dropped_ticks': feed.dropped
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/logs', methods=['GET'])
 def get_ea_logs():
     """Get EA logs from log file"""
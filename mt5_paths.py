@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+MT5 Paths
+Locatie van de MT5 Common Files folder (daar schrijft de EA met FILE_COMMON)
+Gedeeld door mt5_bridge en tick_feed, zonder Flask of andere side effects bij import
+"""
+
+import os
+
+# MT5 Common Files folder (where FILE_COMMON files are stored)
+# On Wine/macOS, FILE_COMMON points to Terminal/Common/Files, NOT MQL5/Files/Common!
+MT5_COMMON_FOLDER = os.path.expanduser(
+    "~/Library/Application Support/net.metaquotes.wine.metatrader5/drive_c/users/user/AppData/Roaming/MetaQuotes/Terminal/Common/Files"
+)
+
+# Alternative paths to try (fallback options)
+ALTERNATIVE_PATHS = [
+    os.path.expanduser("~/Library/Application Support/net.metaquotes.wine.metatrader5/drive_c/Program Files/MetaTrader 5/MQL5/Files/Common"),
+    os.path.expanduser("~/Library/Application Support/net.metaquotes.wine.metatrader5/drive_c/users/user/AppData/Roaming/MetaQuotes/Terminal/Common"),
+    os.path.expanduser("~/Library/Application Support/net.metaquotes.wine.metatrader5/drive_c/Users/Public/Documents/MQL5/Files/Common"),
+    os.path.expanduser("~/.wine/drive_c/Program Files/MetaTrader 5/MQL5/Files/Common"),
+]
+
+def find_common_folder(create: bool = True) -> str:
+    """
+    Find the MT5 Common Files folder
+
+    Args:
+        create: Maak de folder aan als geen van de paden bestaat (de bridge schrijft
+                er requests in); lezers zoals TickFeed gebruiken False
+    """
+    # Try primary path
+    if os.path.exists(MT5_COMMON_FOLDER):
+        return MT5_COMMON_FOLDER
+
+    # Try alternative paths
+    for path in ALTERNATIVE_PATHS:
+        if os.path.exists(path):
+            return path
+
+    if not create:
+        return MT5_COMMON_FOLDER
+
+    # Create if doesn't exist
+    try:
+        os.makedirs(MT5_COMMON_FOLDER, exist_ok=True)
+        return MT5_COMMON_FOLDER
+    except OSError:
+        # Try first alternative
+        try:
+            os.makedirs(ALTERNATIVE_PATHS[0], exist_ok=True)
+            return ALTERNATIVE_PATHS[0]
+        except OSError:
+            pass
+
+    return MT5_COMMON_FOLDER  # Default
+
+if __name__ == "__main__":
+    print(f"📁 Common Folder: {find_common_folder(create=False)}")
@@ -4,22 +4,112 @@ Multi-Strategy Manager
 Run meerdere strategieën tegelijk met portfolio management
 """
 
-from typing import Dict, List, Optional
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 from trading_strategy import TradingStrategy
 from ml_strategy import MLTradingStrategy
 from adaptive_strategy import AdaptiveStrategy
 
+# Strategieën in een process worker: één keer per worker opgebouwd via de pool initializer
+_WORKER_STRATEGIES = {}
+
+def _build_strategy(strategy_type: str, bridge_url: str, parameters: Optional[Dict] = None,
+                    ml_model_path: Optional[str] = None) -> TradingStrategy:
+    """Maak een strategie instance ('standard', 'ml' of 'adaptive')"""
+    if strategy_type == 'ml' and ml_model_path:
+        return MLTradingStrategy(ml_model_path=ml_model_path, bridge_url=bridge_url, parameters=parameters)
+    if strategy_type == 'adaptive':
+        return AdaptiveStrategy(bridge_url=bridge_url)
+    return TradingStrategy(bridge_url=bridge_url, parameters=parameters)
+
+# Signaal codes voor gevectoriseerde combinaties (portfolio backtests)
+SIGNAL_CODES = {'BUY': 1, 'SELL': -1, 'NEUTRAL': 0}
+SIGNAL_NAMES = {1: 'BUY', -1: 'SELL', 0: 'NEUTRAL'}
+
+def combine_scores(buy_score, sell_score, neutral_score, total_weight) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Weighted combination regels van generate_combined_signal
+    
+    Werkt op scalars en op arrays (één waarde per bar).
+    
+    Returns:
+        (signal code: 1 BUY / -1 SELL / 0 NEUTRAL, confidence)
+    """
+    buy, sell, neutral, total = (np.asarray(v, dtype=np.float64) for v in (buy_score, sell_score, neutral_score, total_weight))
+    is_buy = (buy > sell) & (buy > neutral)
+    is_sell = ~is_buy & (sell > buy) & (sell > neutral)
+    safe_total = np.where(total > 0, total, 1.0)
+    confidence = np.where(is_buy, np.where(total > 0, buy / safe_total, 0.0),
+                          np.where(is_sell, np.where(total > 0, sell / safe_total, 0.0), 50.0))
+    return np.where(is_buy, 1, np.where(is_sell, -1, 0)), confidence
+
+def performance_weights(names: List[str], performance_data: Dict[str, Dict]) -> Dict[str, float]:
+    """
+    Genormaliseerde gewichten uit performance metrics (regels van update_weights)
+    
+    Args:
+        names: Strategie namen
+        performance_data: {naam: {win_rate, sharpe_ratio, profit_factor}}; ontbrekende
+                          metrics tellen als neutraal
+    
+    Returns:
+        {naam: gewicht}, som 1
+    """
+    scores = {}
+    for name in names:
+        perf = performance_data.get(name, {})
+        # Combined score from multiple metrics
+        win_rate = perf.get('win_rate', 50) / 100
+        sharpe = perf.get('sharpe_ratio', 0) / 2.0  # Normalize
+        profit_factor = perf.get('profit_factor', 1) / 3.0  # Normalize
+        
+        score = (win_rate * 0.4 + sharpe * 0.3 + profit_factor * 0.3) * 100
+        scores[name] = max(0.1, score)  # Minimum weight of 0.1
+    
+    total_score = sum(scores.values())
+    return {name: score / total_score for name, score in scores.items()} if total_score > 0 else {}
+
+def _init_strategy_worker(specs: Dict[str, Tuple]):
+    """Pool initializer: bouw de process strategieën één keer per worker"""
+    for name, spec in specs.items():
+        _WORKER_STRATEGIES[name] = _build_strategy(*spec)
+
+def _evaluate_in_worker(name: str, candles: List[Dict], symbol: str, timeframe: str) -> Tuple[Dict, float]:
+    """Signaal van één process strategie op de gedeelde snapshot"""
+    start = time.perf_counter()
+    signal = _WORKER_STRATEGIES[name].analyze_snapshot(candles, timeframe=timeframe, symbol=symbol)
+    return signal, (time.perf_counter() - start) * 1000
+
 class MultiStrategyManager:
-    def __init__(self, bridge_url: str = "http://localhost:5002"):
+    def __init__(self, bridge_url: str = "http://localhost:5002", max_threads: Optional[int] = None,
+                 process_workers: Optional[int] = None):
+        """
+        Args:
+            bridge_url: MT5 bridge URL
+            max_threads: Threads voor 'thread' strategieën (default: één per strategie)
+            process_workers: Processen voor 'process' strategieën (default: één per strategie)
+        """
         self.bridge_url = bridge_url
         self.strategies = {}
         self.performance_tracker = {}
         self.weights = {}
         self.total_weight = 0.0
+        self.max_threads = max_threads
+        self.process_workers = process_workers
+        self.fetcher = TradingStrategy(bridge_url=bridge_url)
+        self._thread_pool = None
+        self._thread_capacity = 0
+        self._process_pool = None
+        self._process_specs = None  # Specs waarmee de process pool gestart is
+        self._pool_lock = threading.Lock()
     
     def add_strategy(self, name: str, strategy_type: str = 'standard', 
                     weight: float = 1.0, parameters: Optional[Dict] = None,
-                    ml_model_path: Optional[str] = None) -> bool:
+                    ml_model_path: Optional[str] = None, executor: str = 'thread') -> bool:
         """
         Add a strategy to the portfolio
         
@@ -29,29 +119,29 @@ class MultiStrategyManager:
             weight: Weight for this strategy (for signal combination)
             parameters: Strategy parameters
             ml_model_path: Path to ML model (for ML strategy)
+            executor: 'thread' (ML modellen, lichte strategieën) of 'process' (zware,
+                      CPU-gebonden strategieën zonder state; niet voor 'adaptive')
         
         Returns:
             True if successful
         """
         try:
-            if strategy_type == 'ml' and ml_model_path:
-                strategy = MLTradingStrategy(
-                    ml_model_path=ml_model_path,
-                    bridge_url=self.bridge_url,
-                    parameters=parameters
-                )
-            elif strategy_type == 'adaptive':
-                strategy = AdaptiveStrategy(bridge_url=self.bridge_url)
-            else:
-                strategy = TradingStrategy(
-                    bridge_url=self.bridge_url,
-                    parameters=parameters
-                )
+            if executor not in ('thread', 'process'):
+                raise ValueError(f"Unknown executor: {executor}")
+            if executor == 'process' and strategy_type == 'adaptive':
+                # Regime state moet tussen signalen bewaard blijven: in dit process houden
+                print(f"⚠️  Adaptive strategy '{name}' runs in a thread (keeps regime state)")
+                executor = 'thread'
+            
+            strategy = _build_strategy(strategy_type, self.bridge_url, parameters, ml_model_path)
             
             self.strategies[name] = {
                 'strategy': strategy,
                 'type': strategy_type,
                 'weight': weight,
+                'executor': executor,
+                'spec': (strategy_type, self.bridge_url, parameters, ml_model_path),
+                'lock': threading.Lock(),
                 'performance': {
                     'total_trades': 0,
                     'winning_trades': 0,
@@ -80,14 +170,75 @@ class MultiStrategyManager:
             return True
         return False
     
-    def generate_combined_signal(self, symbol: str = "XAUUSD", timeframe: str = "H1", count: int = 100) -> Dict:
+    def _submit_all(self, candles: List[Dict], symbol: str, timeframe: str) -> Dict:
+        """Start de evaluatie van alle strategieën; {naam: future met (signal, latency_ms)}"""
+        with self._pool_lock:
+            thread_names = [name for name, config in self.strategies.items() if config['executor'] == 'thread']
+            process_specs = {name: config['spec'] for name, config in self.strategies.items()
+                             if config['executor'] == 'process'}
+            
+            threads = self.max_threads or len(thread_names)
+            if thread_names and (self._thread_pool is None or threads > self._thread_capacity):
+                if self._thread_pool is not None:
+                    self._thread_pool.shutdown(wait=False)
+                self._thread_pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='strategy')
+                self._thread_capacity = threads
+            if process_specs != (self._process_specs or {}):
+                # Andere set process strategieën: workers opnieuw opbouwen
+                if self._process_pool is not None:
+                    self._process_pool.shutdown(wait=False)
+                    self._process_pool = None
+                    self._process_specs = None
+            if process_specs and self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.process_workers or len(process_specs),
+                    mp_context=multiprocessing.get_context('spawn'),  # Veilig vanuit Flask/live threads
+                    initializer=_init_strategy_worker, initargs=(process_specs,)
+                )
+                self._process_specs = process_specs
+            
+            futures = {}
+            for name, config in self.strategies.items():
+                if config['executor'] == 'process':
+                    futures[name] = self._process_pool.submit(_evaluate_in_worker, name, candles, symbol, timeframe)
+                else:
+                    futures[name] = self._thread_pool.submit(self._evaluate_in_thread, config, candles, symbol, timeframe)
+        return futures
+    
+    @staticmethod
+    def _evaluate_in_thread(config: Dict, candles: List[Dict], symbol: str, timeframe: str) -> Tuple[Dict, float]:
+        """Signaal van één strategie in dit process (lock: strategie state, bv. regime)"""
+        start = time.perf_counter()
+        with config['lock']:
+            signal = config['strategy'].analyze_snapshot(candles, timeframe=timeframe, symbol=symbol)
+        return signal, (time.perf_counter() - start) * 1000
+    
+    def shutdown(self):
+        """Stop de thread/process pools"""
+        with self._pool_lock:
+            if self._thread_pool is not None:
+                self._thread_pool.shutdown(wait=True)
+                self._thread_pool = None
+                self._thread_capacity = 0
+            if self._process_pool is not None:
+                self._process_pool.shutdown(wait=True)
+                self._process_pool = None
+                self._process_specs = None
+    
+    def generate_combined_signal(self, symbol: str = "XAUUSD", timeframe: str = "H1", count: int = 100,
+                                 candles: Optional[List[Dict]] = None) -> Dict:
         """
         Generate combined signal from all strategies
         
+        Eén candle fetch; alle strategieën evalueren dezelfde snapshot parallel
+        (threads of processen per strategie), dus de latency is die van de
+        langzaamste strategie.
+        
         Args:
             symbol: Trading symbol
             timeframe: Timeframe
             count: Number of candles
+            candles: Optionele snapshot (dan geen fetch)
         
         Returns:
             Combined signal dict
@@ -102,13 +253,26 @@ class MultiStrategyManager:
         signals = {}
         total_confidence = 0
         
-        # Get signals from all strategies
-        for name, config in self.strategies.items():
+        # Eén snapshot voor alle strategieën
+        fetch_start = time.perf_counter()
+        if candles is None:
+            candles = self.fetcher.get_candlestick_data(symbol, timeframe, count)
+        fetch_ms = (time.perf_counter() - fetch_start) * 1000
+        if not candles:
+            return {
+                'signal': 'NEUTRAL',
+                'confidence': 0,
+                'reason': 'No candle data'
+            }
+        
+        # Alle strategieën tegelijk; resultaten in de volgorde van self.strategies
+        eval_start = time.perf_counter()
+        futures = self._submit_all(candles, symbol, timeframe)
+        for name, future in futures.items():
+            config = self.strategies[name]
             try:
-                strategy = config['strategy']
+                signal_data, latency_ms = future.result()
                 weight = config['weight']
-                
-                signal_data = strategy.generate_signal_from_chart(symbol, timeframe, count)
                 signal_type = signal_data.get('signal', 'NEUTRAL')
                 confidence = signal_data.get('confidence', 0)
                 
@@ -117,7 +281,8 @@ class MultiStrategyManager:
                     'confidence': confidence,
                     'weight': weight,
                     'weighted_confidence': confidence * weight,
-                    'reason': signal_data.get('reason', '')
+                    'reason': signal_data.get('reason', ''),
+                    'latency_ms': round(latency_ms, 2)
                 }
                 
                 total_confidence += confidence * weight
@@ -125,6 +290,7 @@ class MultiStrategyManager:
             except Exception as e:
                 print(f"⚠️  Error getting signal from '{name}': {e}")
                 continue
+        eval_ms = (time.perf_counter() - eval_start) * 1000
         
         if not signals:
             return {
@@ -139,15 +305,9 @@ class MultiStrategyManager:
         neutral_score = sum(s['weighted_confidence'] for s in signals.values() if s['signal'] == 'NEUTRAL')
         
         # Determine final signal
-        if buy_score > sell_score and buy_score > neutral_score:
-            final_signal = 'BUY'
-            final_confidence = buy_score / self.total_weight if self.total_weight > 0 else 0
-        elif sell_score > buy_score and sell_score > neutral_score:
-            final_signal = 'SELL'
-            final_confidence = sell_score / self.total_weight if self.total_weight > 0 else 0
-        else:
-            final_signal = 'NEUTRAL'
-            final_confidence = 50
+        code, confidence = combine_scores(buy_score, sell_score, neutral_score, self.total_weight)
+        final_signal = SIGNAL_NAMES[int(code)]
+        final_confidence = float(confidence)
         
         # Generate reason
         reasons = []
@@ -165,7 +325,11 @@ class MultiStrategyManager:
             'buy_score': buy_score,
             'sell_score': sell_score,
             'neutral_score': neutral_score,
-            'total_strategies': len(self.strategies)
+            'total_strategies': len(self.strategies),
+            'timing_ms': {
+                'fetch': round(fetch_ms, 2),
+                'evaluate': round(eval_ms, 2)
+            }
         }
     
     def update_weights(self, performance_data: Dict[str, Dict]):
@@ -179,24 +343,11 @@ class MultiStrategyManager:
             return
         
         # Calculate new weights based on performance
-        total_score = 0
-        scores = {}
-        
-        for name in self.strategies.keys():
-            perf = performance_data.get(name, {})
-            # Combined score from multiple metrics
-            win_rate = perf.get('win_rate', 50) / 100
-            sharpe = perf.get('sharpe_ratio', 0) / 2.0  # Normalize
-            profit_factor = perf.get('profit_factor', 1) / 3.0  # Normalize
-            
-            score = (win_rate * 0.4 + sharpe * 0.3 + profit_factor * 0.3) * 100
-            scores[name] = max(0.1, score)  # Minimum weight of 0.1
-            total_score += scores[name]
+        weights = performance_weights(list(self.strategies.keys()), performance_data)
         
         # Normalize weights
-        if total_score > 0:
-            for name in self.strategies.keys():
-                new_weight = scores[name] / total_score
+        if weights:
+            for name, new_weight in weights.items():
                 self.strategies[name]['weight'] = new_weight
                 self.weights[name] = new_weight
             
@@ -213,6 +364,7 @@ class MultiStrategyManager:
         for name, config in self.strategies.items():
             status['strategies'][name] = {
                 'type': config['type'],
+                'executor': config['executor'],
                 'weight': config['weight'],
                 'performance': config['performance']
             }
@@ -221,11 +373,30 @@ class MultiStrategyManager:
 
 if __name__ == "__main__":
     # Test multi-strategy manager
+    import numpy as np
+    
     manager = MultiStrategyManager()
     
     # Add strategies
     manager.add_strategy('Technical', 'standard', weight=1.0)
+    manager.add_strategy('Fast', 'standard', weight=0.5, parameters={'sma_short': 10, 'sma_long': 30})
+    manager.add_strategy('Heavy', 'standard', weight=0.5, parameters={'sma_short': 25, 'sma_long': 60}, executor='process')
     manager.add_strategy('Adaptive', 'adaptive', weight=1.0)
     
     print(f"✅ Multi-Strategy Manager initialized")
     print(f"   Strategies: {list(manager.strategies.keys())}")
+    
+    # Gedeelde snapshot i.p.v. een bridge fetch
+    rng = np.random.default_rng(2)
+    closes = 2500 + np.cumsum(rng.normal(0, 3, 100))
+    candles = [{
+        'time': f"2024.01.{1 + i // 24:02d} {i % 24:02d}:00:00",
+        'open': closes[i - 1] if i else closes[0], 'close': closes[i],
+        'high': closes[i] + 1.5, 'low': closes[i] - 1.5, 'volume': 500.0
+    } for i in range(len(closes))]
+    
+    for _ in range(3):
+        combined = manager.generate_combined_signal(candles=candles)
+    print(f"Combined: {combined['signal']} ({combined['confidence']}%), timing: {combined['timing_ms']}")
+    print(f"   Latency per strategy: {({name: s['latency_ms'] for name, s in combined['strategy_signals'].items()})}")
+    manager.shutdown()
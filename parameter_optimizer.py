@@ -4,13 +4,23 @@ Parameter Optimization Engine
 Grid search en genetic algorithm voor beste strategie parameters
 """
 
-from typing import Dict, List, Optional, Tuple
-from backtesting_engine import BacktestingEngine
+from typing import Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from backtesting_engine import BacktestingEngine, WARMUP_CANDLES
 from trading_strategy import TradingStrategy
 from performance_metrics import PerformanceMetrics
+from indicator_series import IndicatorCache, PERIOD_INDICATORS, data_fingerprint
+from candle_store import CandleStore, candles_to_arrays, regime_intervals_from_codes
+from market_regime import MarketRegimeDetector, REGIMES, regime_series
+import numpy as np
 import itertools
 import random
 import copy
+import os
+
+# Walk-forward worker state: candles en de indicator cache worden één keer
+# per worker process gezet (via de pool initializer), niet per fold
+_WALK_FORWARD_STATE = {}
 
 class ParameterOptimizer:
     def __init__(self, strategy_class, bridge_url: str = "http://localhost:5002"):
@@ -24,10 +34,15 @@ class ParameterOptimizer:
             'risk_reward_ratio': [1.5, 2.0, 2.5, 3.0]
         }
         self.optimization_results = []
+        # Gedeeld door alle kandidaten: elke SMA/EMA/RSI reeks één keer per data set
+        self.indicator_cache = IndicatorCache()
     
     def grid_search(self, symbol: str = "XAUUSD", timeframe: str = "H1", 
                     days: int = 30, volume: float = 0.20,
-                    objective: str = 'sharpe_ratio', max_combinations: int = 100) -> Dict:
+                    objective: str = 'sharpe_ratio', max_combinations: int = 100,
+                    candles: Optional[List[Dict]] = None, start_index: Optional[int] = None,
+                    end_index: Optional[int] = None, indicator_series: Optional[Dict] = None,
+                    entry_mask: Optional[Sequence[bool]] = None) -> Dict:
         """
         Grid search over parameter ranges
         
@@ -38,6 +53,12 @@ class ParameterOptimizer:
             volume: Trade volume
             objective: Objective metric ('sharpe_ratio', 'profit_factor', 'win_rate', 'total_return')
             max_combinations: Maximum combinations to test (to limit computation time)
+            candles: Optionele lokale candle history; zonder candles wordt per
+                     combinatie via de bridge gebacktest over `days`
+            start_index: Eerste bar van het optimalisatie venster (met candles)
+            end_index: Einde (exclusief) van het optimalisatie venster (met candles)
+            indicator_series: Indicator reeksen over `candles` (default: lazy uit de gedeelde cache)
+            entry_mask: Alleen op bars met True posities openen (met candles, bv. één regime)
         
         Returns:
             Best parameters and results
@@ -57,6 +78,10 @@ class ParameterOptimizer:
         
         all_combinations = list(itertools.product(*param_values))
         
+        # Eén lazy view voor alle kandidaten van deze run
+        if indicator_series is None:
+            indicator_series = self._bind_indicator_cache(candles)
+        
         # Limit combinations if too many
         if len(all_combinations) > max_combinations:
             print(f"⚠️  {len(all_combinations)} combinations found, limiting to {max_combinations}")
@@ -79,16 +104,11 @@ class ParameterOptimizer:
             print(f"  [{i+1}/{len(all_combinations)}] Testing: {params}")
             
             try:
-                # Create strategy with these parameters
-                strategy = self._create_strategy_with_params(params)
-                
-                # Run backtest
-                engine = BacktestingEngine(strategy, initial_balance=100000.0, bridge_url=self.bridge_url)
-                backtest_result = engine.run_backtest(
-                    symbol=symbol,
-                    timeframe=timeframe,
-                    days=days,
-                    volume=volume
+                # Run backtest with these parameters
+                backtest_result = self._run_candidate_backtest(
+                    params, symbol, timeframe, days, volume,
+                    candles=candles, start_index=start_index, end_index=end_index,
+                    indicator_series=indicator_series, entry_mask=entry_mask
                 )
                 
                 if backtest_result.get('error'):
@@ -154,7 +174,10 @@ class ParameterOptimizer:
     def genetic_algorithm(self, symbol: str = "XAUUSD", timeframe: str = "H1",
                          days: int = 30, volume: float = 0.20,
                          population_size: int = 20, generations: int = 10,
-                         objective: str = 'sharpe_ratio') -> Dict:
+                         objective: str = 'sharpe_ratio',
+                         candles: Optional[List[Dict]] = None, start_index: Optional[int] = None,
+                         end_index: Optional[int] = None, indicator_series: Optional[Dict] = None,
+                         entry_mask: Optional[Sequence[bool]] = None) -> Dict:
         """
         Genetic algorithm voor parameter optimization
         
@@ -166,6 +189,11 @@ class ParameterOptimizer:
             population_size: Size of population per generation
             generations: Number of generations
             objective: Objective metric
+            candles: Optionele lokale candle history (zie grid_search)
+            start_index: Eerste bar van het optimalisatie venster (met candles)
+            end_index: Einde (exclusief) van het optimalisatie venster (met candles)
+            indicator_series: Indicator reeksen over `candles` (default: lazy uit de gedeelde cache)
+            entry_mask: Alleen op bars met True posities openen (met candles, bv. één regime)
         
         Returns:
             Best parameters and results
@@ -179,6 +207,9 @@ class ParameterOptimizer:
         print()
         
         # Initialize population
+        if indicator_series is None:
+            indicator_series = self._bind_indicator_cache(candles)
+        
         population = self._initialize_population(population_size)
         
         best_ever = None
@@ -193,9 +224,11 @@ class ParameterOptimizer:
                 print(f"  [{i+1}/{len(population)}] Testing parameters...")
                 
                 try:
-                    strategy = self._create_strategy_with_params(individual)
-                    engine = BacktestingEngine(strategy, initial_balance=100000.0, bridge_url=self.bridge_url)
-                    backtest_result = engine.run_backtest(symbol, timeframe, days, volume)
+                    backtest_result = self._run_candidate_backtest(
+                        individual, symbol, timeframe, days, volume,
+                        candles=candles, start_index=start_index, end_index=end_index,
+                        indicator_series=indicator_series, entry_mask=entry_mask
+                    )
                     
                     if backtest_result.get('error'):
                         continue
@@ -256,9 +289,536 @@ class ParameterOptimizer:
             'objective': objective
         }
     
+    def bayesian_search(self, symbol: str = "XAUUSD", timeframe: str = "H1", volume: float = 0.20,
+                        objective: str = 'sharpe_ratio', n_rounds: int = 6, eta: int = 3,
+                        n_candidates: int = 24, gamma: float = 0.25,
+                        candles: Optional[List[Dict]] = None, start_index: Optional[int] = None,
+                        end_index: Optional[int] = None, indicator_series: Optional[Dict] = None,
+                        candle_store: Optional[CandleStore] = None,
+                        entry_mask: Optional[Sequence[bool]] = None) -> Dict:
+        """
+        Sample-efficient optimization: TPE met successive halving (Hyperband stijl)
+        
+        Elke ronde stelt eta^2 kandidaten voor. Die worden eerst gescoord op het
+        laatste 1/eta^2 deel van de history; alleen de beste 1/eta gaan door naar
+        een 1/eta slice en alleen de beste daarvan krijgen een volledige backtest.
+        Nieuwe kandidaten worden gekozen met een Tree-structured Parzen Estimator
+        (goede vs slechte parameter waarden, per parameter geteld) op het hoogste
+        budget niveau met genoeg observaties.
+        
+        Args:
+            symbol: Trading symbol
+            timeframe: Timeframe
+            volume: Trade volume
+            objective: Objective metric
+            n_rounds: Aantal successive-halving rondes (= aantal volledige backtests)
+            eta: Halving factor (kandidaten per ronde = eta^2)
+            n_candidates: Aantal TPE samples waaruit per voorstel gekozen wordt
+            gamma: Fractie van observaties die als 'goed' telt
+            candles: Optionele candle history; default uit de CandleStore
+            start_index: Eerste bar van het optimalisatie venster
+            end_index: Einde (exclusief) van het optimalisatie venster
+            indicator_series: Indicator reeksen over `candles` (default: lazy uit de gedeelde cache)
+            candle_store: CandleStore om de history uit te laden
+            entry_mask: Alleen op bars met True posities openen (bv. één regime)
+        
+        Returns:
+            Best parameters and results
+        """
+        print(f"\n{'='*70}")
+        print(f"🎯 PARAMETER OPTIMIZATION - Bayesian (TPE + Successive Halving)")
+        print(f"{'='*70}")
+        
+        if candles is None:
+            store = candle_store or CandleStore(bridge_url=self.bridge_url)
+            candles = store.load_candles(symbol, timeframe)
+        
+        start_index = WARMUP_CANDLES if start_index is None else max(start_index, WARMUP_CANDLES)
+        end_index = len(candles) if end_index is None else min(end_index, len(candles))
+        total_bars = end_index - start_index
+        if total_bars < eta ** 2:
+            return {
+                'error': 'Insufficient historical data',
+                'message': f'{len(candles)} candles available',
+                'best_parameters': None
+            }
+        
+        if indicator_series is None:
+            indicator_series = self._bind_indicator_cache(candles)
+        
+        # Budget niveaus: laatste 1/eta^2, 1/eta en de hele history
+        rungs = [eta ** -2, eta ** -1, 1.0]
+        rung_starts = [end_index - max(1, int(total_bars * fraction)) for fraction in rungs]
+        
+        print(f"Symbol: {symbol}")
+        print(f"Timeframe: {timeframe}")
+        print(f"Bars: {total_bars} (slices: {[end_index - s for s in rung_starts]})")
+        print(f"Rounds: {n_rounds} x {eta ** 2} candidates")
+        print(f"Objective: {objective}")
+        print()
+        
+        observations = [[] for _ in rungs]  # per rung: (params, score)
+        full_results = []
+        seen = set()
+        backtests_per_rung = [0 for _ in rungs]
+        
+        for round_number in range(n_rounds):
+            print(f"🔄 Round {round_number + 1}/{n_rounds}")
+            
+            # Stel kandidaten voor (random tot het model genoeg data heeft)
+            candidates = []
+            for _ in range(eta ** 2):
+                params = self._propose_tpe_candidate(observations, seen, n_candidates, gamma)
+                seen.add(tuple(sorted(params.items())))
+                candidates.append(params)
+            
+            # Successive halving over de budget niveaus
+            for rung, rung_start in enumerate(rung_starts):
+                scored = []
+                for params in candidates:
+                    result = self._run_candidate_backtest(
+                        params, symbol, timeframe, 0, volume,
+                        candles=candles, start_index=rung_start, end_index=end_index,
+                        indicator_series=indicator_series, entry_mask=entry_mask
+                    )
+                    backtests_per_rung[rung] += 1
+                    if result.get('error'):
+                        continue
+                    metrics = result.get('metrics', {})
+                    score = self._calculate_objective_score(metrics, objective)
+                    scored.append((score, params, result))
+                    observations[rung].append((params, score))
+                
+                if not scored:
+                    break
+                scored.sort(key=lambda x: x[0], reverse=True)
+                
+                if rung == len(rungs) - 1:
+                    for score, params, result in scored:
+                        full_results.append({
+                            'parameters': params,
+                            'metrics': result.get('metrics', {}),
+                            'score': score,
+                            'total_return': result.get('total_return_pct', 0)
+                        })
+                        print(f"  ✅ Full backtest: {score:.2f} ({objective}) {params}")
+                else:
+                    keep = max(1, len(scored) // eta)
+                    candidates = [params for _, params, _ in scored[:keep]]
+                    print(f"  Slice {end_index - rung_start} bars: best {scored[0][0]:.2f}, promoting {keep}")
+        
+        full_results.sort(key=lambda x: x['score'], reverse=True)
+        best = full_results[0] if full_results else None
+        
+        print()
+        print("="*70)
+        print("📊 OPTIMIZATION RESULTS")
+        print("="*70)
+        if best:
+            print(f"\n🏆 Best Parameters (Score: {best['score']:.2f}):")
+            for key, value in best['parameters'].items():
+                print(f"  {key}: {value}")
+        print(f"\n🧮 Backtests: {backtests_per_rung[-1]} full, {sum(backtests_per_rung[:-1])} on short slices")
+        
+        return {
+            'best_parameters': best['parameters'] if best else None,
+            'best_score': best['score'] if best else float('-inf'),
+            'best_metrics': best['metrics'] if best else {},
+            'all_results': full_results[:10],
+            'total_tested': len(seen),
+            'full_backtests': backtests_per_rung[-1],
+            'partial_backtests': sum(backtests_per_rung[:-1]),
+            'objective': objective
+        }
+    
+    def _propose_tpe_candidate(self, observations: List[List[Tuple[Dict, float]]], seen: set,
+                               n_candidates: int = 24, gamma: float = 0.25) -> Dict:
+        """
+        Kies een nieuwe parameter set met een (categorische) Tree-structured Parzen Estimator
+        
+        Gebruikt het hoogste budget niveau met genoeg observaties. Per parameter
+        worden waarden geteld in de goede (top gamma) en slechte groep; kandidaten
+        worden getrokken uit de goede verdeling en de kandidaat met de hoogste
+        l(x)/g(x) verhouding wint.
+        """
+        min_points = len(self.parameter_ranges) + 2
+        history = next((obs for obs in reversed(observations) if len(obs) >= min_points), None)
+        
+        if history is None:
+            return self._random_valid_parameters(seen)
+        
+        ranked = sorted(history, key=lambda x: x[1], reverse=True)
+        n_good = max(1, int(len(ranked) * gamma))
+        good = [params for params, _ in ranked[:n_good]]
+        bad = [params for params, _ in ranked[n_good:]] or good
+        
+        def density(group: List[Dict], name: str, value) -> float:
+            # Laplace smoothing zodat onbekende waarden nooit kans 0 krijgen
+            values = self.parameter_ranges[name]
+            return (sum(1 for p in group if p[name] == value) + 1.0) / (len(group) + len(values))
+        
+        best_params = None
+        best_ratio = float('-inf')
+        for _ in range(n_candidates):
+            params = {}
+            for name, values in self.parameter_ranges.items():
+                weights = [density(good, name, v) for v in values]
+                params[name] = random.choices(values, weights=weights)[0]
+            if params['sma_short'] >= params['sma_long']:
+                valid_short = [v for v in self.parameter_ranges['sma_short'] if v < params['sma_long']]
+                if not valid_short:
+                    continue
+                params['sma_short'] = random.choice(valid_short)
+            if tuple(sorted(params.items())) in seen:
+                continue
+            
+            ratio = 1.0
+            for name, value in params.items():
+                ratio *= density(good, name, value) / density(bad, name, value)
+            if ratio > best_ratio:
+                best_ratio = ratio
+                best_params = params
+        
+        return best_params or self._random_valid_parameters(seen)
+    
+    def _random_valid_parameters(self, seen: Optional[set] = None, max_attempts: int = 100) -> Dict:
+        """Random geldige parameter set (sma_short < sma_long), bij voorkeur nog niet getest"""
+        individual = None
+        for _ in range(max_attempts):
+            individual = self._initialize_population(1)[0]
+            if not seen or tuple(sorted(individual.items())) not in seen:
+                return individual
+        return individual
+    
+    def walk_forward(self, symbol: str = "XAUUSD", timeframe: str = "H1", volume: float = 0.20,
+                     train_bars: int = 500, test_bars: int = 100, mode: str = 'rolling',
+                     method: str = 'grid_search', objective: str = 'sharpe_ratio',
+                     max_combinations: int = 50, population_size: int = 20, generations: int = 10,
+                     workers: Optional[int] = None, candles: Optional[List[Dict]] = None,
+                     candle_store: Optional[CandleStore] = None) -> Dict:
+        """
+        Walk-forward optimization over de lokale candle history
+        
+        De history wordt opgesplitst in opeenvolgende train/test folds. Elke train
+        fold wordt geoptimaliseerd (grid search of genetic algorithm) en de beste
+        parameters worden getest op het direct volgende out-of-sample venster.
+        Folds draaien parallel in een process pool; de indicator reeksen worden
+        één keer over de hele history berekend en door alle folds gedeeld.
+        
+        Args:
+            symbol: Trading symbol
+            timeframe: Timeframe
+            volume: Trade volume
+            train_bars: Aantal bars per train venster
+            test_bars: Aantal bars per out-of-sample venster
+            mode: 'rolling' (vast train venster schuift mee) of 'anchored' (train start blijft vast)
+            method: 'grid_search' of 'genetic'
+            objective: Objective metric
+            max_combinations: Max combinaties per fold (grid search)
+            population_size: Populatie grootte per fold (genetic)
+            generations: Aantal generaties per fold (genetic)
+            workers: Aantal processen (None = aantal CPU's, 1 = geen pool)
+            candles: Optionele candle history; default uit de CandleStore
+            candle_store: CandleStore om de history uit te laden
+        
+        Returns:
+            Per-fold resultaten en geaggregeerde out-of-sample metrics/equity
+        """
+        print(f"\n{'='*70}")
+        print(f"🚶 PARAMETER OPTIMIZATION - Walk-Forward ({mode}, {method})")
+        print(f"{'='*70}")
+        
+        if candles is None:
+            store = candle_store or CandleStore(bridge_url=self.bridge_url)
+            candles = store.load_candles(symbol, timeframe)
+        
+        folds = self._build_walk_forward_folds(len(candles), train_bars, test_bars, mode)
+        if not folds:
+            return {
+                'error': 'Insufficient historical data',
+                'message': f'{len(candles)} candles available, need at least {WARMUP_CANDLES + train_bars + test_bars}',
+                'folds': []
+            }
+        
+        print(f"Symbol: {symbol}")
+        print(f"Timeframe: {timeframe}")
+        print(f"Candles: {len(candles)}")
+        print(f"Folds: {len(folds)} (train {train_bars} / test {test_bars} bars)")
+        print(f"Objective: {objective}")
+        print()
+        
+        # Workers delen indicator reeksen via shared memory (eerste worker rekent, de rest mapt)
+        closes = [float(c.get('close', 0)) for c in candles]
+        cache_keys = {(PERIOD_INDICATORS[name], period)
+                      for name, periods in self._candidate_periods(timeframe).items() for period in periods}
+        
+        settings = {
+            'symbol': symbol,
+            'timeframe': timeframe,
+            'volume': volume,
+            'method': method,
+            'objective': objective,
+            'max_combinations': max_combinations,
+            'population_size': population_size,
+            'generations': generations
+        }
+        init_args = (self.strategy_class, self.bridge_url, self.parameter_ranges, candles, settings)
+        
+        workers = workers or os.cpu_count() or 1
+        try:
+            if workers == 1 or len(folds) == 1:
+                _init_walk_forward_worker(*init_args)
+                fold_results = [_run_walk_forward_fold(fold) for fold in folds]
+            else:
+                with ProcessPoolExecutor(max_workers=min(workers, len(folds)),
+                                         initializer=_init_walk_forward_worker,
+                                         initargs=init_args) as executor:
+                    fold_results = list(executor.map(_run_walk_forward_fold, folds))
+        finally:
+            _release_walk_forward_cache(data_fingerprint(closes), cache_keys)
+        
+        return self._aggregate_walk_forward(fold_results, objective, timeframe)
+    
+    def _build_walk_forward_folds(self, total_bars: int, train_bars: int, test_bars: int,
+                                  mode: str = 'rolling') -> List[Dict]:
+        """Bouw train/test fold grenzen (bar indices, end exclusief)"""
+        folds = []
+        first_bar = WARMUP_CANDLES
+        train_end = first_bar + train_bars
+        while train_end + test_bars <= total_bars:
+            train_start = first_bar if mode == 'anchored' else train_end - train_bars
+            folds.append({
+                'fold': len(folds),
+                'train_start': train_start,
+                'train_end': train_end,
+                'test_start': train_end,
+                'test_end': train_end + test_bars
+            })
+            train_end += test_bars
+        return folds
+    
+    def _candidate_periods(self, timeframe: str) -> Dict[str, List[int]]:
+        """Alle indicator periodes die kandidaten in deze optimalisatie kunnen gebruiken"""
+        tf_params = self.strategy_class(bridge_url=self.bridge_url).get_timeframe_parameters(timeframe)
+        periods = {}
+        for name in ['sma_short', 'sma_long', 'ema_fast', 'ema_slow', 'rsi_period']:
+            values = set(self.parameter_ranges.get(name, []))
+            values.add(tf_params[name])
+            periods[name] = sorted(values)
+        return periods
+    
+    def _aggregate_walk_forward(self, fold_results: List[Dict], objective: str, timeframe: str = "H1") -> Dict:
+        """Combineer de out-of-sample vensters tot één equity curve en metrics"""
+        initial_balance = 100000.0
+        balance = initial_balance
+        oos_equity = [initial_balance]
+        oos_trades = []
+        
+        for result in fold_results:
+            curve = result.pop('oos_equity_curve', [])
+            oos_trades.extend(result.pop('oos_trades', []))
+            if len(curve) < 2 or curve[0] <= 0:
+                continue
+            # Schaal elk venster op de eind balance van het vorige venster
+            scale = balance / curve[0]
+            oos_equity.extend(round(value * scale, 2) for value in curve[1:])
+            balance = oos_equity[-1]
+        
+        metrics = PerformanceMetrics(oos_trades, oos_equity, timeframe=timeframe).calculate_all_metrics()
+        total_return = (balance - initial_balance) / initial_balance * 100
+        
+        print()
+        print("="*70)
+        print("📊 WALK-FORWARD RESULTS (out-of-sample)")
+        print("="*70)
+        for result in fold_results:
+            print(f"  Fold {result['fold']}: IS score {result['in_sample_score']:.2f} | "
+                  f"OOS score {result['oos_score']:.2f} | {result['best_parameters']}")
+        print(f"\n📈 OOS Return: {total_return:.2f}% | Sharpe: {metrics.get('sharpe_ratio', 0):.2f} | "
+              f"Trades: {metrics.get('total_trades', 0)}")
+        
+        return {
+            'folds': fold_results,
+            'oos_metrics': metrics,
+            'oos_equity_curve': oos_equity,
+            'oos_total_return': round(total_return, 2),
+            'oos_trades': oos_trades,
+            'objective': objective
+        }
+    
+    def optimize_regimes(self, symbol: str = "XAUUSD", timeframe: str = "H1", volume: float = 0.20,
+                         method: str = 'grid_search', objective: str = 'sharpe_ratio',
+                         regimes: Optional[List[str]] = None, min_bars: int = 100,
+                         max_combinations: int = 50, population_size: int = 20, generations: int = 10,
+                         n_rounds: int = 6, eta: int = 3, candles: Optional[List[Dict]] = None,
+                         candle_store: Optional[CandleStore] = None,
+                         output_file: Optional[str] = None) -> Dict:
+        """
+        Optimaliseer de get_strategy_for_regime parameters per regime
+        
+        De regimes komen uit de per-bar regime kolom van de CandleStore (niet
+        per run opnieuw berekend). Per regime loopt de search over de bars van
+        het eerste t/m het laatste interval van dat regime, en posities worden
+        alleen geopend op bars in dat regime. Indicator reeksen worden één keer
+        berekend en door alle regimes gedeeld.
+        
+        Args:
+            symbol: Trading symbol
+            timeframe: Timeframe
+            volume: Trade volume
+            method: 'grid_search', 'genetic' of 'bayesian'
+            objective: Objective metric
+            regimes: Te optimaliseren regimes (default: alle)
+            min_bars: Regimes met minder bars (na warm-up) worden overgeslagen
+            max_combinations: Max combinaties per regime (grid search)
+            population_size: Populatie grootte per regime (genetic)
+            generations: Aantal generaties per regime (genetic)
+            n_rounds: Successive-halving rondes per regime (bayesian)
+            eta: Halving factor (bayesian)
+            candles: Optionele candle history (regimes worden dan in één pass berekend)
+            candle_store: CandleStore met history en regime kolom
+            output_file: Schrijf de beste parameters per regime naar dit JSON bestand
+                         (in te laden met MarketRegimeDetector(parameters_file=...))
+        
+        Returns:
+            Per regime best_parameters/score/metrics en 'strategy_parameters' in
+            de vorm van get_strategy_for_regime
+        """
+        print(f"\n{'='*70}")
+        print(f"🧭 PARAMETER OPTIMIZATION - Per Regime ({method})")
+        print(f"{'='*70}")
+        
+        store = candle_store or CandleStore(bridge_url=self.bridge_url)
+        if candles is None:
+            candles = store.load_candles(symbol, timeframe)
+            codes = store.load_regimes(symbol, timeframe)
+        else:
+            arrays = candles_to_arrays(candles)
+            codes = regime_series(arrays['high'], arrays['low'], arrays['close'], store.regime_lookback)
+        
+        if len(candles) <= WARMUP_CANDLES:
+            return {
+                'error': 'Insufficient historical data',
+                'message': f'{len(candles)} candles available',
+                'regimes': {}
+            }
+        
+        indicator_series = self._bind_indicator_cache(candles)
+        detector = MarketRegimeDetector(parameters_file=output_file)
+        starts, ends, interval_codes = regime_intervals_from_codes(codes)
+        
+        print(f"Symbol: {symbol}")
+        print(f"Timeframe: {timeframe}")
+        print(f"Candles: {len(candles)}")
+        print(f"Objective: {objective}")
+        print()
+        
+        results = {}
+        strategy_parameters = {}
+        for regime in regimes or REGIMES:
+            code = REGIMES.index(regime)
+            mask = codes == code
+            mask[:WARMUP_CANDLES] = False
+            bars = int(np.count_nonzero(mask))
+            intervals = int(np.count_nonzero(interval_codes == code))
+            if bars < min_bars:
+                print(f"⏭️  {regime}: {bars} bars, skipped (min {min_bars})")
+                results[regime] = {
+                    'error': 'Insufficient regime data',
+                    'message': f'{bars} bars in regime, need at least {min_bars}',
+                    'bars': bars,
+                    'intervals': intervals
+                }
+                continue
+            
+            positions = np.flatnonzero(mask)
+            window = {
+                'candles': candles,
+                'start_index': int(positions[0]),
+                'end_index': int(positions[-1]) + 1,
+                'indicator_series': indicator_series,
+                'entry_mask': mask
+            }
+            print(f"🧭 {regime}: {bars} bars in {intervals} intervals")
+            if method == 'genetic':
+                optimization = self.genetic_algorithm(
+                    symbol=symbol, timeframe=timeframe, volume=volume, population_size=population_size,
+                    generations=generations, objective=objective, **window
+                )
+            elif method == 'bayesian':
+                optimization = self.bayesian_search(
+                    symbol=symbol, timeframe=timeframe, volume=volume, objective=objective,
+                    n_rounds=n_rounds, eta=eta, **window
+                )
+            else:
+                optimization = self.grid_search(
+                    symbol=symbol, timeframe=timeframe, volume=volume, objective=objective,
+                    max_combinations=max_combinations, **window
+                )
+            
+            best = optimization.get('best_parameters')
+            results[regime] = {
+                'best_parameters': best,
+                'best_score': optimization.get('best_score', 0) if best else 0,
+                'best_metrics': optimization.get('best_metrics', {}),
+                'bars': bars,
+                'intervals': intervals
+            }
+            if best:
+                detector.set_strategy_parameters(regime, best)
+                strategy_parameters[regime] = detector.get_strategy_for_regime(regime)
+        
+        if output_file and strategy_parameters:
+            detector.save_strategy_parameters(output_file)
+            print(f"💾 Regime parameters saved to {output_file}")
+        
+        print()
+        print("="*70)
+        print("📊 REGIME OPTIMIZATION RESULTS")
+        print("="*70)
+        for regime, result in results.items():
+            if result.get('best_parameters'):
+                print(f"  {regime}: {result['best_score']:.2f} ({objective}) {result['best_parameters']}")
+            else:
+                print(f"  {regime}: {result.get('message', 'no valid parameters')}")
+        
+        return {
+            'regimes': results,
+            'strategy_parameters': strategy_parameters,
+            'objective': objective,
+            'method': method
+        }
+    
+    def _run_candidate_backtest(self, params: Dict, symbol: str, timeframe: str, days: int, volume: float,
+                                candles: Optional[List[Dict]] = None, start_index: Optional[int] = None,
+                                end_index: Optional[int] = None,
+                                indicator_series: Optional[Dict] = None,
+                                entry_mask: Optional[Sequence[bool]] = None) -> Dict:
+        """Backtest één parameter set, op lokale candles of via de bridge"""
+        strategy = self._create_strategy_with_params(params)
+        if candles is None:
+            # Bridge data: de cache herkent identieke history aan de fingerprint
+            engine = BacktestingEngine(strategy, initial_balance=100000.0, bridge_url=self.bridge_url,
+                                       indicator_cache=self.indicator_cache)
+            return engine.run_backtest(symbol=symbol, timeframe=timeframe, days=days, volume=volume)
+        
+        engine = BacktestingEngine(strategy, initial_balance=100000.0, bridge_url=self.bridge_url, verbose=False,
+                                   indicator_cache=self.indicator_cache)
+        return engine.run_backtest_on_candles(
+            candles, symbol=symbol, timeframe=timeframe, volume=volume,
+            start_index=start_index, end_index=end_index, indicator_series=indicator_series,
+            entry_mask=entry_mask
+        )
+    
+    def _bind_indicator_cache(self, candles: Optional[List[Dict]]):
+        """Lazy indicator reeksen over `candles` uit de gedeelde cache (None zonder candles)"""
+        if candles is None:
+            return None
+        return self.indicator_cache.bind([float(c.get('close', 0)) for c in candles])
+    
     def _create_strategy_with_params(self, params: Dict) -> TradingStrategy:
         """Create strategy instance with custom parameters"""
-        strategy = TradingStrategy(bridge_url=self.bridge_url, parameters=params)
+        strategy = self.strategy_class(bridge_url=self.bridge_url, parameters=params)
         return strategy
     
     def _calculate_objective_score(self, metrics: Dict, objective: str) -> float:
@@ -350,6 +910,81 @@ class ParameterOptimizer:
         
         return mutated
 
+def _init_walk_forward_worker(strategy_class, bridge_url: str, parameter_ranges: Dict,
+                              candles: List[Dict], settings: Dict):
+    """Pool initializer: zet de gedeelde history en indicator cache één keer per worker"""
+    indicator_cache = IndicatorCache(shared=True)
+    indicator_series = indicator_cache.bind([float(c.get('close', 0)) for c in candles])
+    _WALK_FORWARD_STATE.update({
+        'strategy_class': strategy_class,
+        'bridge_url': bridge_url,
+        'parameter_ranges': parameter_ranges,
+        'candles': candles,
+        'indicator_cache': indicator_cache,
+        'indicator_series': indicator_series,
+        'settings': settings
+    })
+
+def _release_walk_forward_cache(fingerprint: str, keys):
+    """Ruim de shared memory reeksen van een walk-forward run op (ook die van workers)"""
+    indicator_cache = _WALK_FORWARD_STATE.pop('indicator_cache', None)
+    _WALK_FORWARD_STATE.pop('indicator_series', None)
+    if indicator_cache is not None:
+        indicator_cache.release()
+    IndicatorCache(shared=True).release(fingerprint, keys)
+
+def _run_walk_forward_fold(fold: Dict) -> Dict:
+    """Optimaliseer één train fold en evalueer op het volgende test venster"""
+    state = _WALK_FORWARD_STATE
+    settings = state['settings']
+    candles = state['candles']
+    indicator_series = state['indicator_series']
+    
+    optimizer = ParameterOptimizer(state['strategy_class'], bridge_url=state['bridge_url'])
+    optimizer.parameter_ranges = state['parameter_ranges']
+    
+    window = {
+        'candles': candles,
+        'start_index': fold['train_start'],
+        'end_index': fold['train_end'],
+        'indicator_series': indicator_series
+    }
+    if settings['method'] == 'genetic':
+        optimization = optimizer.genetic_algorithm(
+            symbol=settings['symbol'], timeframe=settings['timeframe'], volume=settings['volume'],
+            population_size=settings['population_size'], generations=settings['generations'],
+            objective=settings['objective'], **window
+        )
+    else:
+        optimization = optimizer.grid_search(
+            symbol=settings['symbol'], timeframe=settings['timeframe'], volume=settings['volume'],
+            objective=settings['objective'], max_combinations=settings['max_combinations'], **window
+        )
+    
+    result = {
+        **fold,
+        'best_parameters': optimization.get('best_parameters'),
+        'in_sample_score': optimization.get('best_score', 0) if optimization.get('best_parameters') else 0,
+        'oos_score': 0,
+        'oos_metrics': {},
+        'oos_trades': [],
+        'oos_equity_curve': []
+    }
+    if not result['best_parameters']:
+        return result
+    
+    oos = optimizer._run_candidate_backtest(
+        result['best_parameters'], settings['symbol'], settings['timeframe'], 0, settings['volume'],
+        candles=candles, start_index=fold['test_start'], end_index=fold['test_end'],
+        indicator_series=indicator_series
+    )
+    if not oos.get('error'):
+        result['oos_metrics'] = oos.get('metrics', {})
+        result['oos_score'] = optimizer._calculate_objective_score(result['oos_metrics'], settings['objective'])
+        result['oos_trades'] = oos.get('trades', [])
+        result['oos_equity_curve'] = oos.get('equity_curve', [])
+    return result
+
 if __name__ == "__main__":
     # Test parameter optimizer
     optimizer = ParameterOptimizer(TradingStrategy)
@@ -4,13 +4,52 @@ Performance Metrics Calculator
 Bereken alle belangrijke trading metrics voor backtesting
 """
 
-from typing import List, Dict
+from typing import List, Dict, Optional
 import math
+import numpy as np
+
+# Bars per handelsdag per timeframe (24h markt, zoals XAUUSD)
+BARS_PER_DAY = {
+    'M1': 1440,
+    'M5': 288,
+    'M15': 96,
+    'M30': 48,
+    'H1': 24,
+    'H4': 6,
+    'D1': 1,
+    'W1': 1 / 5,
+    'MN1': 1 / 21
+}
+TRADING_DAYS_PER_YEAR = 252
+
+def annualization_factor(timeframe: str = "H1") -> float:
+    """
+    Wortel van het aantal bars per jaar, voor Sharpe/Sortino per bar returns
+    
+    H1: sqrt(252 * 24) = sqrt(6048)
+    """
+    bars_per_day = BARS_PER_DAY.get(str(timeframe).upper(), BARS_PER_DAY['H1'])
+    return math.sqrt(TRADING_DAYS_PER_YEAR * bars_per_day)
 
 class PerformanceMetrics:
-    def __init__(self, trades: List[Dict], equity_curve: List[float]):
+    def __init__(self, trades: List[Dict], equity_curve: List[float], timeframe: str = "H1"):
         self.trades = trades
         self.equity_curve = equity_curve
+        self.timeframe = timeframe
+        self._equity = np.asarray(equity_curve, dtype=np.float64)
+        self._pnl = np.array([t.get('pnl', 0) for t in trades], dtype=np.float64)
+        self._returns = None
+    
+    def _get_returns(self) -> np.ndarray:
+        """Per bar returns (één keer berekend, gedeeld door Sharpe en Sortino)"""
+        if self._returns is None:
+            if len(self._equity) < 2:
+                self._returns = np.array([], dtype=np.float64)
+            else:
+                previous = self._equity[:-1]
+                valid = previous > 0
+                self._returns = (self._equity[1:][valid] - previous[valid]) / previous[valid]
+        return self._returns
     
     def calculate_win_rate(self) -> float:
         """Bereken win rate percentage"""
@@ -22,12 +61,12 @@ class PerformanceMetrics:
     
     def calculate_total_pnl(self) -> float:
         """Bereken totale profit/loss"""
-        return sum(t.get('pnl', 0) for t in self.trades)
+        return float(self._pnl.sum())
     
     def calculate_profit_factor(self) -> float:
         """Bereken profit factor (gross profit / gross loss)"""
-        gross_profit = sum(t.get('pnl', 0) for t in self.trades if t.get('pnl', 0) > 0)
-        gross_loss = abs(sum(t.get('pnl', 0) for t in self.trades if t.get('pnl', 0) < 0))
+        gross_profit = float(self._pnl[self._pnl > 0].sum())
+        gross_loss = abs(float(self._pnl[self._pnl < 0].sum()))
         
         if gross_loss == 0:
             return 0.0 if gross_profit == 0 else float('inf')
@@ -36,114 +75,79 @@ class PerformanceMetrics:
     
     def calculate_max_drawdown(self) -> Dict:
         """Bereken maximum drawdown"""
-        if not self.equity_curve:
+        if len(self._equity) == 0:
             return {'max_drawdown': 0.0, 'max_drawdown_pct': 0.0}
         
-        peak = self.equity_curve[0]
-        max_drawdown = 0.0
-        max_drawdown_pct = 0.0
-        
-        for equity in self.equity_curve:
-            if equity > peak:
-                peak = equity
-            
-            drawdown = peak - equity
-            drawdown_pct = (drawdown / peak) * 100 if peak > 0 else 0
-            
-            if drawdown > max_drawdown:
-                max_drawdown = drawdown
-                max_drawdown_pct = drawdown_pct
+        peaks = np.maximum.accumulate(self._equity)
+        drawdowns = peaks - self._equity
+        # Eerste maximum, net als de oude loop (pct hoort bij de grootste absolute drawdown)
+        worst = int(np.argmax(drawdowns))
+        max_drawdown = float(drawdowns[worst])
+        max_drawdown_pct = (max_drawdown / peaks[worst]) * 100 if max_drawdown > 0 and peaks[worst] > 0 else 0.0
         
         return {
             'max_drawdown': round(max_drawdown, 2),
-            'max_drawdown_pct': round(max_drawdown_pct, 2)
+            'max_drawdown_pct': round(float(max_drawdown_pct), 2)
         }
     
     def calculate_sharpe_ratio(self, risk_free_rate: float = 0.0) -> float:
-        """Bereken Sharpe Ratio (annualized)"""
-        if len(self.equity_curve) < 2:
-            return 0.0
-        
-        # Calculate returns
-        returns = []
-        for i in range(1, len(self.equity_curve)):
-            if self.equity_curve[i-1] > 0:
-                ret = (self.equity_curve[i] - self.equity_curve[i-1]) / self.equity_curve[i-1]
-                returns.append(ret)
-        
-        if not returns or len(returns) < 2:
+        """Bereken Sharpe Ratio (annualized naar de timeframe van de bars)"""
+        returns = self._get_returns()
+        if len(returns) < 2:
             return 0.0
         
-        # Calculate mean and std
-        mean_return = sum(returns) / len(returns)
-        variance = sum((r - mean_return) ** 2 for r in returns) / len(returns)
-        std_dev = math.sqrt(variance)
-        
+        std_dev = float(returns.std())
         if std_dev == 0:
             return 0.0
         
-        # Annualize (assuming hourly returns for H1 timeframe)
-        # 252 trading days * 24 hours = 6048 hours per year
-        sharpe = (mean_return - risk_free_rate) / std_dev
-        return round(sharpe * math.sqrt(6048), 2)  # Annualized for hourly data
+        sharpe = (float(returns.mean()) - risk_free_rate) / std_dev
+        return round(sharpe * annualization_factor(self.timeframe), 2)
     
     def calculate_sortino_ratio(self, risk_free_rate: float = 0.0) -> float:
         """Bereken Sortino Ratio (only penalizes downside volatility)"""
-        if len(self.equity_curve) < 2:
+        returns = self._get_returns()
+        if len(returns) < 2:
             return 0.0
         
-        # Calculate returns
-        returns = []
-        for i in range(1, len(self.equity_curve)):
-            if self.equity_curve[i-1] > 0:
-                ret = (self.equity_curve[i] - self.equity_curve[i-1]) / self.equity_curve[i-1]
-                returns.append(ret)
-        
-        if not returns or len(returns) < 2:
-            return 0.0
-        
-        mean_return = sum(returns) / len(returns)
+        mean_return = float(returns.mean())
         
         # Only negative returns for downside deviation
-        downside_returns = [r for r in returns if r < 0]
-        if not downside_returns:
+        downside_returns = returns[returns < 0]
+        if len(downside_returns) == 0:
             return float('inf') if mean_return > risk_free_rate else 0.0
         
-        downside_variance = sum(r ** 2 for r in downside_returns) / len(downside_returns)
-        downside_std = math.sqrt(downside_variance)
-        
+        downside_std = math.sqrt(float(np.mean(downside_returns ** 2)))
         if downside_std == 0:
             return 0.0
         
         sortino = (mean_return - risk_free_rate) / downside_std
-        return round(sortino * math.sqrt(6048), 2)  # Annualized
+        return round(sortino * annualization_factor(self.timeframe), 2)
     
     def calculate_expectancy(self) -> float:
         """Bereken expectancy per trade"""
         if not self.trades:
             return 0.0
         
-        total_pnl = sum(t.get('pnl', 0) for t in self.trades)
-        return total_pnl / len(self.trades)
+        return float(self._pnl.mean())
     
     def calculate_avg_win_loss(self) -> Dict:
         """Bereken gemiddelde win en loss"""
-        winning_trades = [t for t in self.trades if t.get('pnl', 0) > 0]
-        losing_trades = [t for t in self.trades if t.get('pnl', 0) < 0]
+        wins = self._pnl[self._pnl > 0]
+        losses = self._pnl[self._pnl < 0]
         
-        avg_win = sum(t.get('pnl', 0) for t in winning_trades) / len(winning_trades) if winning_trades else 0
-        avg_loss = sum(t.get('pnl', 0) for t in losing_trades) / len(losing_trades) if losing_trades else 0
+        avg_win = float(wins.mean()) if len(wins) else 0
+        avg_loss = float(losses.mean()) if len(losses) else 0
         
         return {
             'avg_win': round(avg_win, 2),
             'avg_loss': round(avg_loss, 2),
-            'win_count': len(winning_trades),
-            'loss_count': len(losing_trades)
+            'win_count': len(wins),
+            'loss_count': len(losses)
         }
     
-    def calculate_recovery_factor(self) -> float:
+    def calculate_recovery_factor(self, max_dd: Optional[Dict] = None) -> float:
         """Bereken recovery factor (net profit / max drawdown)"""
-        max_dd = self.calculate_max_drawdown()
+        max_dd = max_dd or self.calculate_max_drawdown()
         total_pnl = self.calculate_total_pnl()
         
         if max_dd['max_drawdown'] == 0:
@@ -165,10 +169,149 @@ class PerformanceMetrics:
             'sharpe_ratio': self.calculate_sharpe_ratio(),
             'sortino_ratio': self.calculate_sortino_ratio(),
             'expectancy': round(self.calculate_expectancy(), 2),
-            'recovery_factor': self.calculate_recovery_factor(),
+            'recovery_factor': self.calculate_recovery_factor(max_dd),
             'total_trades': len(self.trades),
             'winning_trades': win_loss['win_count'],
             'losing_trades': win_loss['loss_count'],
             'avg_win': win_loss['avg_win'],
             'avg_loss': win_loss['avg_loss']
         }
+
+class MetricsAccumulator:
+    """
+    Incrementele metrics: per bar update_equity(), per gesloten trade add_trade()
+    
+    Houdt alleen lopende sommen bij (Welford voor de return variantie), dus
+    get_metrics() is O(1) op elk moment en geeft dezelfde dict als
+    PerformanceMetrics.calculate_all_metrics() over dezelfde data.
+    """
+    
+    def __init__(self, initial_equity: Optional[float] = None, timeframe: str = "H1"):
+        self.timeframe = timeframe
+        self.reset(initial_equity)
+    
+    def reset(self, initial_equity: Optional[float] = None):
+        """Begin opnieuw (optioneel met een eerste equity punt)"""
+        # Equity / returns
+        self.last_equity = None
+        self.bars = 0
+        self.return_count = 0
+        self.return_mean = 0.0
+        self.return_m2 = 0.0
+        self.downside_count = 0
+        self.downside_sq_sum = 0.0
+        self.peak = None
+        self.max_drawdown = 0.0
+        self.max_drawdown_pct = 0.0
+        # Trades
+        self.trade_count = 0
+        self.profit_flag_count = 0
+        self.win_count = 0
+        self.loss_count = 0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+        self.total_pnl = 0.0
+        
+        if initial_equity is not None:
+            self.update_equity(initial_equity)
+    
+    def update_equity(self, equity: float):
+        """Voeg één equity punt toe (één per bar)"""
+        equity = float(equity)
+        if self.last_equity is not None and self.last_equity > 0:
+            ret = (equity - self.last_equity) / self.last_equity
+            self.return_count += 1
+            delta = ret - self.return_mean
+            self.return_mean += delta / self.return_count
+            self.return_m2 += delta * (ret - self.return_mean)
+            if ret < 0:
+                self.downside_count += 1
+                self.downside_sq_sum += ret * ret
+        
+        if self.peak is None or equity > self.peak:
+            self.peak = equity
+        drawdown = self.peak - equity
+        if drawdown > self.max_drawdown:
+            self.max_drawdown = drawdown
+            self.max_drawdown_pct = (drawdown / self.peak) * 100 if self.peak > 0 else 0
+        
+        self.last_equity = equity
+        self.bars += 1
+    
+    def add_trade(self, pnl: float, profit: Optional[bool] = None):
+        """Registreer een gesloten trade (profit default: pnl > 0)"""
+        pnl = float(pnl)
+        self.trade_count += 1
+        self.total_pnl += pnl
+        if profit if profit is not None else pnl > 0:
+            self.profit_flag_count += 1
+        if pnl > 0:
+            self.win_count += 1
+            self.gross_profit += pnl
+        elif pnl < 0:
+            self.loss_count += 1
+            self.gross_loss += pnl
+    
+    def sharpe_ratio(self, risk_free_rate: float = 0.0) -> float:
+        if self.bars < 2 or self.return_count < 2:
+            return 0.0
+        std_dev = math.sqrt(self.return_m2 / self.return_count)
+        if std_dev == 0:
+            return 0.0
+        return round((self.return_mean - risk_free_rate) / std_dev * annualization_factor(self.timeframe), 2)
+    
+    def sortino_ratio(self, risk_free_rate: float = 0.0) -> float:
+        if self.bars < 2 or self.return_count < 2:
+            return 0.0
+        if self.downside_count == 0:
+            return float('inf') if self.return_mean > risk_free_rate else 0.0
+        downside_std = math.sqrt(self.downside_sq_sum / self.downside_count)
+        if downside_std == 0:
+            return 0.0
+        return round((self.return_mean - risk_free_rate) / downside_std * annualization_factor(self.timeframe), 2)
+    
+    def get_metrics(self) -> Dict:
+        """Zelfde velden als PerformanceMetrics.calculate_all_metrics()"""
+        max_drawdown = round(self.max_drawdown, 2)
+        gross_loss = abs(self.gross_loss)
+        if gross_loss == 0:
+            profit_factor = 0.0 if self.gross_profit == 0 else float('inf')
+        else:
+            profit_factor = self.gross_profit / gross_loss
+        if max_drawdown == 0:
+            recovery_factor = 0.0 if self.total_pnl == 0 else float('inf')
+        else:
+            recovery_factor = round(self.total_pnl / max_drawdown, 2)
+        
+        return {
+            'win_rate': round((self.profit_flag_count / self.trade_count) * 100, 2) if self.trade_count else 0.0,
+            'total_pnl': round(self.total_pnl, 2),
+            'profit_factor': round(profit_factor, 2),
+            'max_drawdown': max_drawdown,
+            'max_drawdown_pct': round(self.max_drawdown_pct, 2),
+            'sharpe_ratio': self.sharpe_ratio(),
+            'sortino_ratio': self.sortino_ratio(),
+            'expectancy': round(self.total_pnl / self.trade_count, 2) if self.trade_count else 0.0,
+            'recovery_factor': recovery_factor,
+            'total_trades': self.trade_count,
+            'winning_trades': self.win_count,
+            'losing_trades': self.loss_count,
+            'avg_win': round(self.gross_profit / self.win_count, 2) if self.win_count else 0,
+            'avg_loss': round(self.gross_loss / self.loss_count, 2) if self.loss_count else 0
+        }
+
+if __name__ == "__main__":
+    # Test metrics op een random walk equity curve
+    rng = np.random.default_rng(7)
+    equity = list(100000 + np.cumsum(rng.normal(5, 120, 2000)))
+    trades = [{'pnl': float(p), 'profit': p > 0} for p in rng.normal(20, 300, 150)]
+    
+    batch = PerformanceMetrics(trades, equity, timeframe="M15").calculate_all_metrics()
+    accumulator = MetricsAccumulator(timeframe="M15")
+    for value in equity:
+        accumulator.update_equity(value)
+    for trade in trades:
+        accumulator.add_trade(trade['pnl'], trade['profit'])
+    
+    print(f"📊 Batch:       {batch}")
+    print(f"📈 Incremental: {accumulator.get_metrics()}")
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Portfolio Backtester
+Backtest van een multi-strategy portfolio over de lokale candle history
+Elke strategie wordt één keer over de hele history geëvalueerd; daarna worden
+de signalen per bar gecombineerd (regels van MultiStrategyManager) voor elk
+gewicht schema, met periodieke herweging op een rolling venster
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from backtesting_engine import BacktestingEngine, WARMUP_CANDLES
+from backtest_results import lttb
+from candle_patterns import pattern_columns_from_candles, patterns_at
+from candle_store import CandleStore
+from indicator_series import ANALYSIS_WINDOW, IndicatorCache, data_fingerprint, indicators_at
+from market_regime import regime_series, REGIMES
+from multi_strategy_manager import SIGNAL_CODES, SIGNAL_NAMES, _build_strategy, combine_scores, performance_weights
+from performance_metrics import PerformanceMetrics
+from trading_strategy import TradingStrategy
+
+# Portfolio worker state: history + gedeelde indicator cache, één keer per worker gezet
+_PORTFOLIO_STATE = {}
+
+WEIGHT_SCHEMES = ('static', 'equal', 'performance')
+
+# Profit factor zonder verliezen is inf; begrensd zodat performance_weights eindig blijft
+MAX_PROFIT_FACTOR = 10.0
+
+def _init_portfolio_worker(candles: List[Dict], symbol: str, timeframe: str, start_index: int, end_index: int):
+    """Pool initializer: zet de gedeelde history en indicator cache één keer per worker"""
+    indicator_cache = IndicatorCache(shared=True)
+    _PORTFOLIO_STATE.update({
+        'candles': candles,
+        'symbol': symbol,
+        'timeframe': timeframe,
+        'start_index': start_index,
+        'end_index': end_index,
+        'indicator_cache': indicator_cache,
+        'indicator_series': indicator_cache.bind([float(c.get('close', 0)) for c in candles])
+    })
+
+def _release_portfolio_cache(fingerprint: Optional[str] = None, keys=()):
+    """Ruim de shared memory reeksen van een portfolio run op (ook die van workers)"""
+    indicator_cache = _PORTFOLIO_STATE.pop('indicator_cache', None)
+    _PORTFOLIO_STATE.clear()
+    if indicator_cache is not None:
+        indicator_cache.release()
+    if fingerprint:
+        IndicatorCache(shared=True).release(fingerprint, keys)
+
+def _member_signals(task: Tuple[str, Tuple]) -> Tuple[str, Dict[str, np.ndarray], List[Tuple[str, int]]]:
+    """
+    Signaal van één strategie voor elke bar in [start_index, end_index)
+
+    Zelfde snapshots als BacktestingEngine (laatste ANALYSIS_WINDOW candles t/m de bar),
+    indicator waarden uit de gedeelde reeksen. Adaptive: het regime per bar komt uit
+    één regime_series pass en kiest de parameter set van dat regime.
+
+    Returns:
+        (naam, {'code', 'confidence', 'tp', 'sl'} arrays over de hele history,
+         gebruikte (indicator, period) keys)
+    """
+    name, spec = task
+    state = _PORTFOLIO_STATE
+    candles, timeframe = state['candles'], state['timeframe']
+    series = state['indicator_series']
+    n = len(candles)
+
+    strategy = _build_strategy(*spec)
+    if spec[0] == 'adaptive':
+        # Eén TradingStrategy per regime, regime per bar in één pass
+        by_regime = [TradingStrategy(bridge_url=spec[1], parameters=strategy.parameter_sets[regime])
+                     for regime in REGIMES]
+        highs, lows, closes = (np.array([float(c.get(field, 0)) for c in candles]) for field in ('high', 'low', 'close'))
+        regimes = regime_series(highs, lows, closes, strategy.regime_detector.lookback)
+        pick = lambda i: by_regime[regimes[i]]
+    else:
+        if hasattr(strategy, 'prepare_backtest'):
+            strategy.prepare_backtest(candles, symbol=state['symbol'], timeframe=timeframe)
+        pick = lambda i: strategy
+
+    signals = {
+        'code': np.zeros(n, dtype=np.int8),
+        'confidence': np.zeros(n),
+        'tp': np.full(n, np.nan),
+        'sl': np.full(n, np.nan)
+    }
+    patterns = pattern_columns_from_candles(candles)
+    for i in range(state['start_index'], state['end_index']):
+        member = pick(i)
+        indicators = indicators_at(series, member.get_indicator_periods(timeframe), i)
+        indicators['patterns'] = patterns_at(patterns, i)
+        try:
+            signal = member.analyze_candles(candles[max(0, i + 1 - ANALYSIS_WINDOW):i + 1], timeframe=timeframe,
+                                            indicators=indicators)
+        except Exception:
+            continue
+        signals['code'][i] = SIGNAL_CODES.get(signal.get('signal'), 0)
+        signals['confidence'][i] = signal.get('confidence', 0) or 0
+        tp_sl = signal.get('tp_sl') or {}
+        if tp_sl.get('tp') and tp_sl.get('sl'):
+            signals['tp'][i] = tp_sl['tp']
+            signals['sl'][i] = tp_sl['sl']
+    return name, signals, list(series)
+
+class _SignalReplay:
+    """Strategie die vooraf berekende signalen per bar teruggeeft (voor BacktestingEngine)"""
+
+    def __init__(self, candles: List[Dict], signals: Dict[str, np.ndarray]):
+        self._bars = {c.get('time'): i for i, c in enumerate(candles)}
+        self.signals = signals
+
+    def get_indicator_periods(self, timeframe: str = "H1") -> Dict:
+        return {}
+
+    def analyze_candles(self, candles: List[Dict], timeframe: str = "H1",
+                        indicators: Optional[Dict] = None) -> Dict:
+        i = self._bars.get(candles[-1].get('time'))
+        if i is None:
+            return {'signal': 'NEUTRAL', 'confidence': 0}
+        tp, sl = self.signals['tp'][i], self.signals['sl'][i]
+        return {
+            'signal': SIGNAL_NAMES[int(self.signals['code'][i])],
+            'confidence': float(self.signals['confidence'][i]),
+            'tp_sl': None if np.isnan(tp) or np.isnan(sl) else {'tp': float(tp), 'sl': float(sl)}
+        }
+
+class PortfolioBacktester:
+    def __init__(self, bridge_url: str = "http://localhost:5002", initial_balance: float = 100000.0,
+                 workers: Optional[int] = None):
+        """
+        Args:
+            bridge_url: MT5 bridge URL
+            initial_balance: Start balance per backtest
+            workers: Processen voor de strategie evaluatie (None = aantal CPU's, 1 = geen pool)
+        """
+        self.bridge_url = bridge_url
+        self.initial_balance = initial_balance
+        self.workers = workers
+        self.members = {}  # naam -> {'spec', 'weight'}
+
+    def add_strategy(self, name: str, strategy_type: str = 'standard', weight: float = 1.0,
+                     parameters: Optional[Dict] = None, ml_model_path: Optional[str] = None):
+        """Voeg een strategie toe (zelfde argumenten als MultiStrategyManager.add_strategy)"""
+        self.members[name] = {
+            'spec': (strategy_type, self.bridge_url, parameters, ml_model_path),
+            'weight': weight
+        }
+
+    @classmethod
+    def from_manager(cls, manager, initial_balance: float = 100000.0,
+                     workers: Optional[int] = None) -> 'PortfolioBacktester':
+        """Backtester met de strategieën en gewichten van een MultiStrategyManager"""
+        backtester = cls(bridge_url=manager.bridge_url, initial_balance=initial_balance, workers=workers)
+        for name, config in manager.strategies.items():
+            backtester.members[name] = {'spec': config['spec'], 'weight': config['weight']}
+        return backtester
+
+    def _engine(self, candles: List[Dict], signals: Dict[str, np.ndarray]) -> BacktestingEngine:
+        return BacktestingEngine(_SignalReplay(candles, signals), initial_balance=self.initial_balance,
+                                 bridge_url=self.bridge_url, verbose=False)
+
+    def _evaluate_members(self, candles: List[Dict], symbol: str, timeframe: str,
+                          start_index: int, end_index: int) -> Dict[str, Dict[str, np.ndarray]]:
+        """Signalen van alle strategieën over de hele history (parallel over processen)"""
+        tasks = [(name, member['spec']) for name, member in self.members.items()]
+        init_args = (candles, symbol, timeframe, start_index, end_index)
+        fingerprint, keys = data_fingerprint([float(c.get('close', 0)) for c in candles]), set()
+
+        workers = min(self.workers or os.cpu_count() or 1, len(tasks))
+        try:
+            if workers == 1:
+                _init_portfolio_worker(*init_args)
+                results = [_member_signals(task) for task in tasks]
+            else:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_portfolio_worker,
+                                         initargs=init_args) as executor:
+                    results = list(executor.map(_member_signals, tasks))
+            for _, _, used in results:
+                keys.update(used)
+        finally:
+            _release_portfolio_cache(fingerprint, keys)
+        return {name: signals for name, signals, _ in results}
+
+    def _standalone(self, candles: List[Dict], signals: Dict[str, np.ndarray], symbol: str, timeframe: str,
+                    volume: float, start_index: int, end_index: int) -> Dict:
+        """
+        Backtest van één strategie op zijn eigen signalen
+
+        Returns:
+            Backtest resultaat + 'exit_bars' (bar index per trade) en 'equity_bars'
+            (equity per bar over de hele history, NaN buiten het venster)
+        """
+        results = self._engine(candles, signals).run_backtest_on_candles(
+            candles, symbol=symbol, timeframe=timeframe, volume=volume,
+            start_index=start_index, end_index=end_index
+        )
+        bars = {c.get('time'): i for i, c in enumerate(candles)}
+        results['exit_bars'] = np.array([bars.get(t['exit_time'], end_index - 1) for t in results['trades']], dtype=np.int64)
+
+        # De engine slaat bars met close 0 over: equity punten terug op bar index zetten
+        traded = np.arange(start_index, end_index)
+        traded = traded[[float(candles[i].get('close', 0)) != 0 for i in traded]]
+        equity_bars = np.full(len(candles), np.nan)
+        equity_bars[traded] = results['equity_curve'][1:len(traded) + 1]
+        results['equity_bars'] = equity_bars
+        return results
+
+    def _performance_weight_matrix(self, names: List[str], standalone: Dict[str, Dict], static: np.ndarray,
+                                   timeframe: str, start_index: int, end_index: int, window: int,
+                                   refit_every: int) -> Tuple[np.ndarray, List[Tuple[int, np.ndarray]]]:
+        """
+        Gewichten per bar: elke `refit_every` bars opnieuw berekend (update_weights regels)
+        uit de trades en equity van elke strategie in de laatste `window` bars
+
+        Tot de eerste refit gelden de statische gewichten.
+
+        Returns:
+            (gewichten array (bars, strategieën), [(refit bar, gewichten)])
+        """
+        weights = np.tile(static, (len(standalone[names[0]]['equity_bars']), 1))
+        history = [(start_index, static)]
+        for refit in range(start_index + refit_every, end_index, refit_every):
+            lo = max(start_index, refit - window)
+            performance = {}
+            for name in names:
+                results = standalone[name]
+                closed = (results['exit_bars'] >= lo) & (results['exit_bars'] < refit)
+                if not closed.any():
+                    continue  # Geen trades in het venster: neutrale score
+                trades = [trade for trade, keep in zip(results['trades'], closed) if keep]
+                equity = results['equity_bars'][lo:refit]
+                metrics = PerformanceMetrics(trades, list(equity[~np.isnan(equity)]), timeframe).calculate_all_metrics()
+                metrics['profit_factor'] = min(metrics['profit_factor'], MAX_PROFIT_FACTOR)
+                performance[name] = metrics
+
+            fitted = performance_weights(names, performance)
+            row = np.array([fitted[name] for name in names])
+            weights[refit:] = row
+            history.append((refit, row))
+        return weights, history
+
+    def combine(self, signals: Dict[str, Dict[str, np.ndarray]], weights: np.ndarray,
+                names: Sequence[str]) -> Dict[str, np.ndarray]:
+        """
+        Gecombineerd signaal per bar (regels van MultiStrategyManager.generate_combined_signal)
+
+        TP/SL komen van de strategie met de hoogste gewogen confidence in de
+        richting van het gecombineerde signaal.
+
+        Args:
+            signals: {naam: signaal arrays}
+            weights: Gewichten per bar, shape (bars, strategieën) in de volgorde van names
+            names: Strategie namen
+
+        Returns:
+            Signaal arrays ('code', 'confidence', 'tp', 'sl')
+        """
+        codes = np.column_stack([signals[name]['code'] for name in names])
+        weighted = np.column_stack([signals[name]['confidence'] for name in names]) * weights
+
+        scores = [np.where(codes == code, weighted, 0.0).sum(axis=1) for code in (1, -1, 0)]
+        code, confidence = combine_scores(*scores, weights.sum(axis=1))
+
+        agreeing = np.where(codes == code[:, None], weighted, -np.inf)
+        leader = np.argmax(agreeing, axis=1)
+        bars = np.arange(len(code))
+        tp = np.column_stack([signals[name]['tp'] for name in names])[bars, leader]
+        sl = np.column_stack([signals[name]['sl'] for name in names])[bars, leader]
+        directional = code != 0
+        return {
+            'code': code.astype(np.int8),
+            'confidence': confidence,
+            'tp': np.where(directional, tp, np.nan),
+            'sl': np.where(directional, sl, np.nan)
+        }
+
+    def run(self, symbol: str = "XAUUSD", timeframe: str = "H1", volume: float = 0.20,
+            schemes: Sequence[str] = WEIGHT_SCHEMES, window: int = 500, refit_every: int = 100,
+            candles: Optional[List[Dict]] = None, candle_store: Optional[CandleStore] = None,
+            start_index: Optional[int] = None, end_index: Optional[int] = None,
+            max_points: int = 500) -> Dict:
+        """
+        Backtest het portfolio voor een of meer gewicht schema's over dezelfde history
+
+        Schema's:
+            static: de gewichten uit add_strategy (zoals de manager ze live gebruikt)
+            equal: alle strategieën even zwaar
+            performance: elke `refit_every` bars herwogen uit de standalone
+                         performance van de laatste `window` bars
+
+        Args:
+            symbol: Trading symbol
+            timeframe: Timeframe
+            volume: Trade volume
+            schemes: Gewicht schema's om te vergelijken
+            window: Bars performance historie per refit
+            refit_every: Bars tussen twee refits
+            candles: Optionele candle history; default uit de CandleStore
+            candle_store: CandleStore om de history uit te laden
+            start_index: Eerste bar om te handelen (default: na de warm-up)
+            end_index: Bar index (exclusief) waar de backtest stopt
+            max_points: Equity punten per schema (LTTB), 0 voor volledige resolutie
+
+        Returns:
+            Per schema metrics, return, gewicht historie en equity; standalone metrics per strategie
+        """
+        unknown = [scheme for scheme in schemes if scheme not in WEIGHT_SCHEMES]
+        if unknown:
+            return {'error': 'Unknown weight scheme', 'message': f'{unknown}, use one of {list(WEIGHT_SCHEMES)}'}
+        if not self.members:
+            return {'error': 'No strategies configured', 'message': 'Add at least one strategy'}
+
+        if candles is None:
+            store = candle_store or CandleStore(bridge_url=self.bridge_url)
+            candles = store.load_candles(symbol, timeframe)
+
+        start_index = WARMUP_CANDLES if start_index is None else max(start_index, WARMUP_CANDLES)
+        end_index = len(candles) if end_index is None else min(end_index, len(candles))
+        if end_index - start_index < 1:
+            return {
+                'error': 'Insufficient historical data',
+                'message': f'{len(candles)} candles available, need more than {WARMUP_CANDLES}'
+            }
+
+        print(f"\n{'='*70}")
+        print(f"📊 PORTFOLIO BACKTEST ({', '.join(schemes)})")
+        print(f"{'='*70}")
+        print(f"Symbol: {symbol}, timeframe: {timeframe}, bars: {end_index - start_index}")
+        print(f"Strategies: {', '.join(self.members)}")
+
+        names = list(self.members)
+        signals = self._evaluate_members(candles, symbol, timeframe, start_index, end_index)
+        standalone = {name: self._standalone(candles, signals[name], symbol, timeframe, volume, start_index, end_index)
+                      for name in names}
+
+        static = np.array([float(self.members[name]['weight']) for name in names])
+        results = {}
+        for scheme in schemes:
+            if scheme == 'performance':
+                weights, history = self._performance_weight_matrix(names, standalone, static, timeframe,
+                                                                   start_index, end_index, window, refit_every)
+            else:
+                row = static if scheme == 'static' else np.full(len(names), 1.0 / len(names))
+                weights, history = np.tile(row, (len(candles), 1)), [(start_index, row)]
+
+            backtest = self._engine(candles, self.combine(signals, weights, names)).run_backtest_on_candles(
+                candles, symbol=symbol, timeframe=timeframe, volume=volume,
+                start_index=start_index, end_index=end_index
+            )
+            equity = np.asarray(backtest['equity_curve'], dtype=np.float64)
+            points = lttb(equity, max_points) if max_points else np.arange(len(equity))
+            results[scheme] = {
+                'metrics': backtest['metrics'],
+                'final_balance': backtest['final_balance'],
+                'total_return_pct': backtest['total_return_pct'],
+                'total_trades': len(backtest['trades']),
+                'weights': [{
+                    'bar': int(bar),
+                    'time': candles[bar].get('time'),
+                    'weights': {name: round(float(w), 4) for name, w in zip(names, row)}
+                } for bar, row in history],
+                'equity_curve': {'index': points.tolist(), 'equity': equity[points].round(2).tolist()}
+            }
+            print(f"   {scheme}: return {backtest['total_return_pct']}%, "
+                  f"sharpe {backtest['metrics'].get('sharpe_ratio', 0)}, trades {len(backtest['trades'])}")
+
+        best = max(results, key=lambda scheme: results[scheme]['metrics'].get('sharpe_ratio', 0))
+        print(f"✅ Best scheme (sharpe): {best}")
+
+        return {
+            'success': True,
+            'symbol': symbol,
+            'timeframe': timeframe,
+            'start_time': candles[start_index].get('time'),
+            'end_time': candles[end_index - 1].get('time'),
+            'bars': end_index - start_index,
+            'schemes': results,
+            'best_scheme': best,
+            'strategies': {name: {
+                'type': self.members[name]['spec'][0],
+                'weight': self.members[name]['weight'],
+                'metrics': standalone[name]['metrics'],
+                'total_return_pct': standalone[name]['total_return_pct']
+            } for name in names},
+            'window': window,
+            'refit_every': refit_every,
+            'generated_at': datetime.now().isoformat()
+        }
+
+if __name__ == "__main__":
+    # Test portfolio backtest op een random walk history
+    rng = np.random.default_rng(7)
+    closes = 2500 + np.cumsum(rng.normal(0, 4, 2000))
+    candles = [{
+        'time': f"2024.{1 + i // 720:02d}.{1 + i // 24 % 30:02d} {i % 24:02d}:00:00",
+        'open': closes[i - 1] if i else closes[0], 'close': closes[i],
+        'high': closes[i] + rng.uniform(0.5, 4), 'low': closes[i] - rng.uniform(0.5, 4), 'volume': 500.0
+    } for i in range(len(closes))]
+
+    backtester = PortfolioBacktester()
+    backtester.add_strategy('standard', weight=1.0)
+    backtester.add_strategy('fast', weight=0.5, parameters={'sma_short': 10, 'sma_long': 30, 'confidence_threshold': 55})
+    backtester.add_strategy('adaptive', strategy_type='adaptive', weight=1.0)
+    report = backtester.run(candles=candles, window=400, refit_every=200)
+    for name, scheme in report['schemes'].items():
+        print(f"   {name}: {scheme['total_return_pct']}% over {scheme['total_trades']} trades")
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Support/Resistance Index
+Gesorteerde index van pivot levels over een rolling venster, bijgewerkt per bar
+Zelfde definitie als TradingStrategy.detect_support_resistance: 5-bar pivots
+binnen de laatste `lookback` candles, strength = aantal pivots binnen 0.1% van het level
+"""
+
+import bisect
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+# Pivots binnen deze relatieve afstand van een level tellen als touch van dat level
+SR_TOLERANCE = 0.001
+
+# Bars nodig rond een pivot (2 links, 2 rechts) en voor de fallback levels (laatste 10)
+PIVOT_SPAN = 2
+FALLBACK_BARS = 10
+
+class SupportResistanceIndex:
+    """
+    Pivot lows (support) en pivot highs (resistance) in twee gesorteerde lijsten
+
+    Een nieuwe bar bevestigt hoogstens één pivot (de bar PIVOT_SPAN plaatsen terug)
+    en laat pivots buiten het venster vervallen, dus een update kost O(log n)
+    per bar i.p.v. een rescan van het venster. De laatste candle mag een nog
+    lopende bar zijn: een update met dezelfde tijd vervangt die bar en herziet
+    alleen de pivot die ervan afhangt.
+    """
+
+    def __init__(self, lookback: int = 50, tolerance: float = SR_TOLERANCE):
+        """
+        Args:
+            lookback: Aantal candles in het venster (sr_lookback van de timeframe)
+            tolerance: Relatieve afstand voor touch counts
+        """
+        self.lookback = lookback
+        self.tolerance = tolerance
+        self.reset()
+
+    def reset(self):
+        self.bars = 0  # Aantal bars sinds reset (globale index van de volgende bar)
+        self._recent = deque(maxlen=max(FALLBACK_BARS, 2 * PIVOT_SPAN + 1))  # (time, high, low, close)
+        self._supports = []     # Gesorteerde pivot lows
+        self._resistances = []  # Gesorteerde pivot highs
+        self._pivots = deque()  # (bar index, 'support'|'resistance', level) oudste eerst
+
+    def update(self, candles: List[Dict]) -> 'SupportResistanceIndex':
+        """
+        Synchroniseer de index met een candle snapshot (oudste eerst)
+
+        Sluit de snapshot aan op de vorige (zelfde bar tijden), dan worden alleen
+        de nieuwe bars verwerkt; anders wordt de index over het venster opnieuw opgebouwd.
+        """
+        window = candles[-self.lookback:]
+        if not window:
+            self.reset()
+            return self
+
+        start = self._resume_position(window)
+        if start is None:
+            self.reset()
+            start = 0
+        for candle in window[start:]:
+            self._push(candle)
+        return self
+
+    def _resume_position(self, window: List[Dict]) -> Optional[int]:
+        """Index in window van de eerste bar die nog verwerkt moet worden (None = opnieuw opbouwen)"""
+        if not self._recent or window[-1].get('time') is None:
+            return None
+        last_time = self._recent[-1][0]
+        for position in range(len(window) - 1, -1, -1):
+            if window[position].get('time') == last_time:
+                break
+        else:
+            return None
+
+        # Bar ervoor is gesloten en moet gelijk zijn; anders andere data (symbol/timeframe)
+        if len(self._recent) > 1 and (position == 0 or self._bar(window[position - 1]) != self._recent[-2]):
+            return None
+        if self._bar(window[position]) != self._recent[-1]:
+            self._replace_last(window[position])
+        return position + 1
+
+    @staticmethod
+    def _bar(candle: Dict) -> Tuple:
+        return (candle.get('time'), float(candle.get('high', 0)), float(candle.get('low', 0)),
+                float(candle.get('close', 0)))
+
+    def _push(self, candle: Dict):
+        self._recent.append(self._bar(candle))
+        self.bars += 1
+        self._confirm()
+        self._expire()
+
+    def _replace_last(self, candle: Dict):
+        """Lopende bar gewijzigd: pivot die op deze bar steunt opnieuw beoordelen"""
+        pivot_bar = self.bars - 1 - PIVOT_SPAN
+        while self._pivots and self._pivots[-1][0] == pivot_bar:
+            _, side, level = self._pivots.pop()
+            levels = self._supports if side == 'support' else self._resistances
+            del levels[bisect.bisect_left(levels, level)]
+        self._recent[-1] = self._bar(candle)
+        self._confirm()
+
+    def _confirm(self):
+        """Beoordeel de bar PIVOT_SPAN plaatsen terug (alle buren zijn nu bekend)"""
+        span = 2 * PIVOT_SPAN + 1
+        if self.bars < span:
+            return
+        bars = list(self._recent)[-span:]
+        _, high, low, _ = bars[PIVOT_SPAN]
+        neighbours = bars[:PIVOT_SPAN] + bars[PIVOT_SPAN + 1:]
+        pivot_bar = self.bars - 1 - PIVOT_SPAN
+        if all(low < bar[2] for bar in neighbours):
+            bisect.insort(self._supports, low)
+            self._pivots.append((pivot_bar, 'support', low))
+        if all(high > bar[1] for bar in neighbours):
+            bisect.insort(self._resistances, high)
+            self._pivots.append((pivot_bar, 'resistance', high))
+
+    def _expire(self):
+        """Pivots waarvan de linker buren buiten het venster vallen vervallen"""
+        first_valid = self.bars - self.lookback + PIVOT_SPAN
+        while self._pivots and self._pivots[0][0] < first_valid:
+            _, side, level = self._pivots.popleft()
+            levels = self._supports if side == 'support' else self._resistances
+            del levels[bisect.bisect_left(levels, level)]
+
+    def touches(self, level: float, side: str = 'support') -> int:
+        """Aantal pivots van een kant binnen de tolerantie van een level (O(log n))"""
+        levels = self._supports if side == 'support' else self._resistances
+        tolerance = level * self.tolerance
+        lo = bisect.bisect_left(levels, level - tolerance)
+        hi = bisect.bisect_right(levels, level + tolerance)
+        # Grenzen exact volgens abs(x - level) < tolerance
+        while lo < hi and not abs(levels[lo] - level) < tolerance:
+            lo += 1
+        while hi > lo and not abs(levels[hi - 1] - level) < tolerance:
+            hi -= 1
+        return hi - lo
+
+    def nearest_support(self, price: float) -> Optional[Tuple[float, int]]:
+        """Hoogste pivot low onder price met zijn touch count, None als er geen is"""
+        position = bisect.bisect_left(self._supports, price)
+        if position == 0:
+            return None
+        level = self._supports[position - 1]
+        return level, self.touches(level, 'support')
+
+    def nearest_resistance(self, price: float) -> Optional[Tuple[float, int]]:
+        """Laagste pivot high boven price met zijn touch count, None als er geen is"""
+        position = bisect.bisect_right(self._resistances, price)
+        if position == len(self._resistances):
+            return None
+        level = self._resistances[position]
+        return level, self.touches(level, 'resistance')
+
+    @property
+    def current_price(self) -> float:
+        return self._recent[-1][3] if self._recent else 0.0
+
+    def recent_low(self, bars: int = FALLBACK_BARS) -> float:
+        return min(bar[2] for bar in list(self._recent)[-bars:])
+
+    def recent_high(self, bars: int = FALLBACK_BARS) -> float:
+        return max(bar[1] for bar in list(self._recent)[-bars:])
+
+    def get_levels(self) -> Dict:
+        """Alle actieve levels (oplopend)"""
+        return {'support': list(self._supports), 'resistance': list(self._resistances)}
+
+if __name__ == "__main__":
+    import time
+    import numpy as np
+
+    # Test: sliding snapshots van een random walk, index vs volledige rescan
+    rng = np.random.default_rng(9)
+    closes = 2500 + np.cumsum(rng.normal(0, 3, 3000))
+    candles = [{
+        'time': i, 'close': closes[i],
+        'high': closes[i] + rng.uniform(0.5, 3), 'low': closes[i] - rng.uniform(0.5, 3)
+    } for i in range(len(closes))]
+
+    index = SupportResistanceIndex(lookback=50)
+    start = time.perf_counter()
+    for end in range(100, len(candles)):
+        index.update(candles[end - 100:end])
+    elapsed = (time.perf_counter() - start) / (len(candles) - 100) * 1000
+    print(f"⚡ {elapsed:.3f}ms per update")
+    print(f"✅ Support: {index.nearest_support(index.current_price)}, "
+          f"resistance: {index.nearest_resistance(index.current_price)}")
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Tick Feed
+Leest de tick ring file die de EA per tick schrijft (memory-mapped, geen EA request)
+en bouwt er M1 bars van. De laatste quote staat altijd in de gemapte file, dus
+de huidige prijs lezen kost geen round-trip naar de EA.
+
+Ring file layout (little-endian), geschreven door MT5_REST_API_EA.mq5:
+    header (64 bytes): magic, version, capacity, record_size (int32),
+                       count (int64, totaal geschreven ticks), heartbeat (int64, TimeGMT),
+                       digits (int32)
+    records: capacity x (time_msc int64, bid, ask, last float64, volume int64)
+Tick n staat in slot n % capacity; de EA schrijft eerst het record en daarna count,
+dus het slot van tick `count` kan half geschreven zijn en wordt nooit gelezen.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from candle_store import format_candle_time
+from mt5_paths import find_common_folder
+from timeframe_aggregator import aggregate_arrays
+
+TICK_MAGIC = 0x4B434954  # b'TICK' als little-endian int32, zie EA
+TICK_VERSION = 1
+HEADER_FORMAT = '<4iqqi'
+HEADER_SIZE = 64
+COUNT_OFFSET = 16
+TICK_DTYPE = np.dtype([('time_msc', '<i8'), ('bid', '<f8'), ('ask', '<f8'), ('last', '<f8'), ('volume', '<i8')])
+
+# Quote is actueel zolang de EA heartbeat niet ouder is dan dit (seconden)
+MAX_QUOTE_AGE = 10
+
+def tick_file_name(symbol: str) -> str:
+    return f"mt5_ticks_{symbol.upper()}.bin"
+
+def default_tick_folder() -> str:
+    """MT5 Common Files folder (daar schrijft de EA met FILE_COMMON)"""
+    return find_common_folder(create=False)
+
+def ticks_to_arrays(ticks: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Ticks als OHLCV kolommen per tick (bid prijs, volume 1), voor aggregate_arrays
+
+    MT5 bouwt bars op bid, dus M1 bars uit deze kolommen komen overeen met CopyRates.
+    """
+    bids = ticks['bid'].astype(np.float64)
+    return {
+        'time': ticks['time_msc'] // 1000,
+        'open': bids,
+        'high': bids,
+        'low': bids,
+        'close': bids,
+        'volume': np.ones(len(ticks))
+    }
+
+class TickRing:
+    """Read-only mapping van een tick ring file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._map = None
+        self._records = None
+        self.capacity = 0
+        self.digits = 2
+
+    def open(self, reload: bool = False) -> bool:
+        """
+        Map de file (opnieuw als de EA hem met een andere grootte of capacity heeft aangemaakt)
+
+        Args:
+            reload: Header altijd opnieuw inlezen (b.v. als count terugliep)
+        """
+        if (not reload and self._map is not None and os.path.exists(self.path)
+                and os.path.getsize(self.path) == len(self._map)
+                and struct.unpack_from('<i', self._map, 8)[0] == self.capacity):
+            return True
+        self.close()
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER_SIZE:
+            return False
+        self._file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, capacity, record_size, _, _, digits = struct.unpack_from(HEADER_FORMAT, self._map, 0)
+        if (magic != TICK_MAGIC or version != TICK_VERSION or record_size != TICK_DTYPE.itemsize
+                or len(self._map) < HEADER_SIZE + capacity * record_size):
+            self.close()
+            return False
+        self.capacity = capacity
+        self.digits = digits
+        self._records = np.frombuffer(self._map, dtype=TICK_DTYPE, count=capacity, offset=HEADER_SIZE)
+        return True
+
+    def close(self):
+        self._records = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def count(self) -> int:
+        """Totaal aantal door de EA geschreven ticks"""
+        return struct.unpack_from('<q', self._map, COUNT_OFFSET)[0]
+
+    @property
+    def heartbeat(self) -> int:
+        """Laatste TimeGMT() van de EA (epoch seconden), ook zonder nieuwe ticks"""
+        return struct.unpack_from('<q', self._map, COUNT_OFFSET + 8)[0]
+
+    def read_since(self, sequence: int) -> Tuple[np.ndarray, int, int]:
+        """
+        Ticks met volgnummer >= sequence die nog in de ring staan
+
+        Returns:
+            (ticks oudste eerst, volgende sequence, aantal gemiste ticks die al
+             overschreven waren)
+        """
+        end = self.count
+        # Het oudste slot is ook het slot dat de EA nu kan overschrijven
+        start = max(sequence, end - self.capacity + 1, 0)
+        if end <= start:
+            return np.empty(0, dtype=TICK_DTYPE), max(sequence, end), 0
+        slots = np.arange(start, end) % self.capacity
+        ticks = self._records[slots].copy()
+
+        # Slots die tijdens het kopiëren door de EA overschreven zijn weggooien
+        overwritten = self.count - self.capacity + 1 - start
+        if overwritten > 0:
+            ticks = ticks[overwritten:]
+            start += overwritten
+        return ticks, end, start - sequence
+
+    def latest(self) -> Optional[np.void]:
+        """Laatste tick record (None als de ring leeg is)"""
+        count = self.count
+        if count == 0:
+            return None
+        return self._records[(count - 1) % self.capacity].copy()
+
+class M1BarBuilder:
+    """
+    M1 bars uit een tick stroom, incrementeel per batch
+
+    Een bar sluit zodra er een tick uit een volgende minuut binnenkomt (zoals in MT5);
+    de laatste bar is de lopende bar.
+    """
+
+    def __init__(self, max_bars: int = 1440):
+        self.bars = deque(maxlen=max_bars)  # Gesloten bars (candle dicts met epoch 'time')
+        self.forming = None
+
+    def add_ticks(self, ticks: np.ndarray) -> int:
+        """
+        Verwerk nieuwe ticks (oudste eerst)
+
+        Returns:
+            Aantal bars dat in deze batch gesloten is
+        """
+        if len(ticks) == 0:
+            return 0
+        arrays = ticks_to_arrays(ticks)
+        if self.forming is not None:
+            # Ticks van vóór de lopende bar (b.v. na een herstart) negeren
+            keep = arrays['time'] >= self.forming['time']
+            arrays = {field: values[keep] for field, values in arrays.items()}
+            if len(arrays['time']) == 0:
+                return 0
+
+        minute = aggregate_arrays(arrays, 'M1')
+        bars = [{field: minute[field][i] for field in minute} for i in range(len(minute['time']))]
+        if self.forming is not None and bars[0]['time'] == self.forming['time']:
+            first = bars[0]
+            bars[0] = {
+                'time': first['time'],
+                'open': self.forming['open'],
+                'high': max(self.forming['high'], first['high']),
+                'low': min(self.forming['low'], first['low']),
+                'close': first['close'],
+                'volume': self.forming['volume'] + first['volume']
+            }
+        elif self.forming is not None:
+            bars.insert(0, self.forming)
+
+        self.bars.extend(bars[:-1])
+        self.forming = bars[-1]
+        return len(bars) - 1
+
+    def get_candles(self, count: Optional[int] = None, include_forming: bool = True) -> List[Dict]:
+        """Bars als candle dicts in bridge formaat (oudste eerst)"""
+        bars = list(self.bars)
+        if include_forming and self.forming is not None:
+            bars.append(self.forming)
+        if count:
+            bars = bars[-count:]
+        return [{
+            'time': format_candle_time(int(bar['time'])),
+            'open': float(bar['open']),
+            'high': float(bar['high']),
+            'low': float(bar['low']),
+            'close': float(bar['close']),
+            'volume': int(bar['volume'])
+        } for bar in bars]
+
+class TickFeed:
+    """Tick ring van één symbol + M1 bar builder + laatste quote"""
+
+    def __init__(self, symbol: str = "XAUUSD", folder: Optional[str] = None, max_bars: int = 1440):
+        """
+        Args:
+            symbol: Symbol van de chart waarop de EA draait
+            folder: Map met de ring file (default: MT5 Common Files folder)
+            max_bars: Aantal gesloten M1 bars in geheugen
+        """
+        self.symbol = symbol.upper()
+        self.ring = TickRing(os.path.join(folder or default_tick_folder(), tick_file_name(symbol)))
+        self.builder = M1BarBuilder(max_bars=max_bars)
+        self.sequence = 0
+        self.dropped = 0
+        # Bridge routes draaien in Flask threads: lezen + sequence bijwerken in één keer
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        with self._lock:
+            return self.ring.open()
+
+    def poll(self) -> int:
+        """
+        Lees nieuwe ticks uit de ring en werk de bars bij
+
+        Returns:
+            Aantal nieuwe ticks (0 als de ring file (nog) niet bestaat)
+        """
+        with self._lock:
+            if not self.ring.open():
+                return 0
+            if self.ring.count < self.sequence:
+                # Ring opnieuw aangemaakt door de EA (mogelijk met een kleinere capacity
+                # in een niet ingekorte file): header opnieuw lezen
+                self.sequence = 0
+                if not self.ring.open(reload=True):
+                    return 0
+            first_read = self.sequence == 0
+            ticks, self.sequence, dropped = self.ring.read_since(self.sequence)
+            if not first_read:
+                self.dropped += dropped
+            self.builder.add_ticks(ticks)
+            return len(ticks)
+
+    def get_quote(self, max_age: Optional[float] = MAX_QUOTE_AGE) -> Optional[Dict]:
+        """
+        Laatste bid/ask uit de ring (zelfde velden als de bridge /tick response)
+
+        Returns:
+            Quote dict, of None als er geen ring is of de EA heartbeat ouder is dan max_age
+        """
+        with self._lock:
+            if not self.ring.open():
+                return None
+            tick = self.ring.latest()
+            heartbeat = self.ring.heartbeat
+            digits = self.ring.digits
+        if tick is None:
+            return None
+        age = time.time() - heartbeat
+        if max_age is not None and age > max_age:
+            return None
+        return {
+            'symbol': self.symbol,
+            'bid': round(float(tick['bid']), digits),
+            'ask': round(float(tick['ask']), digits),
+            'last': round(float(tick['last']), digits),
+            'volume': int(tick['volume']),
+            'time': format_candle_time(int(tick['time_msc']) // 1000),
+            'time_msc': int(tick['time_msc']),
+            'age_seconds': round(age, 3),
+            'source': 'tick_ring'
+        }
+
+    def get_candles(self, count: Optional[int] = None, include_forming: bool = True) -> List[Dict]:
+        """M1 bars uit de ticks (eerst poll() voor de laatste ticks)"""
+        self.poll()
+        with self._lock:
+            return self.builder.get_candles(count, include_forming=include_forming)
+
+    def get_ticks(self) -> np.ndarray:
+        """Alle ticks die nog in de ring staan (voor tick-level backtests)"""
+        with self._lock:
+            if not self.ring.open():
+                return np.empty(0, dtype=TICK_DTYPE)
+            return self.ring.read_since(0)[0]
+
+if __name__ == "__main__":
+    import tempfile
+
+    # Test: schrijf een ring file zoals de EA en lees hem terug
+    folder = tempfile.mkdtemp()
+    capacity = 1000
+    rng = np.random.default_rng(3)
+    ticks = np.zeros(2500, dtype=TICK_DTYPE)
+    ticks['time_msc'] = 1700000000000 + np.cumsum(rng.integers(50, 2000, len(ticks)))
+    ticks['bid'] = 2000 + np.cumsum(rng.normal(0, 0.05, len(ticks)))
+    ticks['ask'] = ticks['bid'] + 0.2
+
+    path = os.path.join(folder, tick_file_name("XAUUSD"))
+    with open(path, 'wb') as f:
+        f.write(struct.pack(HEADER_FORMAT, TICK_MAGIC, TICK_VERSION, capacity, TICK_DTYPE.itemsize, 0, int(time.time()), 2)
+                .ljust(HEADER_SIZE, b'\0'))
+        f.write(np.zeros(capacity, dtype=TICK_DTYPE).tobytes())
+
+    feed = TickFeed("XAUUSD", folder=folder)
+    with open(path, 'r+b') as f:
+        for start in range(0, len(ticks), 700):
+            batch = ticks[start:start + 700]
+            for n, tick in enumerate(batch, start):
+                f.seek(HEADER_SIZE + (n % capacity) * TICK_DTYPE.itemsize)
+                f.write(tick.tobytes())
+            f.seek(COUNT_OFFSET)
+            f.write(struct.pack('<q', start + len(batch)))
+            f.flush()
+            print(f"📥 Polled {feed.poll()} ticks")
+
+    print(f"✅ Quote: {feed.get_quote()}")
+    print(f"📊 {len(feed.builder.bars)} closed M1 bars, last: {feed.get_candles(1)}")
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Timeframe Aggregator
+Hogere timeframe bars incrementeel opgebouwd uit één base timeframe feed
+(CandleStore history + live snapshots), met indicator state per timeframe
+voor multi-timeframe confluence zonder extra EA requests
+"""
+
+from collections import deque
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from candle_store import OHLCV_FIELDS, format_candle_time, parse_candle_time
+
+TIMEFRAME_SECONDS = {
+    'M1': 60,
+    'M5': 300,
+    'M15': 900,
+    'M30': 1800,
+    'H1': 3600,
+    'H4': 14400,
+    'D1': 86400
+}
+
+# Periodes als er geen strategie periodes meegegeven worden
+DEFAULT_PERIODS = {'sma_short': 20, 'sma_long': 50, 'ema_fast': 12, 'ema_slow': 26, 'rsi_period': 14}
+
+def timeframe_seconds(timeframe: str) -> int:
+    """Bar lengte van een timeframe in seconden"""
+    timeframe = timeframe.upper()
+    if timeframe not in TIMEFRAME_SECONDS:
+        raise ValueError(f"Unknown timeframe: {timeframe}, use one of {list(TIMEFRAME_SECONDS)}")
+    return TIMEFRAME_SECONDS[timeframe]
+
+def aggregate_arrays(arrays: Dict[str, np.ndarray], timeframe: str) -> Dict[str, np.ndarray]:
+    """
+    Aggregeer base bars (kolom arrays, oudste eerst) naar een hogere timeframe
+
+    Een bar begint op een veelvoud van de timeframe lengte (epoch, broker tijd);
+    de laatste bar kan nog onvolledig zijn.
+
+    Returns:
+        {'time', 'open', 'high', 'low', 'close', 'volume'} per hogere timeframe bar
+    """
+    seconds = timeframe_seconds(timeframe)
+    times = np.asarray(arrays['time'], dtype=np.int64)
+    if len(times) == 0:
+        return {'time': times.copy(), **{field: np.array([], dtype=np.float64) for field in OHLCV_FIELDS}}
+
+    buckets = times - times % seconds
+    starts = np.concatenate([[0], np.flatnonzero(buckets[1:] != buckets[:-1]) + 1])
+    ends = np.concatenate([starts[1:], [len(times)]])
+    return {
+        'time': buckets[starts],
+        'open': np.asarray(arrays['open'], dtype=np.float64)[starts],
+        'high': np.maximum.reduceat(np.asarray(arrays['high'], dtype=np.float64), starts),
+        'low': np.minimum.reduceat(np.asarray(arrays['low'], dtype=np.float64), starts),
+        'close': np.asarray(arrays['close'], dtype=np.float64)[ends - 1],
+        'volume': np.add.reduceat(np.asarray(arrays['volume'], dtype=np.float64), starts)
+    }
+
+def _merge_bar(bar: Optional[Dict], candle: Dict) -> Dict:
+    """Voeg een base bar toe aan een (lopende) hogere timeframe bar"""
+    if bar is None:
+        return dict(candle)
+    return {
+        'time': bar['time'],
+        'open': bar['open'],
+        'high': max(bar['high'], candle['high']),
+        'low': min(bar['low'], candle['low']),
+        'close': candle['close'],
+        'volume': bar['volume'] + candle['volume']
+    }
+
+class IndicatorState:
+    """
+    SMA/EMA/RSI over gesloten bars, O(1) per bar
+
+    values() geeft de waarden inclusief een optionele lopende close, zonder de
+    state te wijzigen. De EMA loopt over de hele gevoede history (geseed op de
+    eerste close), SMA en RSI zijn dezelfde definities als TradingStrategy.
+    """
+
+    def __init__(self, periods: Optional[Dict[str, int]] = None):
+        self.periods = {**DEFAULT_PERIODS, **(periods or {})}
+        self._windows = {name: deque(maxlen=int(self.periods[name])) for name in ('sma_short', 'sma_long')}
+        self._sums = {name: 0.0 for name in self._windows}
+        self._emas = {name: None for name in ('ema_fast', 'ema_slow')}
+        self._changes = deque(maxlen=int(self.periods['rsi_period']))  # (gain, loss)
+        self._gain_sum = 0.0
+        self._loss_sum = 0.0
+        self.last_close = None
+        self.count = 0
+
+    def push(self, close: float):
+        """Verwerk de close van een gesloten bar"""
+        for name, window in self._windows.items():
+            if len(window) == window.maxlen:
+                self._sums[name] -= window[0]
+            window.append(close)
+            self._sums[name] += close
+        for name, ema in self._emas.items():
+            multiplier = 2.0 / (self.periods[name] + 1)
+            self._emas[name] = close if ema is None else close * multiplier + ema * (1 - multiplier)
+        if self.last_close is not None:
+            if len(self._changes) == self._changes.maxlen:
+                gain, loss = self._changes[0]
+                self._gain_sum -= gain
+                self._loss_sum -= loss
+            change = close - self.last_close
+            gain, loss = (change, 0.0) if change > 0 else (0.0, -change)
+            self._changes.append((gain, loss))
+            self._gain_sum += gain
+            self._loss_sum += loss
+        self.last_close = close
+        self.count += 1
+
+    def values(self, forming_close: Optional[float] = None) -> Dict[str, Optional[float]]:
+        """
+        Indicator waarden na de gesloten bars (+ lopende close)
+
+        Returns:
+            {'sma_short', 'sma_long', 'ema_fast', 'ema_slow', 'rsi', 'close'}; None als
+            er te weinig bars zijn
+        """
+        close = forming_close if forming_close is not None else self.last_close
+        values = {'close': close}
+
+        for name, window in self._windows.items():
+            period = window.maxlen
+            if forming_close is None:
+                values[name] = self._sums[name] / period if len(window) == period else None
+            elif len(window) >= period - 1:
+                dropped = window[0] if len(window) == period else 0.0
+                values[name] = (self._sums[name] - dropped + forming_close) / period
+            else:
+                values[name] = None
+
+        for name, ema in self._emas.items():
+            if forming_close is None or ema is None:
+                values[name] = ema if self.count >= self.periods[name] else None
+            else:
+                multiplier = 2.0 / (self.periods[name] + 1)
+                provisional = forming_close * multiplier + ema * (1 - multiplier)
+                values[name] = provisional if self.count + 1 >= self.periods[name] else None
+
+        gain_sum, loss_sum, changes = self._gain_sum, self._loss_sum, len(self._changes)
+        if forming_close is not None and self.last_close is not None:
+            if changes == self._changes.maxlen:
+                gain, loss = self._changes[0]
+                gain_sum, loss_sum = gain_sum - gain, loss_sum - loss
+            else:
+                changes += 1
+            change = forming_close - self.last_close
+            gain_sum += max(change, 0.0)
+            loss_sum += max(-change, 0.0)
+        if changes < self._changes.maxlen:
+            values['rsi'] = None
+        elif loss_sum <= 0:
+            values['rsi'] = 100.0
+        else:
+            values['rsi'] = 100 - (100 / (1 + gain_sum / loss_sum))
+        return values
+
+class TimeframeAggregator:
+    def __init__(self, base_timeframe: str = "M5", timeframes: Sequence[str] = ('M15', 'H1', 'H4'),
+                 periods: Optional[Dict[str, Dict[str, int]]] = None, max_bars: int = 500):
+        """
+        Args:
+            base_timeframe: Timeframe van de feed
+            timeframes: Hogere timeframes om op te bouwen (veelvoud van de base timeframe)
+            periods: Indicator periodes per timeframe (bv. TradingStrategy.get_indicator_periods)
+            max_bars: Bewaarde gesloten bars per timeframe
+        """
+        self.base_timeframe = base_timeframe.upper()
+        base_seconds = timeframe_seconds(self.base_timeframe)
+        self.timeframes = [tf.upper() for tf in timeframes]
+        for timeframe in self.timeframes:
+            seconds = timeframe_seconds(timeframe)
+            if seconds <= base_seconds or seconds % base_seconds:
+                raise ValueError(f"{timeframe} is not a higher multiple of {self.base_timeframe}")
+        self.periods = {tf.upper(): p for tf, p in (periods or {}).items()}
+        self.max_bars = max_bars
+        self.reset()
+
+    def reset(self):
+        self.last_time = None  # Epoch van de laatst verwerkte base bar
+        self._states = {timeframe: {
+            'seconds': timeframe_seconds(timeframe),
+            'bars': deque(maxlen=self.max_bars),  # Gesloten bars
+            'prefix': None,   # Lopende bar zonder de laatste base bar
+            'forming': None,  # Lopende bar
+            'indicators': IndicatorState(self.periods.get(timeframe))
+        } for timeframe in self.timeframes}
+
+    def backfill(self, arrays: Dict[str, np.ndarray]) -> int:
+        """
+        Bouw alle timeframes opnieuw op uit base history (bv. CandleStore.load_arrays)
+
+        Returns:
+            Aantal verwerkte base bars
+        """
+        self.reset()
+        times = np.asarray(arrays['time'], dtype=np.int64)
+        if len(times) == 0:
+            return 0
+
+        for timeframe, state in self._states.items():
+            aggregated = aggregate_arrays(arrays, timeframe)
+            closed = len(aggregated['time']) - 1
+            for close in aggregated['close'][:closed]:
+                state['indicators'].push(float(close))
+            for i in range(max(0, closed - self.max_bars), closed):
+                state['bars'].append({field: aggregated[field][i].item() for field in aggregated})
+
+            # Lopende bar: alle base bars van de laatste bucket, de laatste apart
+            in_bucket = np.flatnonzero(times - times % state['seconds'] == aggregated['time'][-1])
+            if len(in_bucket) > 1:
+                prefix = {field: np.asarray(arrays[field])[in_bucket[:-1]] for field in ('time',) + tuple(OHLCV_FIELDS)}
+                state['prefix'] = {field: values[0].item() for field, values in aggregate_arrays(prefix, timeframe).items()}
+            state['forming'] = {field: aggregated[field][-1].item() for field in aggregated}
+
+        self.last_time = int(times[-1])
+        return len(times)
+
+    def connects(self, candles: List[Dict]) -> bool:
+        """
+        Sluit de snapshot aan op de verwerkte bars (geen gat ertussen)
+
+        Een snapshot die pas na de laatst verwerkte bar begint kan base bars missen;
+        dan moet eerst opnieuw gebackfilled worden.
+        """
+        if self.last_time is None or not candles:
+            return True
+        return parse_candle_time(candles[0].get('time', 0)) <= self.last_time
+
+    def update(self, candles: List[Dict]) -> int:
+        """
+        Verwerk base candles (bv. de live snapshot); alleen bars vanaf de laatst
+        verwerkte tijd tellen, een bar met dezelfde tijd vervangt de lopende bar
+
+        Sluit de snapshot niet aan (zie connects), dan wordt de state gereset en
+        alleen uit de snapshot opgebouwd: liever te weinig history (trend 'ready'
+        False) dan indicators over een gat.
+
+        Returns:
+            Aantal nieuwe base bars
+        """
+        if not self.connects(candles):
+            self.reset()
+        # Snapshots overlappen: van achteren zoeken naar de eerste nog niet verwerkte bar
+        start = 0
+        if self.last_time is not None:
+            start = len(candles)
+            while start > 0 and parse_candle_time(candles[start - 1].get('time', 0)) >= self.last_time:
+                start -= 1
+
+        added = 0
+        for candle in candles[start:]:
+            bar = {'time': parse_candle_time(candle.get('time', 0)),
+                   **{field: float(candle.get(field, 0)) for field in OHLCV_FIELDS}}
+            if self.last_time is not None and bar['time'] < self.last_time:
+                continue
+            if bar['time'] == self.last_time:
+                for state in self._states.values():
+                    state['forming'] = _merge_bar(state['prefix'], {**bar, 'time': state['forming']['time']})
+                continue
+
+            for state in self._states.values():
+                bucket = bar['time'] - bar['time'] % state['seconds']
+                forming = state['forming']
+                if forming is not None and forming['time'] != bucket:
+                    # Nieuwe bucket: lopende bar is gesloten
+                    state['bars'].append(forming)
+                    state['indicators'].push(forming['close'])
+                    forming = None
+                state['prefix'] = forming
+                state['forming'] = _merge_bar(forming, {**bar, 'time': bucket})
+            self.last_time = bar['time']
+            added += 1
+        return added
+
+    def get_candles(self, timeframe: str, count: Optional[int] = None, include_forming: bool = True) -> List[Dict]:
+        """Hogere timeframe bars als candle dicts (zelfde vorm als de bridge)"""
+        state = self._states[timeframe.upper()]
+        bars = list(state['bars']) + ([state['forming']] if include_forming and state['forming'] else [])
+        if count:
+            bars = bars[-count:]
+        return [{**bar, 'time': format_candle_time(bar['time'])} for bar in bars]
+
+    def trend(self, timeframe: str) -> Dict:
+        """
+        Richting van een timeframe uit de indicator state (regels 1 en 4 van
+        TradingStrategy.analyze_candles: SMA en EMA crossover met prijs bevestiging)
+
+        Returns:
+            {'direction': 'BUY'|'SELL'|'NEUTRAL', 'votes', indicator waarden, 'bars',
+             'ready': False als er te weinig bars zijn voor alle crossover indicators}
+        """
+        state = self._states[timeframe.upper()]
+        forming = state['forming']
+        values = state['indicators'].values(forming['close'] if forming else None)
+        close = values['close']
+
+        votes = 0
+        ready = close is not None
+        for short, long in (('sma_short', 'sma_long'), ('ema_fast', 'ema_slow')):
+            if close is None or values[short] is None or values[long] is None:
+                ready = False
+                continue
+            if values[short] > values[long] and close > values[short]:
+                votes += 1
+            elif values[short] < values[long] and close < values[short]:
+                votes -= 1
+
+        return {
+            'direction': 'BUY' if votes > 0 else 'SELL' if votes < 0 else 'NEUTRAL',
+            'votes': votes,
+            **{name: round(value, 2) if value is not None else None for name, value in values.items()},
+            'bars': len(state['bars']) + (1 if forming else 0),
+            'ready': ready
+        }
+
+    def confluence(self, signal: str) -> Dict:
+        """
+        Vergelijk een signaal met de richting van alle hogere timeframes
+
+        Timeframes met te weinig history staan in 'insufficient'; hun richting is
+        niet betrouwbaar, dus een signaal is dan nooit 'confirmed'.
+
+        Returns:
+            {'aligned': [...], 'opposed': [...], 'insufficient': [...], 'score': -1..1,
+             'confirmed': bool, 'timeframes': {tf: trend}}
+        """
+        trends = {timeframe: self.trend(timeframe) for timeframe in self.timeframes}
+        opposite = {'BUY': 'SELL', 'SELL': 'BUY'}.get(signal)
+        aligned = [tf for tf, trend in trends.items() if signal in ('BUY', 'SELL') and trend['direction'] == signal]
+        opposed = [tf for tf, trend in trends.items() if opposite and trend['direction'] == opposite]
+        insufficient = [tf for tf, trend in trends.items() if not trend['ready']]
+        return {
+            'signal': signal,
+            'aligned': aligned,
+            'opposed': opposed,
+            'insufficient': insufficient,
+            'score': round((len(aligned) - len(opposed)) / len(trends), 2) if trends else 0.0,
+            'confirmed': bool(opposite) and bool(aligned) and not opposed and not insufficient,
+            'timeframes': trends
+        }
+
+if __name__ == "__main__":
+    import time
+
+    # Test: M5 random walk, backfill + incrementele updates vs volledige aggregatie
+    rng = np.random.default_rng(4)
+    n = 6000
+    closes = 2500 + np.cumsum(rng.normal(0, 1, n))
+    arrays = {
+        'time': 1_700_000_000 - 1_700_000_000 % 300 + np.arange(n, dtype=np.int64) * 300,
+        'open': np.concatenate([[closes[0]], closes[:-1]]), 'close': closes,
+        'high': closes + rng.uniform(0, 1, n), 'low': closes - rng.uniform(0, 1, n),
+        'volume': rng.uniform(10, 100, n)
+    }
+    candles = [{'time': format_candle_time(arrays['time'][i]), **{f: float(arrays[f][i]) for f in OHLCV_FIELDS}}
+               for i in range(n)]
+
+    aggregator = TimeframeAggregator("M5", ('M15', 'H1', 'H4'))
+    aggregator.backfill({field: values[:4000] for field, values in arrays.items()})
+    start = time.perf_counter()
+    for end in range(4001, n + 1):
+        aggregator.update(candles[end - 100:end])
+    elapsed = (time.perf_counter() - start) / (n - 4000) * 1000
+    full = aggregate_arrays(arrays, 'H1')
+    print(f"⚡ {elapsed:.3f}ms per update, H1 matches full aggregation: "
+          f"{np.allclose(full['close'][-10:], [c['close'] for c in aggregator.get_candles('H1', 10)])}")
+    print(f"✅ Confluence for BUY: {aggregator.confluence('BUY')['score']}")
@@ -11,6 +11,10 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from collections import defaultdict
 import math
+from support_resistance import SupportResistanceIndex
+from candle_patterns import pattern_columns_from_candles, patterns_at
+from market_data_cache import bridge_get
+from timeframe_aggregator import TimeframeAggregator, timeframe_seconds
 
 class TradingStrategy:
     def __init__(self, bridge_url: str = "http://localhost:5002", parameters: Optional[Dict] = None):
@@ -19,7 +23,16 @@ class TradingStrategy:
         self.cache_time = None
         self.cache_duration = 60  # Cache for 60 seconds
         
+        # Support/resistance indexes per (timeframe, lookback), bijgewerkt per bar
+        self._sr_indexes = {}
+        # Hogere timeframes per (symbol, base timeframe, timeframes) voor confluence
+        self._aggregators = {}
+        
         # Strategy parameters (can be customized)
+        self.set_parameters(parameters)
+    
+    def set_parameters(self, parameters: Optional[Dict] = None):
+        """Vervang de strategie parameters in place (bv. bij een regime wissel)"""
         self.parameters = parameters or {}
         self.sma_short = self.parameters.get('sma_short', 20)
         self.sma_long = self.parameters.get('sma_long', 50)
@@ -93,9 +106,9 @@ class TradingStrategy:
     def get_candlestick_data(self, symbol: str = "XAUUSD", timeframe: str = "H1", count: int = 100) -> List[Dict]:
         """Get real candlestick/OHLC data from MT5"""
         try:
-            response = requests.get(f"{self.bridge_url}/candles/{symbol}/{timeframe}/{count}", timeout=10)
-            if response.status_code == 200:
-                data = response.json()
+            # Shared memory cache van de bridge, anders de bridge zelf
+            data = bridge_get(f"/candles/{symbol}/{timeframe}/{count}", bridge_url=self.bridge_url, timeout=10)
+            if data is not None:
                 if not data.get('error'):
                     candles = data.get('candles', [])
                     return candles
@@ -205,7 +218,8 @@ class TradingStrategy:
     def detect_support_resistance(self, candles: List[Dict], lookback: Optional[int] = None, timeframe: str = "H1") -> Dict:
         """
         Detecteer support en resistance levels op basis van historische highs/lows
-        Gebruikt pivot points en lokale minima/maxima
+        Gebruikt pivot points en lokale minima/maxima; de levels staan in een
+        SupportResistanceIndex per (timeframe, lookback) die per nieuwe bar bijwerkt
         """
         # Get timeframe-specific lookback if not provided
         if lookback is None:
@@ -215,53 +229,30 @@ class TradingStrategy:
         if len(candles) < lookback:
             return {'support': 0, 'resistance': 0, 'support_strength': 0, 'resistance_strength': 0}
         
-        # Extract highs and lows
-        highs = [float(c.get('high', 0)) for c in candles[-lookback:]]
-        lows = [float(c.get('low', 0)) for c in candles[-lookback:]]
-        closes = [float(c.get('close', 0)) for c in candles[-lookback:]]
-        
-        if not highs or not lows:
-            return {'support': 0, 'resistance': 0, 'support_strength': 0, 'resistance_strength': 0}
-        
-        current_price = closes[-1] if closes else 0
-        
-        # Vind lokale minima (support) en maxima (resistance)
-        # Support: lokale minima die meerdere keren zijn getest
-        support_levels = []
-        resistance_levels = []
-        
-        # Zoek naar pivot points (lokale minima/maxima)
-        for i in range(2, len(lows) - 2):
-            # Support: lokale minimum
-            if lows[i] < lows[i-1] and lows[i] < lows[i-2] and lows[i] < lows[i+1] and lows[i] < lows[i+2]:
-                support_levels.append(lows[i])
-            # Resistance: lokale maximum
-            if highs[i] > highs[i-1] and highs[i] > highs[i-2] and highs[i] > highs[i+1] and highs[i] > highs[i+2]:
-                resistance_levels.append(highs[i])
-        
-        # Vind dichtstbijzijnde support en resistance
-        valid_support = [s for s in support_levels if s < current_price]
-        valid_resistance = [r for r in resistance_levels if r > current_price]
-        
-        # Sorteer en neem de meest relevante levels
-        if valid_support:
-            valid_support.sort(reverse=True)  # Dichtstbijzijnde support (hoogste onder current price)
-            support = valid_support[0]
-            # Bereken strength: hoeveel keer is dit level getest?
-            support_strength = sum(1 for s in support_levels if abs(s - support) < (support * 0.001))
+        # Pivot levels van het venster: index wordt alleen met nieuwe bars bijgewerkt
+        key = (timeframe.upper(), lookback)
+        if key not in self._sr_indexes:
+            self._sr_indexes[key] = SupportResistanceIndex(lookback)
+        index = self._sr_indexes[key].update(candles)
+        current_price = index.current_price
+        
+        # Dichtstbijzijnde support (hoogste pivot low onder current price) en strength
+        # (hoeveel keer is dit level getest?)
+        nearest = index.nearest_support(current_price)
+        if nearest:
+            support, support_strength = nearest
         else:
             # Fallback: gebruik recente low
-            support = min(lows[-10:]) if lows else current_price * 0.99
+            support = index.recent_low()
             support_strength = 1
         
-        if valid_resistance:
-            valid_resistance.sort()  # Dichtstbijzijnde resistance (laagste boven current price)
-            resistance = valid_resistance[0]
-            # Bereken strength
-            resistance_strength = sum(1 for r in resistance_levels if abs(r - resistance) < (resistance * 0.001))
+        # Dichtstbijzijnde resistance (laagste pivot high boven current price)
+        nearest = index.nearest_resistance(current_price)
+        if nearest:
+            resistance, resistance_strength = nearest
         else:
             # Fallback: gebruik recente high
-            resistance = max(highs[-10:]) if highs else current_price * 1.01
+            resistance = index.recent_high()
             resistance_strength = 1
         
         return {
@@ -275,76 +266,15 @@ class TradingStrategy:
     def detect_candlestick_patterns(self, candles: List[Dict]) -> Dict:
         """
         Detecteer candlestick patronen (doji, hammer, engulfing, etc.)
+        
+        Patronen komen uit candle_patterns (zelfde kolommen als backtests en ML features)
         """
         if len(candles) < 3:
             return {'patterns': [], 'signal_strength': 0}
         
-        patterns = []
-        signal_strength = 0
-        
         # Analyseer laatste 3 candles
-        recent = candles[-3:]
-        
-        for i, candle in enumerate(recent):
-            open_price = float(candle.get('open', 0))
-            close_price = float(candle.get('close', 0))
-            high_price = float(candle.get('high', 0))
-            low_price = float(candle.get('low', 0))
-            
-            if open_price == 0 or close_price == 0:
-                continue
-            
-            body_size = abs(close_price - open_price)
-            total_range = high_price - low_price
-            
-            if total_range == 0:
-                continue
-            
-            body_ratio = body_size / total_range
-            
-            # Doji pattern (zeer kleine body)
-            if body_ratio < 0.1:
-                patterns.append('DOJI')
-                signal_strength += 5  # Neutraal signaal
-            
-            # Hammer (kleine body bovenaan, lange onderste wick)
-            upper_wick = high_price - max(open_price, close_price)
-            lower_wick = min(open_price, close_price) - low_price
-            if body_ratio < 0.3 and lower_wick > body_size * 2 and upper_wick < body_size:
-                patterns.append('HAMMER')
-                signal_strength += 15  # Bullish signaal
-            
-            # Shooting Star (kleine body onderaan, lange bovenste wick)
-            if body_ratio < 0.3 and upper_wick > body_size * 2 and lower_wick < body_size:
-                patterns.append('SHOOTING_STAR')
-                signal_strength -= 15  # Bearish signaal
-        
-        # Engulfing pattern (twee candles)
-        if len(recent) >= 2:
-            prev = recent[-2]
-            curr = recent[-1]
-            
-            prev_open = float(prev.get('open', 0))
-            prev_close = float(prev.get('close', 0))
-            curr_open = float(curr.get('open', 0))
-            curr_close = float(curr.get('close', 0))
-            
-            # Bullish engulfing
-            if prev_close < prev_open and curr_close > curr_open:
-                if curr_open < prev_close and curr_close > prev_open:
-                    patterns.append('BULLISH_ENGULFING')
-                    signal_strength += 20
-            
-            # Bearish engulfing
-            if prev_close > prev_open and curr_close < curr_open:
-                if curr_open > prev_close and curr_close < prev_open:
-                    patterns.append('BEARISH_ENGULFING')
-                    signal_strength -= 20
-        
-        return {
-            'patterns': patterns,
-            'signal_strength': signal_strength
-        }
+        columns = pattern_columns_from_candles(candles[-3:])
+        return patterns_at(columns, 2)
     
     def calculate_dynamic_tp_sl(self, signal: str, entry_price: float, candles: List[Dict], 
                                  risk_reward_ratio: float = 2.0, timeframe: str = "H1") -> Dict:
@@ -670,17 +600,122 @@ class TradingStrategy:
             'trend': trend
         }
     
-    def generate_signal_from_chart(self, symbol: str = "XAUUSD", timeframe: str = "H1", count: int = 100) -> Dict:
+    def generate_signal_from_chart(self, symbol: str = "XAUUSD", timeframe: str = "H1", count: int = 100,
+                                   confluence_timeframes: Optional[List[str]] = None) -> Dict:
         """
         Generate trading signal based on XAUUSD chart/technical analysis
         Gebruikt: Moving Averages, RSI, MACD, Support/Resistance, Candlestick Patterns
+        
+        Args:
+            confluence_timeframes: Hogere timeframes (bv. ['H1', 'H4']) voor 'confluence'
+                                   in het signaal, opgebouwd uit dezelfde candles
+        """
+        # Haal ECHTE candlestick data op (niet alleen close prices!)
+        candles = self.get_candlestick_data(symbol=symbol, timeframe=timeframe, count=count)
+        
+        signal = self.analyze_candles(candles, timeframe=timeframe)
+        if confluence_timeframes:
+            self.add_confluence(signal, symbol, timeframe, candles, confluence_timeframes)
+        return signal
+    
+    def get_timeframe_aggregator(self, symbol: str, timeframe: str, timeframes: List[str]) -> TimeframeAggregator:
+        """
+        Aggregator voor hogere timeframes uit de base timeframe feed
+        
+        Wordt één keer gevuld uit de lokale CandleStore history van de base timeframe
+        (zie backfill_aggregator) en daarna per cyclus bijgewerkt met de live candles.
+        """
+        key = (symbol.upper(), timeframe.upper(), tuple(tf.upper() for tf in timeframes))
+        if key not in self._aggregators:
+            aggregator = TimeframeAggregator(timeframe, key[2], periods={
+                tf: self.get_timeframe_parameters(tf) for tf in key[2]
+            })
+            self.backfill_aggregator(aggregator, symbol)
+            self._aggregators[key] = aggregator
+        return self._aggregators[key]
+    
+    def backfill_aggregator(self, aggregator: TimeframeAggregator, symbol: str) -> int:
+        """
+        Vul een aggregator (opnieuw) uit de CandleStore, na een sync via de bridge
+        van genoeg base bars voor de trage indicators op de hoogste timeframe
+        
+        Returns:
+            Aantal verwerkte base bars
+        """
+        from candle_store import CandleStore
+        timeframe = aggregator.base_timeframe
+        base_seconds = timeframe_seconds(timeframe)
+        needed = max(timeframe_seconds(tf) // base_seconds
+                     * (max(aggregator.periods[tf]['sma_long'], aggregator.periods[tf]['ema_slow']) + 1)
+                     for tf in aggregator.timeframes)
+        store = CandleStore(bridge_url=self.bridge_url)
+        store.sync(symbol, timeframe, min(needed, 5000))
+        return aggregator.backfill(store.load_arrays(symbol, timeframe))
+    
+    def add_confluence(self, signal: Dict, symbol: str, timeframe: str, candles: List[Dict],
+                       timeframes: List[str]) -> Dict:
+        """
+        Voeg multi-timeframe confluence toe aan een signaal (in place)
+        
+        Returns:
+            Het signaal met 'confluence' (zie TimeframeAggregator.confluence)
+        """
+        try:
+            aggregator = self.get_timeframe_aggregator(symbol, timeframe, timeframes)
+        except ValueError as e:
+            signal['confluence'] = {'error': 'Invalid confluence timeframes', 'message': str(e)}
+            return signal
+        
+        if candles:
+            if not aggregator.connects(candles):
+                # Gat sinds de vorige update (server idle, bridge storing): history opnieuw laden
+                print(f"🔄 Confluence history gap for {symbol} {timeframe}, backfilling again")
+                self.backfill_aggregator(aggregator, symbol)
+            aggregator.update(candles)
+        signal['confluence'] = aggregator.confluence(signal.get('signal', 'NEUTRAL'))
+        return signal
+    
+    def analyze_snapshot(self, candles: List[Dict], timeframe: str = "H1", symbol: str = "XAUUSD") -> Dict:
+        """
+        Live signaal op een al opgehaalde candle snapshot (bv. gedeeld door
+        MultiStrategyManager); subclasses met live state overschrijven dit
+        """
+        return self.analyze_candles(candles, timeframe=timeframe)
+    
+    def get_indicator_periods(self, timeframe: str = "H1") -> Dict:
+        """
+        Indicator periodes die deze strategie gebruikt voor een timeframe
+        (timeframe defaults, overschreven door custom parameters)
+        """
+        tf_params = self.get_timeframe_parameters(timeframe)
+        return {
+            'sma_short': self.parameters.get('sma_short', tf_params['sma_short']),
+            'sma_long': self.parameters.get('sma_long', tf_params['sma_long']),
+            'ema_fast': self.parameters.get('ema_fast', tf_params['ema_fast']),
+            'ema_slow': self.parameters.get('ema_slow', tf_params['ema_slow']),
+            'rsi_period': self.parameters.get('rsi_period', tf_params['rsi_period'])
+        }
+    
+    def analyze_candles(self, candles: List[Dict], timeframe: str = "H1",
+                        indicators: Optional[Dict] = None) -> Dict:
+        """
+        Generate trading signal from a given candle snapshot (no bridge request)
+        
+        Args:
+            candles: Candlestick data (oudste eerst), bv. de laatste 100 candles
+            timeframe: Timeframe van de candles
+            indicators: Optioneel vooraf berekende indicator waarden voor de laatste
+                        candle ('sma_short', 'sma_long', 'ema_fast', 'ema_slow', 'rsi'),
+                        zie indicator_series.indicators_at. None waarden worden berekend.
+                        'patterns' mag een candle_patterns.patterns_at resultaat zijn.
+        
+        Returns:
+            Signal dict (zelfde vorm als generate_signal_from_chart)
         """
         # Get timeframe-specific parameters
         tf_params = self.get_timeframe_parameters(timeframe)
         min_candles = tf_params['min_candles']
-        
-        # Haal ECHTE candlestick data op (niet alleen close prices!)
-        candles = self.get_candlestick_data(symbol=symbol, timeframe=timeframe, count=count)
+        indicators = indicators or {}
         
         if len(candles) < min_candles:
             return {
@@ -704,19 +739,36 @@ class TradingStrategy:
             }
         
         # Use timeframe-specific parameters (override with custom if provided)
-        sma_short_period = self.parameters.get('sma_short', tf_params['sma_short'])
-        sma_long_period = self.parameters.get('sma_long', tf_params['sma_long'])
-        ema_fast_period = self.parameters.get('ema_fast', tf_params['ema_fast'])
-        ema_slow_period = self.parameters.get('ema_slow', tf_params['ema_slow'])
-        rsi_period = self.parameters.get('rsi_period', tf_params['rsi_period'])
+        periods = self.get_indicator_periods(timeframe)
+        sma_short_period = periods['sma_short']
+        sma_long_period = periods['sma_long']
+        ema_fast_period = periods['ema_fast']
+        ema_slow_period = periods['ema_slow']
+        rsi_period = periods['rsi_period']
         
         # Calculate technical indicators with timeframe-specific parameters
-        sma_short = self.calculate_sma(prices, sma_short_period)
-        sma_long = self.calculate_sma(prices, sma_long_period) if len(prices) >= sma_long_period else sma_short
-        ema_fast = self.calculate_ema(prices, ema_fast_period)
-        ema_slow = self.calculate_ema(prices, ema_slow_period) if len(prices) >= ema_slow_period else ema_fast
-        rsi = self.calculate_rsi(prices, rsi_period)
-        macd = self.calculate_macd(prices, fast=ema_fast_period, slow=ema_slow_period)
+        # (vooraf berekende waarden hebben voorrang)
+        sma_short = indicators.get('sma_short')
+        if sma_short is None:
+            sma_short = self.calculate_sma(prices, sma_short_period)
+        sma_long = indicators.get('sma_long')
+        if sma_long is None:
+            sma_long = self.calculate_sma(prices, sma_long_period) if len(prices) >= sma_long_period else sma_short
+        ema_fast = indicators.get('ema_fast')
+        if ema_fast is None:
+            ema_fast = self.calculate_ema(prices, ema_fast_period)
+        ema_slow = indicators.get('ema_slow')
+        if ema_slow is None:
+            ema_slow = self.calculate_ema(prices, ema_slow_period) if len(prices) >= ema_slow_period else ema_fast
+        rsi = indicators.get('rsi')
+        if rsi is None:
+            rsi = self.calculate_rsi(prices, rsi_period)
+        if indicators.get('ema_fast') is not None and indicators.get('ema_slow') is not None and len(prices) >= ema_slow_period:
+            # MACD volgt direct uit de EMA's
+            macd_value = ema_fast - ema_slow
+            macd = {'macd': macd_value, 'signal': macd_value * 0.9, 'histogram': macd_value - macd_value * 0.9}
+        else:
+            macd = self.calculate_macd(prices, fast=ema_fast_period, slow=ema_slow_period)
         
         current_price = prices[-1]
         
@@ -724,7 +776,9 @@ class TradingStrategy:
         sr = self.detect_support_resistance(candles, timeframe=timeframe)
         
         # Detecteer candlestick patronen
-        patterns = self.detect_candlestick_patterns(candles)
+        patterns = indicators.get('patterns')
+        if patterns is None:
+            patterns = self.detect_candlestick_patterns(candles)
         
         # Signal logic met patroonherkenning
         signals = []